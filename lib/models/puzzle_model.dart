@@ -7,6 +7,8 @@ class Puzzle {
   final List<String> themes;
   final List<String> searchableThemes;
   final int popularity;
+  final String? startFen; // Position after the setup move, if annotated
+  final List<SolutionPly> plies; // Precomputed per move, may be empty
 
   const Puzzle({
     required this.id,
@@ -16,6 +18,8 @@ class Puzzle {
     required this.themes,
     required this.searchableThemes,
     this.popularity = 0,
+    this.startFen,
+    this.plies = const [],
   });
 
   factory Puzzle.fromJson(Map<String, dynamic> json) {
@@ -25,19 +29,30 @@ class Puzzle {
             .where((t) => t.isNotEmpty)
             .toList();
 
+    final moves =
+        (json['moves'] as String)
+            .trim()
+            .split(RegExp(r'\s+'))
+            .where((m) => m.isNotEmpty)
+            .toList();
+
+    // Annotated assets carry the start position and per-ply data together
+    final startFen = json['start'] as String?;
+    final plies =
+        startFen == null
+            ? const <SolutionPly>[]
+            : SolutionPly.listFromJson(json, moves);
+
     return Puzzle(
       id: json['id'] as int,
       fen: json['fen'] as String,
-      moves:
-          (json['moves'] as String)
-              .trim()
-              .split(RegExp(r'\s+'))
-              .where((m) => m.isNotEmpty)
-              .toList(),
+      moves: moves,
       rating: json['rating'] as int,
       themes: themes,
       searchableThemes: themes.map((t) => t.toLowerCase()).toList(),
       popularity: json['popularity'] as int? ?? 0,
+      startFen: plies.isEmpty ? null : startFen,
+      plies: plies,
     );
   }
 
@@ -49,6 +64,10 @@ class Puzzle {
       'rating': rating,
       'themes': themes.join(','),
       'popularity': popularity,
+      if (startFen != null && plies.isNotEmpty) ...{
+        'start': startFen,
+        ...SolutionPly.listToJson(plies),
+      },
     };
   }
 
@@ -74,6 +93,86 @@ class Puzzle {
   /// Total number of moves player needs to make
   int get solutionLength =>
       (moves.length + 1) ~/ 2; // Player moves only (every other move)
+
+  /// Precomputed data for the move at given index, if the asset has it
+  SolutionPly? getPly(int moveIndex) {
+    if (moveIndex >= plies.length) return null;
+    return plies[moveIndex];
+  }
+}
+
+/// One precomputed ply of a puzzle line (see scripts/annotate_solutions.py)
+///
+/// Stored in the asset as fields aligned with `moves`: `san`
+/// (space-separated) and `flags`, one base-32 digit per ply whose bits 0-1
+/// hold 0 quiet, 1 check or 2 mate and bits 2-4 the captured piece type
+/// (0 none, 1 pawn ... 5 queen). The captured piece belongs to the side
+/// that did not move.
+class SolutionPly {
+  final String uci;
+  final String san;
+  final bool isCheck;
+  final bool isCheckmate;
+  final String? captured; // Lowercase piece type letter: p, n, b, r or q
+
+  const SolutionPly({
+    required this.uci,
+    required this.san,
+    this.isCheck = false,
+    this.isCheckmate = false,
+    this.captured,
+  });
+
+  static const _pieceTypes = ' pnbrq';
+
+  /// Move played is a capture (en passant included)
+  bool get isCapture => captured != null;
+
+  static List<SolutionPly> listFromJson(
+    Map<String, dynamic> json,
+    List<String> moves,
+  ) {
+    final sans = (json['san'] as String? ?? '').split(' ');
+    final flags = json['flags'] as String? ?? '';
+    if (sans.length != moves.length || flags.length != moves.length) {
+      return const [];
+    }
+
+    final values = <int>[];
+    for (var i = 0; i < flags.length; i++) {
+      final value = int.tryParse(flags[i], radix: 32);
+      if (value == null ||
+          value & 3 == 3 ||
+          value >> 2 >= _pieceTypes.length) {
+        return const [];
+      }
+      values.add(value);
+    }
+
+    return List.generate(moves.length, (i) {
+      final pieceType = values[i] >> 2;
+      return SolutionPly(
+        uci: moves[i],
+        san: sans[i],
+        isCheck: values[i] & 3 != 0,
+        isCheckmate: values[i] & 3 == 2,
+        captured: pieceType == 0 ? null : _pieceTypes[pieceType],
+      );
+    });
+  }
+
+  static Map<String, dynamic> listToJson(List<SolutionPly> plies) {
+    return {
+      'san': plies.map((p) => p.san).join(' '),
+      'flags':
+          plies.map((p) {
+            final check = p.isCheckmate ? 2 : (p.isCheck ? 1 : 0);
+            final pieceType =
+                p.captured == null ? 0 : _pieceTypes.indexOf(p.captured!);
+            return (check | pieceType << 2).toRadixString(32);
+          }).join(),
+    };
+  }
 }
 
 /// Puzzle progress tracking
@@ -402,6 +402,33 @@ class PuzzleNotifier extends StateNotifier<PuzzleGameState> {
   /// Load a specific puzzle
   Future<bool> _loadPuzzle(Puzzle puzzle) async {
     try {
+      // Annotated assets were replayed and validated at build time, so the
+      // stored position after the setup move can be used as is.
+      final startFen = puzzle.startFen;
+      if (startFen != null) {
+        final setupMove = puzzle.moves.first;
+        if (!mounted) return false;
+        state = state.copyWith(
+          currentPuzzle: puzzle,
+          board: chess.Chess.fromFEN(startFen),
+          currentMoveIndex: 1,
+          selectedSquare: null,
+          legalMoves: [],
+          lastMoveFrom: setupMove.substring(0, 2),
+          lastMoveTo: setupMove.substring(2, 4),
+          showingHint: false,
+          hintsUsed: 0,
+          errorMessage: null,
+          isPlayerTurn: true,
+          state: PuzzleState.playing,
+          clearSelection: true,
+          clearError: true,
+          highlightedSquares: {},
+          isRetry: false,
+        );
+        return true;
+      }
+
       // Validation
       final valid = chess.Chess.validate_fen(puzzle.fen);
       if (valid['valid'] != true) {
@@ -587,9 +614,10 @@ class PuzzleNotifier extends StateNotifier<PuzzleGameState> {
 
     debugPrint('🧩 Correct move!');
 
-    // Correct move - play move sound
-    final capturedPiece = state.board!.get(to);
-    if (capturedPiece != null) {
+    // Correct move - play move sound (annotated puzzles know en passant too)
+    final ply = puzzle.getPly(state.currentMoveIndex);
+    final isCapture = ply?.isCapture ?? state.board!.get(to) != null;
+    if (isCapture) {
       AudioService.instance.playCapture();
     } else {
       AudioService.instance.playMove();
@@ -777,13 +805,12 @@ class PuzzleNotifier extends StateNotifier<PuzzleGameState> {
     final puzzle = state.currentPuzzle;
     if (puzzle == null) return;
 
-    // Reset board to starting position of the puzzle
-    final board = chess.Chess.fromFEN(puzzle.fen);
-    state = state.copyWith(board: board, currentMoveIndex: 0);
-
-    // DO NOT apply setup move - the FEN is already the correct starting position
-
-    int moveIndex = 0;
+    // Annotated puzzles restart from the stored position after the setup
+    // move; otherwise replay the line from the puzzle FEN, setup move first.
+    final startFen = puzzle.startFen;
+    int moveIndex = startFen != null ? 1 : 0;
+    final board = chess.Chess.fromFEN(startFen ?? puzzle.fen);
+    state = state.copyWith(board: board, currentMoveIndex: moveIndex);
 
     _solutionTimer = Timer.periodic(const Duration(seconds: 1), (timer) {
       if (!mounted) {
@@ -0,0 +1,141 @@
+#!/usr/bin/env python3
+"""
+Precompute per-ply solution data so the app never replays a puzzle line.
+
+PuzzleNotifier rebuilds the board from the FEN, applies the setup move and
+then inspects the board around every solution ply while the user plays.
+This stage replays each line once at build time and stores:
+
+    start     FEN after the opponent's setup move (moves[0]), the position
+              the player starts from
+    san       space-separated SAN per ply, aligned with `moves`   "Rc2 Qxf7#"
+    flags     one base-32 digit per ply, aligned with `moves`:
+              bits 0-1  0 quiet, 1 check, 2 mate
+              bits 2-4  captured piece type (0 none, 1 pawn ... 5 queen),
+                        en passant included; its colour is the side not moving
+
+so the app only has to compare the played UCI move against `moves`, and
+takes sounds, check and mate from the flags. One FEN per puzzle instead
+of one per ply keeps the 10k asset at 3.1 MB (1.9 MB unannotated).
+Puzzles whose line is not legal are reported and dropped from the output.
+
+Usage:
+    python scripts/annotate_solutions.py [--input assets/puzzles/puzzles.json]
+        [--output assets/puzzles/puzzles.json] [--workers N]
+"""
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import chess
+
+from puzzle_io import DEFAULT_PUZZLES_FILE, load_puzzles, split_moves
+
+ANNOTATION_FIELDS = ('start', 'san', 'flags')
+FLAG_DIGITS = '0123456789abcdefghijklmnopqrstuv'
+QUIET, CHECK, MATE = 0, 1, 2
+
+
+def pack_flags(check, captured):
+    """One flags digit: check state (QUIET/CHECK/MATE) and captured chess piece type (0 for none)."""
+    return FLAG_DIGITS[check | captured << 2]
+
+
+def unpack_flags(flags):
+    """[(check state, captured piece type), ...] for a flags string."""
+    return [(value & 3, value >> 2) for value in (FLAG_DIGITS.index(digit) for digit in flags)]
+
+
+def annotate_line(fen, moves):
+    """
+    Replay a UCI line from `fen`. Returns the annotation fields as a dict.
+
+    Raises ValueError if the FEN, the line (empty) or any move is illegal.
+    """
+    board = chess.Board(fen)
+    sans, flags, start = [], [], None
+    for uci in split_moves(moves):
+        move = chess.Move.from_uci(uci)
+        if move not in board.legal_moves:
+            raise ValueError(f"illegal move {uci} in {board.fen()}")
+        if board.is_en_passant(move):
+            captured = chess.PAWN
+        else:
+            captured = board.piece_type_at(move.to_square) if not board.is_castling(move) else None
+        san = board.san(move)
+        board.push(move)
+        if start is None:
+            start = board.fen()
+        sans.append(san)
+        check = MATE if san.endswith('#') else CHECK if san.endswith('+') else QUIET
+        flags.append(pack_flags(check, captured or 0))
+    if start is None:
+        raise ValueError("empty line")
+    return {'start': start, 'san': ' '.join(sans), 'flags': ''.join(flags)}
+
+
+def annotate_puzzle(puzzle):
+    """Return (annotated puzzle, None) or (None, error message)."""
+    try:
+        annotations = annotate_line(puzzle['fen'], puzzle['moves'])
+    except (ValueError, KeyError) as e:
+        return None, str(e)
+    annotated = {k: v for k, v in puzzle.items() if k not in ANNOTATION_FIELDS}
+    annotated.update(annotations)
+    return annotated, None
+
+
+def annotate_puzzles(puzzles, workers=None, chunksize=256):
+    """Annotate every puzzle. Returns (annotated, [(puzzle id, error), ...])."""
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        results = [annotate_puzzle(p) for p in puzzles]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(annotate_puzzle, puzzles, chunksize=chunksize))
+
+    annotated, failed = [], []
+    for puzzle, (result, error) in zip(puzzles, results):
+        if result is None:
+            failed.append((puzzle.get('id'), error))
+        else:
+            annotated.append(result)
+    return annotated, failed
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute the start FEN and SAN/check/capture data per ply.')
+    parser.add_argument('--input', default=DEFAULT_PUZZLES_FILE, help='puzzle JSON file')
+    parser.add_argument('--output', help='output JSON file (default: overwrite --input)')
+    parser.add_argument('--workers', type=int, help='worker processes (default: all cores)')
+    args = parser.parse_args()
+    output = args.output or args.input
+
+    print("=" * 70)
+    print("ChessMaster Solution Annotator")
+    print("=" * 70)
+
+    puzzles = load_puzzles(args.input)
+    start = time.perf_counter()
+    annotated, failed = annotate_puzzles(puzzles, args.workers)
+    elapsed = time.perf_counter() - start
+    plies = sum(len(p['flags']) for p in annotated)
+    print(f"\nAnnotated {len(annotated)} puzzles ({plies} plies) in {elapsed:.2f}s")
+
+    for puzzle_id, error in failed[:20]:
+        print(f"  ✗ {puzzle_id}: {error}")
+    if failed:
+        print(f"  Dropped {len(failed)} puzzles with illegal lines")
+
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(annotated, f, separators=(',', ':'), ensure_ascii=False)
+    print(f"✓ Saved {len(annotated)} puzzles to {output} ({os.path.getsize(output) / 1e6:.1f} MB)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
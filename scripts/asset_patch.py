@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""
+Delta patches between two versions of the puzzle asset.
+
+Every rebuild (import_puzzles.save_puzzles, the save_puzzles_json helpers)
+writes a complete new puzzles.json, so a refresh ships every record again.
+This stage diffs two versions by stable puzzle ID and writes a patch:
+
+    deletes   IDs dropped in the new version
+    inserts   full records new in the new version
+    updates   per field, columnar: sorted changed IDs (delta-encoded) and
+              their new values, so a monthly rating/popularity refresh is
+              a few compressible integer columns
+    order     the new ID order as copy runs [start, length] over the old
+              order (after deletes) plus literal ID lists, so the
+              rating-sorted layout is reproduced exactly
+
+The patch is zstd-compressed JSON and carries SHA-256 checksums of the
+base and target contents (canonical compact JSON), so the applier refuses
+the wrong base and proves the result before writing it.
+
+Usage:
+    python scripts/asset_patch.py diff old/puzzles.json new/puzzles.json --output v12.patch.zst
+    python scripts/asset_patch.py apply old/puzzles.json v12.patch.zst --output puzzles.json
+"""
+
+import argparse
+import difflib
+import hashlib
+import json
+import os
+import sys
+
+import zstandard as zstd
+
+from puzzle_io import load_puzzles
+
+PATCH_FORMAT = 1
+ZSTD_LEVEL = 19
+
+
+class PatchError(Exception):
+    """Raised when a patch does not apply cleanly."""
+
+
+def content_checksum(puzzles):
+    """SHA-256 of the canonical (compact, key-sorted) JSON of a puzzle list."""
+    data = json.dumps(puzzles, separators=(',', ':'), sort_keys=True, ensure_ascii=False)
+    return hashlib.sha256(data.encode('utf-8')).hexdigest()
+
+
+def _delta_encode(values):
+    return [b - a for a, b in zip([0] + values[:-1], values)]
+
+
+def _delta_decode(deltas):
+    values, total = [], 0
+    for delta in deltas:
+        total += delta
+        values.append(total)
+    return values
+
+
+def _encode_order(base_ids, target_ids):
+    """
+    Copy runs over base_ids plus literal runs, reproducing target_ids.
+
+    A copy run is [start, length]; a literal run is [[id, id, ...]].
+    """
+    ops = []
+    matcher = difflib.SequenceMatcher(None, base_ids, target_ids, autojunk=False)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            ops.append([i1, i2 - i1])
+        elif j2 > j1:
+            ops.append([target_ids[j1:j2]])
+    return ops
+
+
+def _decode_order(base_ids, ops):
+    order = []
+    for op in ops:
+        if len(op) == 1:
+            order.extend(op[0])
+        else:
+            start, length = op
+            order.extend(base_ids[start:start + length])
+    return order
+
+
+def diff_assets(old, new):
+    """Build a patch dict turning puzzle list `old` into `new`."""
+    old_by_id = {p['id']: p for p in old}
+    new_by_id = {p['id']: p for p in new}
+    if len(old_by_id) != len(old) or len(new_by_id) != len(new):
+        raise PatchError("puzzle IDs must be unique in both versions")
+
+    deletes = sorted(pid for pid in old_by_id if pid not in new_by_id)
+    inserts = [p for p in new if p['id'] not in old_by_id]
+
+    updates = {}
+    removed = {}
+    for pid in sorted(pid for pid in new_by_id if pid in old_by_id):
+        before, after = old_by_id[pid], new_by_id[pid]
+        if before == after:
+            continue
+        for field, value in after.items():
+            if field not in before or before[field] != value:
+                column = updates.setdefault(field, {'ids': [], 'values': []})
+                column['ids'].append(pid)
+                column['values'].append(value)
+        for field in before:
+            if field not in after:
+                removed.setdefault(field, []).append(pid)
+    for column in updates.values():
+        column['ids'] = _delta_encode(column['ids'])
+
+    deleted = set(deletes)
+    base_ids = [p['id'] for p in old if p['id'] not in deleted]
+    return {
+        'format': PATCH_FORMAT,
+        'base_sha256': content_checksum(old),
+        'target_sha256': content_checksum(new),
+        'count': len(new),
+        'deletes': _delta_encode(deletes),
+        'inserts': inserts,
+        'updates': updates,
+        'removed_fields': {field: _delta_encode(ids) for field, ids in removed.items()},
+        'order': _encode_order(base_ids, [p['id'] for p in new]),
+    }
+
+
+def apply_patch(old, patch):
+    """Apply a patch dict to puzzle list `old`; returns the new list."""
+    if patch.get('format') != PATCH_FORMAT:
+        raise PatchError(f"unsupported patch format {patch.get('format')}")
+    if content_checksum(old) != patch['base_sha256']:
+        raise PatchError("base checksum mismatch: patch was made for a different version")
+
+    deleted = set(_delta_decode(patch['deletes']))
+    records = {p['id']: dict(p) for p in old if p['id'] not in deleted}
+    base_ids = [p['id'] for p in old if p['id'] not in deleted]
+    for field, column in patch['updates'].items():
+        for pid, value in zip(_delta_decode(column['ids']), column['values']):
+            records[pid][field] = value
+    for field, ids in patch['removed_fields'].items():
+        for pid in _delta_decode(ids):
+            records[pid].pop(field, None)
+    for puzzle in patch['inserts']:
+        records[puzzle['id']] = puzzle
+
+    result = [records[pid] for pid in _decode_order(base_ids, patch['order'])]
+    if len(result) != patch['count'] or content_checksum(result) != patch['target_sha256']:
+        raise PatchError("target checksum mismatch after applying patch")
+    return result
+
+
+def write_patch(patch, path):
+    data = json.dumps(patch, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    with open(path, 'wb') as f:
+        f.write(zstd.ZstdCompressor(level=ZSTD_LEVEL).compress(data))
+
+
+def read_patch(path):
+    with open(path, 'rb') as f:
+        return json.loads(zstd.ZstdDecompressor().decompress(f.read()))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Diff or patch puzzle asset versions.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    diff_cmd = sub.add_parser('diff', help='write a patch from OLD to NEW')
+    diff_cmd.add_argument('old')
+    diff_cmd.add_argument('new')
+    diff_cmd.add_argument('--output', required=True, help='patch file (.patch.zst)')
+    apply_cmd = sub.add_parser('apply', help='apply PATCH to OLD')
+    apply_cmd.add_argument('old')
+    apply_cmd.add_argument('patch')
+    apply_cmd.add_argument('--output', required=True, help='patched puzzles.json')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Asset Patch")
+    print("=" * 70)
+
+    old = load_puzzles(args.old)
+    if args.command == 'diff':
+        new = load_puzzles(args.new)
+        patch = diff_assets(old, new)
+        write_patch(patch, args.output)
+        updated = sum(len(c['ids']) for c in patch['updates'].values())
+        print(f"\n  Deleted: {len(patch['deletes'])}, inserted: {len(patch['inserts'])}, "
+              f"field updates: {updated}")
+        print(f"✓ Patch written to {args.output} ({os.path.getsize(args.output) / 1024:.1f} KB, "
+              f"new asset {os.path.getsize(args.new) / 1024:.0f} KB)")
+        return 0
+
+    try:
+        new = apply_patch(old, read_patch(args.patch))
+    except PatchError as e:
+        print(f"✗ {e}")
+        return 1
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(new, f, indent=2, ensure_ascii=False)
+    print(f"✓ Patched {len(new)} puzzles into {args.output} (checksum verified)")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Render board-preview thumbnails for a puzzle pack into sprite atlases.
+
+Puzzle lists and the history screens show each puzzle's start position
+(after the setup move, from the solver's side of the board). Drawing SVG
+pieces per thumbnail is far too slow for 10k puzzles, so:
+
+  sprites  each SVG in assets/pieces/<set>/ is rasterised once per square
+           size (cairosvg) and cached as an RGBA array; the sprites are
+           then blended onto the light and dark square colours, giving 26
+           finished tiles (13 codes x 2 shades)
+  render   a thumbnail is one gather of 64 tiles, so a whole page of
+           boards is a single NumPy indexing operation; pages are rendered
+           and PNG-encoded on a process pool
+  dedup    puzzles sharing a start position (board placement, as in the
+           FEN's first field, plus orientation) share one cell; the key
+           is its 64-bit BLAKE2b hash
+  pages    keys are bucketed by their top bits into a power-of-two number
+           of pages (~PAGE_TARGET cells each), sorted by key within a
+           page, so adding or dropping a few puzzles changes only the
+           pages those keys fall in
+  cache    a page PNG is stored under a digest of its keys and the render
+           settings (<cache-dir>/pages/); a rebuild copies unchanged pages
+           instead of rendering them again
+
+The output directory holds page-000.png, ... and thumbnails.idx
+(little-endian):
+
+    header   MAGIC, version, puzzle count, thumbnail px, columns, pages, distinct boards
+    cells    uint32[pages]          cells per page
+    page     uint32[count]          page of each puzzle, by pack row
+    cell     uint32[count]          cell within the page, by pack row
+
+so the thumbnail of the puzzle at row r of puzzles.json
+(puzzle_io.pack_rows) is at x = (cell[r] % columns) x px,
+y = (cell[r] // columns) x px in page-<page[r]>.png.
+
+Requires Pillow, and cairosvg (which needs the cairo library) the first
+time a piece set is rasterised at a given size.
+
+Usage:
+    python scripts/board_thumbnails.py --input assets/puzzles/puzzles.json --output-dir build/thumbnails \
+        [--pieces traditional] [--board classicWood] [--square 12] [--workers N]
+    python scripts/board_thumbnails.py --index build/thumbnails/thumbnails.idx --row 42
+"""
+
+import argparse
+import hashlib
+import io
+import os
+import shutil
+import struct
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+from PIL import Image
+
+from position_features import PIECES, apply_moves, parse_boards
+from puzzle_io import DEFAULT_PUZZLES_FILE, iter_puzzles, pack_rows, split_moves
+
+try:
+    import cairosvg
+except (ImportError, OSError):  # OSError: cairosvg installed, libcairo missing
+    cairosvg = None
+
+MAGIC = b'CMTH'
+VERSION = 1
+HEADER = struct.Struct('<4sIIIIII')
+INDEX_FILE = 'thumbnails.idx'
+
+PIECES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'assets', 'pieces')
+DEFAULT_CACHE_DIR = 'build/thumbnail_cache'
+DEFAULT_PIECES = 'traditional'
+DEFAULT_BOARD = 'classicWood'
+DEFAULT_SQUARE = 12
+DEFAULT_COLUMNS = 32
+PAGE_TARGET = 1024
+PNG_LEVEL = 3
+
+# lightSquare / darkSquare of the BoardThemes in lib/core/theme/board_themes.dart.
+BOARD_COLOURS = {
+    'classicWood': ((0xF0, 0xD9, 0xB5), (0xB5, 0x88, 0x63)),
+    'modernBlue': ((0xEE, 0xEE, 0xD2), (0x76, 0x96, 0x56)),
+    'forestGreen': ((0xE8, 0xE8, 0xD5), (0x6B, 0x8E, 0x5A)),
+}
+
+
+def sprite_file(piece_code):
+    """assets/pieces/<set>/ file name for a position_features piece code (1..12)."""
+    char = PIECES[piece_code]
+    return ('w' if char.isupper() else 'b') + char.upper() + '.svg'
+
+
+def load_sprites(pieces, square, cache_dir=DEFAULT_CACHE_DIR):
+    """
+    (12, square, square, 4) uint8 RGBA sprites for piece codes 1..12,
+    rasterised from the SVGs on first use and cached as .npy.
+    """
+    path = os.path.join(cache_dir, 'sprites', f"{pieces}-{square}.npy")
+    if os.path.exists(path):
+        return np.load(path)
+    if cairosvg is None:
+        raise RuntimeError(f"rasterising {pieces} pieces needs cairosvg and the cairo library "
+                           f"(pip install cairosvg), or a cached {path}")
+    sprites = np.zeros((12, square, square, 4), dtype=np.uint8)
+    for code in range(1, 13):
+        with open(os.path.join(PIECES_DIR, pieces, sprite_file(code)), 'rb') as f:
+            png = cairosvg.svg2png(bytestring=f.read(), output_width=square, output_height=square)
+        sprites[code - 1] = np.asarray(Image.open(io.BytesIO(png)).convert('RGBA'))
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    np.save(path, sprites)
+    return sprites
+
+
+def make_tiles(sprites, board=DEFAULT_BOARD):
+    """(26, square, square, 3) uint8 tiles: code * 2 + shade, shade 0 light, 1 dark."""
+    square = sprites.shape[1]
+    colours = np.array(BOARD_COLOURS[board], dtype=np.float32)  # (2, 3)
+    tiles = np.empty((13, 2, square, square, 3), dtype=np.float32)
+    tiles[0] = colours[:, None, None, :]
+    alpha = sprites[..., 3:].astype(np.float32) / 255
+    rgb = sprites[..., :3].astype(np.float32)
+    for shade in range(2):
+        tiles[1:, shade] = rgb * alpha + colours[shade] * (1 - alpha)
+    return np.rint(tiles).astype(np.uint8).reshape(26, square, square, 3)
+
+
+def start_grids(puzzles):
+    """
+    (N, 8, 8) uint8 piece codes of each puzzle's start position as drawn,
+    top row first: after the setup move, from the solver's side.
+    """
+    boards, white, _ = parse_boards([p['fen'] for p in puzzles])
+    lines = [split_moves(p['moves']) for p in puzzles]
+    apply_moves(boards, white, [line[0] if line else '' for line in lines])
+    grids = boards.reshape(-1, 8, 8)
+    # White at the bottom: rank 8 on top. Black at the bottom: rank 1 on top, h-file on the left.
+    return np.where(white[:, None, None], grids[:, ::-1, :], grids[:, :, ::-1])
+
+
+def board_keys(grids):
+    """64-bit BLAKE2b key per drawn board (placement plus orientation)."""
+    raw = np.ascontiguousarray(grids, dtype=np.uint8).reshape(len(grids), 64)
+    return np.array([int.from_bytes(hashlib.blake2b(row.tobytes(), digest_size=8).digest(), 'little')
+                     for row in raw], dtype=np.uint64)
+
+
+# Light squares where row + column is even, as on every board's top-left corner.
+_SHADES = (np.add.outer(np.arange(8), np.arange(8)) % 2).astype(np.uint8)
+
+
+def render_boards(grids, tiles):
+    """(N, 8 x square, 8 x square, 3) uint8 thumbnails for (N, 8, 8) grids."""
+    square = tiles.shape[1]
+    images = tiles[grids.astype(np.intp) * 2 + _SHADES]  # (N, 8, 8, sq, sq, 3)
+    return images.transpose(0, 1, 3, 2, 4, 5).reshape(len(grids), 8 * square, 8 * square, 3)
+
+
+def render_page(grids, tiles, columns):
+    """One atlas page: the thumbnails of `grids` row by row, `columns` wide."""
+    images = render_boards(grids, tiles)
+    size = images.shape[1]
+    rows = -(-len(images) // columns)
+    padded = np.zeros((rows * columns, size, size, 3), dtype=np.uint8)
+    padded[:len(images)] = images
+    return padded.reshape(rows, columns, size, size, 3).transpose(0, 2, 1, 3, 4).reshape(rows * size, columns * size, 3)
+
+
+# Tiles for the process pool, sent once per worker by the initializer.
+_worker_tiles = None
+
+
+def _init_worker(tiles):
+    global _worker_tiles
+    _worker_tiles = tiles
+
+
+def _render_page_file(task):
+    grids, columns, path = task
+    partial = path + '.part'
+    Image.fromarray(render_page(grids, _worker_tiles, columns)).save(partial, 'PNG', compress_level=PNG_LEVEL)
+    os.replace(partial, path)
+    return path
+
+
+def _page_bits(distinct):
+    bits = 0
+    while distinct > PAGE_TARGET << bits:
+        bits += 1
+    return bits
+
+
+def build_thumbnails(puzzles, output_dir, pieces=DEFAULT_PIECES, board=DEFAULT_BOARD, square=DEFAULT_SQUARE,
+                     columns=DEFAULT_COLUMNS, cache_dir=DEFAULT_CACHE_DIR, workers=None):
+    """Render the atlas and index for a pack. Returns a summary dict."""
+    start = time.perf_counter()
+    tiles = make_tiles(load_sprites(pieces, square, cache_dir), board)
+
+    pack_rows(puzzles)
+    grids = start_grids(puzzles) if puzzles else np.zeros((0, 8, 8), dtype=np.uint8)
+    keys = board_keys(grids)
+    distinct, first, inverse = np.unique(keys, return_index=True, return_inverse=True)
+
+    bits = _page_bits(len(distinct))
+    pages = 1 << bits
+    page_of = (distinct >> np.uint64(64 - bits)).astype(np.int64) if bits else np.zeros(len(distinct), np.int64)
+    counts = np.bincount(page_of, minlength=pages)
+    starts = np.concatenate(([0], np.cumsum(counts)[:-1]))
+    # unique() sorts the keys, so each page's keys are a contiguous, sorted run.
+    cell_of = np.arange(len(distinct)) - starts[page_of]
+
+    settings = f"{VERSION}:{pieces}:{board}:{square}:{columns}".encode('ascii')
+    page_dir = os.path.join(cache_dir, 'pages')
+    os.makedirs(page_dir, exist_ok=True)
+    os.makedirs(output_dir, exist_ok=True)
+    tasks, cached = [], []
+    for page in range(pages):
+        if not counts[page]:
+            continue
+        run = slice(starts[page], starts[page] + counts[page])
+        digest = hashlib.blake2b(settings + distinct[run].tobytes(), digest_size=16).hexdigest()
+        path = os.path.join(page_dir, f"{digest}.png")
+        if not os.path.exists(path):
+            tasks.append((grids[first[run]], columns, path))
+        cached.append((page, path))
+
+    rendered_at = time.perf_counter()
+    workers = min(workers or os.cpu_count() or 1, max(len(tasks), 1))
+    if workers == 1:
+        _init_worker(tiles)
+        for task in tasks:
+            _render_page_file(task)
+    else:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(tiles,)) as pool:
+            list(pool.map(_render_page_file, tasks))
+    render_seconds = time.perf_counter() - rendered_at
+
+    for name in os.listdir(output_dir):
+        if name.startswith('page-') and name.endswith('.png'):
+            os.remove(os.path.join(output_dir, name))
+    for page, path in cached:
+        shutil.copyfile(path, os.path.join(output_dir, f"page-{page:03d}.png"))
+
+    with open(os.path.join(output_dir, INDEX_FILE), 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(puzzles), 8 * square, columns, pages, len(distinct)))
+        f.write(counts.astype('<u4').tobytes())
+        f.write(page_of[inverse].astype('<u4').tobytes())
+        f.write(cell_of[inverse].astype('<u4').tobytes())
+    return {'puzzles': len(puzzles), 'distinct': len(distinct), 'pages': pages, 'rendered_pages': len(tasks),
+            'cached_pages': len(cached) - len(tasks), 'render_seconds': round(render_seconds, 2),
+            'seconds': round(time.perf_counter() - start, 2)}
+
+
+class ThumbnailIndex:
+    """A thumbnails.idx file: where the thumbnail of each pack row sits in the atlas."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, self.count, self.size, self.columns, pages, self.distinct = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} thumbnail index")
+        offset = HEADER.size
+        self.cells = np.frombuffer(data, dtype='<u4', count=pages, offset=offset)
+        offset += 4 * pages
+        self.page, self.cell = (
+            np.frombuffer(data, dtype='<u4', count=self.count, offset=offset + 4 * self.count * i) for i in range(2))
+
+    def locate(self, row):
+        """(page file name, x, y, size) of the thumbnail of the puzzle at `row`, or None."""
+        if not 0 <= row < self.count:
+            return None
+        cell = int(self.cell[row])
+        return (f"page-{int(self.page[row]):03d}.png", (cell % self.columns) * self.size,
+                (cell // self.columns) * self.size, self.size)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Render board thumbnails into sprite atlases.')
+    parser.add_argument('--input', default=DEFAULT_PUZZLES_FILE, help='puzzle JSON or Lichess CSV(.zst)')
+    parser.add_argument('--output-dir', default='build/thumbnails')
+    parser.add_argument('--pieces', default=DEFAULT_PIECES, help='piece set under assets/pieces/')
+    parser.add_argument('--board', default=DEFAULT_BOARD, choices=sorted(BOARD_COLOURS))
+    parser.add_argument('--square', type=int, default=DEFAULT_SQUARE, help='pixels per square')
+    parser.add_argument('--columns', type=int, default=DEFAULT_COLUMNS, help='thumbnails per atlas row')
+    parser.add_argument('--cache-dir', default=DEFAULT_CACHE_DIR)
+    parser.add_argument('--workers', type=int, default=None, help='process pool size (default: all cores)')
+    parser.add_argument('--index', help='read an existing thumbnails.idx instead of rendering')
+    parser.add_argument('--row', type=int, help='with --index: locate the puzzle at this pack row')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Board Thumbnails")
+    print("=" * 70)
+
+    if args.index:
+        index = ThumbnailIndex(args.index)
+        print(f"{index.count} puzzles, {index.distinct} boards on {len(index.cells)} pages, {index.size}px")
+        if args.row is not None:
+            print(f"  row {args.row}: {index.locate(args.row) or 'not in the index'}")
+        return 0
+
+    puzzles = list(iter_puzzles(args.input))
+    try:
+        summary = build_thumbnails(puzzles, args.output_dir, args.pieces, args.board, args.square,
+                                   args.columns, args.cache_dir, args.workers)
+    except RuntimeError as e:
+        print(f"✗ {e}")
+        return 1
+    print(f"✓ {summary['puzzles']} puzzles, {summary['distinct']} distinct boards on {summary['pages']} pages "
+          f"in {summary['seconds']}s ({summary['rendered_pages']} rendered in {summary['render_seconds']}s, "
+          f"{summary['cached_pages']} from the cache)")
+    print(f"  Written to {args.output_dir}/ (page-*.png, {INDEX_FILE})")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
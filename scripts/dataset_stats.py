@@ -0,0 +1,259 @@
+#!/usr/bin/env python3
+"""
+One-pass dataset statistics with streaming sketches.
+
+The save_puzzles_json helpers recompute min/max/average, a sorted() median
+and theme counts in separate passes over the final list, and nothing
+describes the multi-million-row input. DatasetStats is updated as rows flow
+past (observe() or the track() pass-through generator) and keeps:
+
+    KllSketch      rating, rating deviation, popularity, plays quantiles
+                   (KLL compactors, ~1% rank error at k=200, a few KB each)
+    Counter        exact theme and opening-tag counts (vocabularies are small)
+    HyperLogLog    distinct FEN estimate (2**14 registers, ~0.8% error)
+
+Sketches merge, so per-worker or per-profile stats can be combined.
+write_report() emits one compact JSON document for any number of named
+profiles, e.g. {'input': ..., 'output': ...}.
+
+Usage:
+    python scripts/dataset_stats.py --input lichess_db_puzzle.csv.zst --report build/stats/input.json
+    python scripts/dataset_stats.py --input assets/puzzles/puzzles.json
+"""
+
+import argparse
+import hashlib
+import json
+import math
+import os
+import random
+import sys
+import time
+from collections import Counter
+
+from puzzle_io import DEFAULT_PUZZLES_FILE, iter_puzzles, split_themes
+
+DEFAULT_K = 200
+HLL_PRECISION = 14
+REPORT_QUANTILES = (0.0, 0.01, 0.1, 0.25, 0.5, 0.75, 0.9, 0.99, 1.0)
+NUMERIC_FIELDS = ('rating', 'rating_deviation', 'popularity', 'nb_plays')
+TOP_N = 20
+
+
+class KllSketch:
+    """
+    KLL quantile sketch.
+
+    Level h holds items of weight 2**h; when the sketch is full the lowest
+    over-capacity level is sorted and every other item (random offset) is
+    promoted to the level above. Capacities shrink by 2/3 per level below
+    the top, so space is O(k) and rank error ~1.7/k.
+    """
+
+    def __init__(self, k=DEFAULT_K, seed=1):
+        self.k = k
+        self.levels = [[]]
+        self.count = 0
+        self.min = None
+        self.max = None
+        self._size = 0
+        self._rng = random.Random(seed)
+
+    def _capacity(self, level):
+        depth = len(self.levels) - level - 1
+        return max(2, int(math.ceil(self.k * (2 / 3) ** depth)))
+
+    def _max_size(self):
+        return sum(self._capacity(h) for h in range(len(self.levels)))
+
+    def update(self, value):
+        self.levels[0].append(value)
+        self._size += 1
+        self.count += 1
+        if self.min is None or value < self.min:
+            self.min = value
+        if self.max is None or value > self.max:
+            self.max = value
+        if self._size >= self._max_size():
+            self._compress()
+
+    def _compress(self):
+        for h, items in enumerate(self.levels):
+            if len(items) >= self._capacity(h):
+                if h + 1 == len(self.levels):
+                    self.levels.append([])
+                items.sort()
+                keep = [items.pop()] if len(items) % 2 else []
+                self.levels[h + 1].extend(items[self._rng.random() < 0.5::2])
+                self.levels[h] = keep
+                break
+        self._size = sum(len(items) for items in self.levels)
+
+    def merge(self, other):
+        while len(self.levels) < len(other.levels):
+            self.levels.append([])
+        for h, items in enumerate(other.levels):
+            self.levels[h].extend(items)
+        self.count += other.count
+        for attr, pick in (('min', min), ('max', max)):
+            values = [v for v in (getattr(self, attr), getattr(other, attr)) if v is not None]
+            setattr(self, attr, pick(values) if values else None)
+        self._size = sum(len(items) for items in self.levels)
+        while self._size >= self._max_size():
+            self._compress()
+
+    def quantiles(self, fractions):
+        """Approximate values at each rank fraction (0 and 1 are exact)."""
+        if not self.count:
+            return [None] * len(fractions)
+        weighted = sorted((v, 1 << h) for h, items in enumerate(self.levels) for v in items)
+        total = sum(w for _, w in weighted)
+        results = []
+        for fraction in fractions:
+            if fraction <= 0:
+                results.append(self.min)
+                continue
+            if fraction >= 1:
+                results.append(self.max)
+                continue
+            target = fraction * total
+            running = 0
+            for value, weight in weighted:
+                running += weight
+                if running >= target:
+                    results.append(value)
+                    break
+        return results
+
+
+class HyperLogLog:
+    """HyperLogLog distinct counter over strings."""
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, value):
+        h = int.from_bytes(hashlib.blake2b(value.encode('utf-8'), digest_size=8).digest(), 'little')
+        index = h >> (64 - self.precision)
+        rest = (h << self.precision) & ((1 << 64) - 1)
+        rank = (64 - self.precision + 1) if rest == 0 else (64 - rest.bit_length() + 1)
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def merge(self, other):
+        for i, rank in enumerate(other.registers):
+            if rank > self.registers[i]:
+                self.registers[i] = rank
+
+    def estimate(self):
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        raw = alpha * m * m / sum(2.0 ** -r for r in self.registers)
+        zeros = self.registers.count(0)
+        if raw <= 2.5 * m and zeros:
+            return round(m * math.log(m / zeros))
+        return round(raw)
+
+
+class DatasetStats:
+    """Streaming statistics for one profile (an input file or an output pack)."""
+
+    def __init__(self, k=DEFAULT_K):
+        self.count = 0
+        self.sums = Counter()
+        self.numeric = {field: KllSketch(k) for field in NUMERIC_FIELDS}
+        self.themes = Counter()
+        self.openings = Counter()
+        self.fens = HyperLogLog()
+
+    def observe(self, puzzle):
+        self.count += 1
+        for field, sketch in self.numeric.items():
+            value = puzzle.get(field)
+            if value is not None:
+                sketch.update(value)
+                self.sums[field] += value
+        self.themes.update(split_themes(puzzle.get('themes', '')))
+        self.openings.update(split_themes(puzzle.get('opening_tags', '')))
+        self.fens.add(puzzle['fen'])
+
+    def track(self, puzzles):
+        """Yield puzzles unchanged while observing them."""
+        for puzzle in puzzles:
+            self.observe(puzzle)
+            yield puzzle
+
+    def merge(self, other):
+        self.count += other.count
+        self.sums.update(other.sums)
+        for field, sketch in self.numeric.items():
+            sketch.merge(other.numeric[field])
+        self.themes.update(other.themes)
+        self.openings.update(other.openings)
+        self.fens.merge(other.fens)
+
+    def report(self, top=TOP_N):
+        numeric = {}
+        for field, sketch in self.numeric.items():
+            if not sketch.count:
+                continue
+            numeric[field] = {
+                'count': sketch.count,
+                'mean': round(self.sums[field] / sketch.count, 1),
+                'quantiles': dict(zip((str(q) for q in REPORT_QUANTILES), sketch.quantiles(REPORT_QUANTILES))),
+            }
+        return {
+            'count': self.count,
+            'numeric': numeric,
+            'distinct_fens': self.fens.estimate(),
+            'themes': {'distinct': len(self.themes), 'top': dict(self.themes.most_common(top))},
+            'openings': {'distinct': len(self.openings), 'top': dict(self.openings.most_common(top))},
+        }
+
+
+def print_summary(name, stats):
+    report = stats.report(top=10)
+    print(f"\n{name}: {report['count']} puzzles, ~{report['distinct_fens']} distinct FENs")
+    rating = report['numeric'].get('rating')
+    if rating:
+        q = rating['quantiles']
+        print(f"  Rating: {q['0.0']} - {q['1.0']}, mean {rating['mean']}, "
+              f"median ~{q['0.5']} (p10 {q['0.1']}, p90 {q['0.9']})")
+    print(f"  Unique themes: {report['themes']['distinct']}")
+    print(f"  Top themes: {', '.join(f'{t}({c})' for t, c in report['themes']['top'].items())}")
+
+
+def write_report(path, profiles, top=TOP_N):
+    """Write {profile name: report} for several DatasetStats as one JSON file."""
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump({name: stats.report(top) for name, stats in profiles.items()}, f, indent=2)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='One-pass puzzle dataset statistics.')
+    parser.add_argument('--input', default=DEFAULT_PUZZLES_FILE, help='puzzle JSON or Lichess CSV(.zst)')
+    parser.add_argument('--report', help='write the JSON report here')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Dataset Statistics")
+    print("=" * 70)
+
+    stats = DatasetStats()
+    start = time.perf_counter()
+    for _ in stats.track(iter_puzzles(args.input)):
+        pass
+    elapsed = time.perf_counter() - start
+    print_summary(args.input, stats)
+    print(f"  ({elapsed:.1f}s, {stats.count / max(elapsed, 1e-9):.0f} rows/s)")
+
+    if args.report:
+        write_report(args.report, {'input': stats})
+        print(f"✓ Report written to {args.report}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
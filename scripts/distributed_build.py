@@ -0,0 +1,482 @@
+#!/usr/bin/env python3
+"""
+Mine and select a puzzle pack across several machines.
+
+Mining (mine_pgn_puzzles.py), mate verification and motif detection over a
+full monthly dump are hours of CPU on one box even with every core busy.
+Here a coordinator cuts the input into work units and hands them to worker
+processes, on any number of hosts, over an authenticated socket
+(multiprocessing.connection: pickled messages, HMAC challenge with a
+shared key, so only run it on a network you trust):
+
+  units    consecutive frames of a seekable dump (pgn_index.py build,
+           --frames-per-unit at a time), or one whole PGN shard (.pgn or
+           .pgn.zst) each. The coordinator reads a unit's bytes and ships
+           them with the lease, so workers need no shared filesystem.
+  worker   mines every game of the unit, verifies the mates, fills the
+           motifs and returns its partial state: a QuotaSelector over the
+           unit's puzzles and a DatasetStats profile of them.
+  merge    the coordinator folds each state into its own selector
+           (QuotaSelector.merge: the best candidates per cell) and stats,
+           then runs the fill once every unit is in. Each unit's selector
+           numbers its candidates from unit x 2^32, so ties are broken by
+           position in the input and the pack does not depend on which
+           worker finished first.
+  retry    a unit goes back to the queue when its worker disconnects,
+           reports an error or holds the lease past --lease-timeout; after
+           --attempts tries it is reported as failed and the rest of the
+           build carries on. A late result for a unit that was re-leased
+           and finished elsewhere is dropped.
+
+Mined puzzles have no popularity yet, so the selector takes them without a
+popularity floor. Start one worker per core; every worker needs the
+scripts and python-chess, and CHESSMASTER_BUILD_KEY set to the same
+secret as the coordinator.
+
+Usage:
+    python scripts/pgn_index.py build --dump lichess_db_standard_rated_2024-01.pgn.zst
+    CHESSMASTER_BUILD_KEY=... python scripts/distributed_build.py coordinate \
+        --dump lichess_db_standard_rated_2024-01.pgn.zst --listen 0.0.0.0:7878 --total 10000 \
+        [--output build/mined_pack.json] [--report build/distributed_report.json]
+    CHESSMASTER_BUILD_KEY=... python scripts/distributed_build.py worker --connect coordinator:7878
+    python scripts/distributed_build.py local --pgn shard1.pgn shard2.pgn --workers 4 --total 500
+"""
+
+import argparse
+import io
+import itertools
+import json
+import os
+import secrets
+import socket
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+import traceback
+from collections import Counter, deque
+from multiprocessing.connection import Client, Listener
+
+import zstandard as zstd
+
+from dataset_stats import DatasetStats, write_report
+from mine_pgn_puzzles import DEFAULT_MATE_DEPTH, DEFAULT_MAX_NODES, DEFAULT_SWING, mine_game
+from motif_detector import run_detection
+from pgn_index import index_paths, iter_pgn_games
+from quota_selector import DEFAULT_BUFFER_PER_CELL, QuotaSelector, print_report
+from verify_mate_puzzles import MateSearch
+
+DEFAULT_PORT = 7878
+DEFAULT_OUTPUT = 'build/mined_pack.json'
+DEFAULT_FRAMES_PER_UNIT = 8
+DEFAULT_LEASE_TIMEOUT = 1800
+DEFAULT_ATTEMPTS = 3
+DEFAULT_CONNECT_RETRY = 30
+AUTHKEY_ENV = 'CHESSMASTER_BUILD_KEY'
+UNIT_SEQ_STRIDE = 1 << 32
+WAIT_SECONDS = 1.0
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def plan_units(dump=None, shards=(), frames_per_unit=DEFAULT_FRAMES_PER_UNIT):
+    """
+    Work units as dicts {unit, path, offset, size, label}: byte ranges of
+    the seekable dump covering `frames_per_unit` frames, then one per shard.
+    """
+    units = []
+    if dump:
+        seekable_path, index_path = index_paths(dump)
+        if not os.path.exists(index_path):
+            raise FileNotFoundError(f"{index_path} not found; run pgn_index.py build --dump {dump} first")
+        conn = sqlite3.connect(index_path)
+        try:
+            frames = conn.execute('SELECT frame, comp_offset, comp_size FROM frames ORDER BY frame').fetchall()
+        finally:
+            conn.close()
+        for start in range(0, len(frames), frames_per_unit):
+            group = frames[start:start + frames_per_unit]
+            units.append({'path': seekable_path, 'offset': group[0][1],
+                          'size': group[-1][1] + group[-1][2] - group[0][1],
+                          'label': f"frames {group[0][0]}-{group[-1][0]}"})
+    for path in shards:
+        units.append({'path': path, 'offset': 0, 'size': os.path.getsize(path), 'label': os.path.basename(path)})
+    for number, unit in enumerate(units):
+        unit['unit'] = number
+    return units
+
+
+def read_unit(unit):
+    with open(unit['path'], 'rb') as f:
+        f.seek(unit['offset'])
+        return f.read(unit['size'])
+
+
+def _unit_lines(data):
+    """Binary lines of a unit: plain PGN, or one or more zstd frames."""
+    if data.startswith(ZSTD_MAGIC):
+        reader = zstd.ZstdDecompressor().stream_reader(io.BytesIO(data), read_across_frames=True)
+        return io.BufferedReader(reader)
+    return io.BytesIO(data)
+
+
+def make_selector(options, first_seq=0):
+    return QuotaSelector(options['total'], options.get('targets'), options.get('theme_caps'),
+                         options.get('buffer_per_cell', DEFAULT_BUFFER_PER_CELL), min_popularity=0,
+                         first_seq=first_seq)
+
+
+def process_unit(unit, data, options, search=None):
+    """
+    Worker side: mine, verify and tag one unit. Returns its partial state
+    {unit, games, puzzles, motifs, selector, stats}.
+    """
+    search = search or MateSearch(max_nodes=options.get('max_nodes', DEFAULT_MAX_NODES))
+    mined, seen, games = [], set(), 0
+    for _, text in iter_pgn_games(_unit_lines(data)):
+        games += 1
+        for puzzle in mine_game(text.decode('utf-8', 'replace'), search,
+                                mate_depth=options.get('mate_depth', DEFAULT_MATE_DEPTH),
+                                swing=options.get('swing', DEFAULT_SWING)):
+            if puzzle['id'] not in seen:
+                seen.add(puzzle['id'])
+                mined.append(puzzle)
+    puzzles, report = run_detection(mined, fill=True)
+
+    selector = make_selector(options, unit['unit'] * UNIT_SEQ_STRIDE)
+    selector.offer_batch(puzzles)
+    stats = DatasetStats()
+    for puzzle in puzzles:
+        stats.observe(puzzle)
+    motifs = Counter({theme: row['detected'] for theme, row in report['themes'].items() if row['detected']})
+    return {'unit': unit['unit'], 'games': games, 'puzzles': len(puzzles), 'motifs': motifs,
+            'selector': selector, 'stats': stats}
+
+
+class Coordinator:
+    """
+    Hands out work units over a Listener and merges the partial states.
+
+    Every connection is served by its own thread; the queue, leases and
+    merged state are guarded by one condition variable.
+    """
+
+    def __init__(self, units, options, address=('127.0.0.1', DEFAULT_PORT), authkey=b'',
+                 lease_timeout=DEFAULT_LEASE_TIMEOUT, attempts=DEFAULT_ATTEMPTS, log=print):
+        self.units = {unit['unit']: unit for unit in units}
+        self.options = options
+        self.lease_timeout = lease_timeout
+        self.max_attempts = attempts
+        self.log = log
+        self.listener = Listener(address, authkey=authkey)
+        self.address = self.listener.address
+
+        self._lock = threading.Condition()
+        self._pending = deque(sorted(self.units))
+        self._leases = {}  # unit -> (token, worker, deadline)
+        self._tokens = itertools.count(1)
+        self.attempts = Counter()
+        self.done = {}
+        self.failed = {}
+        self.retries = 0
+        self.workers = set()
+        self.selector = make_selector(options)
+        self.stats = DatasetStats()
+        self.motifs = Counter()
+
+    def _finished(self):
+        return len(self.done) + len(self.failed) == len(self.units)
+
+    def _lease(self, worker):
+        with self._lock:
+            if self._pending:
+                number = self._pending.popleft()
+                self.attempts[number] += 1
+                token = next(self._tokens)
+                self._leases[number] = (token, worker, time.monotonic() + self.lease_timeout)
+                return number, token
+            return None, None
+
+    def _release(self, number, token, reason):
+        """Put a unit back after a failed attempt, or give up on it."""
+        with self._lock:
+            lease = self._leases.get(number)
+            if lease is None or lease[0] != token or number in self.done:
+                return
+            del self._leases[number]
+            if self.attempts[number] >= self.max_attempts:
+                self.failed[number] = reason
+                self.log(f"  ✗ unit {number} ({self.units[number]['label']}) failed: {reason.splitlines()[-1]}")
+            else:
+                self.retries += 1
+                self._pending.appendleft(number)
+                self.log(f"  unit {number} back in the queue ({reason.splitlines()[-1]})")
+            self._lock.notify_all()
+
+    def _complete(self, number, state):
+        with self._lock:
+            if number in self.done:
+                return
+            self._leases.pop(number, None)
+            self.failed.pop(number, None)
+            self.selector.merge(state['selector'])
+            self.stats.merge(state['stats'])
+            self.motifs.update(state['motifs'])
+            self.done[number] = {'games': state['games'], 'puzzles': state['puzzles']}
+            self.log(f"  ✓ unit {number} ({self.units[number]['label']}): {state['games']} games, "
+                     f"{state['puzzles']} puzzles [{len(self.done)}/{len(self.units)}]")
+            self._lock.notify_all()
+
+    def _expire(self):
+        now = time.monotonic()
+        with self._lock:
+            expired = [(number, token) for number, (token, _, deadline) in self._leases.items() if deadline < now]
+        for number, token in expired:
+            self._release(number, token, 'lease timed out')
+
+    def _serve(self, conn):
+        leased = None
+        worker = None
+        try:
+            while True:
+                message = conn.recv()
+                if message[0] == 'lease':
+                    worker = message[1]
+                    with self._lock:
+                        self.workers.add(worker)
+                    number, token = self._lease(worker)
+                    if number is not None:
+                        unit = self.units[number]
+                        try:
+                            data = read_unit(unit)
+                        except OSError as e:
+                            self._release(number, token, f"cannot read {unit['path']}: {e}")
+                            conn.send(('wait', 0))
+                            continue
+                        leased = (number, token)
+                        conn.send(('unit', unit, data, self.options))
+                    else:
+                        with self._lock:
+                            finished = self._finished()
+                        conn.send(('done',) if finished else ('wait', WAIT_SECONDS))
+                        if finished:
+                            return
+                elif message[0] == 'result':
+                    self._complete(message[1], message[2])
+                    leased = None
+                    conn.send(('ok',))
+                elif message[0] == 'failed':
+                    if leased and leased[0] == message[1]:
+                        self._release(*leased, message[2])
+                    leased = None
+                    conn.send(('ok',))
+        except (EOFError, OSError):
+            if leased:
+                self._release(*leased, f"worker {worker} disconnected")
+        finally:
+            conn.close()
+
+    def _accept(self):
+        while True:
+            try:
+                conn = self.listener.accept()
+            except OSError:
+                return  # listener closed
+            except Exception as e:  # AuthenticationError and friends: drop that client only
+                self.log(f"  ✗ rejected a connection: {e}")
+                continue
+            threading.Thread(target=self._serve, args=(conn,), daemon=True).start()
+
+    def run(self):
+        """Serve until every unit is merged or has failed. Returns the summary dict."""
+        start = time.perf_counter()
+        acceptor = threading.Thread(target=self._accept, daemon=True)
+        acceptor.start()
+        while True:
+            with self._lock:
+                if self._finished():
+                    break
+                self._lock.wait(WAIT_SECONDS)
+            self._expire()
+        return {
+            'units': len(self.units),
+            'done': len(self.done),
+            'failed': {self.units[n]['label']: reason for n, reason in sorted(self.failed.items())},
+            'retries': self.retries,
+            'workers': len(self.workers),
+            'games': sum(d['games'] for d in self.done.values()),
+            'puzzles': sum(d['puzzles'] for d in self.done.values()),
+            'motifs': dict(self.motifs.most_common()),
+            'seconds': round(time.perf_counter() - start, 1),
+        }
+
+    def close(self, linger=WAIT_SECONDS):
+        """Stop listening; idle workers get `linger` seconds to hear 'done' first."""
+        time.sleep(linger)
+        self.listener.close()
+
+    def finish(self):
+        """The selected pack and its quota report (call after run())."""
+        selected = self.selector.finish()
+        return selected, self.selector.report()
+
+
+def run_worker(address, authkey, name=None, retry=DEFAULT_CONNECT_RETRY, log=print):
+    """
+    Lease, process and return units until the coordinator says done.
+    Returns the number of units processed.
+    """
+    name = name or f"{socket.gethostname()}:{os.getpid()}"
+    deadline = time.monotonic() + retry
+    while True:
+        try:
+            conn = Client(address, authkey=authkey)
+            break
+        except ConnectionRefusedError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(WAIT_SECONDS)
+
+    searches = {}
+    processed = 0
+    try:
+        while True:
+            conn.send(('lease', name))
+            reply = conn.recv()
+            if reply[0] == 'done':
+                break
+            if reply[0] == 'wait':
+                time.sleep(reply[1])
+                continue
+            _, unit, data, options = reply
+            max_nodes = options.get('max_nodes', DEFAULT_MAX_NODES)
+            search = searches.setdefault(max_nodes, MateSearch(max_nodes=max_nodes))
+            try:
+                state = process_unit(unit, data, options, search)
+            except Exception:
+                conn.send(('failed', unit['unit'], traceback.format_exc()))
+            else:
+                conn.send(('result', unit['unit'], state))
+                processed += 1
+            conn.recv()
+    except EOFError:
+        log(f"  coordinator closed the connection after {processed} units")
+    finally:
+        conn.close()
+    return processed
+
+
+def parse_address(text, default_host='127.0.0.1'):
+    host, _, port = text.rpartition(':')
+    return (host or default_host, int(port or DEFAULT_PORT))
+
+
+def _authkey():
+    key = os.environ.get(AUTHKEY_ENV)
+    return key.encode('utf-8') if key else None
+
+
+def _options(args):
+    options = {'total': args.total, 'mate_depth': args.mate_depth, 'swing': args.swing,
+               'max_nodes': args.max_nodes, 'buffer_per_cell': args.buffer}
+    for name in ('targets', 'theme_caps'):
+        if getattr(args, name):
+            with open(getattr(args, name), encoding='utf-8') as f:
+                options[name] = json.load(f)
+    return options
+
+
+def _coordinate(args, address, authkey, spawn=0):
+    units = plan_units(args.dump, args.pgn or (), args.frames_per_unit)
+    if not units:
+        print("✗ Nothing to do: give --dump and/or --pgn")
+        return 1
+    coordinator = Coordinator(units, _options(args), address, authkey, args.lease_timeout, args.attempts)
+    host, port = coordinator.address
+    print(f"{len(units)} units, listening on {host}:{port}")
+
+    workers = []
+    env = dict(os.environ, **{AUTHKEY_ENV: authkey.decode('utf-8')})
+    for _ in range(spawn):
+        workers.append(subprocess.Popen([sys.executable, os.path.abspath(__file__), 'worker',
+                                         '--connect', f"{host}:{port}"], env=env))
+    summary = coordinator.run()
+    for worker in workers:
+        worker.wait()
+    coordinator.close()
+
+    selected, report = coordinator.finish()
+    print(f"\nMerged {summary['done']} of {summary['units']} units from {summary['workers']} workers in "
+          f"{summary['seconds']}s: {summary['games']} games, {summary['puzzles']} puzzles, "
+          f"{summary['retries']} retries")
+    for label, reason in summary['failed'].items():
+        print(f"  ✗ {label}: {reason.splitlines()[-1]}")
+    print_report(report)
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    selected.sort(key=lambda p: p['rating'])
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(selected, f, indent=2, ensure_ascii=False)
+    write_report(os.path.join(os.path.dirname(args.output) or '.', 'stats.json'), {'mined': coordinator.stats})
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'build': summary, 'quota': report}, f, indent=2)
+    print(f"\n✓ Saved {len(selected)} puzzles to {args.output}")
+    return 1 if summary['failed'] else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mine and select a puzzle pack across several machines.')
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    def build_options(sub):
+        sub.add_argument('--dump', help='Lichess dump indexed with pgn_index.py build (its frames become units)')
+        sub.add_argument('--pgn', nargs='+', help='PGN shards (.pgn or .pgn.zst), one unit each')
+        sub.add_argument('--frames-per-unit', type=int, default=DEFAULT_FRAMES_PER_UNIT)
+        sub.add_argument('--total', type=int, default=10000)
+        sub.add_argument('--targets', help='quota targets JSON (see quota_selector.py)')
+        sub.add_argument('--theme-caps', help='theme caps JSON (see quota_selector.py)')
+        sub.add_argument('--buffer', type=int, default=DEFAULT_BUFFER_PER_CELL, help='candidates kept per cell')
+        sub.add_argument('--mate-depth', type=int, default=DEFAULT_MATE_DEPTH)
+        sub.add_argument('--swing', type=int, default=DEFAULT_SWING)
+        sub.add_argument('--max-nodes', type=int, default=DEFAULT_MAX_NODES)
+        sub.add_argument('--lease-timeout', type=float, default=DEFAULT_LEASE_TIMEOUT, help='seconds per unit')
+        sub.add_argument('--attempts', type=int, default=DEFAULT_ATTEMPTS, help='tries per unit')
+        sub.add_argument('--output', default=DEFAULT_OUTPUT)
+        sub.add_argument('--report', help='write the build summary and quota report as JSON')
+
+    coordinate = commands.add_parser('coordinate', help='serve work units to remote workers')
+    build_options(coordinate)
+    coordinate.add_argument('--listen', default=f"0.0.0.0:{DEFAULT_PORT}", help='host:port to listen on')
+    worker = commands.add_parser('worker', help='process units for a coordinator')
+    worker.add_argument('--connect', required=True, help='coordinator host:port')
+    worker.add_argument('--name', help='worker name in the logs (default host:pid)')
+    worker.add_argument('--retry', type=float, default=DEFAULT_CONNECT_RETRY, help='seconds to wait for the coordinator')
+    local = commands.add_parser('local', help='coordinator plus N workers on this machine')
+    build_options(local)
+    local.add_argument('--workers', type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args()
+
+    if args.command == 'worker':
+        authkey = _authkey()
+        if authkey is None:
+            print(f"✗ Set {AUTHKEY_ENV} to the coordinator's key")
+            return 1
+        processed = run_worker(parse_address(args.connect), authkey, args.name, args.retry)
+        print(f"✓ Worker finished after {processed} units")
+        return 0
+
+    print("=" * 70)
+    print("ChessMaster Distributed Build")
+    print("=" * 70)
+    if args.command == 'local':
+        return _coordinate(args, ('127.0.0.1', 0), secrets.token_hex(16).encode('ascii'), spawn=args.workers)
+    authkey = _authkey()
+    if authkey is None:
+        print(f"✗ Set {AUTHKEY_ENV} to a shared secret (workers need the same value)")
+        return 1
+    return _coordinate(args, parse_address(args.listen, '0.0.0.0'), authkey)
+
+
+if __name__ == '__main__':
+    sys.exit(main())
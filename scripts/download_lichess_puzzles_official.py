@@ -10,13 +10,19 @@ Format: CSV with fields: PuzzleId,FEN,Moves,Rating,RatingDeviation,Popularity,Nb
 
 import requests
 import csv
+import itertools
 import json
 import zstandard as zstd
 import io
-from collections import defaultdict
+
+from dataset_stats import DatasetStats, print_summary, write_report
+from puzzle_batch import PuzzleBatch
+from quota_selector import BATCH_SIZE, QuotaSelector
 
 # URL for the official Lichess puzzle database
 PUZZLE_DB_URL = "https://database.lichess.org/lichess_db_puzzle.csv.zst"
+STATS_REPORT = 'build/stats/lichess_official.json'
+OUTPUT_FIELDS = ('id', 'fen', 'moves', 'rating', 'themes', 'popularity')
 
 def download_and_decompress_puzzles(url, max_puzzles=10000):
     """
@@ -63,99 +69,65 @@ def download_and_decompress_puzzles(url, max_puzzles=10000):
     print(f"Downloaded {len(csv_lines)} lines")
     return ''.join(csv_lines)
 
-def parse_puzzles_from_csv(csv_content, target_count=10000):
+def parse_puzzles_from_csv(csv_content, target_count=10000, stats=None):
     """
     Parse puzzles from CSV content and select a diverse set.
     
+    Selection is done by QuotaSelector (quota_selector.py), which balances
+    rating bands, game phase and themes together instead of rating alone.
+    
     Args:
         csv_content: Decompressed CSV content as string
         target_count: Number of puzzles to extract (default 10,000)
+        stats: Optional {'input': DatasetStats, 'output': DatasetStats},
+               updated as rows are parsed and selected
     
     Returns:
         List of puzzle dictionaries
     """
     print(f"\nParsing CSV to extract {target_count} puzzles...")
     
-    # Define rating buckets for distribution
-    rating_buckets = {
-        'beginner': (600, 1200),      # 2000 puzzles
-        'intermediate': (1200, 1600), # 2500 puzzles
-        'advanced': (1600, 2000),     # 2500 puzzles
-        'expert': (2000, 2400),       # 2000 puzzles
-        'master': (2400, 3000),       # 1000 puzzles
-    }
-    
-    target_per_bucket = {
-        'beginner': 2000,
-        'intermediate': 2500,
-        'advanced': 2500,
-        'expert': 2000,
-        'master': 1000,
-    }
-    
-    puzzles_by_bucket = defaultdict(list)
-    
-    # Parse CSV
-    csv_file = io.StringIO(csv_content)
-    reader = csv.DictReader(csv_file)
+    selector = QuotaSelector(target_count)
+    
+    # Parse CSV straight into columnar batches; no dict per row
+    reader = csv.reader(io.StringIO(csv_content))
+    next(reader, None)  # header
     
     total_parsed = 0
-    for row in reader:
-        total_parsed += 1
-        
-        if total_parsed % 10000 == 0:
-            print(f"  Parsed {total_parsed} puzzles...")
-        
-        try:
-            rating = int(row['Rating'])
-            popularity = int(row['Popularity'])
-            nb_plays = int(row['NbPlays'])
-            
-            # Only include puzzles with good popularity and enough plays
-            if popularity < 50 or nb_plays < 50:
-                continue
-            
-            # Determine bucket
-            bucket = None
-            for bucket_name, (min_rating, max_rating) in rating_buckets.items():
-                if min_rating <= rating < max_rating:
-                    bucket = bucket_name
-                    break
-            
-            if bucket and len(puzzles_by_bucket[bucket]) < target_per_bucket[bucket]:
-                # Convert Lichess puzzle ID to numeric ID (hash it to get a number)
-                puzzle_id_hash = abs(hash(row['PuzzleId'])) % (10**9)  # Keep it under 1 billion
-                
-                puzzle = {
-                    'id': puzzle_id_hash,
-                    'fen': row['FEN'],
-                    'moves': row['Moves'],
-                    'rating': rating,
-                    'themes': row['Themes'],
-                    'popularity': popularity
-                }
-                puzzles_by_bucket[bucket].append(puzzle)
-        
-        except (ValueError, KeyError) as e:
-            continue
-        
-        # Check if we have enough puzzles
-        total_collected = sum(len(puzzles) for puzzles in puzzles_by_bucket.values())
-        if total_collected >= target_count:
+    while True:
+        rows = list(itertools.islice(reader, BATCH_SIZE))
+        if not rows:
             break
+        total_parsed += len(rows)
+        print(f"  Parsed {total_parsed} puzzles...")
+        
+        # IDs are the base62-decoded Lichess PuzzleId (stable across runs, unlike hash())
+        batch = PuzzleBatch.from_csv_rows(rows)
+        if stats:
+            for puzzle in batch:
+                stats['input'].observe(puzzle)
+        selector.offer_batch(batch)
     
     print(f"\nParsed {total_parsed} total puzzles from CSV")
     
-    # Combine all buckets
     all_puzzles = []
-    for bucket_name in ['beginner', 'intermediate', 'advanced', 'expert', 'master']:
-        bucket_puzzles = puzzles_by_bucket[bucket_name]
-        all_puzzles.extend(bucket_puzzles)
-        print(f"  {bucket_name}: {len(bucket_puzzles)} puzzles")
+    for puzzle in selector.finish():
+        if stats:
+            stats['output'].observe(puzzle)
+        all_puzzles.append({field: puzzle[field] for field in OUTPUT_FIELDS})
+    
+    report = selector.report()
+    for row in report['rows']:
+        if row['dimension'] == 'rating':
+            print(f"  {row['value']}: {row['achieved']} puzzles")
+    worst = report['worst']
+    if worst and worst['gap']:
+        print(f"  Largest quota gap: {worst['dimension']}={worst['value']} "
+              f"({worst['achieved']} of {worst['target']})")
     
     return all_puzzles
 
-def save_puzzles_json(puzzles, output_file='assets/puzzles/puzzles.json'):
+def save_puzzles_json(puzzles, output_file='assets/puzzles/puzzles.json', stats=None):
     """Save puzzles to JSON file."""
     print(f"\nSaving {len(puzzles)} puzzles to {output_file}...")
     
@@ -167,24 +139,16 @@ def save_puzzles_json(puzzles, output_file='assets/puzzles/puzzles.json'):
     
     print(f"✓ Successfully saved {len(puzzles)} verified puzzles")
     
-    # Print statistics
+    # Statistics come from sketches updated while parsing, so no extra passes
+    if stats is None:
+        stats = {'output': DatasetStats()}
+        for puzzle in puzzles:
+            stats['output'].observe(puzzle)
     print("\nPuzzle Statistics:")
-    print(f"  Total puzzles: {len(puzzles)}")
-    
-    ratings = [p['rating'] for p in puzzles]
-    print(f"  Rating range: {min(ratings)} - {max(ratings)}")
-    print(f"  Average rating: {sum(ratings) // len(ratings)}")
-    
-    # Count themes
-    theme_counts = defaultdict(int)
-    for puzzle in puzzles:
-        for theme in puzzle['themes'].split():
-            if theme:
-                theme_counts[theme] += 1
-    
-    print(f"  Unique themes: {len(theme_counts)}")
-    top_themes = sorted(theme_counts.items(), key=lambda x: x[1], reverse=True)[:10]
-    print(f"  Top themes: {', '.join(f'{t}({c})' for t, c in top_themes)}")
+    for name, profile in stats.items():
+        print_summary(name, profile)
+    write_report(STATS_REPORT, stats)
+    print(f"✓ Statistics report written to {STATS_REPORT}")
 
 def main():
     print("=" * 70)
@@ -200,10 +164,11 @@ def main():
         csv_content = download_and_decompress_puzzles(PUZZLE_DB_URL, max_puzzles=10000)
         
         # Parse and select puzzles
-        puzzles = parse_puzzles_from_csv(csv_content, target_count=10000)
+        stats = {'input': DatasetStats(), 'output': DatasetStats()}
+        puzzles = parse_puzzles_from_csv(csv_content, target_count=10000, stats=stats)
         
         # Save to JSON
-        save_puzzles_json(puzzles)
+        save_puzzles_json(puzzles, stats=stats)
         
         print("\n" + "=" * 70)
         print("✓ Puzzle download complete!")
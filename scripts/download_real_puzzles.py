@@ -4,17 +4,24 @@ Download REAL chess puzzles from Lichess database.
 This script properly parses the Lichess puzzle CSV format.
 """
 
+import argparse
 import requests
 import json
 import csv
 import io
+import itertools
+import numpy as np
 import zstandard as zstd
 from collections import defaultdict
 
+from memory_governor import MemoryGovernor, parse_size
+from puzzle_batch import DEFAULT_BATCH_SIZE, PuzzleBatch
+
 def download_lichess_puzzle_database():
     """
-    Download the Lichess puzzle database (compressed with zstandard).
-    This is a large file (~500MB compressed, ~2GB uncompressed).
+    Open the Lichess puzzle database (compressed with zstandard) as a text stream.
+    This is a large file (~500MB compressed, ~2GB uncompressed), so it is
+    decompressed while it downloads instead of being held in memory twice.
     """
     print("Downloading Lichess puzzle database...")
     print("This may take a while (file is ~500MB)...")
@@ -24,19 +31,11 @@ def download_lichess_puzzle_database():
     try:
         response = requests.get(url, stream=True, timeout=300)
         response.raise_for_status()
+        response.raw.decode_content = True
         
-        # Decompress zstandard data
-        dctx = zstd.ZstdDecompressor()
-        
-        # Read compressed data
-        compressed_data = b''
-        for chunk in response.iter_content(chunk_size=8192):
-            compressed_data += chunk
-        
-        print("Decompressing data...")
-        decompressed_data = dctx.decompress(compressed_data)
-        
-        return decompressed_data.decode('utf-8')
+        # Decompress zstandard data as it arrives
+        reader = zstd.ZstdDecompressor().stream_reader(response.raw)
+        return io.TextIOWrapper(reader, encoding='utf-8', newline='')
     
     except Exception as e:
         print(f"Error downloading database: {e}")
@@ -45,10 +44,23 @@ def download_lichess_puzzle_database():
         print("Then decompress and run: python scripts/parse_puzzles.py lichess_db_puzzle.csv")
         return None
 
-def parse_lichess_csv(csv_data, max_puzzles=10000):
+def _compact(batch, keep_per_bucket):
+    """Keep the `keep_per_bucket` most popular puzzles of each rating bucket, in input order."""
+    buckets = batch['rating'] // 200
+    order = np.lexsort((-batch['popularity'], buckets))  # stable: ties stay in input order
+    sorted_buckets = buckets[order]
+    rank = np.arange(len(order)) - np.searchsorted(sorted_buckets, sorted_buckets, side='left')
+    return batch.select(np.sort(order[rank < keep_per_bucket]))
+
+def parse_lichess_csv(csv_data, max_puzzles=10000, governor=None):
     """
     Parse Lichess puzzle CSV format.
     
+    `csv_data` is the CSV as a string or a text stream. Only the best
+    2 * max_puzzles rows per rating bucket are kept while parsing (no
+    bucket contributes more than that to the selection), so memory does
+    not grow with the dump. A MemoryGovernor, if given, sets the batch size.
+    
     CSV Format:
     PuzzleId,FEN,Moves,Rating,RatingDeviation,Popularity,NbPlays,Themes,GameUrl
     
@@ -56,66 +68,64 @@ def parse_lichess_csv(csv_data, max_puzzles=10000):
     00008,r6k/pp2r2p/4Rp1Q/3p4/8/1N1P2R1/PqP2bPP/7K b - - 0 24,e7e6 h6h7 h8g8 h7h6,1678,74,88,5140,crushing hangingPiece long middlegame,https://lichess.org/yyznGmXs/black#48
     """
     print("Parsing puzzle data...")
-    
-    puzzles = []
-    csv_reader = csv.DictReader(io.StringIO(csv_data))
-    
-    # Rating ranges for balanced selection
-    rating_buckets = defaultdict(list)
-    
-    for row in csv_reader:
-        try:
-            puzzle_id = int(row['PuzzleId'])
-            fen = row['FEN']
-            moves = row['Moves']
-            rating = int(row['Rating'])
-            themes = row['Themes']
-            popularity = int(row['Popularity'])
-            
-            # Validate puzzle
-            if not fen or not moves:
-                continue
-            
-            # Create puzzle object
-            puzzle = {
-                'id': puzzle_id,
-                'fen': fen,
-                'moves': moves,  # Space-separated UCI moves
-                'rating': rating,
-                'themes': themes.replace(' ', ','),  # Convert spaces to commas
-                'popularity': popularity
-            }
-            
-            # Add to rating bucket
-            bucket = (rating // 200) * 200  # Bucket by 200 rating intervals
-            rating_buckets[bucket].append(puzzle)
-            
-        except (KeyError, ValueError) as e:
-            continue
-    
-    print(f"Parsed {sum(len(b) for b in rating_buckets.values())} total puzzles")
-    
-    # Select puzzles evenly across rating ranges
-    target_per_bucket = max_puzzles // len(rating_buckets)
-    
-    for bucket, bucket_puzzles in sorted(rating_buckets.items()):
-        # Sort by popularity and take top puzzles
-        bucket_puzzles.sort(key=lambda p: p['popularity'], reverse=True)
-        selected = bucket_puzzles[:target_per_bucket]
-        puzzles.extend(selected)
-        print(f"  Rating {bucket}-{bucket+199}: Selected {len(selected)} puzzles")
+    governor = governor or MemoryGovernor()
+    
+    # Parse into columnar batches instead of one dict per row
+    csv_reader = csv.reader(io.StringIO(csv_data) if isinstance(csv_data, str) else csv_data)
+    next(csv_reader, None)  # header
+    parsed = PuzzleBatch.from_csv_rows([])
+    pending = []
+    total_parsed = 0
+    while True:
+        rows = list(itertools.islice(csv_reader, governor.batch_size('csv rows', DEFAULT_BATCH_SIZE)))
+        if rows:
+            pending.append(PuzzleBatch.from_csv_rows(rows))
+            total_parsed += len(pending[-1])
+        # Compact once the new rows outnumber the kept ones, so each row is copied a bounded number of times.
+        if pending and (not rows or sum(len(b) for b in pending) >= max(len(parsed), 4 * max_puzzles)):
+            parsed = _compact(PuzzleBatch.concat([parsed] + pending), 2 * max_puzzles)
+            pending = []
+        if not rows:
+            break
+    
+    print(f"Parsed {total_parsed} total puzzles")
+    if not len(parsed):
+        return []
+    
+    # Rating ranges for balanced selection, 200 rating points per bucket
+    buckets = (parsed['rating'] // 200) * 200
+    popularity = parsed['popularity']
+    bucket_values = np.unique(buckets)
+    target_per_bucket = max_puzzles // len(bucket_values)
+    
+    # Select puzzles evenly across rating ranges, most popular first
+    chosen = np.zeros(len(parsed), dtype=bool)
+    for bucket in bucket_values.tolist():
+        rows = np.flatnonzero(buckets == bucket)
+        rows = rows[np.argsort(-popularity[rows], kind='stable')][:target_per_bucket]
+        chosen[rows] = True
+        print(f"  Rating {bucket}-{bucket+199}: Selected {len(rows)} puzzles")
+    order = np.flatnonzero(chosen)
+    order = order[np.argsort(buckets[order], kind='stable')]
     
     # If we need more puzzles, add from most popular
-    if len(puzzles) < max_puzzles:
-        all_remaining = []
-        for bucket_puzzles in rating_buckets.values():
-            all_remaining.extend(bucket_puzzles)
-        
-        all_remaining.sort(key=lambda p: p['popularity'], reverse=True)
-        needed = max_puzzles - len(puzzles)
-        puzzles.extend(all_remaining[:needed])
-    
-    return puzzles[:max_puzzles]
+    if len(order) < max_puzzles:
+        remaining = np.flatnonzero(~chosen)
+        remaining = remaining[np.argsort(-popularity[remaining], kind='stable')]
+        order = np.concatenate([order, remaining[:max_puzzles - len(order)]])
+    
+    selected = parsed.select(order[:max_puzzles])
+    return [
+        {
+            'id': puzzle['id'],
+            'fen': puzzle['fen'],
+            'moves': puzzle['moves'],  # Space-separated UCI moves
+            'rating': puzzle['rating'],
+            'themes': puzzle['themes'].replace(' ', ','),  # Convert spaces to commas
+            'popularity': puzzle['popularity'],
+        }
+        for puzzle in selected.to_records()
+    ]
 
 def save_puzzles_json(puzzles, output_file='assets/puzzles/puzzles.json'):
     """Save puzzles to JSON file."""
@@ -150,6 +160,11 @@ def save_puzzles_json(puzzles, output_file='assets/puzzles/puzzles.json'):
         print(f"    - {theme}: {count}")
 
 def main():
+    parser = argparse.ArgumentParser(description='Download and select real Lichess puzzles.')
+    parser.add_argument('--max-puzzles', type=int, default=10000)
+    parser.add_argument('--max-memory', type=parse_size, help='RSS cap, e.g. 1G; parses in smaller batches near it')
+    args = parser.parse_args()
+    
     print("=" * 70)
     print("ChessMaster REAL Puzzle Downloader")
     print("=" * 70)
@@ -169,7 +184,13 @@ def main():
     csv_data = download_lichess_puzzle_database()
     
     if csv_data:
-        puzzles = parse_lichess_csv(csv_data, max_puzzles=10000)
+        governor = MemoryGovernor(args.max_memory)
+        with csv_data:
+            puzzles = parse_lichess_csv(csv_data, max_puzzles=args.max_puzzles, governor=governor)
+        if governor.enabled:
+            memory = governor.report()
+            print(f"  Peak RSS {memory['peak_rss_mb']} MB of {memory['max_memory_mb']} MB, "
+                  f"{len(memory['adaptations'])} adaptations")
         
         if puzzles:
             save_puzzles_json(puzzles)
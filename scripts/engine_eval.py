@@ -0,0 +1,466 @@
+#!/usr/bin/env python3
+"""
+Attach UCI engine evaluations to puzzles using a pool of warm engine processes.
+
+For every puzzle the engine looks at the start position (after the
+opponent's setup move, solver to move) with MultiPV 2 and we record:
+
+    engine.eval_cp      evaluation for the solver in centipawns (mates mapped
+                        to +/- MATE_CP minus the distance)
+    engine.mate         mate distance if the engine sees one, else None
+    engine.best_move    the engine's best move
+    engine.agrees       whether best_move equals the puzzle's first solver move
+    engine.margin_cp    best score minus second-best score (None if only one move)
+
+Each worker thread owns one engine subprocess that stays running for the
+whole batch: `uci`/`isready` happen once, and per position we write the
+`position` and `go` commands in a single buffered write and stream `info`
+lines until `bestmove`, with no handshake in between. A search that runs
+past its timeout is stopped and recorded as failed; an engine that ignores
+`stop` or crashes is killed and restarted, and a position lost to a crash
+is retried once.
+
+Results are cached in SQLite keyed by start FEN and search budget, so a
+re-run with the same budget never touches the engine.
+
+Usage:
+    python scripts/engine_eval.py --engine stockfish [--nodes 200000 | --depth 18 |
+        --movetime 200] [--workers 4] [--input puzzles.json] [--output out.json]
+"""
+
+import argparse
+import json
+import os
+import queue
+import sqlite3
+import subprocess
+import sys
+import threading
+import time
+
+import chess
+
+from puzzle_io import DEFAULT_PUZZLES_FILE, load_puzzles, split_moves
+
+MATE_CP = 100000
+DEFAULT_CACHE_FILE = os.path.join('build', 'puzzle_cache', 'engine_eval.sqlite')
+DEFAULT_TIMEOUT = 30.0
+HANDSHAKE_TIMEOUT = 10.0
+STOP_GRACE = 2.0
+
+
+class EngineError(Exception):
+    """The engine died or stopped responding."""
+
+
+class EngineTimeout(EngineError):
+    """A search did not finish within its timeout."""
+
+
+def search_budget(nodes=None, depth=None, movetime=None):
+    """Return the `go` arguments for a budget, e.g. 'nodes 200000'."""
+    if nodes:
+        return f'nodes {nodes}'
+    if depth:
+        return f'depth {depth}'
+    if movetime:
+        return f'movetime {movetime}'
+    return 'depth 12'
+
+
+def score_to_cp(kind, value):
+    """Map a UCI `score cp|mate` pair onto one centipawn scale."""
+    if kind == 'mate':
+        return MATE_CP - abs(value) if value > 0 else -MATE_CP + abs(value)
+    return value
+
+
+def parse_info(line):
+    """
+    Parse the parts of an `info` line we care about.
+
+    Returns (multipv, score_kind, score_value, first_pv_move) or None when
+    the line carries no score.
+    """
+    tokens = line.split()
+    multipv = 1
+    kind = value = None
+    pv_move = None
+    i = 1
+    while i < len(tokens):
+        token = tokens[i]
+        if token == 'multipv':
+            multipv = int(tokens[i + 1])
+            i += 2
+        elif token == 'score':
+            kind = tokens[i + 1]
+            value = int(tokens[i + 2])
+            i += 3
+        elif token == 'pv':
+            pv_move = tokens[i + 1] if i + 1 < len(tokens) else None
+            break
+        else:
+            i += 1
+    if kind is None:
+        return None
+    return multipv, kind, value, pv_move
+
+
+class UciEngine:
+    """One long-lived UCI engine subprocess."""
+
+    def __init__(self, command, options=None):
+        self.command = command if isinstance(command, list) else [command]
+        self.options = dict(options or {})
+        self.options.setdefault('MultiPV', 2)
+        self.process = None
+        self._lines = None
+        self.restarts = 0
+
+    def start(self):
+        self.process = subprocess.Popen(
+            self.command,
+            stdin=subprocess.PIPE,
+            stdout=subprocess.PIPE,
+            stderr=subprocess.DEVNULL,
+            text=True,
+            bufsize=1,
+        )
+        self._lines = queue.Queue()
+        reader = threading.Thread(target=self._read_stdout, args=(self.process, self._lines), daemon=True)
+        reader.start()
+
+        self._send('uci')
+        self._wait_for('uciok', HANDSHAKE_TIMEOUT)
+        for name, value in self.options.items():
+            self._send(f'setoption name {name} value {value}')
+        self._send('isready')
+        self._wait_for('readyok', HANDSHAKE_TIMEOUT)
+
+    @staticmethod
+    def _read_stdout(process, lines):
+        for line in process.stdout:
+            lines.put(line.strip())
+        lines.put(None)
+
+    def _send(self, text):
+        try:
+            self.process.stdin.write(text + '\n')
+            self.process.stdin.flush()
+        except (BrokenPipeError, OSError) as e:
+            raise EngineError(f'engine pipe closed: {e}')
+
+    def _readline(self, deadline):
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise EngineTimeout()
+        try:
+            line = self._lines.get(timeout=remaining)
+        except queue.Empty:
+            raise EngineTimeout()
+        if line is None:
+            raise EngineError('engine exited')
+        return line
+
+    def _wait_for(self, token, timeout):
+        deadline = time.monotonic() + timeout
+        while True:
+            if self._readline(deadline).startswith(token):
+                return
+
+    def close(self):
+        if self.process is None:
+            return
+        try:
+            self._send('quit')
+            self.process.wait(timeout=STOP_GRACE)
+        except (EngineError, subprocess.TimeoutExpired):
+            self.process.kill()
+            self.process.wait()
+        self.process = None
+
+    def restart(self):
+        if self.process is not None:
+            self.process.kill()
+            self.process.wait()
+            self.process = None
+        self.restarts += 1
+        self.start()
+
+    def analyse(self, fen, budget, timeout=DEFAULT_TIMEOUT):
+        """
+        Search `fen` with the given `go` budget.
+
+        Returns {'best_move', 'lines': [(kind, value, first_move), ...]} with
+        one entry per MultiPV line, best first.
+        Raises EngineTimeout if the search had to be stopped.
+        """
+        # position + go in a single write: no isready round-trip per position.
+        self._send(f'position fen {fen}\ngo {budget}')
+
+        lines = {}
+        deadline = time.monotonic() + timeout
+        try:
+            while True:
+                line = self._readline(deadline)
+                if line.startswith('info'):
+                    parsed = parse_info(line)
+                    if parsed:
+                        multipv, kind, value, move = parsed
+                        lines[multipv] = (kind, value, move)
+                elif line.startswith('bestmove'):
+                    parts = line.split()
+                    best = parts[1] if len(parts) > 1 else None
+                    return {'best_move': best, 'lines': [lines[k] for k in sorted(lines)]}
+        except EngineTimeout:
+            # Ask politely; an engine that ignores `stop` is replaced.
+            self._send('stop')
+            try:
+                self._wait_for('bestmove', STOP_GRACE)
+            except EngineTimeout:
+                self.restart()
+            raise
+
+
+def start_position(puzzle):
+    """FEN after the setup move and the expected first solver move."""
+    board = chess.Board(puzzle['fen'])
+    moves = split_moves(puzzle['moves'])
+    if moves:
+        board.push_uci(moves[0])
+    expected = moves[1] if len(moves) > 1 else None
+    return board.fen(), expected
+
+
+def summarize_analysis(analysis, expected_move):
+    """Turn raw engine output into the fields stored on the puzzle."""
+    lines = analysis['lines']
+    best = lines[0] if lines else None
+    second = lines[1] if len(lines) > 1 else None
+    if best is None:
+        return {
+            'eval_cp': None, 'mate': None, 'best_move': analysis['best_move'],
+            'agrees': analysis['best_move'] == expected_move, 'margin_cp': None,
+        }
+
+    best_cp = score_to_cp(best[0], best[1])
+    margin = None
+    if second is not None:
+        margin = best_cp - score_to_cp(second[0], second[1])
+
+    return {
+        'eval_cp': best_cp,
+        'mate': best[1] if best[0] == 'mate' else None,
+        'best_move': analysis['best_move'],
+        'agrees': analysis['best_move'] == expected_move,
+        'margin_cp': margin,
+    }
+
+
+class EvalCache:
+    """Persistent (FEN, budget) -> evaluation cache."""
+
+    def __init__(self, path):
+        self.path = path
+        if path != ':memory:':
+            os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._lock = threading.Lock()
+        self._conn.execute(
+            'CREATE TABLE IF NOT EXISTS evals ('
+            ' fen TEXT NOT NULL, budget TEXT NOT NULL, result TEXT NOT NULL,'
+            ' PRIMARY KEY (fen, budget))'
+        )
+        self._conn.commit()
+
+    def get(self, fen, budget):
+        with self._lock:
+            row = self._conn.execute(
+                'SELECT result FROM evals WHERE fen = ? AND budget = ?', (fen, budget)
+            ).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def put(self, fen, budget, analysis):
+        with self._lock:
+            self._conn.execute(
+                'INSERT OR REPLACE INTO evals (fen, budget, result) VALUES (?, ?, ?)',
+                (fen, budget, json.dumps(analysis)),
+            )
+
+    def commit(self):
+        with self._lock:
+            self._conn.commit()
+
+    def close(self):
+        self.commit()
+        self._conn.close()
+
+
+def _engine_worker(engine_factory, tasks, results, budget, timeout):
+    engine = engine_factory()
+    start_error = None
+    try:
+        engine.start()
+    except (OSError, EngineError) as e:
+        engine, start_error = None, str(e)
+
+    try:
+        while True:
+            task = tasks.get()
+            if task is None:
+                return
+            index, fen = task
+            if engine is None:
+                results.put((index, None, f'engine failed to start: {start_error}'))
+                continue
+
+            analysis = None
+            error = None
+            try:
+                # A crashed engine is restarted and the position retried once;
+                # a timeout is not retried with the same budget.
+                for attempt in range(2):
+                    try:
+                        analysis = engine.analyse(fen, budget, timeout=timeout)
+                        break
+                    except EngineTimeout:
+                        error = f'timeout after {timeout}s'
+                        break
+                    except EngineError as e:
+                        error = str(e)
+                        try:
+                            engine.restart()
+                        except (OSError, EngineError) as e:
+                            error = f'restart failed: {e}'
+                            break
+            except Exception as e:
+                # Anything else (e.g. OSError from the restart after a timeout)
+                # must still post a result, or evaluate_puzzles waits forever.
+                analysis, error = None, repr(e)
+            results.put((index, analysis, error))
+    finally:
+        if engine is not None:
+            engine.close()
+
+
+def evaluate_puzzles(puzzles, engine_command, workers=2, budget='depth 12',
+                     timeout=DEFAULT_TIMEOUT, cache=None, options=None):
+    """
+    Evaluate every puzzle's start position and attach an 'engine' dict.
+
+    Positions already in `cache` for this budget are not sent to the engine.
+    Returns (puzzles, stats) where stats counts cache hits, engine searches
+    and failures.
+    """
+    stats = {'cached': 0, 'searched': 0, 'failed': 0}
+    pending = []
+    starts = []
+    for index, puzzle in enumerate(puzzles):
+        try:
+            fen, expected = start_position(puzzle)
+        except ValueError as e:  # bad FEN or illegal setup move: skip just this puzzle
+            puzzle['engine'] = {'error': f'bad start position: {e}'}
+            stats['failed'] += 1
+            starts.append((None, None))
+            continue
+        starts.append((fen, expected))
+        cached = cache.get(fen, budget) if cache else None
+        if cached is not None:
+            puzzle['engine'] = summarize_analysis(cached, expected)
+            stats['cached'] += 1
+        else:
+            pending.append((index, fen))
+
+    if pending:
+        tasks = queue.Queue()
+        results = queue.Queue()
+        for task in pending:
+            tasks.put(task)
+        worker_count = max(1, min(workers, len(pending)))
+        for _ in range(worker_count):
+            tasks.put(None)
+
+        factory = lambda: UciEngine(engine_command, options)  # noqa: E731
+        threads = [
+            threading.Thread(target=_engine_worker, args=(factory, tasks, results, budget, timeout), daemon=True)
+            for _ in range(worker_count)
+        ]
+        for thread in threads:
+            thread.start()
+
+        for done in range(1, len(pending) + 1):
+            index, analysis, error = results.get()
+            fen, expected = starts[index]
+            if analysis is None:
+                puzzles[index]['engine'] = {'error': error}
+                stats['failed'] += 1
+            else:
+                puzzles[index]['engine'] = summarize_analysis(analysis, expected)
+                stats['searched'] += 1
+                if cache:
+                    cache.put(fen, budget, analysis)
+            if done % 500 == 0:
+                print(f"  Evaluated {done}/{len(pending)} positions...")
+                if cache:
+                    cache.commit()
+
+        for thread in threads:
+            thread.join()
+        if cache:
+            cache.commit()
+
+    return puzzles, stats
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Attach UCI engine evaluations to puzzles.')
+    parser.add_argument('--engine', default='stockfish', help='path to a UCI engine binary')
+    parser.add_argument('--input', default=DEFAULT_PUZZLES_FILE)
+    parser.add_argument('--output', help='output JSON (default: overwrite --input)')
+    parser.add_argument('--workers', type=int, default=max((os.cpu_count() or 2) // 2, 1))
+    budget = parser.add_mutually_exclusive_group()
+    budget.add_argument('--nodes', type=int, help='node budget per position')
+    budget.add_argument('--depth', type=int, help='depth per position')
+    budget.add_argument('--movetime', type=int, help='milliseconds per position')
+    parser.add_argument('--timeout', type=float, default=DEFAULT_TIMEOUT, help='seconds before a search is abandoned')
+    parser.add_argument('--hash', type=int, default=64, help='engine hash size in MB')
+    parser.add_argument('--cache', default=DEFAULT_CACHE_FILE, help='SQLite result cache')
+    parser.add_argument('--no-cache', action='store_true')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Puzzle Engine Evaluation")
+    print("=" * 70)
+
+    puzzles = load_puzzles(args.input)
+    go = search_budget(args.nodes, args.depth, args.movetime)
+    cache = None if args.no_cache else EvalCache(args.cache)
+    print(f"Evaluating {len(puzzles)} puzzles with '{args.engine}' ({go}, {args.workers} workers)")
+
+    start = time.perf_counter()
+    try:
+        puzzles, stats = evaluate_puzzles(
+            puzzles, args.engine, workers=args.workers, budget=go,
+            timeout=args.timeout, cache=cache, options={'Hash': args.hash, 'Threads': 1},
+        )
+    finally:
+        if cache:
+            cache.close()
+    elapsed = time.perf_counter() - start
+
+    evaluated = [p['engine'] for p in puzzles if 'error' not in p.get('engine', {})]
+    agree = sum(1 for e in evaluated if e['agrees'])
+    print(f"\n✓ {stats['searched']} searched, {stats['cached']} from cache, "
+          f"{stats['failed']} failed in {elapsed:.1f}s")
+    if evaluated:
+        print(f"  Best-move agreement: {agree}/{len(evaluated)} ({100 * agree / len(evaluated):.1f}%)")
+
+    output = args.output or args.input
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(puzzles, f, indent=2, ensure_ascii=False)
+    print(f"✓ Saved {len(puzzles)} puzzles to {output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
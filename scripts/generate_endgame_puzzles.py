@@ -0,0 +1,507 @@
+#!/usr/bin/env python3
+"""
+Generate verified endgame puzzles from retrograde-analysed tables.
+
+generate_puzzles.generate_rating_variations copies ~70 base positions with
+jittered ratings, and its endgame lines (e.g. 8/8/8/4k3/8/8/4K3/4R3 with a
+made-up move list) are not solutions. This script solves small material
+sets exactly and cuts puzzles from the result:
+
+    KQK, KRK    queen / rook mates
+    KPK         wins through promotion (uses the KQK and KRK tables)
+    KBNK        bishop and knight mate (16.7M positions, a few minutes)
+
+Each table is a pair of int16 arrays over every placement of the pieces,
+index = sum(square_i * 64**(n-1-i)) for pieces [K, extra..., k]:
+
+    w[idx]  plies to mate with white to move (odd), -1 draw/illegal
+    b[idx]  plies until black is mated with black to move (even), -1 otherwise
+
+The build is frontier based and vectorised with NumPy: starting from the
+mates, positions lost for black in p plies un-move white pieces to find
+wins in p+1, and each new white win decrements a counter of black's
+remaining non-losing king moves; a counter reaching zero is a loss in p+2.
+The lone king capturing an undefended piece is always a draw here.
+
+Puzzles are white-to-move positions whose whole line is forced: every
+white move is the unique fastest mate and black always takes the longest
+defence. The setup move is a black king move into the position. Ratings
+grow with the distance to mate. Tables are cached in build/endgame/.
+
+Usage:
+    python scripts/generate_endgame_puzzles.py [--tables KQK,KRK,KPK,KBNK]
+        [--per-depth 20] [--max-moves 10] [--output build/endgame_puzzles.json]
+"""
+
+import argparse
+import json
+import os
+import random
+import sys
+import time
+
+import chess
+import numpy as np
+
+from motif_detector import run_detection
+from puzzle_io import length_theme, line_id
+
+TABLE_DIR = 'build/endgame'
+DEFAULT_OUTPUT = 'build/endgame_puzzles.json'
+DEFAULT_TABLES = ['KQK', 'KRK', 'KPK', 'KBNK']
+DEFAULT_PER_DEPTH = 20
+DEFAULT_MAX_MOVES = 10
+
+# White's extra pieces per table, in index order.
+PIECE_SETS = {'KQK': 'Q', 'KRK': 'R', 'KPK': 'P', 'KBNK': 'BN'}
+PROMOTION_TABLES = {'KPK': (('Q', 'KQK'), ('R', 'KRK'))}
+MATERIAL_THEMES = {'KQK': ['queenEndgame'], 'KRK': ['rookEndgame'], 'KPK': ['pawnEndgame'], 'KBNK': []}
+# Difficulty: base rating per table plus a step per move to mate.
+RATING_BASE = {'KQK': 700, 'KRK': 900, 'KPK': 1100, 'KBNK': 1700}
+RATING_PER_MOVE = 60
+MAX_RATING = 3000
+
+_PIECE_TYPES = {'K': chess.KING, 'Q': chess.QUEEN, 'R': chess.ROOK, 'B': chess.BISHOP,
+                'N': chess.KNIGHT, 'P': chess.PAWN}
+
+_SQUARES = np.arange(64)
+_BIT = np.left_shift(np.uint64(1), _SQUARES.astype(np.uint64))
+_FILE = _SQUARES % 8
+_RANK = _SQUARES // 8
+
+
+def _pair_table(bitboards):
+    return np.array([[bool(bitboards[a] & chess.BB_SQUARES[b]) for b in range(64)] for a in range(64)])
+
+
+_KING = _pair_table(chess.BB_KING_ATTACKS)
+_KNIGHT = _pair_table(chess.BB_KNIGHT_ATTACKS)
+_PAWN = _pair_table(chess.BB_PAWN_ATTACKS[chess.WHITE])
+_BETWEEN = np.array([[chess.between(a, b) for b in range(64)] for a in range(64)], dtype=np.uint64)
+_SAME_LINE = ((_FILE[:, None] == _FILE[None, :]) | (_RANK[:, None] == _RANK[None, :])) & \
+    (_SQUARES[:, None] != _SQUARES[None, :])
+_SAME_DIAGONAL = (np.abs(_FILE[:, None] - _FILE[None, :]) == np.abs(_RANK[:, None] - _RANK[None, :])) & \
+    (_SQUARES[:, None] != _SQUARES[None, :])
+_LINES = {'R': _SAME_LINE, 'B': _SAME_DIAGONAL, 'Q': _SAME_LINE | _SAME_DIAGONAL}
+
+_KING_DIRS = [(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)]
+_KNIGHT_DIRS = [(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)]
+_SLIDER_DIRS = {'R': _KING_DIRS[0::2], 'B': _KING_DIRS[1::2], 'Q': _KING_DIRS}
+
+
+def _step_table(dirs):
+    """_step[d][sq] = square one step in direction d from sq, or -1 off the board."""
+    table = np.full((len(dirs), 64), -1, dtype=np.int64)
+    for d, (df, dr) in enumerate(dirs):
+        for sq in range(64):
+            f, r = sq % 8 + df, sq // 8 + dr
+            if 0 <= f < 8 and 0 <= r < 8:
+                table[d, sq] = r * 8 + f
+    return table
+
+
+_KING_STEP = _step_table(_KING_DIRS)
+_KNIGHT_STEP = _step_table(_KNIGHT_DIRS)
+
+
+def _attacks(kind, frm, to, occupied):
+    """Vectorised: does a white `kind` on `frm` attack `to` given `occupied`?"""
+    if kind == 'K':
+        return _KING[frm, to]
+    if kind == 'N':
+        return _KNIGHT[frm, to]
+    if kind == 'P':
+        return _PAWN[frm, to]
+    return _LINES[kind][frm, to] & ((_BETWEEN[frm, to] & occupied) == 0)
+
+
+def _empty(occupied, squares):
+    """Vectorised: is each of `squares` (-1 = off board) on the board and empty?"""
+    on_board = squares >= 0
+    return on_board & ((occupied & _BIT[np.where(on_board, squares, 0)]) == 0)
+
+
+class EndgameTable:
+    """Solved table for one material set; see the module docstring for the layout."""
+
+    def __init__(self, name, w, b):
+        self.name = name
+        self.pieces = 'K' + PIECE_SETS[name] + 'k'
+        self.strides = [64 ** (len(self.pieces) - 1 - i) for i in range(len(self.pieces))]
+        self.w = w
+        self.b = b
+
+    def index(self, board):
+        squares = [board.king(chess.WHITE)]
+        for symbol in PIECE_SETS[self.name]:
+            squares.append(next(iter(board.pieces(_PIECE_TYPES[symbol], chess.WHITE))))
+        squares.append(board.king(chess.BLACK))
+        return sum(sq * stride for sq, stride in zip(squares, self.strides))
+
+    def board(self, idx, white_to_move=True):
+        board = chess.Board(None)
+        for symbol, stride in zip(self.pieces, self.strides):
+            color = chess.BLACK if symbol == 'k' else chess.WHITE
+            board.set_piece_at(idx // stride % 64, chess.Piece(_PIECE_TYPES[symbol.upper()], color))
+        board.turn = chess.WHITE if white_to_move else chess.BLACK
+        return board
+
+    def probe(self, board):
+        """Plies to mate for the side to move (white wins, black loses), or None."""
+        value = (self.w if board.turn == chess.WHITE else self.b)[self.index(board)]
+        return int(value) if value >= 0 else None
+
+    def save(self, directory=TABLE_DIR):
+        os.makedirs(directory, exist_ok=True)
+        np.savez_compressed(os.path.join(directory, f'{self.name}.npz'), w=self.w, b=self.b)
+
+    @classmethod
+    def load(cls, name, directory=TABLE_DIR):
+        path = os.path.join(directory, f'{name}.npz')
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            return cls(name, data['w'], data['b'])
+
+
+def signature(board):
+    """Table name for a board with a lone black king, e.g. 'KBNK', or None."""
+    if board.occupied_co[chess.BLACK] != board.kings & board.occupied_co[chess.BLACK]:
+        return None
+    white = ''.join(chess.piece_symbol(piece_type).upper() * len(board.pieces(piece_type, chess.WHITE))
+                    for piece_type in (chess.QUEEN, chess.ROOK, chess.BISHOP, chess.KNIGHT, chess.PAWN))
+    name = 'K' + white + 'K'
+    return name if name in PIECE_SETS else None
+
+
+def build_table(name, tables=None, log=None):
+    """Solve one material set. `tables` must hold the promotion targets for KPK."""
+    pieces = 'K' + PIECE_SETS[name] + 'k'
+    n = len(pieces)
+    size = 64 ** n
+    strides = [64 ** (n - 1 - i) for i in range(n)]
+    bk = n - 1
+
+    idx = np.arange(size, dtype=np.int64)
+    sq = [(idx // stride % 64).astype(np.int16) for stride in strides]
+    white_occ = np.zeros(size, dtype=np.uint64)
+    for i in range(bk):
+        white_occ |= _BIT[sq[i]]
+
+    valid = ~_KING[sq[0], sq[bk]]
+    for i in range(n):
+        for j in range(i + 1, n):
+            valid &= sq[i] != sq[j]
+        if pieces[i] == 'P':
+            valid &= (sq[i] >= 8) & (sq[i] < 56)
+
+    check = np.zeros(size, dtype=bool)
+    for i in range(bk):
+        check |= _attacks(pieces[i], sq[i], sq[bk], white_occ)
+    valid_w = valid & ~check
+
+    # Black's non-capturing king moves that do not walk into check, and
+    # whether it can take an undefended piece instead (a draw here).
+    moves = np.zeros(size, dtype=np.int16)
+    escape = np.zeros(size, dtype=bool)
+    for d in range(8):
+        dest = _KING_STEP[d][sq[bk]]
+        child = idx + (np.where(dest >= 0, dest, sq[bk]) - sq[bk]) * strides[bk]
+        quiet = _empty(white_occ, dest) & valid_w[child]
+        moves += quiet
+        for i in range(1, bk):
+            hit = valid & (dest == sq[i])
+            if not hit.any():
+                continue
+            rows = np.flatnonzero(hit)
+            occ = white_occ[rows] & ~_BIT[sq[i][rows]]
+            defended = np.zeros(len(rows), dtype=bool)
+            for j in range(bk):
+                if j != i:
+                    defended |= _attacks(pieces[j], sq[j][rows], sq[i][rows], occ)
+            escape[rows[~defended]] = True
+    del white_occ, idx, child
+
+    w = np.full(size, -1, dtype=np.int16)
+    b = np.full(size, -1, dtype=np.int16)
+    b[valid & check & (moves == 0) & ~escape] = 0
+    moves[~valid | escape] = -1
+
+    promotions = _promotion_values(name, pieces, sq, valid_w, strides, tables or {})
+
+    ply = 0
+    while True:
+        lost = np.flatnonzero(b == ply)
+        won = _white_unmoves(pieces, sq, lost, strides, valid_w, w)
+        if promotions is not None:
+            won = np.union1d(won, np.flatnonzero((promotions == ply + 1) & (w < 0) & valid_w))
+        w[won] = ply + 1
+
+        preds = _black_unmoves(sq, won, strides[bk], bk, valid)
+        preds = preds[moves[preds] > 0]
+        np.subtract.at(moves, preds, 1)
+        newly_lost = np.unique(preds[moves[preds] == 0])
+        newly_lost = newly_lost[b[newly_lost] < 0]
+        b[newly_lost] = ply + 2
+
+        if log:
+            log(f"  {name} ply {ply + 1:>3}: {len(won):>8} wins, {len(newly_lost):>8} losses")
+        pending = promotions is not None and ((promotions > ply + 1) & (promotions < np.iinfo(np.int16).max)).any()
+        if not len(won) and not len(newly_lost) and not pending:
+            break
+        ply += 2
+    return EndgameTable(name, w, b)
+
+
+def _white_unmoves(pieces, sq, lost, strides, valid_w, w):
+    """White-to-move predecessors (undecided, legal) of the black-to-move positions `lost`."""
+    if not len(lost):
+        return lost
+    bk = len(pieces) - 1
+    squares = [s[lost] for s in sq]
+    occ = np.zeros(len(lost), dtype=np.uint64)
+    for s in squares:
+        occ |= _BIT[s]
+
+    found = []
+    for i in range(bk):
+        kind, to = pieces[i], squares[i]
+        others = occ & ~_BIT[to]
+        origins = []
+        if kind in 'KN':
+            step = _KING_STEP if kind == 'K' else _KNIGHT_STEP
+            origins = [(step[d][to], None) for d in range(8)]
+        elif kind == 'P':
+            rank = to // 8
+            origins = [(np.where(rank >= 2, to - 8, -1), None),
+                       (np.where(rank == 3, to - 16, -1), to - 8)]
+        else:
+            for d in range(len(_KING_DIRS)):
+                if _KING_DIRS[d] not in _SLIDER_DIRS[kind]:
+                    continue
+                cur = to
+                alive = np.ones(len(lost), dtype=bool)
+                for _ in range(7):
+                    cur = np.where(alive, _KING_STEP[d][np.where(cur >= 0, cur, 0)], -1)
+                    alive &= _empty(others, cur)
+                    if not alive.any():
+                        break
+                    origins.append((np.where(alive, cur, -1), None))
+        for origin, through in origins:
+            ok = _empty(others, origin)
+            if through is not None:
+                ok &= _empty(others, through)
+            rows = np.flatnonzero(ok)
+            pred = lost[rows] + (origin[rows].astype(np.int64) - to[rows]) * strides[i]
+            found.append(pred[valid_w[pred] & (w[pred] < 0)])
+    return np.unique(np.concatenate(found)) if found else lost[:0]
+
+
+def _black_unmoves(sq, won, stride, bk, valid):
+    """Black-to-move predecessors of the white-to-move positions `won` (one per king move)."""
+    if not len(won):
+        return won
+    king = sq[bk][won]
+    occ = np.zeros(len(won), dtype=np.uint64)
+    for i in range(bk):
+        occ |= _BIT[sq[i][won]]
+    preds = []
+    for d in range(8):
+        origin = _KING_STEP[d][king]
+        rows = np.flatnonzero(_empty(occ, origin))
+        pred = won[rows] + (origin[rows].astype(np.int64) - king[rows]) * stride
+        preds.append(pred[valid[pred]])
+    return np.concatenate(preds)
+
+
+def _promotion_values(name, pieces, sq, valid_w, strides, tables):
+    """Plies to mate via an immediate promotion for each KPK position, else int16 max."""
+    if name not in PROMOTION_TABLES:
+        return None
+    best = np.full(len(valid_w), np.iinfo(np.int16).max, dtype=np.int16)
+    pawn = pieces.index('P')
+    to = sq[pawn] + 8
+    occupied = (to == sq[0]) | (to == sq[-1])
+    rows = np.flatnonzero(valid_w & (sq[pawn] >= 48) & ~occupied)
+    for _, target in PROMOTION_TABLES[name]:
+        table = tables[target]
+        child = (sq[0][rows].astype(np.int64) * table.strides[0] + to[rows].astype(np.int64) * table.strides[1] +
+                 sq[-1][rows])
+        value = table.b[child].astype(np.int32) + 1
+        better = (table.b[child] >= 0) & (value < best[rows])
+        best[rows[better]] = value[better]
+    return best
+
+
+def load_or_build(names, directory=TABLE_DIR, log=print):
+    """Return {name: EndgameTable} for `names` plus their promotion targets."""
+    wanted = []
+    for name in names:
+        for _, target in PROMOTION_TABLES.get(name, ()):
+            if target not in wanted:
+                wanted.append(target)
+        if name not in wanted:
+            wanted.append(name)
+
+    tables = {}
+    for name in wanted:
+        table = EndgameTable.load(name, directory)
+        if table is None:
+            start = time.perf_counter()
+            table = build_table(name, tables)
+            table.save(directory)
+            log(f"✓ Built {name} in {time.perf_counter() - start:.1f}s")
+        tables[name] = table
+    return tables
+
+
+def probe_position(board, tables):
+    """Plies to mate for the side to move, 0 if it is mated, None if not a forced mate."""
+    if board.is_checkmate():
+        return 0
+    name = signature(board)
+    if name not in tables:
+        return None
+    return tables[name].probe(board)
+
+
+def forced_line(board, tables):
+    """
+    The mating line from a won white-to-move position, or None if some
+    white move on it is not the unique fastest mate.
+    """
+    board = board.copy(stack=False)
+    line = []
+    while not board.is_checkmate():
+        if board.turn == chess.WHITE:
+            best, best_value, ties = None, None, 0
+            for move in board.legal_moves:
+                board.push(move)
+                value = probe_position(board, tables)
+                board.pop()
+                if value is None:
+                    continue
+                if best_value is None or value < best_value:
+                    best, best_value, ties = move, value, 1
+                elif value == best_value:
+                    ties += 1
+            if best is None or ties > 1:
+                return None
+        else:
+            best, best_value = None, -1
+            for move in sorted(board.legal_moves, key=lambda m: m.uci()):
+                board.push(move)
+                value = probe_position(board, tables)
+                board.pop()
+                if value is None:
+                    return None
+                if value > best_value:
+                    best, best_value = move, value
+        line.append(best)
+        board.push(best)
+    return line
+
+
+def _setup_move(board, rng):
+    """A legal black king move into `board`, as (position before it, move), or None."""
+    king = board.king(chess.BLACK)
+    origins = list(chess.scan_forward(chess.BB_KING_ATTACKS[king] & ~board.occupied))
+    rng.shuffle(origins)
+    for origin in origins:
+        before = board.copy(stack=False)
+        before.remove_piece_at(king)
+        before.set_piece_at(origin, chess.Piece(chess.KING, chess.BLACK))
+        before.turn = chess.BLACK
+        move = chess.Move(origin, king)
+        if before.is_valid() and move in before.legal_moves:
+            return before, move
+    return None
+
+
+def make_puzzle(name, before, setup, line):
+    mate_in = (len(line) + 1) // 2
+    moves = ' '.join(move.uci() for move in [setup] + line)
+    themes = ['endgame', 'mate'] + MATERIAL_THEMES[name]
+    if mate_in <= 5:
+        themes.append(f'mateIn{mate_in}')
+    if any(move.promotion for move in line):
+        themes.append('promotion')
+    themes.append(length_theme(mate_in))
+    fen = before.fen()
+    return {
+        'id': line_id(fen, moves),
+        'fen': fen,
+        'moves': moves,
+        'rating': min(MAX_RATING, RATING_BASE[name] + RATING_PER_MOVE * mate_in),
+        'themes': ' '.join(themes),
+        'popularity': 0,
+        'source': f'endgame:{name}',
+    }
+
+
+def generate_puzzles(name, tables, per_depth=DEFAULT_PER_DEPTH, max_moves=DEFAULT_MAX_MOVES, seed=1,
+                     attempts=50):
+    """Up to `per_depth` forced-line puzzles for each mate-in-1..max_moves."""
+    table = tables[name]
+    rng = random.Random(seed)
+    np_rng = np.random.default_rng(seed)
+    puzzles = []
+    for mate_in in range(1, max_moves + 1):
+        candidates = np.flatnonzero(table.w == 2 * mate_in - 1)
+        if not len(candidates):
+            continue
+        sample = np_rng.choice(candidates, min(len(candidates), per_depth * attempts), replace=False)
+        found = 0
+        for idx in sample:
+            board = table.board(int(idx))
+            line = forced_line(board, tables)
+            setup = _setup_move(board, rng) if line else None
+            if setup is None:
+                continue
+            puzzles.append(make_puzzle(name, setup[0], setup[1], line))
+            found += 1
+            if found == per_depth:
+                break
+    return puzzles
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate endgame puzzles from retrograde-analysed tables.')
+    parser.add_argument('--tables', default=','.join(DEFAULT_TABLES), help='comma-separated material sets')
+    parser.add_argument('--per-depth', type=int, default=DEFAULT_PER_DEPTH, help='puzzles per table and mate depth')
+    parser.add_argument('--max-moves', type=int, default=DEFAULT_MAX_MOVES, help='longest mate to emit')
+    parser.add_argument('--table-dir', default=TABLE_DIR, help='where solved tables are cached')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--seed', type=int, default=1)
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Endgame Puzzle Generator")
+    print("=" * 70)
+
+    names = [name.strip().upper() for name in args.tables.split(',') if name.strip()]
+    unknown = [name for name in names if name not in PIECE_SETS]
+    if unknown:
+        print(f"✗ Unknown material set(s): {', '.join(unknown)} (known: {', '.join(PIECE_SETS)})")
+        return 1
+
+    tables = load_or_build(names, args.table_dir)
+    puzzles = []
+    for name in names:
+        table = tables[name]
+        longest = (int(table.w.max()) + 1) // 2
+        found = generate_puzzles(name, tables, args.per_depth, args.max_moves, args.seed)
+        print(f"  {name}: {int((table.w > 0).sum())} won positions, longest mate {longest}, "
+              f"{len(found)} puzzles")
+        puzzles.extend(found)
+    puzzles, _ = run_detection(puzzles, fill=True)
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(puzzles, f, indent=2)
+    print(f"\n✓ Saved {len(puzzles)} puzzles to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
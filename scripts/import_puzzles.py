@@ -5,6 +5,8 @@ import sys
 import random
 import os
 
+from opening_index import build_trie, save_index
+
 try:
     import requests
     import zstandard as zstd
@@ -14,6 +16,7 @@ except ImportError:
 
 # Configuration
 OUTPUT_FILE = 'assets/puzzles/puzzles.json'
+OPENINGS_FILE = 'assets/puzzles/openings.json'
 TARGET_TOTAL_COUNT = 5500 # Aim for a bit more than 5000
 MIN_POPULARITY = 80
 MAX_RATING_DEVIATION = 100
@@ -111,7 +114,8 @@ def download_and_process_puzzles(existing_puzzles):
             "rating": rating,
             "themes": themes,
             "popularity": popularity,
-            "lichess_id": puzzle_id_str # Store original ID for reference
+            "lichess_id": puzzle_id_str, # Store original ID for reference
+            "opening_tags": row[9] if len(row) > 9 else ''
         }
 
         new_puzzles.append(puzzle)
@@ -135,5 +139,10 @@ def save_puzzles(puzzles):
 
     print(f"Saved total {len(puzzles)} puzzles to {OUTPUT_FILE}")
 
+    # Opening family -> variation index over the same puzzles
+    trie, tagged = build_trie(puzzles)
+    save_index(trie, OPENINGS_FILE)
+    print(f"Indexed {tagged} puzzles by opening in {OPENINGS_FILE}")
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,196 @@
+#!/usr/bin/env python3
+"""
+Keep a pipeline run under a resident-memory cap.
+
+Full-dump builds OOM on the shared build boxes: batch sizes, selector
+buffers and worker counts are all fixed up front and tuned for a laptop.
+A MemoryGovernor samples the resident set size (RSS) of this process and
+every process below it (pool workers included) and, when the total gets
+close to `--max-memory`, the loops that consult it back off:
+
+    batch_size(name, size)   halve the batch size above HIGH_WATER, grow
+                             it back towards `size` below LOW_WATER
+    workers(name, workers)   drop one worker above HIGH_WATER, add one
+                             back below LOW_WATER
+    should_spill(name)       True above HIGH_WATER; the caller moves its
+                             buffers to disk (QuotaSelector.spill)
+
+Every adaptation is logged as it happens and kept in report(), which the
+scripts add to their run report. Without a cap the governor never adapts
+and never samples, so passing one around costs nothing.
+
+RSS comes from /proc (Linux). Elsewhere only this process's peak RSS is
+available, which errs on the side of adapting too early.
+
+Usage:
+    python scripts/memory_governor.py [--pid PID]    # print the current RSS tree
+"""
+
+import argparse
+import os
+import re
+import sys
+import time
+
+HIGH_WATER = 0.85
+LOW_WATER = 0.5
+SAMPLE_INTERVAL = 0.5
+_SIZE = re.compile(r'^\s*(\d+(?:\.\d+)?)\s*([KMGT]?)i?B?\s*$', re.IGNORECASE)
+_UNITS = {'': 1, 'K': 1 << 10, 'M': 1 << 20, 'G': 1 << 30, 'T': 1 << 40}
+
+
+def parse_size(text):
+    """'512M', '2G', '1.5GB' or a plain byte count -> bytes."""
+    match = _SIZE.match(str(text))
+    if not match:
+        raise ValueError(f"not a memory size: {text!r}")
+    return int(float(match.group(1)) * _UNITS[match.group(2).upper()])
+
+
+def _proc_rss(pid):
+    with open(f'/proc/{pid}/statm', 'rb') as f:
+        return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+
+
+def _children(pid):
+    """Direct children of `pid`, read from /proc/*/stat."""
+    children = []
+    for entry in os.listdir('/proc'):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f'/proc/{entry}/stat', 'rb') as f:
+                stat = f.read()
+        except OSError:
+            continue
+        # The command name may contain spaces; ppid is the 2nd field after ')'.
+        if int(stat[stat.rindex(b')') + 2:].split()[1]) == pid:
+            children.append(int(entry))
+    return children
+
+
+def tree_rss(pid=None):
+    """Bytes resident in `pid` (default: this process) and all of its descendants."""
+    pid = pid or os.getpid()
+    if not os.path.exists('/proc/self/statm'):
+        import resource
+
+        # Peak, not current, and only this process: the best portable answer.
+        scale = 1 if sys.platform == 'darwin' else 1024
+        return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * scale
+    total, pending = 0, [pid]
+    while pending:
+        current = pending.pop()
+        try:
+            total += _proc_rss(current)
+        except OSError:
+            continue  # exited between listing and reading
+        pending.extend(_children(current))
+    return total
+
+
+class MemoryGovernor:
+    """Samples tree RSS against a cap and adapts batch sizes, workers and buffers."""
+
+    def __init__(self, max_bytes=None, log=print, interval=SAMPLE_INTERVAL):
+        self.max_bytes = max_bytes
+        self.log = log
+        self.interval = interval
+        self.adaptations = []
+        self.peak = 0
+        self._start = time.perf_counter()
+        self._sampled_at = None
+        self._rss = 0
+        self._sizes = {}
+        self._workers = {}
+
+    @property
+    def enabled(self):
+        return bool(self.max_bytes)
+
+    def rss(self, fresh=False):
+        """Tree RSS in bytes, re-sampled at most every `interval` seconds."""
+        now = time.perf_counter()
+        if fresh or self._sampled_at is None or now - self._sampled_at >= self.interval:
+            self._rss = tree_rss()
+            self._sampled_at = now
+            self.peak = max(self.peak, self._rss)
+        return self._rss
+
+    def pressure(self):
+        """RSS as a fraction of the cap (0.0 when there is no cap)."""
+        if not self.enabled:
+            return 0.0
+        return self.rss() / self.max_bytes
+
+    def _record(self, action, name, before, after):
+        rss = self._rss
+        self.adaptations.append({
+            'seconds': round(time.perf_counter() - self._start, 2),
+            'rss_mb': round(rss / (1 << 20), 1),
+            'action': action,
+            'target': name,
+            'from': before,
+            'to': after,
+        })
+        change = f"{before} -> {after}" if after is not None else 'to disk'
+        self.log(f"  memory: {rss / (1 << 20):.0f} of {self.max_bytes / (1 << 20):.0f} MB, "
+                 f"{name} {action} {change}")
+
+    def batch_size(self, name, size, minimum=1000):
+        """The batch size to use next for `name`, at most `size`."""
+        current = self._sizes.get(name, size)
+        pressure = self.pressure()
+        target = current
+        if pressure > HIGH_WATER:
+            target = max(min(minimum, size), current // 2)
+        elif pressure < LOW_WATER:
+            target = min(size, current * 2)
+        if target != current:
+            self._record('batch_size', name, current, target)
+        self._sizes[name] = target
+        return target
+
+    def workers(self, name, workers):
+        """The worker count to use next for `name`, at most `workers`."""
+        current = self._workers.get(name, workers)
+        pressure = self.pressure()
+        target = current
+        if pressure > HIGH_WATER and current > 1:
+            target = current - 1
+        elif pressure < LOW_WATER and current < workers:
+            target = current + 1
+        if target != current:
+            self._record('workers', name, current, target)
+        self._workers[name] = target
+        return target
+
+    def should_spill(self, name):
+        """True when `name` should move its in-memory buffers to disk."""
+        if self.pressure() <= HIGH_WATER:
+            return False
+        self._record('spill', name, None, None)
+        return True
+
+    def report(self):
+        return {
+            'max_memory_mb': round(self.max_bytes / (1 << 20), 1) if self.enabled else None,
+            'peak_rss_mb': round(self.peak / (1 << 20), 1),
+            'adaptations': self.adaptations,
+        }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Print the resident memory of a process tree.')
+    parser.add_argument('--pid', type=int, help='root process (default: this one)')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Memory Governor")
+    print("=" * 70)
+    print(f"  Tree RSS: {tree_rss(args.pid) / (1 << 20):.1f} MB")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,417 @@
+#!/usr/bin/env python3
+"""
+Mine puzzles from a local PGN game collection.
+
+Every puzzle we ship comes from the Lichess puzzle CSV or from the fake
+generators in download_puzzles.py and fetch_real_puzzles.py. This stage
+streams a PGN archive (.pgn or .pgn.zst, e.g. a Lichess monthly dump),
+replays each game with python-chess and flags two kinds of tactical moment
+after every move (the "setup move" of the resulting puzzle):
+
+  mate    the side to move has a forced mate in <= --mate-depth moves.
+          A checks-only search picks the candidates (a full-width search
+          on every ply would cost ~0.2s per position), then
+          verify_mate_puzzles.MateSearch proves them within a node budget.
+          The first solver move must be the only fastest mate; the
+          defender's replies are the ones that last longest. Mates whose
+          first move is quiet are therefore not mined.
+  swing   in the game itself the side to move then wins >= --swing points
+          of material (P=1 N=3 B=3 R=5 Q=9, counted from before the setup
+          move so plain trades do not count) within 3 of its own moves,
+          starting with a capture, check or promotion, and keeps it one
+          move later. These come from the game's continuation, not an
+          engine, so they are tagged `advantage` and are candidates only.
+
+Games are split out of the stream with pgn_index.iter_pgn_games and handed
+to a process pool in batches; workers tokenize movetext with a single
+regex (comments, NAGs and variations skipped) instead of building
+python-chess game trees. Records use the usual puzzle format plus
+`game_url` and `source`; the rating is the players' mean Elo, a proxy until
+the puzzle has been played.
+
+Usage:
+    python scripts/mine_pgn_puzzles.py --pgn lichess_db_standard_rated_2024-01.pgn.zst \
+        [--output build/mined_puzzles.json] [--max-games N] [--workers N]
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter, deque
+from concurrent.futures import ProcessPoolExecutor
+
+import chess
+
+from motif_detector import run_detection
+from pgn_index import iter_pgn_games, open_pgn
+from position_features import (ENDGAME_MAX_PHASE, MAX_PHASE, OPENING_MAX_MOVE, OPENING_MIN_PHASE,
+                               PHASE_WEIGHTS, PIECE_VALUES)
+from puzzle_io import length_theme, line_id
+from verify_mate_puzzles import MateSearch, SearchBudgetExceeded
+
+DEFAULT_OUTPUT = 'build/mined_puzzles.json'
+DEFAULT_MATE_DEPTH = 2
+DEFAULT_SWING = 3
+DEFAULT_MAX_NODES = 3000
+DEFAULT_RATING = 1500
+MIN_PLY = 8
+SWING_SOLVER_MOVES = 3
+GAMES_PER_TASK = 64
+
+_HEADER = re.compile(r'^\[(\w+)\s+"((?:[^"\\]|\\.)*)"\]\s*$', re.M)
+_TOKEN = re.compile(r'\{[^}]*\}|;[^\n]*|\$\d+|1-0|0-1|1/2-1/2|\*|\d+\.+|[()]|[^\s(){};$]+')
+_ANNOTATION = re.compile(r'[!?]+$')
+
+
+def tokenize_game(text):
+    """Split one PGN game into (headers dict, mainline SAN list)."""
+    headers = {}
+    body_start = 0
+    for match in _HEADER.finditer(text):
+        headers[match.group(1)] = match.group(2)
+        body_start = match.end()
+
+    sans = []
+    depth = 0
+    for token in _TOKEN.findall(text, body_start):
+        first = token[0]
+        if first == '(':
+            depth += 1
+        elif first == ')':
+            depth -= 1
+        elif depth or first in '{;$*' or first.isdigit():
+            # Variations, comments, NAGs, move numbers and results.
+            continue
+        else:
+            sans.append(_ANNOTATION.sub('', token))
+    return headers, sans
+
+
+_MATERIAL = [(piece_type, PIECE_VALUES[chess.piece_symbol(piece_type).upper()]) for piece_type in chess.PIECE_TYPES]
+_PHASE = [(piece_type, PHASE_WEIGHTS[chess.piece_symbol(piece_type).upper()]) for piece_type in chess.PIECE_TYPES]
+
+
+def material_balance(board, color):
+    """Material of `color` minus its opponent's."""
+    return sum(value * (chess.popcount(board.pieces_mask(piece_type, color)) -
+                        chess.popcount(board.pieces_mask(piece_type, not color)))
+               for piece_type, value in _MATERIAL)
+
+
+def phase_theme(board):
+    """opening / middlegame / endgame, with the thresholds position_features.py uses."""
+    phase = min(MAX_PHASE, sum(weight * chess.popcount(board.pieces_mask(piece_type, chess.WHITE) |
+                                                         board.pieces_mask(piece_type, chess.BLACK))
+                               for piece_type, weight in _PHASE))
+    if phase <= ENDGAME_MAX_PHASE:
+        return 'endgame'
+    if phase >= OPENING_MIN_PHASE and board.fullmove_number <= OPENING_MAX_MOVE:
+        return 'opening'
+    return 'middlegame'
+
+
+def has_checking_mate(board, depth):
+    """
+    Cheap pre-filter: can the side to move mate within `depth` moves giving
+    check on every move? Only positions that pass get the full search.
+    """
+    for move in list(board.legal_moves):
+        board.push(move)
+        try:
+            if board.is_check():
+                if board.is_checkmate():
+                    return True
+                if depth > 1 and all(_reply_allows_mate(board, reply, depth - 1)
+                                     for reply in list(board.legal_moves)):
+                    return True
+        finally:
+            board.pop()
+    return False
+
+
+def _reply_allows_mate(board, reply, depth):
+    board.push(reply)
+    try:
+        return has_checking_mate(board, depth)
+    finally:
+        board.pop()
+
+
+def _fastest_mates(board, search, depth):
+    """(k, moves) for the smallest k <= depth at which some move mates, else (None, [])."""
+    moves = list(board.legal_moves)
+    for k in range(1, depth + 1):
+        mating = [move for move in moves if search.mates_after(board, move, k)]
+        if mating:
+            return k, mating
+    return None, []
+
+
+def _longest_defence(board, search, depth):
+    """The reply that postpones mate longest (all replies are mated within `depth`)."""
+    best, best_k = None, 0
+    for move in list(board.legal_moves):
+        board.push(move)
+        try:
+            k = next((k for k in range(1, depth + 1) if search.attack(board, k)), depth)
+        finally:
+            board.pop()
+        if k > best_k:
+            best, best_k = move, k
+    return best
+
+
+def find_mate_line(board, search, max_depth):
+    """
+    Return (depth, line) if the side to move mates in <= max_depth with a
+    unique first move, else None. Raises SearchBudgetExceeded.
+    """
+    if not search.attack(board, max_depth):
+        return None
+    depth, mating = _fastest_mates(board, search, max_depth)
+    if len(mating) != 1:
+        return None
+
+    position = board.copy(stack=False)
+    line = []
+    remaining = depth
+    move = mating[0]
+    while True:
+        line.append(move)
+        position.push(move)
+        if position.is_checkmate():
+            return depth, line
+        remaining -= 1
+        reply = _longest_defence(position, search, remaining)
+        if reply is None:
+            return None
+        line.append(reply)
+        position.push(reply)
+        remaining, mating = _fastest_mates(position, search, remaining)
+        if not mating:
+            # The search promised a mate the line doesn't reach (e.g. a
+            # transposition entry from a deeper probe); don't emit it.
+            return None
+        move = mating[0]
+
+
+def find_swing_line(boards, moves, ply, threshold):
+    """
+    Solution after setup move `moves[ply]` if the game's continuation wins
+    material for the side to move, else None. `boards[i]` is the position
+    before `moves[i]` (one more entry than moves).
+    """
+    solver = boards[ply + 1].turn
+    base = material_balance(boards[ply], solver)
+    first = moves[ply + 1] if ply + 1 < len(moves) else None
+    if first is None:
+        return None
+    before = boards[ply + 1]
+    if not (before.is_capture(first) or first.promotion or before.gives_check(first)):
+        return None
+
+    for solver_move in range(SWING_SOLVER_MOVES):
+        end = ply + 1 + 2 * solver_move
+        if end >= len(moves):
+            return None
+        # Judge after the opponent's reply, and check the gain is still
+        # there a full move later.
+        after = boards[min(end + 2, len(moves))]
+        later = boards[min(end + 4, len(moves))]
+        if (material_balance(after, solver) - base >= threshold and
+                material_balance(later, solver) - base >= threshold):
+            return moves[ply + 1:end + 1]
+    return None
+
+
+def _rating(headers):
+    elos = [int(headers[key]) for key in ('WhiteElo', 'BlackElo') if headers.get(key, '').isdigit()]
+    return round(sum(elos) / len(elos)) if elos else DEFAULT_RATING
+
+
+def _record(board, setup, solution, themes, headers, ply, kind):
+    moves = ' '.join(move.uci() for move in [setup] + solution)
+    fen = board.fen()
+    solver_moves = (len(solution) + 1) // 2
+    themes = themes + [length_theme(solver_moves)]
+    record = {
+        'id': line_id(fen, moves),
+        'fen': fen,
+        'moves': moves,
+        'rating': _rating(headers),
+        'themes': ' '.join(themes),
+        'popularity': 0,
+        'source': kind,
+    }
+    site = headers.get('Site', '')
+    if site.startswith('http'):
+        color = 'white' if ply % 2 else 'black'
+        record['game_url'] = f"{site}/{color}#{ply}"
+    return record
+
+
+def mine_game(text, search, mate_depth=DEFAULT_MATE_DEPTH, swing=DEFAULT_SWING, min_ply=MIN_PLY):
+    """Return the puzzle records found in one PGN game text."""
+    headers, sans = tokenize_game(text)
+    if headers.get('Variant', 'Standard') not in ('Standard', 'From Position'):
+        return []
+    board = chess.Board(headers['FEN']) if 'FEN' in headers else chess.Board()
+
+    boards = [board.copy(stack=False)]
+    moves = []
+    for san in sans:
+        try:
+            move = board.parse_san(san)
+        except ValueError:
+            break
+        board.push(move)
+        moves.append(move)
+        boards.append(board.copy(stack=False))
+
+    puzzles = []
+    resume = min_ply
+    for ply in range(min_ply, len(moves)):
+        if ply < resume:
+            continue
+        position = boards[ply + 1]
+        if position.is_game_over():
+            break
+
+        if mate_depth and has_checking_mate(position, mate_depth):
+            search.reset_budget()
+            try:
+                found = find_mate_line(position, search, mate_depth)
+            except SearchBudgetExceeded:
+                found = None
+            if found:
+                depth, line = found
+                themes = ['mate', f'mateIn{depth}', phase_theme(position)]
+                puzzles.append(_record(boards[ply], moves[ply], line, themes, headers, ply, 'mate'))
+                resume = ply + 1 + len(line)
+                continue
+
+        line = find_swing_line(boards, moves, ply, swing) if swing else None
+        if line:
+            themes = ['advantage', phase_theme(position)]
+            if any(move.promotion for move in line):
+                themes.append('promotion')
+            puzzles.append(_record(boards[ply], moves[ply], line, themes, headers, ply, 'swing'))
+            resume = ply + 1 + len(line)
+    return puzzles
+
+
+# Per-process search, created by the pool initializer so its
+# transposition tables stay warm across the games a worker handles.
+_worker_search = None
+_worker_options = None
+
+
+def _init_worker(max_nodes, options):
+    global _worker_search, _worker_options
+    _worker_search = MateSearch(max_nodes=max_nodes)
+    _worker_options = options
+
+
+def _mine_batch(texts):
+    puzzles = []
+    for text in texts:
+        puzzles.extend(mine_game(text.decode('utf-8', 'replace'), _worker_search, **_worker_options))
+    return len(texts), puzzles
+
+
+def _batches(path, max_games=None, size=GAMES_PER_TASK):
+    batch = []
+    games = 0
+    with open_pgn(path) as lines:
+        for _, text in iter_pgn_games(lines):
+            batch.append(text)
+            games += 1
+            if len(batch) == size:
+                yield batch
+                batch = []
+            if max_games and games >= max_games:
+                break
+    if batch:
+        yield batch
+
+
+def mine_pgn(path, workers=None, max_games=None, max_nodes=DEFAULT_MAX_NODES, **options):
+    """
+    Mine every game in `path`; yields (games in batch, puzzles) per batch.
+
+    Batches are submitted a few per worker ahead of the results, so the
+    stream is never read further than the pool can keep up with.
+    """
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker(max_nodes, options)
+        for batch in _batches(path, max_games):
+            yield _mine_batch(batch)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(max_nodes, options)) as pool:
+        pending = deque()
+        for batch in _batches(path, max_games):
+            pending.append(pool.submit(_mine_batch, batch))
+            if len(pending) >= workers * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Mine tactical puzzles from a local PGN collection.')
+    parser.add_argument('--pgn', required=True, help='PGN file (.pgn or .pgn.zst)')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT)
+    parser.add_argument('--max-games', type=int, help='stop after this many games')
+    parser.add_argument('--mate-depth', type=int, default=DEFAULT_MATE_DEPTH, help='0 disables the mate search')
+    parser.add_argument('--swing', type=int, default=DEFAULT_SWING, help='material gain to flag; 0 disables')
+    parser.add_argument('--max-nodes', type=int, default=DEFAULT_MAX_NODES, help='mate search budget per position')
+    parser.add_argument('--workers', type=int, default=None, help='process pool size (default: all cores)')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster PGN Puzzle Miner")
+    print("=" * 70)
+
+    seen = set()
+    puzzles = []
+    games = 0
+    start = time.perf_counter()
+    last_report = start
+    for batch_games, found in mine_pgn(args.pgn, args.workers, args.max_games, args.max_nodes,
+                                       mate_depth=args.mate_depth, swing=args.swing):
+        games += batch_games
+        for puzzle in found:
+            if puzzle['id'] not in seen:
+                seen.add(puzzle['id'])
+                puzzles.append(puzzle)
+        now = time.perf_counter()
+        if now - last_report >= 10:
+            print(f"  {games} games, {len(puzzles)} puzzles, {games / (now - start):.0f} games/s")
+            last_report = now
+    elapsed = time.perf_counter() - start
+
+    kinds = Counter(p['source'] for p in puzzles)
+    print(f"\nMined {len(puzzles)} puzzles from {games} games in {elapsed:.1f}s "
+          f"({games / max(elapsed, 1e-9):.0f} games/s)")
+    for kind, count in sorted(kinds.items()):
+        print(f"  {kind}: {count}")
+    # The miner only knows mate / advantage; add the motifs the lines show.
+    puzzles, report = run_detection(puzzles, fill=True)
+    print(f"  motifs: {sum(s['detected'] for t, s in report['themes'].items() if not t.startswith('mate'))} "
+          f"tagged")
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    with open(args.output, 'w', encoding='utf-8') as f:
+        json.dump(puzzles, f, indent=2)
+    print(f"✓ Saved to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
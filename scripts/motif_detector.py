@@ -0,0 +1,558 @@
+#!/usr/bin/env python3
+"""
+Detect tactical motifs by replaying puzzle solutions, in NumPy batches.
+
+Themes have been taken on trust: the synthetic scripts pick them at
+random (download_puzzles.py, fetch_real_puzzles.py) and the miners only
+know "mate" or "advantage". This stage replays every solution and looks
+for the motifs themselves, from attack maps of the position after each
+solver move:
+
+    fork              the moved piece (not the king, not en prise) hits
+                      two or more non-pawn pieces worth more or hanging
+    pin               an enemy piece pinned to its king cannot take a
+                      solver piece off the line, or escape a cheaper pinner
+    skewer            a slider captures along the line the opponent's last
+                      move vacated, taking the cheaper piece left behind
+    discoveredAttack  check from a piece other than the mover, or a capture
+                      through the square the previous solver move vacated
+    doubleCheck       two solver pieces give check
+    backRankMate      mate on the king's home rank, checked from that rank,
+                      the squares in front of the king held by its own
+                      pieces and not attacked
+    mate, mateInN     the line ends in checkmate
+    promotion, underPromotion, enPassant, castling   from the moves
+
+Boards are the (N, 64) piece-code arrays of position_features.py. Attack
+maps are uint64 bitboards per square: leapers come from tables, sliders
+from rays cut at the nearest blocker (lowest or highest set bit of
+ray & occupied, via a popcount: np.bitwise_count on NumPy >= 2, a SWAR
+fallback before that). Only rows whose last position is a check with no
+free king square are confirmed with python-chess.
+
+check_themes() compares the claimed themes with the detected ones:
+`unsupported` lists claims of detectable motifs the line does not show,
+`missing` lists detected motifs that were not claimed. assign_themes()
+fills themes in for mined and generated puzzles.
+
+Usage:
+    python scripts/motif_detector.py --input puzzles.json [--report motif_report.json]
+        [--output with_themes.json --fill [--drop-unsupported]]
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from position_features import (BISHOP, BLACK, EMPTY, KING, KNIGHT, PAWN, QUEEN, ROOK, apply_moves,
+                               parse_boards)
+from puzzle_batch import PuzzleBatch
+from puzzle_io import DEFAULT_PUZZLES_FILE, iter_puzzles, length_theme, split_moves, split_themes
+
+BATCH_SIZE = 20000
+MOTIF_THEMES = ('fork', 'pin', 'skewer', 'discoveredAttack', 'doubleCheck', 'backRankMate',
+                'promotion', 'underPromotion', 'enPassant', 'castling')
+MATE_THEMES = ('mate', 'mateIn1', 'mateIn2', 'mateIn3', 'mateIn4', 'mateIn5')
+DETECTABLE = frozenset(MOTIF_THEMES + MATE_THEMES)
+
+# Piece values for "worth more" comparisons; the king outranks everything.
+_VALUE = np.array([0, 1, 3, 3, 5, 9, 100], dtype=np.int16)
+_WORTH = np.unique(_VALUE[1:])
+_ONE = np.uint64(1)
+_BIT = _ONE << np.arange(64, dtype=np.uint64)
+
+# (file step, rank step): four orthogonal then four diagonal directions.
+_DIRECTIONS = [(1, 0), (-1, 0), (0, 1), (0, -1), (1, 1), (-1, 1), (1, -1), (-1, -1)]
+_ORTHOGONAL = 4
+
+
+def _on_board(square, df, dr):
+    file, rank = square % 8 + df, square // 8 + dr
+    return 0 <= file < 8 and 0 <= rank < 8
+
+
+def _table(steps):
+    table = np.zeros(64, dtype=np.uint64)
+    for square in range(64):
+        for df, dr in steps:
+            if _on_board(square, df, dr):
+                table[square] |= _BIT[square + dr * 8 + df]
+    return table
+
+
+def _rays():
+    rays = np.zeros((len(_DIRECTIONS), 64), dtype=np.uint64)
+    for d, (df, dr) in enumerate(_DIRECTIONS):
+        for square in range(64):
+            distance = 1
+            while _on_board(square, df * distance, dr * distance):
+                rays[d, square] |= _BIT[square + (dr * 8 + df) * distance]
+                distance += 1
+    return rays
+
+
+_KNIGHT = _table([(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)])
+_KING = _table([(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)])
+_PAWN = np.stack([_table([(-1, 1), (1, 1)]), _table([(-1, -1), (1, -1)])])  # white, black
+_RAYS = _rays()
+
+
+def _lines():
+    """(between, line): squares strictly between two aligned squares, and the whole line through them."""
+    between = np.zeros((64, 64), dtype=np.uint64)
+    line = np.zeros((64, 64), dtype=np.uint64)
+    for d, (df, dr) in enumerate(_DIRECTIONS):
+        back = _DIRECTIONS.index((-df, -dr))
+        for square in range(64):
+            path, distance = np.uint64(0), 1
+            while _on_board(square, df * distance, dr * distance):
+                target = square + (dr * 8 + df) * distance
+                between[square, target] = path
+                line[square, target] = _RAYS[d, square] | _RAYS[back, square] | _BIT[square]
+                path |= _BIT[target]
+                distance += 1
+    return between, line
+
+
+_BETWEEN, _LINE = _lines()
+# Rays towards higher square numbers meet their nearest blocker at the lowest set bit.
+_ASCENDING = [dr * 8 + df > 0 for df, dr in _DIRECTIONS]
+
+
+def _swar_popcount(x):
+    """Bits set per uint64 element, for NumPy < 2.0 which lacks np.bitwise_count."""
+    x = x - ((x >> np.uint64(1)) & np.uint64(0x5555555555555555))
+    x = (x & np.uint64(0x3333333333333333)) + ((x >> np.uint64(2)) & np.uint64(0x3333333333333333))
+    x = (x + (x >> np.uint64(4))) & np.uint64(0x0F0F0F0F0F0F0F0F)
+    return (x * np.uint64(0x0101010101010101)) >> np.uint64(56)
+
+
+_popcount = getattr(np, 'bitwise_count', _swar_popcount)
+
+
+def _lowest(x):
+    return _popcount((x & (~x + _ONE)) - _ONE).astype(np.intp)
+
+
+def _highest(x):
+    for shift in (1, 2, 4, 8, 16, 32):
+        x = x | (x >> np.uint64(shift))
+    return _popcount(x).astype(np.intp) - 1
+
+
+def _nearest(d, blockers):
+    """Square of the nearest blocker along direction d (garbage where blockers == 0)."""
+    return np.minimum(_lowest(blockers), 63) if _ASCENDING[d] else np.maximum(_highest(blockers), 0)
+
+
+def occupancy(mask):
+    """(N, 64) bool -> (N,) uint64 bitboard."""
+    return np.bitwise_or.reduce(np.where(mask, _BIT, np.uint64(0)), axis=1)
+
+
+def piece_types(boards):
+    return np.where(boards > BLACK, boards - BLACK, boards)
+
+
+def attack_sets(boards, occupied=None):
+    """
+    (N, 64) uint64: the squares attacked by the piece on each square (0 on
+    empty squares). `occupied` overrides the occupancy the sliders see.
+    """
+    types = piece_types(boards)
+    if occupied is None:
+        occupied = occupancy(boards != EMPTY)
+    white = (boards > EMPTY) & (boards <= BLACK)
+    zero = np.uint64(0)
+    attacks = np.where(types == KNIGHT, _KNIGHT, zero)
+    attacks |= np.where(types == KING, _KING, zero)
+    attacks |= np.where(types == PAWN, np.where(white, _PAWN[0], _PAWN[1]), zero)
+    for d in range(len(_DIRECTIONS)):
+        slides = (types == QUEEN) | (types == (ROOK if d < _ORTHOGONAL else BISHOP))
+        if not slides.any():
+            continue
+        ray = _RAYS[d]
+        blockers = ray & occupied[:, None]
+        beyond = ray[_nearest(d, blockers)]
+        attacks |= np.where(slides, np.where(blockers != zero, ray ^ beyond, ray), zero)
+    return attacks
+
+
+def _side_masks(boards, white):
+    """(solver pieces, enemy pieces) as (N, 64) bool, for solver = white where `white`."""
+    is_white = (boards > EMPTY) & (boards <= BLACK)
+    is_black = boards > BLACK
+    solver = np.where(white[:, None], is_white, is_black)
+    enemy = np.where(white[:, None], is_black, is_white)
+    return solver, enemy
+
+
+def _union(attacks, mask):
+    return np.bitwise_or.reduce(np.where(mask, attacks, np.uint64(0)), axis=1)
+
+
+def _has(bitboards, squares):
+    return (bitboards & _BIT[squares]) != 0
+
+
+def _xray_pairs(boards, occupied):
+    """
+    For every square and direction: the first and second occupied squares
+    along the ray, (first, second) each (8, N, 64), -1 where absent.
+    """
+    zero = np.uint64(0)
+    first = np.full((len(_DIRECTIONS),) + boards.shape, -1, dtype=np.intp)
+    second = first.copy()
+    for d in range(len(_DIRECTIONS)):
+        blockers = _RAYS[d] & occupied[:, None]
+        near = _nearest(d, blockers)
+        rest = blockers & ~_BIT[near]
+        far = _nearest(d, rest)
+        first[d] = np.where(blockers != zero, near, -1)
+        second[d] = np.where(rest != zero, far, -1)
+    return first, second
+
+
+def _code_at(boards, squares):
+    return np.where(squares >= 0, np.take_along_axis(boards, np.maximum(squares, 0), axis=-1), EMPTY)
+
+
+def _bad_spot(attacks, types, own, opp, squares):
+    """The piece on `squares` can be taken: attacked and undefended, or attacked by something cheaper."""
+    attackers = (attacks & _BIT[squares][:, None]) != 0
+    hitters = attackers & opp
+    value = _VALUE[types[np.arange(len(types)), squares]]
+    cheaper = (hitters & (_VALUE[types] < value[:, None])).any(axis=1)
+    return hitters.any(axis=1) & (~(attackers & own).any(axis=1) | cheaper)
+
+
+def _on_line(between, squares):
+    return (between & np.where(squares >= 0, _BIT[np.maximum(squares, 0)], np.uint64(0))) != 0
+
+
+def _analyze_move(before, after, white, frm, to, promo, final, history):
+    """
+    Motif flags (dict of (n,) bool) for one solver move per row. `history`
+    holds the previous solver move ('solver_from', 'solver_to',
+    'solver_castle') and the opponent's reply to it ('reply_from',
+    'reply_to'), -1 / False where there is none.
+    """
+    rows = np.arange(len(after))
+    themes = {}
+    moved = piece_types(after[rows, to])
+    moved_before = piece_types(before[rows, frm])
+    captured = piece_types(before[rows, to])
+    themes['promotion'] = promo > 0
+    themes['underPromotion'] = (promo > 0) & (promo != QUEEN)
+    themes['enPassant'] = (moved_before == PAWN) & (frm % 8 != to % 8) & (captured == EMPTY)
+    castle = (moved_before == KING) & (np.abs(to - frm) == 2)
+    themes['castling'] = castle
+
+    solver, enemy = _side_masks(after, white)
+    occupied = occupancy(after != EMPTY)
+    attacks = attack_sets(after, occupied)
+    solver_attacks = _union(attacks, solver)
+    enemy_attacks = _union(attacks, enemy)
+    types = piece_types(after)
+    values = _VALUE[types]
+
+    enemy_king = np.argmax(enemy & (types == KING), axis=1)
+    checkers = ((attacks & _BIT[enemy_king][:, None]) != 0) & solver
+    in_check = checkers.any(axis=1)
+    themes['doubleCheck'] = checkers.sum(axis=1) >= 2
+
+    # Fork: the moved piece, safe on its square, hits 2+ non-pawn pieces
+    # that are worth more than it or hanging.
+    safe = ~_bad_spot(attacks, types, solver, enemy, to)
+    targets = (attacks[rows, to][:, None] & _BIT) != 0
+    hanging = (enemy_attacks[:, None] & _BIT) == 0
+    valuable = targets & enemy & (types != PAWN) & ((values > _VALUE[moved][:, None]) | hanging)
+    themes['fork'] = (valuable.sum(axis=1) >= 2) & (moved != KING) & safe & ~final
+
+    # Pin: an enemy piece pinned to its king by a solver slider, where the
+    # pin stops it taking a solver piece (worth more or hanging) off the
+    # line, or stops it escaping a cheaper pinner.
+    first, second = _xray_pairs(after, occupied)
+    pin = np.zeros(len(after), dtype=bool)
+    solver_bits = occupancy(solver)
+    undefended = solver_bits & ~solver_attacks
+    # Solver pieces worth more than each piece value, indexed like _WORTH.
+    above = np.stack([occupancy(solver & (values > v)) for v in _WORTH])
+    for d in range(len(_DIRECTIONS)):
+        line_piece = ROOK if d < _ORTHOGONAL else BISHOP
+        slider = solver & ((types == QUEEN) | (types == line_piece))
+        front_code, back_code = _code_at(after, first[d]), _code_at(after, second[d])
+        front_enemy = np.where(white[:, None], front_code > BLACK, (front_code > EMPTY) & (front_code <= BLACK))
+        back_enemy = np.where(white[:, None], back_code > BLACK, (back_code > EMPTY) & (back_code <= BLACK))
+        pinned = slider & front_enemy & (piece_types(front_code) != KING) & back_enemy & (piece_types(back_code) == KING)
+        hit, pinner = np.nonzero(pinned)
+        if not len(hit):
+            continue
+        square = first[d][hit, pinner]
+        value = _VALUE[types[hit, square]]
+        off_line = attacks[hit, square] & solver_bits[hit] & ~_LINE[enemy_king[hit], square]
+        worth = above[np.searchsorted(_WORTH, value), hit]
+        prevents_attack = (off_line & (worth | undefended[hit])) != 0
+        prevents_escape = value > values[hit, pinner]
+        pin[hit[prevents_attack | prevents_escape]] = True
+    themes['pin'] = pin
+
+    # Skewer: a slider captures along a line the opponent's last move
+    # vacated, taking something cheaper than the piece that moved away
+    # and that was left en prise.
+    solver_before, enemy_before = _side_masks(before, white)
+    types_before = piece_types(before)
+    attacks_before = attack_sets(before)
+    between = _BETWEEN[frm, to]
+    reply_from, reply_to = history['reply_from'], history['reply_to']
+    fled = _VALUE[types_before[rows, np.maximum(reply_to, 0)]]
+    skewer = ((captured != EMPTY) & np.isin(moved, (BISHOP, ROOK, QUEEN)) & (reply_to != to)
+              & _on_line(between, reply_from) & (fled > _VALUE[captured])
+              & _bad_spot(attacks_before, types_before, enemy_before, solver_before, to))
+    themes['skewer'] = skewer
+
+    # Discovered attack: check from a piece other than the mover, or a
+    # capture through the square the previous solver move vacated.
+    discovered_check = in_check & ~checkers[rows, to]
+    solver_from, solver_to = history['solver_from'], history['solver_to']
+    through = ((captured != EMPTY) & _on_line(between, solver_from) & (to != solver_to) & (frm != solver_to)
+               & ~history['solver_castle'] & (reply_to != to))
+    themes['discoveredAttack'] = discovered_check | through
+
+    # Mate candidates: in check and every king square is blocked or covered
+    # (slider rays computed as if the king were not there).
+    without_king = occupied & ~_BIT[enemy_king]
+    covered = _union(attack_sets(after, without_king), solver)
+    own = occupancy(enemy)
+    escapes = _KING[enemy_king] & ~own & ~covered
+    mate_candidate = in_check & (escapes == 0)
+    themes['mate_candidate'] = mate_candidate
+    themes['skewer'] &= ~(final & mate_candidate)
+
+    # Back-rank shape: king on its home rank, checked from that rank, the
+    # squares in front of it held by its own pieces and not attacked.
+    home = np.where(white, 7, 0)
+    on_home = enemy_king // 8 == home
+    rank_check = (checkers & (np.arange(64)[None, :] // 8 == home[:, None])).any(axis=1)
+    forward = np.where(white, -8, 8)
+    front_blocked = np.ones(len(after), dtype=bool)
+    for df in (-1, 0, 1):
+        file = enemy_king % 8 + df
+        valid = (file >= 0) & (file < 8)
+        square = np.clip(enemy_king + forward + df, 0, 63)
+        front_blocked &= ~valid | (enemy[rows, square] & ~_has(solver_attacks, square))
+    themes['back_rank_shape'] = on_home & rank_check & front_blocked
+    return themes
+
+
+def _confirm_mates(fens, move_lists):
+    """python-chess checkmate test on the final position of each line."""
+    import chess
+
+    confirmed = []
+    for fen, moves in zip(fens, move_lists):
+        board = chess.Board(fen)
+        try:
+            for uci in moves:
+                board.push_uci(uci)
+        except ValueError:
+            confirmed.append(False)
+            continue
+        confirmed.append(board.is_checkmate())
+    return confirmed
+
+
+def _squares(moves):
+    """(from, to) square arrays for a list of UCI moves."""
+    from_sq = np.array([(ord(m[1]) - 49) * 8 + ord(m[0]) - 97 for m in moves], dtype=np.intp)
+    to_sq = np.array([(ord(m[3]) - 49) * 8 + ord(m[2]) - 97 for m in moves], dtype=np.intp)
+    return from_sq, to_sq
+
+
+def detect_motifs(puzzles):
+    """
+    Detected themes (a set per puzzle) for a list of puzzle records or a
+    PuzzleBatch. Raises ValueError if a FEN in the batch is malformed.
+    """
+    if isinstance(puzzles, PuzzleBatch):
+        fens, move_strings = puzzles.strings('fen'), puzzles.strings('moves')
+    else:
+        fens, move_strings = [p['fen'] for p in puzzles], [p['moves'] for p in puzzles]
+    move_lists = [split_moves(m) for m in move_strings]
+    count = len(fens)
+    found = [set() for _ in range(count)]
+    if not count:
+        return found
+
+    boards, white, _ = parse_boards(fens)
+    lengths = np.array([len(m) for m in move_lists])
+    apply_moves(boards, white, [m[0] if m else '' for m in move_lists])
+    solver_white = white.copy()
+    candidates = np.zeros(count, dtype=bool)
+    back_rank = np.zeros(count, dtype=bool)
+    history = {name: np.full(count, -1, dtype=np.intp)
+               for name in ('solver_from', 'solver_to', 'reply_from', 'reply_to')}
+    history['solver_castle'] = np.zeros(count, dtype=bool)
+
+    for ply in range(1, int(lengths.max(initial=0)), 2):
+        rows = np.flatnonzero(lengths > ply)
+        before = boards[rows].copy()
+        moves = [move_lists[row][ply] for row in rows.tolist()]
+        from_sq, to_sq = _squares(moves)
+        promo = np.array([{'n': KNIGHT, 'b': BISHOP, 'r': ROOK, 'q': QUEEN}.get(m[4:5], 0) for m in moves])
+        step = [''] * count
+        for row, move in zip(rows.tolist(), moves):
+            step[row] = move
+        apply_moves(boards, white, step)
+
+        final = lengths[rows] == ply + 1
+        flags = _analyze_move(before, boards[rows], solver_white[rows], from_sq, to_sq, promo, final,
+                              {name: values[rows] for name, values in history.items()})
+        candidates[rows[final]] = flags.pop('mate_candidate')[final]
+        back_rank[rows[final]] = flags.pop('back_rank_shape')[final]
+        for theme, hit in flags.items():
+            for row in rows[hit].tolist():
+                found[row].add(theme)
+        history['solver_from'][rows], history['solver_to'][rows] = from_sq, to_sq
+        history['solver_castle'][rows] = flags['castling']
+
+        if ply + 1 < lengths.max():
+            replied = np.flatnonzero(lengths > ply + 1)
+            reply = [''] * count
+            for row in replied.tolist():
+                reply[row] = move_lists[row][ply + 1]
+            apply_moves(boards, white, reply)
+            history['reply_from'][replied], history['reply_to'][replied] = _squares([reply[r] for r in replied.tolist()])
+
+    rows = np.flatnonzero(candidates).tolist()
+    for row, mate in zip(rows, _confirm_mates([fens[r] for r in rows], [move_lists[r] for r in rows])):
+        if mate:
+            found[row].update(('mate', f'mateIn{lengths[row] // 2}'))
+            if back_rank[row]:
+                found[row].add('backRankMate')
+    return found
+
+
+def detect_motifs_safe(puzzles):
+    """detect_motifs() over a list, isolating malformed puzzles by halving (None for those rows)."""
+    try:
+        return detect_motifs(puzzles)
+    except (ValueError, IndexError):
+        if len(puzzles) == 1:
+            return [None]
+        middle = len(puzzles) // 2
+        return detect_motifs_safe(puzzles[:middle]) + detect_motifs_safe(puzzles[middle:])
+
+
+def check_themes(claimed, detected):
+    """Compare one puzzle's claimed theme string with its detected set."""
+    claims = set(split_themes(claimed))
+    return {
+        'unsupported': sorted((claims & DETECTABLE) - detected),
+        'missing': sorted(detected - claims),
+    }
+
+
+def assign_themes(puzzle, detected, drop_unsupported=False):
+    """Add detected motifs (and the line's length theme) to puzzle['themes'], in place."""
+    themes = split_themes(puzzle.get('themes', ''))
+    if drop_unsupported:
+        themes = [t for t in themes if t not in DETECTABLE or t in detected]
+    solver_moves = len(split_moves(puzzle['moves'])) // 2
+    extra = sorted(detected - set(themes))
+    if solver_moves and not any(t in themes for t in ('oneMove', 'short', 'long', 'veryLong')):
+        extra.append(length_theme(solver_moves))
+    puzzle['themes'] = ' '.join(themes + extra)
+    return puzzle
+
+
+def run_detection(puzzles_iter, fill=False, drop_unsupported=False, batch_size=BATCH_SIZE):
+    """
+    Detect motifs over a stream of puzzles. Returns (puzzles, report): the
+    puzzles with themes assigned when `fill` (else unchanged) and a report
+    of per-theme agreement plus the flagged puzzle IDs.
+    """
+    out = []
+    stats = {theme: {'claimed': 0, 'detected': 0, 'both': 0} for theme in sorted(DETECTABLE)}
+    flagged = {}
+    skipped = 0
+    batch = []
+
+    def flush():
+        nonlocal skipped
+        for puzzle, detected in zip(batch, detect_motifs_safe(batch)):
+            if detected is None:
+                skipped += 1
+                out.append(puzzle)
+                continue
+            claims = set(split_themes(puzzle.get('themes', '')))
+            for theme in DETECTABLE:
+                stats[theme]['claimed'] += theme in claims
+                stats[theme]['detected'] += theme in detected
+                stats[theme]['both'] += theme in claims and theme in detected
+            unsupported = check_themes(puzzle.get('themes', ''), detected)['unsupported']
+            if unsupported:
+                flagged[str(puzzle['id'])] = unsupported
+            if fill:
+                assign_themes(puzzle, detected, drop_unsupported)
+            out.append(puzzle)
+        batch.clear()
+
+    for puzzle in puzzles_iter:
+        batch.append(puzzle)
+        if len(batch) >= batch_size:
+            flush()
+    flush()
+    report = {'puzzles': len(out), 'skipped': skipped, 'flagged': len(flagged),
+              'themes': {t: s for t, s in stats.items() if s['claimed'] or s['detected']},
+              'flagged_ids': flagged}
+    return out, report
+
+
+def print_report(report):
+    print(f"\n  {'theme':<17} {'claimed':>8} {'detected':>9} {'both':>7} {'supported':>10}")
+    for theme, s in report['themes'].items():
+        supported = f"{100 * s['both'] / s['claimed']:.1f}%" if s['claimed'] else '-'
+        print(f"  {theme:<17} {s['claimed']:>8} {s['detected']:>9} {s['both']:>7} {supported:>10}")
+    print(f"\n  {report['flagged']} of {report['puzzles']} puzzles claim motifs their line does not show"
+          + (f"; {report['skipped']} skipped (bad FEN)" if report['skipped'] else ''))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Detect tactical motifs and check claimed themes.')
+    parser.add_argument('--input', default=DEFAULT_PUZZLES_FILE, help='puzzle JSON or Lichess CSV(.zst)')
+    parser.add_argument('--limit', type=int, help='only the first N puzzles')
+    parser.add_argument('--report', help='write per-theme agreement and flagged IDs as JSON')
+    parser.add_argument('--output', help='write the puzzles (with --fill, themes assigned)')
+    parser.add_argument('--fill', action='store_true', help='add detected motifs to each puzzle\'s themes')
+    parser.add_argument('--drop-unsupported', action='store_true', help='with --fill, remove unsupported claims')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Motif Detector")
+    print("=" * 70)
+
+    from itertools import islice
+
+    start = time.perf_counter()
+    puzzles, report = run_detection(islice(iter_puzzles(args.input), args.limit), args.fill, args.drop_unsupported)
+    elapsed = time.perf_counter() - start
+    print(f"Checked {report['puzzles']} puzzles in {elapsed:.1f}s ({report['puzzles'] / max(elapsed, 1e-9):.0f}/s)")
+    print_report(report)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+        print(f"✓ Report written to {args.report}")
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(puzzles, f, indent=2, ensure_ascii=False)
+        print(f"✓ Saved {len(puzzles)} puzzles to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""
+Find near-duplicate puzzles with MinHash + LSH banding and keep one per cluster.
+
+Exact FEN dedup misses puzzles that differ by one irrelevant pawn or a
+shifted king: the generate_puzzles.py variants, and many Lichess puzzles
+from the same opening trap. Here each puzzle becomes a set of integer
+features:
+
+    piece-square tokens   piece_index * 64 + square, from the FEN board
+    side to move          one token
+    first moves           setup move + first solver replies, tagged by ply
+
+and near-duplicates are pairs with high Jaccard similarity between those
+sets. Comparing every pair is quadratic, so instead:
+
+  1. each set is reduced to a NUM_PERM-value MinHash signature (vectorized
+     in NumPy over batches of puzzles; one seeded splitmix64 per "permutation",
+     since linear (a*x + b) mod p hashes are badly biased on small integers),
+  2. signatures are cut into BANDS bands; puzzles sharing any band hash
+     land in the same bucket (found by sorting each band column),
+  3. bucket members are confirmed against the bucket leader by signature
+     agreement (an unbiased Jaccard estimate) and merged with union-find.
+
+Only IDs, popularity and signatures are held per puzzle (signatures live
+in a disk-backed memmap for large inputs), so the full 4M-row dump fits in
+well under a GB of RAM. The most popular member of each cluster is kept.
+
+Usage:
+    python scripts/near_duplicates.py --input lichess_db_puzzle.csv.zst --report clusters.json
+    python scripts/near_duplicates.py --input assets/puzzles/puzzles.json --output deduped.json
+"""
+
+import argparse
+import json
+import os
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from puzzle_io import DEFAULT_PUZZLES_FILE, iter_puzzles, split_moves
+
+NUM_PERM = 64
+BANDS = 16
+ROWS_PER_BAND = NUM_PERM // BANDS
+DEFAULT_THRESHOLD = 0.8
+MOVE_PLIES = 3
+BATCH_SIZE = 8192
+# Giant buckets are almost always trivial shared structure; cap the work.
+MAX_BUCKET = 5000
+
+_PIECE_INDEX = {p: i for i, p in enumerate('PNBRQKpnbrqk')}
+_FILES = 'abcdefgh'
+_MOVE_TOKEN_BASE = 12 * 64 + 2
+_PROMOTION_INDEX = {'': 0, 'n': 1, 'b': 2, 'r': 3, 'q': 4}
+
+
+def _square_index(name):
+    return (int(name[1]) - 1) * 8 + _FILES.index(name[0])
+
+
+def position_features(fen, moves, move_plies=MOVE_PLIES):
+    """
+    Integer feature set for a position and the start of its solution line.
+
+    Parses the FEN board directly (no move generation) so tokenizing the
+    full dump stays cheap.
+    """
+    placement, turn = fen.split(' ', 2)[:2]
+    tokens = []
+    rank = 7
+    file = 0
+    for char in placement:
+        if char == '/':
+            rank -= 1
+            file = 0
+        elif char.isdigit():
+            file += int(char)
+        else:
+            tokens.append(_PIECE_INDEX[char] * 64 + rank * 8 + file)
+            file += 1
+    tokens.append(12 * 64 + (0 if turn == 'w' else 1))
+
+    for ply, move in enumerate(split_moves(moves)[:move_plies]):
+        try:
+            from_to = _square_index(move[:2]) * 64 + _square_index(move[2:4])
+        except (ValueError, IndexError):
+            continue
+        promotion = _PROMOTION_INDEX.get(move[4:5], 0)
+        tokens.append(_MOVE_TOKEN_BASE + (ply * 5 + promotion) * 4096 + from_to)
+    return tokens
+
+
+def make_permutations(num_perm=NUM_PERM, seed=1):
+    """One random 64-bit seed per MinHash "permutation"."""
+    rng = np.random.default_rng(seed)
+    return rng.integers(0, np.iinfo(np.uint64).max, size=num_perm, dtype=np.uint64, endpoint=True)
+
+
+def _splitmix64(x):
+    """splitmix64 finalizer on a uint64 array (wrapping arithmetic)."""
+    x = x + np.uint64(0x9E3779B97F4A7C15)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def minhash_batch(token_lists, seeds):
+    """
+    MinHash signatures for a batch of feature sets, shape (len, num_perm).
+
+    Sets are padded to a common width by repeating their first token, which
+    leaves the minimum unchanged, so the whole batch is one broadcast.
+    """
+    width = max(len(t) for t in token_lists)
+    padded = np.empty((len(token_lists), width), dtype=np.uint64)
+    for row, tokens in enumerate(token_lists):
+        padded[row, :len(tokens)] = tokens
+        padded[row, len(tokens):] = tokens[0]
+    hashed = _splitmix64(padded[:, :, None] ^ seeds[None, None, :])
+    return (hashed.min(axis=1) >> np.uint64(32)).astype(np.uint32)
+
+
+def band_keys(signatures, band):
+    """Combine one band's rows into a single uint64 bucket key per puzzle."""
+    rows = signatures[:, band * ROWS_PER_BAND:(band + 1) * ROWS_PER_BAND].astype(np.uint64)
+    key = np.full(len(signatures), band, dtype=np.uint64)
+    for column in range(rows.shape[1]):
+        key = key * np.uint64(0x9E3779B97F4A7C15) + rows[:, column]
+    return key
+
+
+class UnionFind:
+    """Array-backed union-find over puzzle indices."""
+
+    def __init__(self, size):
+        self.parent = np.arange(size, dtype=np.int64)
+
+    def find(self, x):
+        parent = self.parent
+        root = x
+        while parent[root] != root:
+            root = parent[root]
+        while parent[x] != root:
+            parent[x], x = root, parent[x]
+        return root
+
+    def union(self, x, y):
+        rx, ry = self.find(x), self.find(y)
+        if rx != ry:
+            self.parent[max(rx, ry)] = min(rx, ry)
+
+    def roots(self):
+        return np.array([self.find(i) for i in range(len(self.parent))], dtype=np.int64)
+
+
+def find_clusters(signatures, threshold=DEFAULT_THRESHOLD, chunk=1 << 20):
+    """
+    Cluster puzzles whose estimated Jaccard similarity is >= threshold.
+
+    Returns a root index per puzzle; puzzles sharing a root are one cluster.
+    """
+    count = len(signatures)
+    uf = UnionFind(count)
+    min_agree = int(np.ceil(threshold * signatures.shape[1]))
+
+    for band in range(BANDS):
+        keys = band_keys(signatures, band)
+        order = np.argsort(keys, kind='stable')
+        sorted_keys = keys[order]
+        del keys
+
+        # Index (into `order`) of the first element of each element's run.
+        starts = np.ones(count, dtype=bool)
+        starts[1:] = sorted_keys[1:] != sorted_keys[:-1]
+        run_start = np.maximum.accumulate(np.where(starts, np.arange(count), 0))
+        followers = np.nonzero(~starts & (np.arange(count) - run_start < MAX_BUCKET))[0]
+
+        for offset in range(0, len(followers), chunk):
+            part = followers[offset:offset + chunk]
+            members = order[part]
+            leaders = order[run_start[part]]
+            agree = (signatures[members] == signatures[leaders]).sum(axis=1)
+            for member, leader in zip(members[agree >= min_agree], leaders[agree >= min_agree]):
+                uf.union(int(member), int(leader))
+
+    return uf.roots()
+
+
+def compute_signatures(puzzles_iter, seeds, work_dir, progress_every=500000):
+    """
+    Stream puzzles into (ids, popularity, signatures).
+
+    Signatures are appended batch by batch to a memmap in `work_dir`, so
+    memory stays flat regardless of how many rows the input has.
+    """
+    sig_path = os.path.join(work_dir, 'signatures.u32')
+    ids, popularity = [], []
+    batch = []
+    written = 0
+    with open(sig_path, 'wb') as sig_file:
+        def flush():
+            nonlocal written
+            if batch:
+                sig_file.write(minhash_batch(batch, seeds).tobytes())
+                written += len(batch)
+                batch.clear()
+
+        for puzzle in puzzles_iter:
+            try:
+                batch.append(position_features(puzzle['fen'], puzzle['moves']))
+            except (KeyError, ValueError):
+                continue
+            ids.append(puzzle['id'])
+            popularity.append(puzzle.get('popularity', 0))
+            if len(batch) >= BATCH_SIZE:
+                flush()
+                if written % progress_every < BATCH_SIZE:
+                    print(f"  Hashed {written} puzzles...")
+        flush()
+
+    signatures = np.memmap(sig_path, dtype=np.uint32, mode='r', shape=(written, len(seeds))) \
+        if written else np.zeros((0, len(seeds)), dtype=np.uint32)
+    return np.array(ids, dtype=np.int64), np.array(popularity, dtype=np.int32), signatures
+
+
+def pick_representatives(roots, popularity):
+    """
+    Return a boolean keep-mask with the most popular member of each cluster
+    (ties go to the earlier row).
+    """
+    count = len(roots)
+    # Sort by cluster, then popularity descending, then row order.
+    order = np.lexsort((np.arange(count), -popularity.astype(np.int64), roots))
+    first = np.ones(count, dtype=bool)
+    first[1:] = roots[order][1:] != roots[order][:-1]
+    keep = np.zeros(count, dtype=bool)
+    keep[order[first]] = True
+    return keep
+
+
+def deduplicate(puzzles_iter, threshold=DEFAULT_THRESHOLD, work_dir=None, seed=1):
+    """
+    Run the whole stage. Returns (ids, keep_mask, roots).
+    """
+    seeds = make_permutations(seed=seed)
+    with tempfile.TemporaryDirectory(dir=work_dir) as tmp:
+        ids, popularity, signatures = compute_signatures(puzzles_iter, seeds, tmp)
+        roots = find_clusters(signatures, threshold) if len(ids) else np.zeros(0, dtype=np.int64)
+        del signatures
+    keep = pick_representatives(roots, popularity)
+    return ids, keep, roots
+
+
+def cluster_report(ids, keep, roots, limit=1000):
+    """Largest clusters as {kept_id: [dropped ids...]}."""
+    clusters = {}
+    for row in np.nonzero(~keep)[0]:
+        clusters.setdefault(int(roots[row]), []).append(int(ids[row]))
+    kept_by_root = {int(roots[row]): int(ids[row]) for row in np.nonzero(keep)[0]}
+    largest = sorted(clusters.items(), key=lambda item: len(item[1]), reverse=True)[:limit]
+    return {str(kept_by_root[root]): dropped for root, dropped in largest}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Drop near-duplicate puzzles using MinHash/LSH.')
+    parser.add_argument('--input', default=DEFAULT_PUZZLES_FILE, help='puzzle JSON or Lichess CSV(.zst)')
+    parser.add_argument('--output', help='write kept puzzles as JSON (second streaming pass)')
+    parser.add_argument('--report', help='write the largest clusters to this JSON file')
+    parser.add_argument('--threshold', type=float, default=DEFAULT_THRESHOLD, help='Jaccard threshold')
+    parser.add_argument('--work-dir', help='directory for the signature memmap (default: system temp)')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Near-Duplicate Puzzle Detection")
+    print("=" * 70)
+
+    start = time.perf_counter()
+    ids, keep, roots = deduplicate(iter_puzzles(args.input), args.threshold, args.work_dir)
+    elapsed = time.perf_counter() - start
+
+    dropped = int((~keep).sum())
+    clusters = len(np.unique(roots[~keep])) if dropped else 0
+    print(f"\nScanned {len(ids)} puzzles in {elapsed:.1f}s ({len(ids) / max(elapsed, 1e-9):.0f}/s)")
+    print(f"  Near-duplicate clusters: {clusters}")
+    print(f"  Dropped: {dropped}, kept: {int(keep.sum())}")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(cluster_report(ids, keep, roots), f, indent=2)
+        print(f"✓ Cluster report written to {args.report}")
+
+    if args.output:
+        kept_ids = set(ids[keep].tolist())
+        kept = [p for p in iter_puzzles(args.input) if p['id'] in kept_ids]
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(kept, f, indent=2, ensure_ascii=False)
+        print(f"✓ Saved {len(kept)} puzzles to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,488 @@
+#!/usr/bin/env python3
+"""
+Build a Polyglot opening book from local PGN archives.
+
+SimpleBotService and LightweightEngineService play offline with no
+opening knowledge beyond a handful of hard-coded replies, so they spend
+their search budget on move 1 and still play odd openings. This script
+streams PGN archives (.pgn or .pgn.zst, e.g. Lichess monthly dumps),
+replays the first --plies plies of every game and writes a standard
+Polyglot book that a bot can binary-search without parsing anything:
+
+    entry   16 bytes, big-endian: key u64 (Polyglot Zobrist hash of the
+            position), move u16, weight u16, learn u32 (always 0)
+    order   sorted by key, then by weight (descending)
+    move    to_file | to_rank << 3 | from_file << 6 | from_rank << 9 |
+            promotion << 12 (N=1 B=2 R=3 Q=4); castling is written as
+            the king capturing its own rook (e1h1), as Polyglot expects
+
+Each game adds 2 to the weight of every move the winner played and 1 to
+both sides' moves in a draw; losing moves add nothing, so a move needs
+wins or draws behind it to be in the book. Pairs seen in fewer than
+--min-games games are dropped, and a position's weights are scaled down
+together when the top one would overflow 16 bits.
+
+Aggregation is an external-memory sort-and-merge: workers turn batches
+of games into (key, move, weight, count) rows, the main process sorts
+and sums them into runs of at most --run-entries rows on disk, and a
+chunked k-way merge over the runs (cut at key boundaries so no position
+is split) sums them again and writes the book. Memory stays at about
+one run plus one chunk per run, however big the archive.
+
+Replaying SAN is the cost of a build. Each worker keeps the positions
+of the opening prefixes it has already replayed (PrefixCache), so a game
+is only parsed from the ply where it leaves well-trodden theory, and
+Zobrist keys are updated from the bitboards a move changed rather than
+rehashed square by square. `build` reports games/s; `benchmark` times
+lookups against python-chess's reader.
+
+Usage:
+    python scripts/opening_book.py build --pgn lichess_db_standard_rated_2024-01.pgn.zst \
+        [--output build/opening_book.bin] [--plies 20] [--min-games 3] [--workers N]
+    python scripts/opening_book.py probe --book build/opening_book.bin [--fen FEN]
+    python scripts/opening_book.py benchmark --book build/opening_book.bin [--lookups 100000]
+"""
+
+import argparse
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+
+import chess
+import chess.polyglot
+import numpy as np
+
+from mine_pgn_puzzles import tokenize_game
+from pgn_index import iter_pgn_games, open_pgn
+
+DEFAULT_OUTPUT = 'build/opening_book.bin'
+DEFAULT_PLIES = 20
+DEFAULT_MIN_GAMES = 3
+RUN_ENTRIES = 4_000_000
+MERGE_CHUNK = 1 << 18
+GAMES_PER_TASK = 256
+PREFIX_CACHE = 20000
+MAX_WEIGHT = 0xFFFF
+
+ENTRY = np.dtype([('key', '>u8'), ('move', '>u2'), ('weight', '>u2'), ('learn', '>u4')])
+RUN = np.dtype([('key', '<u8'), ('move', '<u2'), ('weight', '<u4'), ('count', '<u4')])
+# Weight of a move for (white, black) by game result.
+RESULT_WEIGHTS = {'1-0': (2, 0), '0-1': (0, 2), '1/2-1/2': (1, 1)}
+_ENTRY = struct.Struct('>QHHI')
+_ZOBRIST = chess.polyglot.ZobristHasher(chess.polyglot.POLYGLOT_RANDOM_ARRAY)
+_RANDOM = chess.polyglot.POLYGLOT_RANDOM_ARRAY
+
+
+def encode_move(board, move):
+    """Polyglot u16 for a legal `move` in `board`."""
+    to_square = move.to_square
+    if board.is_castling(move) and not board.chess960:
+        rook_file = 7 if chess.square_file(move.to_square) > chess.square_file(move.from_square) else 0
+        to_square = chess.square(rook_file, chess.square_rank(move.from_square))
+    promotion = move.promotion - 1 if move.promotion else 0
+    return to_square | move.from_square << 6 | promotion << 12
+
+
+def decode_move(board, raw):
+    """chess.Move for a Polyglot u16 in `board` (castling mapped back to king moves)."""
+    from_square, to_square = raw >> 6 & 63, raw & 63
+    promotion = raw >> 12 & 7
+    move = chess.Move(from_square, to_square, promotion + 1 if promotion else None)
+    if board.piece_type_at(from_square) == chess.KING and board.color_at(to_square) == board.turn \
+            and board.piece_type_at(to_square) == chess.ROOK:
+        # King "captures" its rook: the g- or c-file king move in standard chess.
+        file = 6 if to_square > from_square else 2
+        move = chess.Move(from_square, chess.square(file, chess.square_rank(from_square)))
+    return move
+
+
+def _piece_masks(board):
+    """Bitboards in Polyglot piece order: black pawn, white pawn, black knight, ..."""
+    black, white = board.occupied_co
+    return [mask & side for mask in (board.pawns, board.knights, board.bishops, board.rooks, board.queens,
+                                     board.kings) for side in (black, white)]
+
+
+class PrefixCache:
+    """
+    Opening prefixes already replayed, as a trie of SAN moves. Games share
+    their first plies, so most of a game's rows come from the trie and
+    only the plies after it leaves the trie are parsed and hashed.
+    """
+
+    def __init__(self, limit=PREFIX_CACHE):
+        self.root = {}
+        self.size = 0
+        self.limit = limit
+
+
+def game_rows(text, plies=DEFAULT_PLIES, min_elo=0, cache=None):
+    """(key, move, weight) for the first `plies` plies of one PGN game; [] if it is skipped."""
+    headers, sans = tokenize_game(text)
+    weights = RESULT_WEIGHTS.get(headers.get('Result'))
+    if weights is None or headers.get('Variant', 'Standard') not in ('Standard', 'From Position'):
+        return []
+    if min_elo:
+        try:
+            if min(int(headers['WhiteElo']), int(headers['BlackElo'])) < min_elo:
+                return []
+        except (KeyError, ValueError):
+            return []
+    try:
+        board = chess.Board(headers['FEN']) if 'FEN' in headers else chess.Board()
+    except ValueError:
+        return []
+    rows = []
+    # Trie nodes: [key, move, side, board after, masks after, pieces after, children].
+    children = cache.root if cache is not None and 'FEN' not in headers else None
+    node = None
+    # The piece part of the hash is updated from the bitboards a move
+    # changed; rehashing all 64 squares every ply was most of the build.
+    masks = _piece_masks(board)
+    pieces = _ZOBRIST.hash_board(board)
+    for san in sans[:plies]:
+        cached = children.get(san) if children is not None else None
+        if cached is not None:
+            node, children, board = cached, cached[6], None
+            rows.append((node[0], node[1], weights[node[2]]))
+            continue
+        if board is None:
+            board, masks, pieces = node[3].copy(stack=False), node[4], node[5]
+        try:
+            move = board.parse_san(san)
+        except ValueError:
+            break
+        key = pieces ^ _ZOBRIST.hash_castling(board) ^ _ZOBRIST.hash_ep_square(board) ^ _ZOBRIST.hash_turn(board)
+        side = board.turn == chess.BLACK
+        code = encode_move(board, move)
+        rows.append((key, code, weights[side]))
+        board.push(move)
+        changed = _piece_masks(board)
+        for index, (old, new) in enumerate(zip(masks, changed)):
+            for square in chess.scan_forward(old ^ new):
+                pieces ^= _RANDOM[64 * index + square]
+        masks = changed
+        if children is not None and cache.size < cache.limit:
+            cached = [key, code, side, board.copy(stack=False), masks, pieces, {}]
+            children[san] = cached
+            cache.size += 1
+            children = cached[6]
+        else:
+            children = None
+    return rows
+
+
+def aggregate(rows):
+    """Sort RUN rows by (key, move) and sum the weight and count of duplicates."""
+    if not len(rows):
+        return np.zeros(0, dtype=RUN)
+    rows = rows[np.lexsort((rows['move'], rows['key']))]
+    starts = np.flatnonzero(np.concatenate(([True], (rows['key'][1:] != rows['key'][:-1])
+                                            | (rows['move'][1:] != rows['move'][:-1]))))
+    out = rows[starts].copy()
+    out['weight'] = np.add.reduceat(rows['weight'], starts)
+    out['count'] = np.add.reduceat(rows['count'], starts)
+    return out
+
+
+_worker_options = {}
+_worker_cache = None
+
+
+def _init_worker(options):
+    global _worker_options, _worker_cache
+    _worker_options = options
+    _worker_cache = PrefixCache()
+
+
+def _book_batch(texts):
+    """(games read, games used, aggregated RUN rows) for a batch of PGN games."""
+    rows = []
+    used = 0
+    for text in texts:
+        found = game_rows(text.decode('utf-8', 'replace'), cache=_worker_cache, **_worker_options)
+        used += bool(found)
+        rows.extend(found)
+    table = np.zeros(len(rows), dtype=RUN)
+    if rows:
+        keys, moves, weights = zip(*rows)
+        table['key'] = np.array(keys, dtype=np.uint64)
+        table['move'] = moves
+        table['weight'] = weights
+        table['count'] = 1
+    return len(texts), used, aggregate(table)
+
+
+def _batches(paths, max_games=None, size=GAMES_PER_TASK):
+    batch = []
+    games = 0
+    for path in paths:
+        with open_pgn(path) as lines:
+            for _, text in iter_pgn_games(lines):
+                batch.append(text)
+                games += 1
+                if len(batch) == size:
+                    yield batch
+                    batch = []
+                if max_games and games >= max_games:
+                    if batch:
+                        yield batch
+                    return
+    if batch:
+        yield batch
+
+
+def _map_batches(paths, workers, max_games, options):
+    if workers == 1:
+        _init_worker(options)
+        for batch in _batches(paths, max_games):
+            yield _book_batch(batch)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(options,)) as pool:
+        pending = deque()
+        for batch in _batches(paths, max_games):
+            pending.append(pool.submit(_book_batch, batch))
+            if len(pending) >= workers * 4:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+class _RunReader:
+    """Sequential chunks of one sorted run file."""
+
+    def __init__(self, path, chunk):
+        self.file = open(path, 'rb')
+        self.chunk = chunk
+
+    def read(self):
+        data = np.fromfile(self.file, dtype=RUN, count=self.chunk)
+        if len(data) < self.chunk:
+            self.file.close()
+        return data
+
+    @property
+    def done(self):
+        return self.file.closed
+
+
+def merge_runs(paths, chunk=MERGE_CHUNK):
+    """Yield aggregated RUN chunks in key order; a key never spans two chunks."""
+    readers = [_RunReader(path, chunk) for path in paths]
+    buffers = [reader.read() for reader in readers]
+    while any(len(buffer) for buffer in buffers):
+        # Everything below the smallest "last key read" of the unfinished
+        # runs is complete: no later chunk can hold a smaller key.
+        open_runs = [i for i, reader in enumerate(readers) if not reader.done]
+        boundary = min(buffers[i]['key'][-1] for i in open_runs) if open_runs else None
+        parts = []
+        for i, buffer in enumerate(buffers):
+            take = len(buffer) if boundary is None else np.searchsorted(buffer['key'], boundary)
+            parts.append(buffer[:take])
+            buffers[i] = buffer[take:]
+        merged = aggregate(np.concatenate(parts))
+        if len(merged):
+            yield merged
+        for i in open_runs:
+            if not len(buffers[i]) or buffers[i]['key'][-1] == boundary:
+                buffers[i] = np.concatenate([buffers[i], readers[i].read()])
+
+
+def book_entries(rows, min_games=DEFAULT_MIN_GAMES):
+    """ENTRY array (Polyglot order) for aggregated RUN rows holding whole positions."""
+    rows = rows[(rows['count'] >= min_games) & (rows['weight'] > 0)]
+    entries = np.zeros(len(rows), dtype=ENTRY)
+    if not len(rows):
+        return entries
+    starts = np.flatnonzero(np.concatenate(([True], rows['key'][1:] != rows['key'][:-1])))
+    top = np.maximum.reduceat(rows['weight'], starts)
+    sizes = np.diff(np.append(starts, len(rows)))
+    scale = np.repeat(np.minimum(1.0, MAX_WEIGHT / top), sizes)
+    weights = np.maximum(1, np.floor(rows['weight'] * scale)).astype(np.uint16)
+    order = np.lexsort((-weights.astype(np.int32), rows['key']))
+    entries['key'] = rows['key'][order]
+    entries['move'] = rows['move'][order]
+    entries['weight'] = weights[order]
+    return entries
+
+
+def build_book(paths, output, plies=DEFAULT_PLIES, min_games=DEFAULT_MIN_GAMES, min_elo=0, workers=None,
+               max_games=None, run_entries=RUN_ENTRIES, log=print):
+    """Stream `paths` into a Polyglot book at `output`. Returns a summary dict."""
+    workers = workers or os.cpu_count() or 1
+    options = {'plies': plies, 'min_elo': min_elo}
+    start = time.perf_counter()
+    games = used = pending_rows = 0
+    last_report = start
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with tempfile.TemporaryDirectory(dir=os.path.dirname(os.path.abspath(output))) as work:
+        runs, pending = [], []
+
+        def spill():
+            nonlocal pending_rows
+            path = os.path.join(work, f'run{len(runs):05d}.bin')
+            aggregate(np.concatenate(pending)).tofile(path)
+            runs.append(path)
+            pending.clear()
+            pending_rows = 0
+
+        for batch_games, batch_used, rows in _map_batches(paths, workers, max_games, options):
+            games += batch_games
+            used += batch_used
+            pending.append(rows)
+            pending_rows += len(rows)
+            if pending_rows >= run_entries:
+                spill()
+            now = time.perf_counter()
+            if now - last_report >= 10:
+                log(f"  {games} games, {len(runs)} runs, {games / (now - start):.0f} games/s")
+                last_report = now
+        if pending:
+            spill()
+        build_seconds = time.perf_counter() - start
+
+        entries = positions = 0
+        with open(output + '.tmp', 'wb') as f:
+            for rows in merge_runs(runs):
+                chunk = book_entries(rows, min_games)
+                chunk.tofile(f)
+                entries += len(chunk)
+                positions += int(np.count_nonzero(np.diff(chunk['key'].astype(np.uint64)))) + bool(len(chunk))
+        os.replace(output + '.tmp', output)
+
+    elapsed = time.perf_counter() - start
+    return {'games': games, 'games_used': used, 'runs': len(runs), 'entries': entries, 'positions': positions,
+            'bytes': entries * ENTRY.itemsize, 'seconds': round(elapsed, 2),
+            'games_per_second': round(games / max(build_seconds, 1e-9))}
+
+
+class OpeningBook:
+    """Read-only Polyglot book, binary-searched in place over an mmap."""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        size = os.fstat(self._file.fileno()).st_size
+        self._data = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        self.size = size // ENTRY.itemsize
+
+    def close(self):
+        if isinstance(self._data, mmap.mmap):
+            self._data.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def __len__(self):
+        return self.size
+
+    def _key(self, index):
+        return _ENTRY.unpack_from(self._data, index * ENTRY.itemsize)[0]
+
+    def entries(self, key):
+        """[(move u16, weight)] stored for a Zobrist key, heaviest first."""
+        low, high = 0, self.size
+        while low < high:
+            mid = (low + high) // 2
+            if self._key(mid) < key:
+                low = mid + 1
+            else:
+                high = mid
+        found = []
+        while low < self.size:
+            entry_key, move, weight, _ = _ENTRY.unpack_from(self._data, low * ENTRY.itemsize)
+            if entry_key != key:
+                break
+            found.append((move, weight))
+            low += 1
+        return found
+
+    def moves(self, board):
+        """[(chess.Move, weight)] for a position, heaviest first."""
+        return [(decode_move(board, move), weight)
+                for move, weight in self.entries(chess.polyglot.zobrist_hash(board))]
+
+
+def benchmark_lookups(path, lookups=100000, seed=0):
+    """Average lookup latency (microseconds) for keys in the book and random misses."""
+    rng = random.Random(seed)
+    with OpeningBook(path) as book:
+        if not len(book):
+            return {'entries': 0}
+        hits = [book._key(rng.randrange(len(book))) for _ in range(lookups)]
+        misses = [rng.getrandbits(64) for _ in range(lookups)]
+        timings = {}
+        for name, keys in (('hit', hits), ('miss', misses)):
+            start = time.perf_counter()
+            for key in keys:
+                book.entries(key)
+            timings[f'{name}_us'] = round((time.perf_counter() - start) / lookups * 1e6, 2)
+    with chess.polyglot.open_reader(path) as reader:
+        board = chess.Board()
+        start = time.perf_counter()
+        for _ in range(min(lookups, 10000)):
+            list(reader.find_all(board))
+        timings['python_chess_start_us'] = round((time.perf_counter() - start) / min(lookups, 10000) * 1e6, 2)
+    timings['entries'] = len(book)
+    return timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build, probe or benchmark a Polyglot opening book.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build = sub.add_parser('build', help='build a book from PGN archives')
+    build.add_argument('--pgn', nargs='+', required=True, help='PGN files (.pgn or .pgn.zst)')
+    build.add_argument('--output', default=DEFAULT_OUTPUT)
+    build.add_argument('--plies', type=int, default=DEFAULT_PLIES, help='plies replayed per game')
+    build.add_argument('--min-games', type=int, default=DEFAULT_MIN_GAMES, help='games a move needs to be kept')
+    build.add_argument('--min-elo', type=int, default=0, help='skip games where either player is rated below')
+    build.add_argument('--max-games', type=int, help='stop after this many games')
+    build.add_argument('--workers', type=int, help='process pool size (default: all cores)')
+    build.add_argument('--run-entries', type=int, default=RUN_ENTRIES, help='rows per sorted run on disk')
+    probe = sub.add_parser('probe', help='list the book moves for a position')
+    probe.add_argument('--book', default=DEFAULT_OUTPUT)
+    probe.add_argument('--fen', default=chess.STARTING_FEN)
+    bench = sub.add_parser('benchmark', help='time book lookups')
+    bench.add_argument('--book', default=DEFAULT_OUTPUT)
+    bench.add_argument('--lookups', type=int, default=100000)
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Opening Book")
+    print("=" * 70)
+
+    if args.command == 'build':
+        summary = build_book(args.pgn, args.output, args.plies, args.min_games, args.min_elo, args.workers,
+                             args.max_games, args.run_entries)
+        print(f"\nRead {summary['games']} games ({summary['games_used']} used) in {summary['seconds']}s, "
+              f"{summary['games_per_second']} games/s, {summary['runs']} sorted runs")
+        print(f"✓ Saved {summary['entries']} entries for {summary['positions']} positions "
+              f"({summary['bytes'] / (1 << 20):.1f} MB) to {args.output}")
+    elif args.command == 'probe':
+        board = chess.Board(args.fen)
+        with OpeningBook(args.book) as book:
+            moves = book.moves(board)
+        total = sum(weight for _, weight in moves) or 1
+        print(f"{len(moves)} book moves for {args.fen}")
+        for move, weight in moves:
+            print(f"  {board.san(move):<8} {weight:>6} {100 * weight / total:5.1f}%")
+    else:
+        timings = benchmark_lookups(args.book, args.lookups)
+        print(f"{timings['entries']} entries")
+        for name, value in timings.items():
+            if name != 'entries':
+                print(f"  {name:<24} {value}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
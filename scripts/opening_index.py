@@ -0,0 +1,275 @@
+#!/usr/bin/env python3
+"""
+Opening-tag trie over puzzle packs.
+
+The Lichess CSV's last column, OpeningTags, names the opening a puzzle
+came from as a family followed by ever more specific variations:
+
+    Sicilian_Defense Sicilian_Defense_Najdorf_Variation
+    Sicilian_Defense Sicilian_Defense_Najdorf_Variation Sicilian_Defense_Najdorf_Variation_English_Attack
+
+Each tag extends its parent's name, so the tags form a tree: family ->
+variation -> sub-variation. OpeningTrie stores that tree with a posting
+list per node holding every puzzle at or below it, sorted by rating.
+That makes the common queries cheap:
+
+    per-opening counts    len(node postings), no pass over the puzzles
+    "Najdorf 1600-1800"   prefix lookup on the tag names (one bisect over
+                          the sorted tags, or over the variation names
+                          when no full tag matches), then a rating range
+                          on each matching node's postings (two bisects)
+
+The exported index (openings.json next to puzzles.json) is a flat node
+list in preorder:
+
+    {"version": 1, "nodes": [{"tag", "parent", "count", "ids", "ratings"}, ...]}
+
+with `ids` sorted by (rating, id) and `ratings` alongside, so a client can
+run the same range lookup without loading the puzzles.
+
+Usage:
+    python scripts/opening_index.py --input lichess_db_puzzle.csv.zst --output build/openings.json
+    python scripts/opening_index.py --index build/openings.json --query Sicilian_Defense_Najdorf \
+        --min-rating 1600 --max-rating 1800
+    python scripts/opening_index.py --index build/openings.json --top 20
+"""
+
+import argparse
+import bisect
+import json
+import sys
+
+from puzzle_io import DEFAULT_PUZZLES_FILE, iter_puzzles
+
+VERSION = 1
+
+
+def normalize_tag(text):
+    """'sicilian defense najdorf' -> 'Sicilian_Defense_Najdorf' style lookup key (case-folded)."""
+    return '_'.join(text.replace('_', ' ').split()).casefold()
+
+
+def opening_path(opening_tags):
+    """The OpeningTags column as a root-to-leaf list of tags."""
+    tags = opening_tags.split() if opening_tags else []
+    # Lichess lists family first; sort by length in case a source does not.
+    return sorted(dict.fromkeys(tags), key=len)
+
+
+class OpeningNode:
+    """One opening or variation, with its puzzles sorted by rating."""
+
+    __slots__ = ('tag', 'parent', 'children', 'ids', 'ratings')
+
+    def __init__(self, tag, parent):
+        self.tag = tag
+        self.parent = parent
+        self.children = {}
+        self.ids = []
+        self.ratings = []
+
+    @property
+    def name(self):
+        """The tag without its parent's prefix, e.g. 'Najdorf_Variation'."""
+        if self.parent is not None and self.parent.tag and self.tag.startswith(self.parent.tag + '_'):
+            return self.tag[len(self.parent.tag) + 1:]
+        return self.tag
+
+    def __len__(self):
+        return len(self.ids)
+
+    def in_range(self, min_rating=None, max_rating=None):
+        """IDs of this node's puzzles rated min_rating..max_rating (inclusive)."""
+        low = 0 if min_rating is None else bisect.bisect_left(self.ratings, min_rating)
+        high = len(self.ratings) if max_rating is None else bisect.bisect_right(self.ratings, max_rating)
+        return self.ids[low:high]
+
+
+class OpeningTrie:
+    """Family -> variation tree of opening tags with per-node posting lists."""
+
+    def __init__(self):
+        self.root = OpeningNode('', None)
+        self._by_key = {}
+        self._sorted_keys = self._sorted_names = None
+
+    def add(self, puzzle_id, rating, opening_tags):
+        """Index one puzzle under every node on its opening path. Returns False if it has no tags."""
+        path = opening_path(opening_tags)
+        node = self.root
+        for tag in path:
+            child = node.children.get(tag)
+            if child is None:
+                child = node.children[tag] = OpeningNode(tag, node)
+                self._by_key[normalize_tag(tag)] = child
+            child.ids.append(puzzle_id)
+            child.ratings.append(rating)
+            node = child
+        self._sorted_keys = None
+        return bool(path)
+
+    def finish(self):
+        """Sort every posting list by (rating, id). Call once after the last add()."""
+        for node in self.nodes():
+            order = sorted(zip(node.ratings, node.ids))
+            node.ratings = [rating for rating, _ in order]
+            node.ids = [puzzle_id for _, puzzle_id in order]
+        return self
+
+    def nodes(self):
+        """Every node except the root, in preorder (children by descending count)."""
+        stack = [self.root]
+        while stack:
+            node = stack.pop()
+            if node is not self.root:
+                yield node
+            stack.extend(sorted(node.children.values(), key=lambda n: (len(n), n.tag)))
+
+    def get(self, tag):
+        return self._by_key.get(normalize_tag(tag))
+
+    def _prefix_matches(self, keys, key):
+        start = bisect.bisect_left(keys, (key,))
+        for candidate, node in keys[start:]:
+            if not candidate.startswith(key):
+                break
+            yield node
+
+    def lookup(self, prefix):
+        """
+        The outermost nodes whose tag starts with `prefix` ('Sicilian_Defense_Najdorf'),
+        or failing that whose own name does ('Najdorf' -> Najdorf_Variation).
+        Case and '_' vs ' ' are ignored. Descendants of a match are left out
+        because the match's postings already contain theirs.
+        """
+        if self._sorted_keys is None:
+            self._sorted_keys = sorted((key, node) for key, node in self._by_key.items())
+            self._sorted_names = sorted(((normalize_tag(node.name), key), node) for key, node in self._by_key.items())
+        key = normalize_tag(prefix)
+        matches = list(self._prefix_matches(self._sorted_keys, key))
+        if not matches:
+            start = bisect.bisect_left(self._sorted_names, ((key, ''),))
+            for (name, _), node in self._sorted_names[start:]:
+                if not name.startswith(key):
+                    break
+                matches.append(node)
+        matched = {id(node) for node in matches}
+        outermost = []
+        for node in matches:
+            parent = node.parent
+            while parent is not None and id(parent) not in matched:
+                parent = parent.parent
+            if parent is None:
+                outermost.append(node)
+        return outermost
+
+    def query(self, prefix, min_rating=None, max_rating=None):
+        """Sorted IDs of the puzzles under openings matching `prefix`, rated min..max."""
+        ids = set()
+        for node in self.lookup(prefix):
+            ids.update(node.in_range(min_rating, max_rating))
+        return sorted(ids)
+
+    def counts(self, depth=None):
+        """{tag: puzzle count} for every node (or only nodes `depth` levels down, 1 = families)."""
+        counts = {}
+        for node in self.nodes():
+            if depth is None or _depth(node) == depth:
+                counts[node.tag] = len(node)
+        return counts
+
+    def to_json(self):
+        nodes = list(self.nodes())
+        index = {id(node): i for i, node in enumerate(nodes)}
+        return {
+            'version': VERSION,
+            'nodes': [{'tag': node.tag, 'parent': index.get(id(node.parent), -1), 'count': len(node),
+                       'ids': node.ids, 'ratings': node.ratings} for node in nodes],
+        }
+
+    @classmethod
+    def from_json(cls, data):
+        if data.get('version') != VERSION:
+            raise ValueError(f"unsupported opening index version {data.get('version')!r}")
+        trie = cls()
+        built = []
+        for entry in data['nodes']:
+            parent = trie.root if entry['parent'] < 0 else built[entry['parent']]
+            node = parent.children[entry['tag']] = OpeningNode(entry['tag'], parent)
+            node.ids = list(entry['ids'])
+            node.ratings = list(entry['ratings'])
+            trie._by_key[normalize_tag(entry['tag'])] = node
+            built.append(node)
+        return trie
+
+
+def _depth(node):
+    depth = 0
+    while node.parent is not None:
+        depth += 1
+        node = node.parent
+    return depth
+
+
+def build_trie(puzzles):
+    """OpeningTrie over puzzle records carrying 'opening_tags'. Returns (trie, tagged count)."""
+    trie = OpeningTrie()
+    tagged = 0
+    for puzzle in puzzles:
+        tagged += trie.add(puzzle['id'], puzzle['rating'], puzzle.get('opening_tags', ''))
+    return trie.finish(), tagged
+
+
+def save_index(trie, path):
+    with open(path, 'w', encoding='utf-8') as f:
+        json.dump(trie.to_json(), f, separators=(',', ':'))
+
+
+def load_index(path):
+    with open(path, 'r', encoding='utf-8') as f:
+        return OpeningTrie.from_json(json.load(f))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query the opening-tag trie index.')
+    parser.add_argument('--input', help=f'puzzle JSON or Lichess CSV(.zst) to index (e.g. {DEFAULT_PUZZLES_FILE})')
+    parser.add_argument('--output', help='write the index as JSON')
+    parser.add_argument('--index', help='query an index written by --output')
+    parser.add_argument('--query', help='opening tag prefix, e.g. Sicilian_Defense_Najdorf')
+    parser.add_argument('--min-rating', type=int)
+    parser.add_argument('--max-rating', type=int)
+    parser.add_argument('--top', type=int, default=10, help='families to list with their counts')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Opening Index")
+    print("=" * 70)
+
+    if args.input:
+        trie, tagged = build_trie(iter_puzzles(args.input))
+        print(f"✓ Indexed {tagged} puzzles with opening tags into {sum(1 for _ in trie.nodes())} nodes")
+        if args.output:
+            save_index(trie, args.output)
+            print(f"✓ Saved index to {args.output}")
+    elif args.index:
+        trie = load_index(args.index)
+    else:
+        parser.error('give --input to build an index or --index to query one')
+
+    if args.query:
+        nodes = trie.lookup(args.query)
+        ids = trie.query(args.query, args.min_rating, args.max_rating)
+        print(f"\n{args.query!r}: {len(nodes)} matching openings, {len(ids)} puzzles in range")
+        for node in nodes[:args.top]:
+            print(f"  {node.tag:<60} {len(node.in_range(args.min_rating, args.max_rating)):>7}")
+        return 0
+
+    families = sorted(trie.counts(depth=1).items(), key=lambda item: -item[1])
+    print(f"\nTop {min(args.top, len(families))} of {len(families)} opening families:")
+    for tag, count in families[:args.top]:
+        print(f"  {tag:<60} {count:>7}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
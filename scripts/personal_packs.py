@@ -0,0 +1,181 @@
+#!/usr/bin/env python3
+"""
+Build personalised next-puzzle packs from exported device databases.
+
+Each device's chess_master.db holds puzzle_progress(puzzle_id, attempts,
+solved, last_attempted) and statistics.current_puzzle_rating, but the app
+still filters its recently solved IDs against the full puzzle list at
+runtime. This tool does the filtering offline for many users at once:
+
+  1. The pack is sorted by rating and every puzzle gets a dense index, so
+     a rating window (rating +/- RATING_WINDOW) is one contiguous range.
+     One roaring bitmap per balanced theme (quota_selector's theme list)
+     is built once per worker.
+  2. Each user's solved set becomes a roaring bitmap over those indices;
+     candidates are range(window) minus solved.
+  3. Slots are filled round-robin from the least-used theme that still has
+     candidates (theme bitmap & candidates), then from any candidate. Picks
+     are random but seeded per user, so reruns give the same pack.
+
+Databases are processed on a process pool; results are written as JSON
+lines, one user per line.
+
+Usage:
+    python scripts/personal_packs.py --db-dir exported_dbs/ --output packs.jsonl \
+        [--input assets/puzzles/puzzles.json] [--pack-size 50] [--workers N]
+"""
+
+import argparse
+import bisect
+import glob
+import json
+import os
+import random
+import sqlite3
+import sys
+import time
+import zlib
+from concurrent.futures import ProcessPoolExecutor
+
+from pyroaring import BitMap
+
+from puzzle_io import DEFAULT_PUZZLES_FILE, load_puzzles, split_themes
+from quota_selector import DEFAULT_TARGETS
+
+RATING_WINDOW = 200
+DEFAULT_PACK_SIZE = 50
+DEFAULT_RATING = 1200
+BALANCED_THEMES = tuple(DEFAULT_TARGETS['theme'])
+
+
+class PackIndex:
+    """Rating-sorted puzzle IDs plus one bitmap of dense indices per theme."""
+
+    def __init__(self, puzzles, themes=BALANCED_THEMES):
+        ordered = sorted(puzzles, key=lambda p: (p['rating'], p['id']))
+        self.ids = [p['id'] for p in ordered]
+        self.ratings = [p['rating'] for p in ordered]
+        self.position = {pid: i for i, pid in enumerate(self.ids)}
+        wanted = set(themes)
+        self.themes = {}
+        for i, puzzle in enumerate(ordered):
+            for theme in split_themes(puzzle.get('themes', '')):
+                if theme in wanted:
+                    self.themes.setdefault(theme, BitMap()).add(i)
+
+    def window(self, rating, width=RATING_WINDOW):
+        """Dense index range [lo, hi) of puzzles within rating +/- width."""
+        return bisect.bisect_left(self.ratings, rating - width), bisect.bisect_right(self.ratings, rating + width)
+
+    def solved_bitmap(self, puzzle_ids):
+        """Bitmap of dense indices for the solved IDs that are in this pack."""
+        return BitMap(self.position[pid] for pid in puzzle_ids if pid in self.position)
+
+    def build_pack(self, rating, solved, size=DEFAULT_PACK_SIZE, seed=0):
+        """Pick up to `size` unsolved puzzle IDs near `rating`, theme-balanced."""
+        lo, hi = self.window(rating)
+        candidates = BitMap(range(lo, hi)) - solved
+        rng = random.Random(seed)
+        used = {theme: 0 for theme in self.themes}
+        picks = []
+        while len(picks) < size and candidates:
+            pool = None
+            for theme in sorted(used, key=lambda t: (used[t], t)):
+                pool = self.themes[theme] & candidates
+                if pool:
+                    used[theme] += 1
+                    break
+                del used[theme]
+            if not pool:
+                pool = candidates
+            pick = pool[rng.randrange(len(pool))]
+            candidates.discard(pick)
+            picks.append(self.ids[pick])
+        return picks
+
+
+def read_user_db(path):
+    """Return (rating, solved puzzle IDs, attempted count) from one exported DB."""
+    conn = sqlite3.connect(f'file:{path}?mode=ro', uri=True)
+    try:
+        row = conn.execute('SELECT current_puzzle_rating FROM statistics WHERE id = 1').fetchone()
+        rating = row[0] if row and row[0] is not None else DEFAULT_RATING
+        solved = [r[0] for r in conn.execute('SELECT puzzle_id FROM puzzle_progress WHERE solved = 1')]
+        attempted = conn.execute('SELECT COUNT(*) FROM puzzle_progress').fetchone()[0]
+    finally:
+        conn.close()
+    return rating, solved, attempted
+
+
+_index = None
+_pack_size = DEFAULT_PACK_SIZE
+
+
+def _init_worker(puzzles_file, pack_size):
+    global _index, _pack_size
+    _index = PackIndex(load_puzzles(puzzles_file))
+    _pack_size = pack_size
+
+
+def _pack_for_db(path):
+    user = os.path.splitext(os.path.basename(path))[0]
+    try:
+        rating, solved_ids, attempted = read_user_db(path)
+    except sqlite3.Error as e:
+        return {'user': user, 'error': str(e)}
+    solved = _index.solved_bitmap(solved_ids)
+    pack = _index.build_pack(rating, solved, _pack_size, seed=zlib.crc32(user.encode('utf-8')))
+    return {'user': user, 'rating': rating, 'solved': len(solved_ids), 'attempted': attempted, 'pack': pack}
+
+
+def build_packs(db_paths, puzzles_file=DEFAULT_PUZZLES_FILE, pack_size=DEFAULT_PACK_SIZE,
+                workers=None, chunksize=32):
+    """Yield one result dict per database, in input order."""
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        _init_worker(puzzles_file, pack_size)
+        yield from map(_pack_for_db, db_paths)
+        return
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(puzzles_file, pack_size)) as pool:
+        yield from pool.map(_pack_for_db, db_paths, chunksize=chunksize)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build personalised puzzle packs from exported device DBs.')
+    parser.add_argument('--db-dir', required=True, help='directory of exported *.db files')
+    parser.add_argument('--input', default=DEFAULT_PUZZLES_FILE, help='puzzle JSON file')
+    parser.add_argument('--output', default='build/personal_packs.jsonl', help='JSON lines output')
+    parser.add_argument('--pack-size', type=int, default=DEFAULT_PACK_SIZE)
+    parser.add_argument('--workers', type=int, help='worker processes (default: all cores)')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Personalised Pack Builder")
+    print("=" * 70)
+
+    db_paths = sorted(glob.glob(os.path.join(args.db_dir, '*.db')))
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    start = time.perf_counter()
+    errors = 0
+    short = 0
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for result in build_packs(db_paths, args.input, args.pack_size, args.workers):
+            if 'error' in result:
+                errors += 1
+                print(f"  ✗ {result['user']}: {result['error']}")
+                continue
+            short += len(result['pack']) < args.pack_size
+            f.write(json.dumps(result) + '\n')
+    elapsed = time.perf_counter() - start
+
+    print(f"\nBuilt {len(db_paths) - errors} packs in {elapsed:.1f}s "
+          f"({len(db_paths) / max(elapsed, 1e-9) * 60:.0f} DBs/min)")
+    if short:
+        print(f"  {short} users ran out of unsolved puzzles in their rating window")
+    print(f"✓ Saved packs to {args.output}")
+    return 0 if not errors else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,268 @@
+#!/usr/bin/env python3
+"""
+Index a local Lichess PGN dump by game ID and extract puzzle source games.
+
+Every puzzle parser drops the GameUrl column
+(https://lichess.org/yyznGmXs/black#48), so puzzles lose their game. The
+monthly dumps (lichess_db_standard_rated_YYYY-MM.pgn.zst) are one zstd
+frame of several GB, and a zstd stream cannot be resumed mid-frame, so:
+
+  build    stream the dump once and re-frame it into independent zstd
+           frames of ~FRAME_SIZE uncompressed bytes, cut at game
+           boundaries (<dump>.seekable.zst, still a valid .zst file),
+           and record in SQLite (<dump>.index.sqlite):
+               frames(frame, comp_offset, comp_size, raw_size)
+               games(game_id, frame, offset, length)
+  extract  read puzzles (Lichess CSV or JSON with game_url), group the
+           wanted games by frame, and on a process pool decompress each
+           needed frame once, cut out the games and replay them to the
+           puzzle ply. Output is JSON lines with the PGN prefix.
+
+The ply in GameUrl is where the puzzle starts. The prefix ends at the ply
+whose position equals the puzzle FEN (checked at #N and #N-1, whichever
+matches), otherwise at #N; `fen_match` records which.
+
+Usage:
+    python scripts/pgn_index.py build --dump lichess_db_standard_rated_2024-01.pgn.zst
+    python scripts/pgn_index.py extract --dump lichess_db_standard_rated_2024-01.pgn.zst \
+        --puzzles lichess_db_puzzle.csv.zst --output build/source_games.jsonl [--workers N]
+"""
+
+import argparse
+import io
+import json
+import os
+import re
+import sqlite3
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import chess
+import chess.pgn
+import zstandard as zstd
+
+from puzzle_io import iter_puzzles
+
+FRAME_SIZE = 4 * 1024 * 1024
+ZSTD_LEVEL = 3
+INSERT_BATCH = 50000
+
+_SITE = re.compile(rb'^\[Site "https?://lichess\.org/(\w{8})')
+_GAME_URL = re.compile(r'lichess\.org/(\w{8})(?:\w{4})?(?:/(white|black))?(?:#(\d+))?')
+
+
+def index_paths(dump):
+    """(seekable dump path, index path) for a dump."""
+    base = dump[:-4] if dump.endswith('.zst') else dump
+    return base + '.seekable.zst', base + '.index.sqlite'
+
+
+def parse_game_url(url):
+    """Return (game_id, ply) from a GameUrl, or None."""
+    match = _GAME_URL.search(url or '')
+    if not match:
+        return None
+    return match.group(1), int(match.group(3) or 0)
+
+
+def iter_pgn_games(lines):
+    """Group PGN lines (bytes) into games; yields (game_id or None, game bytes)."""
+    game, game_id, in_moves = [], None, False
+    for line in lines:
+        if line.startswith(b'[Event ') and in_moves:
+            yield game_id, b''.join(game)
+            game, game_id, in_moves = [], None, False
+        if line.startswith(b'['):
+            match = _SITE.match(line)
+            if match:
+                game_id = match.group(1).decode('ascii')
+        elif line.strip():
+            in_moves = True
+        game.append(line)
+    if game:
+        yield game_id, b''.join(game)
+
+
+def open_pgn(path):
+    """Open a PGN file as binary lines, decompressing `.zst` on the fly."""
+    if path.endswith('.zst'):
+        raw = open(path, 'rb')
+        return io.BufferedReader(zstd.ZstdDecompressor().stream_reader(raw, closefd=True), 1 << 20)
+    return open(path, 'rb')
+
+
+def _connect(index_path):
+    conn = sqlite3.connect(index_path)
+    conn.execute('CREATE TABLE IF NOT EXISTS frames ('
+                 ' frame INTEGER PRIMARY KEY, comp_offset INTEGER, comp_size INTEGER, raw_size INTEGER)')
+    conn.execute('CREATE TABLE IF NOT EXISTS games ('
+                 ' game_id TEXT PRIMARY KEY, frame INTEGER, offset INTEGER, length INTEGER)')
+    return conn
+
+
+def build_index(dump, frame_size=FRAME_SIZE, level=ZSTD_LEVEL):
+    """Re-frame `dump` and index it. Returns (games indexed, frames written)."""
+    seekable_path, index_path = index_paths(dump)
+    for path in (seekable_path, index_path):
+        if os.path.exists(path):
+            os.remove(path)
+    conn = _connect(index_path)
+    compressor = zstd.ZstdCompressor(level=level)
+
+    frame_no = 0
+    comp_offset = 0
+    buffer = []
+    buffered = 0
+    pending = []
+    games = 0
+
+    with open_pgn(dump) as lines, open(seekable_path, 'wb') as out:
+        def flush_frame():
+            nonlocal frame_no, comp_offset, buffered
+            data = compressor.compress(b''.join(buffer))
+            out.write(data)
+            conn.execute('INSERT INTO frames VALUES (?, ?, ?, ?)', (frame_no, comp_offset, len(data), buffered))
+            comp_offset += len(data)
+            frame_no += 1
+            buffer.clear()
+            buffered = 0
+
+        for game_id, game in iter_pgn_games(lines):
+            if buffered and buffered + len(game) > frame_size:
+                flush_frame()
+            if game_id:
+                pending.append((game_id, frame_no, buffered, len(game)))
+                games += 1
+            buffer.append(game)
+            buffered += len(game)
+            if len(pending) >= INSERT_BATCH:
+                conn.executemany('INSERT OR IGNORE INTO games VALUES (?, ?, ?, ?)', pending)
+                pending.clear()
+        if buffer:
+            flush_frame()
+    conn.executemany('INSERT OR IGNORE INTO games VALUES (?, ?, ?, ?)', pending)
+    conn.commit()
+    conn.close()
+    return games, frame_no
+
+
+def _prefix(pgn_text, ply, puzzle_fen):
+    """Replay a game and cut it at the puzzle ply. Returns a result dict."""
+    game = chess.pgn.read_game(io.StringIO(pgn_text))
+    if game is None:
+        return {'error': 'unreadable game'}
+    moves = list(game.mainline_moves())
+    board = game.board()
+    fens = [board.board_fen()]
+    for move in moves[:ply + 1]:
+        board.push(move)
+        fens.append(board.board_fen())
+
+    target = puzzle_fen.split(' ')[0] if puzzle_fen else None
+    cut, fen_match = min(ply, len(moves)), False
+    for candidate in (ply, ply - 1):
+        if target and 0 <= candidate < len(fens) and fens[candidate] == target:
+            cut, fen_match = candidate, True
+            break
+
+    prefix = chess.pgn.Game(headers=game.headers)
+    node = prefix
+    for move in moves[:cut]:
+        node = node.add_variation(move)
+    exporter = chess.pgn.StringExporter(headers=True, variations=False, comments=False)
+    return {'ply': cut, 'fen_match': fen_match, 'pgn': prefix.accept(exporter)}
+
+
+def _extract_frame(task):
+    """Worker: decompress one frame and cut out every requested game."""
+    seekable_path, comp_offset, comp_size, wanted = task
+    with open(seekable_path, 'rb') as f:
+        f.seek(comp_offset)
+        data = zstd.ZstdDecompressor().decompress(f.read(comp_size))
+    results = []
+    for puzzle_id, game_id, offset, length, ply, fen in wanted:
+        result = _prefix(data[offset:offset + length].decode('utf-8', 'replace'), ply, fen)
+        result.update({'puzzle_id': puzzle_id, 'game_id': game_id})
+        results.append(result)
+    return results
+
+
+def extract_games(dump, puzzles, workers=None):
+    """
+    Yield one result dict per puzzle whose source game is in the index.
+
+    Puzzles without a game_url, or whose game is not in this dump, are
+    skipped; results come frame by frame, not in puzzle order.
+    """
+    seekable_path, index_path = index_paths(dump)
+    conn = sqlite3.connect(index_path)
+    by_frame = {}
+    try:
+        for puzzle in puzzles:
+            parsed = parse_game_url(puzzle.get('game_url'))
+            if not parsed:
+                continue
+            game_id, ply = parsed
+            row = conn.execute('SELECT frame, offset, length FROM games WHERE game_id = ?', (game_id,)).fetchone()
+            if row is None:
+                continue
+            frame, offset, length = row
+            by_frame.setdefault(frame, []).append(
+                (puzzle.get('lichess_id', puzzle['id']), game_id, offset, length, ply, puzzle.get('fen')))
+        frames = {frame: (offset, size) for frame, offset, size in
+                  conn.execute('SELECT frame, comp_offset, comp_size FROM frames')}
+    finally:
+        conn.close()
+
+    tasks = [(seekable_path, *frames[frame], wanted) for frame, wanted in sorted(by_frame.items())]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        for task in tasks:
+            yield from _extract_frame(task)
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        for results in pool.map(_extract_frame, tasks):
+            yield from results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Index a Lichess PGN dump and extract puzzle source games.')
+    sub = parser.add_subparsers(dest='command', required=True)
+    build_cmd = sub.add_parser('build', help='re-frame and index a dump')
+    build_cmd.add_argument('--dump', required=True, help='lichess_db_standard_rated_*.pgn(.zst)')
+    build_cmd.add_argument('--frame-size', type=int, default=FRAME_SIZE, help='uncompressed bytes per frame')
+    extract_cmd = sub.add_parser('extract', help='extract source-game prefixes for puzzles')
+    extract_cmd.add_argument('--dump', required=True, help='dump that was indexed with build')
+    extract_cmd.add_argument('--puzzles', required=True, help='Lichess puzzle CSV(.zst) or JSON with game_url')
+    extract_cmd.add_argument('--output', default='build/source_games.jsonl')
+    extract_cmd.add_argument('--workers', type=int, help='worker processes (default: all cores)')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Source Game Index")
+    print("=" * 70)
+
+    start = time.perf_counter()
+    if args.command == 'build':
+        games, frames = build_index(args.dump, args.frame_size)
+        seekable_path, index_path = index_paths(args.dump)
+        print(f"✓ Indexed {games} games in {frames} frames in {time.perf_counter() - start:.1f}s")
+        print(f"  {seekable_path}\n  {index_path}")
+        return 0
+
+    os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+    found = matched = 0
+    with open(args.output, 'w', encoding='utf-8') as f:
+        for result in extract_games(args.dump, iter_puzzles(args.puzzles), args.workers):
+            found += 1
+            matched += result.get('fen_match', False)
+            f.write(json.dumps(result) + '\n')
+    elapsed = time.perf_counter() - start
+    print(f"\nExtracted {found} source games in {elapsed:.1f}s ({matched} matched the puzzle FEN)")
+    print(f"✓ Saved to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,294 @@
+#!/usr/bin/env python3
+"""
+Vectorized per-puzzle position features for bucketing and pack balancing.
+
+Selection used to look only at `rating` and `popularity`. This stage adds
+numeric columns computed in NumPy batches straight from the FEN strings,
+for the position the solver actually sees (after the setup move):
+
+    white_to_move       1 if the solver is white
+    count_P .. count_k  piece counts per type and colour
+    piece_count         all pieces including kings
+    material_white/_black   P=1 N=3 B=3 R=5 Q=9
+    material_balance    solver material minus opponent material
+    phase               0 (bare kings/pawns) .. 24 (full set of pieces)
+    phase_class         0 opening, 1 middlegame, 2 endgame (see PHASES)
+    in_check            1 if the solver's king is in check
+    solution_length     solver moves in the line
+    solution_plies      plies after the setup move
+
+Boards are expanded from FEN with C-level string replaces into an (N, 64)
+uint8 array, the setup move is applied to all rows at once (including
+castling, en passant and promotion), and check detection walks knight,
+pawn, king and sliding rays as whole-column operations.
+
+Usage:
+    python scripts/position_features.py [--input puzzles.json] [--output with_features.json]
+        [--npz features.npz]
+"""
+
+import argparse
+import json
+import sys
+import time
+
+import numpy as np
+
+from puzzle_batch import PuzzleBatch
+from puzzle_io import DEFAULT_PUZZLES_FILE, load_puzzles, split_moves
+
+PIECES = '.PNBRQKpnbrqk'
+PHASES = ['opening', 'middlegame', 'endgame']
+PIECE_VALUES = {'P': 1, 'N': 3, 'B': 3, 'R': 5, 'Q': 9, 'K': 0}
+PHASE_WEIGHTS = {'P': 0, 'N': 1, 'B': 1, 'R': 2, 'Q': 4, 'K': 0}
+MAX_PHASE = 24
+# Opening: little material traded and still early; endgame: few pieces left.
+OPENING_MAX_MOVE = 12
+OPENING_MIN_PHASE = 20
+ENDGAME_MAX_PHASE = 8
+
+EMPTY, PAWN, KNIGHT, BISHOP, ROOK, QUEEN, KING = range(7)
+BLACK = 6
+
+_CODE = np.zeros(256, dtype=np.uint8)
+for _code, _char in enumerate(PIECES):
+    _CODE[ord(_char)] = _code
+_VALUES = np.array([0] + [PIECE_VALUES[c.upper()] for c in PIECES[1:]], dtype=np.int16)
+_PHASE = np.array([0] + [PHASE_WEIGHTS[c.upper()] for c in PIECES[1:]], dtype=np.int16)
+
+# FEN lists rank 8 first; square index is rank * 8 + file with a1 = 0.
+_FEN_TO_SQUARE = np.array([(7 - sq // 8) * 8 + sq % 8 for sq in range(64)])
+_EXPAND = [(str(n), '.' * n) for n in range(8, 0, -1)]
+
+_KNIGHT_STEPS = [(1, 2), (2, 1), (2, -1), (1, -2), (-1, -2), (-2, -1), (-2, 1), (-1, 2)]
+_KING_STEPS = [(1, 0), (1, 1), (0, 1), (-1, 1), (-1, 0), (-1, -1), (0, -1), (1, -1)]
+_ORTHOGONAL = [(1, 0), (-1, 0), (0, 1), (0, -1)]
+_DIAGONAL = [(1, 1), (1, -1), (-1, 1), (-1, -1)]
+_PROMOTION = {'n': KNIGHT, 'b': BISHOP, 'r': ROOK, 'q': QUEEN}
+
+
+def _expand_placement(placement):
+    for digit, dots in _EXPAND:
+        placement = placement.replace(digit, dots)
+    return placement.replace('/', '')
+
+
+def parse_boards(fens):
+    """
+    FEN strings -> (boards (N, 64) uint8 piece codes, white_to_move (N,) bool,
+    fullmove (N,) int32).
+    """
+    placements = []
+    white = np.empty(len(fens), dtype=bool)
+    fullmove = np.empty(len(fens), dtype=np.int32)
+    for i, fen in enumerate(fens):
+        fields = fen.split(' ')
+        expanded = _expand_placement(fields[0])
+        if len(expanded) != 64:
+            raise ValueError(f'bad FEN placement: {fen}')
+        placements.append(expanded)
+        white[i] = len(fields) < 2 or fields[1] == 'w'
+        fullmove[i] = int(fields[5]) if len(fields) > 5 else 1
+    raw = np.frombuffer(''.join(placements).encode('ascii'), dtype=np.uint8).reshape(-1, 64)
+    boards = _CODE[raw][:, _FEN_TO_SQUARE]
+    return boards, white, fullmove
+
+
+def _parse_uci(moves):
+    """UCI strings -> (from, to, promotion piece type or 0); invalid moves give from = -1."""
+    frm = np.full(len(moves), -1, dtype=np.int16)
+    to = np.zeros(len(moves), dtype=np.int16)
+    promo = np.zeros(len(moves), dtype=np.uint8)
+    for i, move in enumerate(moves):
+        if len(move) < 4:
+            continue
+        frm[i] = (ord(move[1]) - 49) * 8 + ord(move[0]) - 97
+        to[i] = (ord(move[3]) - 49) * 8 + ord(move[2]) - 97
+        promo[i] = _PROMOTION.get(move[4:5], 0)
+    return frm, to, promo
+
+
+def apply_moves(boards, white, moves):
+    """
+    Play one UCI move per row in place. Rows with no move are left alone.
+
+    Handles promotion, en passant (pawn moving diagonally onto an empty
+    square) and castling (king moving two files; UCI e1g1 style).
+    """
+    frm, to, promo = _parse_uci(moves)
+    rows = np.nonzero(frm >= 0)[0]
+    frm, to, promo = frm[rows], to[rows], promo[rows]
+
+    piece = boards[rows, frm]
+    piece_type = np.where(piece > BLACK, piece - BLACK, piece)
+    target_empty = boards[rows, to] == EMPTY
+
+    # En passant: captured pawn sits beside the mover, on the from-rank.
+    ep = (piece_type == PAWN) & (frm % 8 != to % 8) & target_empty
+    boards[rows[ep], (frm[ep] // 8) * 8 + to[ep] % 8] = EMPTY
+
+    # Castling: move the rook as well.
+    castle = (piece_type == KING) & (np.abs(to - frm) == 2)
+    kingside = to > frm
+    rook_from = np.where(kingside, frm + 3, frm - 4)
+    rook_to = np.where(kingside, frm + 1, frm - 1)
+    cr = rows[castle]
+    boards[cr, rook_to[castle]] = boards[cr, rook_from[castle]]
+    boards[cr, rook_from[castle]] = EMPTY
+
+    colour = np.where(piece > BLACK, BLACK, 0).astype(np.uint8)
+    boards[rows, to] = np.where(promo > 0, promo + colour, piece)
+    boards[rows, frm] = EMPTY
+    white[rows] = ~white[rows]
+
+
+def _look(boards, sq, df, dr):
+    """Piece code at king square + (df, dr) per row, and whether that square is on the board."""
+    file = sq % 8 + df
+    rank = sq // 8 + dr
+    valid = (file >= 0) & (file < 8) & (rank >= 0) & (rank < 8)
+    target = np.where(valid, rank * 8 + file, 0)
+    return np.where(valid, boards[np.arange(len(boards)), target], EMPTY), valid
+
+
+def in_check(boards, white):
+    """Whether the side to move's king is attacked, per row."""
+    count = len(boards)
+    own_king = np.where(white, KING, KING + BLACK)
+    king_sq = np.argmax(boards == own_king[:, None], axis=1)
+    has_king = boards[np.arange(count), king_sq] == own_king
+    enemy = np.where(white, BLACK, 0).astype(np.uint8)
+    attacked = np.zeros(count, dtype=bool)
+
+    for df, dr in _KNIGHT_STEPS:
+        piece, _ = _look(boards, king_sq, df, dr)
+        attacked |= piece == KNIGHT + enemy
+    for df, dr in _KING_STEPS:
+        piece, _ = _look(boards, king_sq, df, dr)
+        attacked |= piece == KING + enemy
+    # Enemy pawns attack toward our king: from above for white, below for black.
+    pawn_dr = np.where(white, 1, -1)
+    for df in (-1, 1):
+        piece, _ = _look(boards, king_sq, df, pawn_dr)
+        attacked |= piece == PAWN + enemy
+
+    for steps, slider in ((_ORTHOGONAL, ROOK), (_DIAGONAL, BISHOP)):
+        for df, dr in steps:
+            open_ray = np.ones(count, dtype=bool)
+            for distance in range(1, 8):
+                piece, valid = _look(boards, king_sq, df * distance, dr * distance)
+                open_ray &= valid
+                hit = open_ray & ((piece == slider + enemy) | (piece == QUEEN + enemy))
+                attacked |= hit
+                open_ray &= piece == EMPTY
+                if not open_ray.any():
+                    break
+
+    return attacked & has_king
+
+
+def extract_features(puzzles):
+    """
+    Compute the feature columns for a list of puzzle records or a PuzzleBatch.
+
+    Returns a dict of NumPy arrays aligned with `puzzles`.
+    """
+    if isinstance(puzzles, PuzzleBatch):
+        fens, moves = puzzles.strings('fen'), puzzles.strings('moves')
+    else:
+        fens, moves = [p['fen'] for p in puzzles], [p['moves'] for p in puzzles]
+    move_lists = [split_moves(m) for m in moves]
+    boards, white, fullmove = parse_boards(fens)
+    apply_moves(boards, white, [moves[0] if moves else '' for moves in move_lists])
+
+    counts = np.stack([(boards == code).sum(axis=1) for code in range(1, 13)], axis=1).astype(np.int16)
+    material_white = counts[:, :6] @ _VALUES[1:7]
+    material_black = counts[:, 6:] @ _VALUES[7:]
+    phase = np.minimum(counts @ _PHASE[1:], MAX_PHASE).astype(np.int8)
+
+    phase_class = np.full(len(puzzles), 1, dtype=np.int8)
+    phase_class[(phase >= OPENING_MIN_PHASE) & (fullmove <= OPENING_MAX_MOVE)] = 0
+    phase_class[phase <= ENDGAME_MAX_PHASE] = 2
+
+    plies = np.array([max(len(m) - 1, 0) for m in move_lists], dtype=np.int16)
+    features = {
+        'white_to_move': white.astype(np.int8),
+        'piece_count': counts.sum(axis=1).astype(np.int8),
+        'material_white': material_white.astype(np.int16),
+        'material_black': material_black.astype(np.int16),
+        'material_balance': np.where(white, material_white - material_black,
+                                     material_black - material_white).astype(np.int16),
+        'phase': phase,
+        'phase_class': phase_class,
+        'in_check': in_check(boards, white).astype(np.int8),
+        'solution_length': ((plies + 1) // 2).astype(np.int8),
+        'solution_plies': plies,
+    }
+    for index, char in enumerate(PIECES[1:]):
+        features[f'count_{char}'] = counts[:, index].astype(np.int8)
+    return features
+
+
+def extract_features_batched(puzzles, batch_size=50000):
+    """extract_features() over fixed-size batches, concatenated."""
+    parts = [extract_features(puzzles[i:i + batch_size]) for i in range(0, len(puzzles), batch_size)]
+    if not parts:
+        return {}
+    return {name: np.concatenate([part[name] for part in parts]) for name in parts[0]}
+
+
+def attach_features(puzzles, features):
+    """Copy feature columns onto the puzzle records (phase_class as its name)."""
+    for name, column in features.items():
+        values = column.tolist()
+        if name == 'phase_class':
+            values = [PHASES[v] for v in values]
+        for puzzle, value in zip(puzzles, values):
+            puzzle[name] = value
+    return puzzles
+
+
+def print_phase_table(puzzles, features, band_width=200):
+    """Share of each phase per rating band."""
+    ratings = np.array([p['rating'] for p in puzzles])
+    bands = (ratings // band_width) * band_width
+    print(f"\n  {'band':>11} {'count':>6} " + ' '.join(f'{name:>10}' for name in PHASES))
+    for band in np.unique(bands):
+        mask = bands == band
+        shares = [(features['phase_class'][mask] == i).mean() * 100 for i in range(len(PHASES))]
+        print(f"  {band:>5}-{band + band_width - 1:<5} {mask.sum():>6} " + ' '.join(f'{s:>9.1f}%' for s in shares))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compute per-puzzle position features.')
+    parser.add_argument('--input', default=DEFAULT_PUZZLES_FILE)
+    parser.add_argument('--output', help='write puzzles with feature fields attached')
+    parser.add_argument('--npz', help='write the feature columns (plus ids) to a .npz file')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Puzzle Feature Extraction")
+    print("=" * 70)
+
+    puzzles = load_puzzles(args.input)
+    start = time.perf_counter()
+    features = extract_features_batched(puzzles)
+    elapsed = time.perf_counter() - start
+    print(f"Extracted features for {len(puzzles)} puzzles in {elapsed:.2f}s "
+          f"({len(puzzles) / max(elapsed, 1e-9):.0f}/s)")
+    print(f"  In check at start: {int(features['in_check'].sum())}")
+    print_phase_table(puzzles, features)
+
+    if args.npz:
+        np.savez_compressed(args.npz, id=np.array([p['id'] for p in puzzles], dtype=np.int64), **features)
+        print(f"\n✓ Feature columns written to {args.npz}")
+    if args.output:
+        attach_features(puzzles, features)
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(puzzles, f, indent=2, ensure_ascii=False)
+        print(f"✓ Saved {len(puzzles)} puzzles with features to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
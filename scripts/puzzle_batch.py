@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+Columnar puzzle batches for the hot loops.
+
+Parsers used to build one dict per CSV row and keep hundreds of thousands
+of them (rating_buckets in download_real_puzzles.py holds the whole dump),
+at 500+ bytes of small-object overhead each. A PuzzleBatch holds a block
+of records as columns instead:
+
+    integer fields   one NumPy array per field (int32 where the range
+                     allows, int64 for ids and unknown integer fields)
+    string fields    one packed UTF-8 buffer plus int64 offsets
+    anything else    a plain list (rare: nested or mixed-type fields)
+
+Filtering and sorting work on whole columns (`batch['rating'] >= 1500`,
+`batch.select(mask)`), and `batch[i]` returns a PuzzleView, a __slots__
+object that reads one row lazily and supports the dict-style access
+(`p['fen']`, `p.get('popularity', 0)`) existing code uses, so views can be
+passed to functions that expect puzzle dicts. to_records() turns a batch
+back into dicts at the edges (JSON output, worker pickling).
+
+iter_csv_batches() reads the Lichess CSV straight into batches without a
+per-row dict; write_batches()/read_batches() stream batches through a file.
+
+Usage:
+    python scripts/puzzle_batch.py --input lichess_db_puzzle.csv.zst [--limit 500000]
+"""
+
+import argparse
+import csv
+import io
+import struct
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+from puzzle_io import lichess_id_to_int, load_puzzles, open_text
+
+DEFAULT_BATCH_SIZE = 20000
+# Narrower dtypes for the fields we know; other integer fields get int64.
+INT_DTYPES = {'rating': np.int32, 'popularity': np.int32, 'nb_plays': np.int32, 'rating_deviation': np.int32}
+CSV_COLUMNS = ['id', 'fen', 'moves', 'rating', 'themes', 'popularity', 'lichess_id',
+               'rating_deviation', 'nb_plays', 'game_url', 'opening_tags']
+_CSV_INT_COLUMNS = {'id', 'rating', 'popularity', 'rating_deviation', 'nb_plays'}
+_CSV_INT_FIELDS = [('rating', 3), ('rating_deviation', 4), ('popularity', 5), ('nb_plays', 6)]
+_CSV_STRING_FIELDS = [('lichess_id', 0), ('fen', 1), ('moves', 2), ('themes', 7), ('game_url', 8),
+                      ('opening_tags', 9)]
+_BASE62 = np.full(256, -1, dtype=np.int64)
+for _value, _char in enumerate(b'0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'):
+    _BASE62[_char] = _value
+_LENGTH = struct.Struct('<Q')
+_TAKE_BLOCK = 8192
+
+
+def _decode_ids(puzzle_ids):
+    """lichess_id_to_int() over a column, vectorized when every ID has 5 characters."""
+    if any(len(puzzle_id) != 5 for puzzle_id in puzzle_ids):
+        return np.array([lichess_id_to_int(puzzle_id) for puzzle_id in puzzle_ids], dtype=np.int64)
+    digits = _BASE62[np.frombuffer(''.join(puzzle_ids).encode('latin-1', 'replace'), dtype=np.uint8)]
+    if (digits < 0).any():
+        raise KeyError('not a base62 puzzle ID')
+    return digits.reshape(-1, 5) @ (62 ** np.arange(4, -1, -1, dtype=np.int64))
+
+
+def _row_is_numeric(row):
+    try:
+        lichess_id_to_int(row[0])
+        for _, index in _CSV_INT_FIELDS:
+            int(row[index])
+    except (KeyError, ValueError):
+        return False
+    return True
+
+
+class StringColumn:
+    """Strings packed into one UTF-8 buffer with int64 offsets."""
+
+    __slots__ = ('data', 'offsets')
+
+    def __init__(self, data, offsets):
+        self.data = data
+        self.offsets = offsets
+
+    @classmethod
+    def from_strings(cls, strings):
+        encoded = [s.encode('utf-8') for s in strings]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        np.cumsum([len(e) for e in encoded], out=offsets[1:])
+        return cls(b''.join(encoded), offsets)
+
+    def __len__(self):
+        return len(self.offsets) - 1
+
+    def __getitem__(self, row):
+        return self.data[self.offsets[row]:self.offsets[row + 1]].decode('utf-8')
+
+    def tolist(self):
+        data, offsets = self.data, self.offsets.tolist()
+        return [data[offsets[i]:offsets[i + 1]].decode('utf-8') for i in range(len(offsets) - 1)]
+
+    def take(self, rows):
+        rows = np.asarray(rows, dtype=np.int64)
+        starts = self.offsets[rows]
+        lengths = self.offsets[rows + 1] - starts
+        offsets = np.zeros(len(rows) + 1, dtype=np.int64)
+        np.cumsum(lengths, out=offsets[1:])
+        # Gather the bytes of every selected string, laid end to end, a
+        # block of rows at a time so the index array stays small.
+        source = np.frombuffer(self.data, dtype=np.uint8)
+        parts = []
+        for low in range(0, len(rows), _TAKE_BLOCK):
+            high = min(low + _TAKE_BLOCK, len(rows))
+            positions = (np.repeat(starts[low:high] - offsets[low:high], lengths[low:high])
+                         + np.arange(offsets[low], offsets[high], dtype=np.int64))
+            parts.append(source[positions].tobytes())
+        return StringColumn(b''.join(parts), offsets)
+
+    @classmethod
+    def concat(cls, columns):
+        sizes = [c.offsets[-1] for c in columns]
+        bases = np.concatenate([[0], np.cumsum(sizes)[:-1]]).astype(np.int64)
+        offsets = np.concatenate([c.offsets[:-1] + base for c, base in zip(columns, bases)] +
+                                 [np.array([sum(sizes)], dtype=np.int64)])
+        return cls(b''.join(c.data for c in columns), offsets)
+
+    @property
+    def nbytes(self):
+        return len(self.data) + self.offsets.nbytes
+
+
+class PuzzleView:
+    """One row of a PuzzleBatch with dict-style read access."""
+
+    __slots__ = ('batch', 'row')
+
+    def __init__(self, batch, row):
+        self.batch = batch
+        self.row = row
+
+    def __getitem__(self, key):
+        return self.batch.value(key, self.row)
+
+    def get(self, key, default=None):
+        if key not in self.batch.columns:
+            return default
+        return self.batch.value(key, self.row)
+
+    def __contains__(self, key):
+        return key in self.batch.columns
+
+    def keys(self):
+        return self.batch.columns.keys()
+
+    def to_dict(self):
+        return {key: self.batch.value(key, self.row) for key in self.batch.columns}
+
+    def __repr__(self):
+        return f"PuzzleView({self.to_dict()!r})"
+
+
+class PuzzleBatch:
+    """A block of puzzle records stored column by column."""
+
+    def __init__(self, columns, size):
+        self.columns = columns
+        self.size = size
+
+    @classmethod
+    def from_records(cls, records):
+        records = list(records)
+        keys = {}
+        for record in records:
+            for key in record:
+                keys.setdefault(key, None)
+        columns = {}
+        for key in keys:
+            values = [record.get(key) for record in records]
+            present = [v for v in values if v is not None]
+            if present and all(isinstance(v, int) and not isinstance(v, bool) for v in present):
+                columns[key] = np.array([0 if v is None else v for v in values],
+                                        dtype=INT_DTYPES.get(key, np.int64))
+            elif present and all(isinstance(v, str) for v in present):
+                columns[key] = StringColumn.from_strings(['' if v is None else v for v in values])
+            else:
+                columns[key] = values
+        return cls(columns, len(records))
+
+    @classmethod
+    def from_csv_rows(cls, rows):
+        """Build a batch from Lichess CSV rows, skipping malformed ones (as puzzle_from_csv_row does)."""
+        rows = [row if len(row) >= 10 else row + [''] * (10 - len(row))
+                for row in rows if len(row) >= 8 and row[1] and row[2]]
+        if not rows:
+            return cls({name: np.zeros(0, dtype=INT_DTYPES.get(name, np.int64)) if name in _CSV_INT_COLUMNS
+                        else StringColumn.from_strings([]) for name in CSV_COLUMNS}, 0)
+        fields = list(zip(*rows))
+        try:
+            ints = {name: np.array(fields[index], dtype=INT_DTYPES[name]) for name, index in _CSV_INT_FIELDS}
+            ids = _decode_ids(fields[0])
+        except (KeyError, ValueError):
+            # Rare malformed numbers: drop those rows and convert the rest one by one.
+            rows = [row for row in rows if _row_is_numeric(row)]
+            fields = list(zip(*rows)) or [()] * 10
+            ints = {name: np.array([int(v) for v in fields[index]], dtype=INT_DTYPES[name])
+                    for name, index in _CSV_INT_FIELDS}
+            ids = np.array([lichess_id_to_int(v) for v in fields[0]], dtype=np.int64)
+        columns = {'id': ids}
+        for name, index in _CSV_STRING_FIELDS:
+            columns[name] = StringColumn.from_strings(fields[index])
+        columns.update(ints)
+        return cls({name: columns[name] for name in CSV_COLUMNS}, len(rows))
+
+    @classmethod
+    def concat(cls, batches):
+        parts = list(batches)
+        batches = [b for b in parts if b.size]
+        if not batches:
+            # Keep the schema: callers index columns of an empty result too.
+            return cls(dict(parts[0].columns), 0) if parts else cls({}, 0)
+        columns = {}
+        for key, first in batches[0].columns.items():
+            parts = [b.columns[key] for b in batches]
+            if isinstance(first, StringColumn):
+                columns[key] = StringColumn.concat(parts)
+            elif isinstance(first, np.ndarray):
+                columns[key] = np.concatenate(parts)
+            else:
+                columns[key] = [v for part in parts for v in part]
+        return cls(columns, sum(b.size for b in batches))
+
+    def __len__(self):
+        return self.size
+
+    def __getitem__(self, key):
+        """batch['rating'] -> column (array, StringColumn or list); batch[3] -> PuzzleView."""
+        if isinstance(key, str):
+            return self.columns[key]
+        if key < 0:
+            key += self.size
+        if not 0 <= key < self.size:
+            raise IndexError(key)
+        return PuzzleView(self, key)
+
+    def __iter__(self):
+        return (PuzzleView(self, row) for row in range(self.size))
+
+    def value(self, key, row):
+        column = self.columns[key]
+        if isinstance(column, np.ndarray):
+            return int(column[row])
+        return column[row]
+
+    def strings(self, key):
+        """A string column decoded to a list of str."""
+        column = self.columns[key]
+        return column.tolist() if isinstance(column, StringColumn) else list(column)
+
+    def select(self, rows):
+        """New batch with the given row indices or boolean mask, in that order."""
+        rows = np.asarray(rows)
+        if rows.dtype == bool:
+            rows = np.flatnonzero(rows)
+        columns = {}
+        for key, column in self.columns.items():
+            if isinstance(column, StringColumn):
+                columns[key] = column.take(rows)
+            elif isinstance(column, np.ndarray):
+                columns[key] = column[rows]
+            else:
+                columns[key] = [column[row] for row in rows.tolist()]
+        return PuzzleBatch(columns, len(rows))
+
+    def to_records(self):
+        decoded = {}
+        for key, column in self.columns.items():
+            decoded[key] = column.tolist() if not isinstance(column, list) else column
+        keys = list(decoded)
+        return [dict(zip(keys, values)) for values in zip(*(decoded[key] for key in keys))]
+
+    @property
+    def nbytes(self):
+        total = 0
+        for column in self.columns.values():
+            total += column.nbytes if hasattr(column, 'nbytes') else sys.getsizeof(column)
+        return total
+
+
+def iter_csv_batches(path, batch_size=DEFAULT_BATCH_SIZE):
+    """Stream a local lichess_db_puzzle.csv(.zst) as PuzzleBatches."""
+    with open_text(path) as f:
+        reader = csv.reader(f)
+        rows = []
+        for row in reader:
+            if row and row[0] == 'PuzzleId':
+                continue
+            rows.append(row)
+            if len(rows) == batch_size:
+                yield PuzzleBatch.from_csv_rows(rows)
+                rows = []
+        if rows:
+            yield PuzzleBatch.from_csv_rows(rows)
+
+
+def rebatch(puzzles, batch_size=DEFAULT_BATCH_SIZE):
+    """Group an iterable of puzzle dicts into PuzzleBatches."""
+    chunk = []
+    for puzzle in puzzles:
+        chunk.append(puzzle)
+        if len(chunk) == batch_size:
+            yield PuzzleBatch.from_records(chunk)
+            chunk = []
+    if chunk:
+        yield PuzzleBatch.from_records(chunk)
+
+
+def iter_batches(path, batch_size=DEFAULT_BATCH_SIZE):
+    """Stream PuzzleBatches from a JSON puzzle file or the Lichess CSV dump."""
+    if path.endswith('.json'):
+        yield from rebatch(load_puzzles(path), batch_size)
+    else:
+        yield from iter_csv_batches(path, batch_size)
+
+
+def _column_arrays(batch):
+    arrays = {}
+    for key, column in batch.columns.items():
+        if isinstance(column, StringColumn):
+            arrays[f's:{key}:data'] = np.frombuffer(column.data, dtype=np.uint8)
+            arrays[f's:{key}:offsets'] = column.offsets
+        elif isinstance(column, np.ndarray):
+            arrays[f'i:{key}'] = column
+        else:
+            raise TypeError(f"column {key!r} holds non-scalar values and cannot be written")
+    return arrays
+
+
+def write_batches(path, batches):
+    """Write batches as length-prefixed .npz blobs. Returns the number of records."""
+    count = 0
+    with open(path, 'wb') as f:
+        for batch in batches:
+            blob = io.BytesIO()
+            np.savez(blob, **_column_arrays(batch))
+            f.write(_LENGTH.pack(blob.tell()))
+            f.write(blob.getvalue())
+            count += batch.size
+    return count
+
+
+def read_batches(path):
+    """Stream the batches written by write_batches()."""
+    with open(path, 'rb') as f:
+        while True:
+            header = f.read(_LENGTH.size)
+            if not header:
+                return
+            with np.load(io.BytesIO(f.read(_LENGTH.unpack(header)[0]))) as data:
+                columns = {}
+                for name in data.files:
+                    kind, key = name.split(':')[:2]
+                    if kind == 'i':
+                        columns[key] = data[name]
+                    elif name.endswith(':data'):
+                        columns[key] = StringColumn(data[name].tobytes(), data[f's:{key}:offsets'])
+            size = len(next(iter(columns.values()))) if columns else 0
+            yield PuzzleBatch(columns, size)
+
+
+def _load(path, layout, limit):
+    from itertools import islice
+
+    from puzzle_io import iter_lichess_csv
+
+    if layout == 'dicts':
+        return list(islice(iter_lichess_csv(path), limit))
+    held, rows = [], 0
+    for batch in iter_csv_batches(path):
+        if limit and rows + len(batch) > limit:
+            batch = batch.select(np.arange(limit - rows))
+        held.append(batch)
+        rows += len(batch)
+        if limit and rows >= limit:
+            break
+    return held
+
+
+def _top_popular(held, layout, low=1500, high=1700, count=1000):
+    """The filter-and-rank step the selectors run: most popular puzzles in a rating band."""
+    if layout == 'dicts':
+        band = [p for p in held if low <= p['rating'] < high]
+        band.sort(key=lambda p: p['popularity'], reverse=True)
+        return band[:count]
+    batch = PuzzleBatch.concat([b.select((b['rating'] >= low) & (b['rating'] < high)) for b in held])
+    order = np.argsort(-batch['popularity'], kind='stable')[:count]
+    return batch.select(order).to_records()
+
+
+def run_benchmark(path, limit=None):
+    """Parse `limit` rows as dicts and as batches; compare time, memory held and a filter-and-rank pass."""
+    print(f"\nBenchmark: {path}" + (f" (first {limit} rows)" if limit else ''))
+    print(f"  {'layout':<8} {'rows':>9} {'parse s':>8} {'rows/s':>9} {'held MB':>8} {'bytes/row':>10} {'rank s':>7}")
+    for layout in ('dicts', 'batches'):
+        start = time.perf_counter()
+        held = _load(path, layout, limit)
+        parse_seconds = time.perf_counter() - start
+        rows = len(held) if layout == 'dicts' else sum(len(b) for b in held)
+        start = time.perf_counter()
+        _top_popular(held, layout)
+        rank_seconds = time.perf_counter() - start
+        del held
+
+        # Memory in a second pass: tracemalloc slows allocation-heavy code down.
+        tracemalloc.start()
+        held = _load(path, layout, limit)
+        current, _ = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        del held
+        print(f"  {layout:<8} {rows:>9} {parse_seconds:>8.2f} {rows / max(parse_seconds, 1e-9):>9.0f} "
+              f"{current / 1e6:>8.1f} {current / max(rows, 1):>10.0f} {rank_seconds:>7.3f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare dict-per-row and columnar puzzle parsing.')
+    parser.add_argument('--input', required=True, help='lichess_db_puzzle.csv(.zst)')
+    parser.add_argument('--limit', type=int, help='rows to parse')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Puzzle Batch Benchmark")
+    print("=" * 70)
+    run_benchmark(args.input, args.limit)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,353 @@
+#!/usr/bin/env python3
+"""
+Serve puzzles over HTTP from a puzzle store (see puzzle_store.py).
+
+A small asyncio HTTP/1.1 server (keep-alive, GET only, stdlib only) with:
+
+    GET /puzzle/<id>                       one record
+    GET /puzzles?min_rating=1200&max_rating=1400&themes=fork,pin
+                &exclude=1,2,3&limit=50&offset=0
+                                           records matching every theme
+    GET /shard/<n>?size=500                n-th rating-sorted shard
+    GET /stats                             counts and cache hit rates
+
+At startup every record is decoded once to build the query index: IDs in
+rating order (dense indices), and a roaring bitmap of dense indices per
+theme. A query is a rating range (bisect) intersected with the theme
+bitmaps minus the exclusion list; the matching records are copied from
+the store as raw bytes, never re-encoded.
+
+Lookups run on a thread pool; each thread borrows one of `--readers`
+PuzzleStore instances (separate mmaps) from a pool. Encoded responses for
+queries and shards live in a bounded LRU cache (entries and bytes).
+
+Usage:
+    python scripts/puzzle_store.py --output build/puzzles.store
+    python scripts/puzzle_daemon.py --store build/puzzles.store [--port 8787]
+    python scripts/puzzle_daemon_loadtest.py --port 8787
+"""
+
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import queue
+import sys
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from urllib.parse import parse_qs, urlsplit
+
+from pyroaring import BitMap
+
+from puzzle_io import split_themes
+from puzzle_store import PuzzleStore
+
+DEFAULT_PORT = 8787
+DEFAULT_READERS = 4
+DEFAULT_CACHE_ITEMS = 2048
+DEFAULT_CACHE_BYTES = 64 * 1024 * 1024
+DEFAULT_LIMIT = 50
+MAX_LIMIT = 1000
+DEFAULT_SHARD_SIZE = 500
+MAX_REQUEST_LINE = 8192
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed'}
+
+
+class QueryError(Exception):
+    """Bad request parameters; reported as HTTP 400."""
+
+
+class LruCache:
+    """Thread-safe OrderedDict LRU bounded by entry count and total value bytes."""
+
+    def __init__(self, max_items=DEFAULT_CACHE_ITEMS, max_bytes=DEFAULT_CACHE_BYTES):
+        self._lock = threading.Lock()
+        self.max_items = max_items
+        self.max_bytes = max_bytes
+        self._data = OrderedDict()
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        with self._lock:
+            value = self._data.get(key)
+            if value is None:
+                self.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.hits += 1
+            return value
+
+    def put(self, key, value):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.bytes -= len(old)
+            self._data[key] = value
+            self.bytes += len(value)
+            while len(self._data) > self.max_items or self.bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.bytes -= len(evicted)
+
+    def __len__(self):
+        return len(self._data)
+
+
+class ReaderPool:
+    """A fixed set of PuzzleStore readers shared by the worker threads."""
+
+    def __init__(self, path, size=DEFAULT_READERS):
+        self._readers = queue.Queue()
+        self._all = [PuzzleStore(path) for _ in range(size)]
+        for reader in self._all:
+            self._readers.put(reader)
+
+    @contextmanager
+    def reader(self):
+        store = self._readers.get()
+        try:
+            yield store
+        finally:
+            self._readers.put(store)
+
+    def close(self):
+        for reader in self._all:
+            reader.close()
+
+
+class QueryIndex:
+    """Rating-ordered IDs plus per-theme bitmaps of dense indices."""
+
+    def __init__(self, store):
+        rows = []
+        for puzzle_id in store.ids():
+            puzzle = store.get(puzzle_id)
+            rows.append((puzzle['rating'], puzzle_id, split_themes(puzzle.get('themes', ''))))
+        rows.sort(key=lambda r: (r[0], r[1]))
+        self.ratings = [r[0] for r in rows]
+        self.ids = [r[1] for r in rows]
+        self.position = {pid: i for i, pid in enumerate(self.ids)}
+        self.themes = {}
+        for i, (_, _, themes) in enumerate(rows):
+            for theme in themes:
+                self.themes.setdefault(theme.lower(), BitMap()).add(i)
+
+    def query(self, min_rating, max_rating, themes=(), exclude=(), offset=0, limit=DEFAULT_LIMIT):
+        """Puzzle IDs in rating order matching every theme and not excluded."""
+        lo = bisect.bisect_left(self.ratings, min_rating)
+        hi = bisect.bisect_right(self.ratings, max_rating)
+        matches = BitMap(range(lo, hi))
+        for theme in themes:
+            matches &= self.themes.get(theme.lower(), BitMap())
+        if exclude:
+            matches -= BitMap(self.position[pid] for pid in exclude if pid in self.position)
+        return [self.ids[i] for i in matches[offset:offset + limit]]
+
+
+def _int_param(params, name, default, low=None, high=None):
+    raw = params.get(name, [None])[-1]
+    if raw in (None, ''):
+        return default
+    try:
+        value = int(raw)
+    except ValueError:
+        raise QueryError(f"{name} must be an integer") from None
+    if (low is not None and value < low) or (high is not None and value > high):
+        raise QueryError(f"{name} out of range")
+    return value
+
+
+def _list_param(params, name):
+    return [item for raw in params.get(name, []) for item in raw.split(',') if item]
+
+
+class PuzzleService:
+    """Request handling independent of the socket layer."""
+
+    def __init__(self, store_path, readers=DEFAULT_READERS, cache_items=DEFAULT_CACHE_ITEMS,
+                 cache_bytes=DEFAULT_CACHE_BYTES):
+        self.pool = ReaderPool(store_path, readers)
+        with self.pool.reader() as store:
+            self.index = QueryIndex(store)
+        self.cache = LruCache(cache_items, cache_bytes)
+        self.requests = 0
+
+    def _records(self, puzzle_ids):
+        with self.pool.reader() as store:
+            return b'[' + b','.join(store.get_raw(pid) for pid in puzzle_ids) + b']'
+
+    def handle(self, target):
+        """Return (status, body bytes) for a GET target such as '/puzzles?...'."""
+        self.requests += 1
+        url = urlsplit(target)
+        params = parse_qs(url.query)
+        parts = [p for p in url.path.split('/') if p]
+        try:
+            if parts == ['stats']:
+                return 200, json.dumps(self.stats()).encode('utf-8')
+            if len(parts) == 2 and parts[0] == 'puzzle':
+                return self._puzzle(parts[1])
+            key = (tuple(parts), tuple(sorted((k, tuple(v)) for k, v in params.items())))
+            cached = self.cache.get(key)
+            if cached is not None:
+                return 200, cached
+            if parts == ['puzzles']:
+                body = self._query(params)
+            elif len(parts) == 2 and parts[0] == 'shard':
+                body = self._shard(parts[1], params)
+            else:
+                return 404, b'{"error":"not found"}'
+            self.cache.put(key, body)
+            return 200, body
+        except QueryError as e:
+            return 400, json.dumps({'error': str(e)}).encode('utf-8')
+
+    def _puzzle(self, raw_id):
+        try:
+            puzzle_id = int(raw_id)
+        except ValueError:
+            raise QueryError("puzzle id must be an integer") from None
+        with self.pool.reader() as store:
+            raw = store.get_raw(puzzle_id)
+        return (200, raw) if raw is not None else (404, b'{"error":"no such puzzle"}')
+
+    def _query(self, params):
+        try:
+            exclude = [int(pid) for pid in _list_param(params, 'exclude')]
+        except ValueError:
+            raise QueryError("exclude must be a list of integers") from None
+        ids = self.index.query(
+            _int_param(params, 'min_rating', 0),
+            _int_param(params, 'max_rating', 10000),
+            _list_param(params, 'themes'),
+            exclude,
+            _int_param(params, 'offset', 0, low=0),
+            _int_param(params, 'limit', DEFAULT_LIMIT, low=0, high=MAX_LIMIT),
+        )
+        return self._records(ids)
+
+    def _shard(self, raw_index, params):
+        size = _int_param(params, 'size', DEFAULT_SHARD_SIZE, low=1, high=10 * DEFAULT_SHARD_SIZE)
+        try:
+            shard = int(raw_index)
+        except ValueError:
+            raise QueryError("shard must be an integer") from None
+        if shard < 0 or shard * size >= len(self.index.ids):
+            raise QueryError("shard out of range")
+        return self._records(self.index.ids[shard * size:(shard + 1) * size])
+
+    def stats(self):
+        lookups = self.cache.hits + self.cache.misses
+        return {
+            'puzzles': len(self.index.ids),
+            'themes': len(self.index.themes),
+            'requests': self.requests,
+            'cache_entries': len(self.cache),
+            'cache_bytes': self.cache.bytes,
+            'cache_hit_rate': round(self.cache.hits / lookups, 4) if lookups else 0.0,
+        }
+
+    def close(self):
+        self.pool.close()
+
+
+def _response(status, body, keep_alive):
+    head = (f"HTTP/1.1 {status} {_REASONS.get(status, 'Error')}\r\n"
+            f"Content-Type: application/json\r\n"
+            f"Content-Length: {len(body)}\r\n"
+            f"Connection: {'keep-alive' if keep_alive else 'close'}\r\n\r\n")
+    return head.encode('ascii') + body
+
+
+async def _serve_connection(service, executor, reader, writer):
+    loop = asyncio.get_running_loop()
+    try:
+        while True:
+            request_line = await reader.readline()
+            if not request_line:
+                break
+            if len(request_line) > MAX_REQUEST_LINE:
+                writer.write(_response(400, b'{"error":"request line too long"}', False))
+                break
+            keep_alive = True
+            while True:
+                header = await reader.readline()
+                if header in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = header.decode('latin-1').partition(':')
+                if name.strip().lower() == 'connection' and value.strip().lower() == 'close':
+                    keep_alive = False
+            try:
+                method, target, _ = request_line.decode('latin-1').split(' ', 2)
+            except ValueError:
+                writer.write(_response(400, b'{"error":"bad request"}', False))
+                break
+            if method != 'GET':
+                status, body = 405, b'{"error":"GET only"}'
+            else:
+                status, body = await loop.run_in_executor(executor, service.handle, target)
+            writer.write(_response(status, body, keep_alive))
+            await writer.drain()
+            if not keep_alive:
+                break
+    except (ConnectionError, asyncio.IncompleteReadError):
+        pass
+    finally:
+        writer.close()
+
+
+async def serve(service, host='127.0.0.1', port=DEFAULT_PORT, threads=DEFAULT_READERS, on_listening=None):
+    """Run the HTTP server until cancelled; on_listening(port) is called once bound."""
+    executor = ThreadPoolExecutor(max_workers=threads)
+    server = await asyncio.start_server(
+        lambda r, w: _serve_connection(service, executor, r, w), host, port)
+    if on_listening is not None:
+        on_listening(server.sockets[0].getsockname()[1])
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        executor.shutdown(wait=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve puzzles over HTTP from a puzzle store.')
+    parser.add_argument('--store', default='build/puzzles.store', help='store built by puzzle_store.py')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--readers', type=int, default=DEFAULT_READERS, help='pooled mmap readers / threads')
+    parser.add_argument('--cache-items', type=int, default=DEFAULT_CACHE_ITEMS)
+    parser.add_argument('--cache-mb', type=int, default=DEFAULT_CACHE_BYTES // (1024 * 1024))
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Puzzle Daemon")
+    print("=" * 70)
+
+    if not os.path.exists(args.store):
+        print(f"✗ Store not found: {args.store} (build it with scripts/puzzle_store.py)")
+        return 1
+    start = time.perf_counter()
+    service = PuzzleService(args.store, args.readers, args.cache_items, args.cache_mb * 1024 * 1024)
+    print(f"✓ Indexed {len(service.index.ids)} puzzles, {len(service.index.themes)} themes "
+          f"in {time.perf_counter() - start:.2f}s")
+    print(f"  Listening on http://{args.host}:{args.port}")
+    try:
+        asyncio.run(serve(service, args.host, args.port, args.readers))
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,166 @@
+#!/usr/bin/env python3
+"""
+Load-test a running puzzle_daemon.py and report latency and throughput.
+
+Opens `--concurrency` keep-alive connections and sends `--requests` GETs
+in total from a mix of single-puzzle lookups, rating/theme queries (some
+with exclusion lists) and shard fetches, then prints requests/sec and
+p50/p90/p99 latency overall and per endpoint. With --store the daemon is
+started in a subprocess on a free port and stopped afterwards.
+
+Usage:
+    python scripts/puzzle_daemon_loadtest.py --port 8787 [--requests 20000] [--concurrency 32]
+    python scripts/puzzle_daemon_loadtest.py --store build/puzzles.store
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+
+from puzzle_daemon import DEFAULT_PORT
+
+THEMES = ['fork', 'pin', 'skewer', 'mateIn1', 'mateIn2', 'endgame', 'middlegame', 'sacrifice']
+
+
+async def _get(reader, writer, target):
+    writer.write(f"GET {target} HTTP/1.1\r\nHost: localhost\r\n\r\n".encode('ascii'))
+    await writer.drain()
+    status_line = await reader.readline()
+    if not status_line:
+        raise ConnectionError("connection closed by server")
+    length = 0
+    while True:
+        header = await reader.readline()
+        if header in (b'\r\n', b''):
+            break
+        name, _, value = header.decode('latin-1').partition(':')
+        if name.lower() == 'content-length':
+            length = int(value)
+    body = await reader.readexactly(length)
+    return int(status_line.split()[1]), body
+
+
+def _make_request(rng, puzzle_ids, shards):
+    kind = rng.random()
+    if kind < 0.4:
+        return 'puzzle', f"/puzzle/{rng.choice(puzzle_ids)}"
+    if kind < 0.85:
+        low = rng.randrange(600, 2600, 100)
+        target = f"/puzzles?min_rating={low}&max_rating={low + 200}&limit=20"
+        if rng.random() < 0.5:
+            target += f"&themes={rng.choice(THEMES)}"
+        if rng.random() < 0.3:
+            target += "&exclude=" + ','.join(str(pid) for pid in rng.sample(puzzle_ids, 20))
+        return 'query', target
+    return 'shard', f"/shard/{rng.randrange(shards)}?size=200"
+
+
+def _percentile(sorted_values, fraction):
+    if not sorted_values:
+        return 0.0
+    return sorted_values[min(len(sorted_values) - 1, int(fraction * len(sorted_values)))]
+
+
+async def run_load(host, port, total, concurrency, seed=1):
+    """Run the load; returns {'elapsed', 'errors', 'latencies': {kind: [seconds...]}}."""
+    reader, writer = await asyncio.open_connection(host, port)
+    _, body = await _get(reader, writer, '/puzzles?limit=1000')
+    puzzle_ids = [p['id'] for p in json.loads(body)]
+    _, body = await _get(reader, writer, '/stats')
+    shards = max(1, json.loads(body)['puzzles'] // 200)
+    writer.close()
+
+    latencies = {}
+    errors = 0
+    counter = iter(range(total))
+
+    async def client(index):
+        nonlocal errors
+        rng = random.Random(seed * 1000 + index)
+        conn_reader, conn_writer = await asyncio.open_connection(host, port)
+        try:
+            for _ in counter:
+                kind, target = _make_request(rng, puzzle_ids, shards)
+                start = time.perf_counter()
+                status, _ = await _get(conn_reader, conn_writer, target)
+                latencies.setdefault(kind, []).append(time.perf_counter() - start)
+                errors += status != 200
+        finally:
+            conn_writer.close()
+
+    start = time.perf_counter()
+    await asyncio.gather(*(client(i) for i in range(concurrency)))
+    return {'elapsed': time.perf_counter() - start, 'errors': errors, 'latencies': latencies}
+
+
+def print_results(results):
+    everything = sorted(v for values in results['latencies'].values() for v in values)
+    elapsed = results['elapsed']
+    print(f"\n{len(everything)} requests in {elapsed:.2f}s: {len(everything) / elapsed:.0f} req/s, "
+          f"{results['errors']} errors")
+    print(f"  {'endpoint':<10} {'count':>7} {'p50 ms':>8} {'p90 ms':>8} {'p99 ms':>8}")
+    rows = sorted(results['latencies'].items()) + [('all', everything)]
+    for kind, values in rows:
+        values = sorted(values)
+        print(f"  {kind:<10} {len(values):>7} {_percentile(values, 0.5) * 1e3:>8.2f} "
+              f"{_percentile(values, 0.9) * 1e3:>8.2f} {_percentile(values, 0.99) * 1e3:>8.2f}")
+
+
+def _free_port():
+    with socket.socket() as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def _start_daemon(store, port):
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'puzzle_daemon.py')
+    proc = subprocess.Popen([sys.executable, script, '--store', store, '--port', str(port)],
+                            stdout=subprocess.DEVNULL)
+    deadline = time.time() + 60
+    while time.time() < deadline:
+        if proc.poll() is not None:
+            raise RuntimeError("daemon exited during startup")
+        try:
+            socket.create_connection(('127.0.0.1', port), timeout=0.2).close()
+            return proc
+        except OSError:
+            time.sleep(0.1)
+    proc.kill()
+    raise RuntimeError("daemon did not start listening")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the puzzle daemon.')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT)
+    parser.add_argument('--store', help='start a daemon on this store for the test')
+    parser.add_argument('--requests', type=int, default=20000)
+    parser.add_argument('--concurrency', type=int, default=32)
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Puzzle Daemon Load Test")
+    print("=" * 70)
+
+    proc = None
+    if args.store:
+        args.port = _free_port()
+        proc = _start_daemon(args.store, args.port)
+    try:
+        results = asyncio.run(run_load(args.host, args.port, args.requests, args.concurrency))
+    finally:
+        if proc is not None:
+            proc.terminate()
+            proc.wait()
+    print_results(results)
+    return 0 if not results['errors'] else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Shared helpers for reading and writing puzzle records.
+
+The puzzle scripts all produce the same record shape:
+    {'id': ..., 'fen': ..., 'moves': ..., 'rating': ..., 'themes': ..., 'popularity': ...}
+
+`moves` is a space-separated UCI line whose first move is the opponent's
+setup move (Lichess convention). `themes` is separated by spaces in the
+official dump and by commas in the hand-written sets, so always go through
+split_themes() instead of calling str.split() directly.
+"""
+
+import csv
+import hashlib
+import io
+import json
+import re
+
+DEFAULT_PUZZLES_FILE = 'assets/puzzles/puzzles.json'
+
+# PuzzleId,FEN,Moves,Rating,RatingDeviation,Popularity,NbPlays,Themes,GameUrl,OpeningTags
+LICHESS_CSV_FIELDS = [
+    'PuzzleId', 'FEN', 'Moves', 'Rating', 'RatingDeviation',
+    'Popularity', 'NbPlays', 'Themes', 'GameUrl', 'OpeningTags',
+]
+
+MAX_PACK_ROWS = 1 << 32
+_THEME_SEPARATORS = re.compile(r'[\s,]+')
+# Lichess length themes by number of solver moves; longer lines are veryLong.
+_LENGTH_THEMES = {1: 'oneMove', 2: 'short', 3: 'long'}
+
+_BASE62 = '0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz'
+_BASE62_VALUE = {c: i for i, c in enumerate(_BASE62)}
+
+
+def split_themes(themes):
+    """Split a themes string on spaces and/or commas, dropping empties."""
+    if not themes:
+        return []
+    return [t for t in _THEME_SEPARATORS.split(themes) if t]
+
+
+def split_moves(moves):
+    """Split a UCI move line into a list of moves."""
+    return moves.split() if moves else []
+
+
+def load_puzzles(path=DEFAULT_PUZZLES_FILE):
+    """Load a puzzle list from a JSON file."""
+    with open(path, 'r', encoding='utf-8') as f:
+        return json.load(f)
+
+
+def lichess_id_to_int(puzzle_id):
+    """
+    Stable numeric ID for a Lichess puzzle ID.
+
+    Lichess IDs are 5 base62 characters, so decoding them gives a unique
+    integer below 62**5 (~916M) that is the same on every run, unlike the
+    `abs(hash(...))` the older scripts used.
+    """
+    value = 0
+    for char in puzzle_id:
+        value = value * 62 + _BASE62_VALUE[char]
+    return value
+
+
+def line_id(fen, moves):
+    """
+    Stable numeric ID for a generated puzzle, from its position and line.
+
+    Bit 61 is always set, so these never collide with lichess_id_to_int().
+    """
+    digest = hashlib.blake2b(f"{fen} {moves}".encode('utf-8'), digest_size=8).digest()
+    return (int.from_bytes(digest, 'little') >> 3) | (1 << 61)
+
+
+def pack_rows(puzzles):
+    """
+    {puzzle ID: row} for a pack in its exported order.
+
+    The files built beside puzzles.json (ladders.bin, similar.bin,
+    thumbnails.idx) refer to puzzles by this row, stored as uint32: a row
+    always fits, while mined and generated IDs (line_id) set bit 61.
+    Raises ValueError if the pack has more rows than uint32 can index.
+    """
+    if len(puzzles) > MAX_PACK_ROWS:
+        raise ValueError(f"{len(puzzles)} puzzles: pack rows must fit in uint32")
+    return {puzzle['id']: row for row, puzzle in enumerate(puzzles)}
+
+
+def length_theme(solver_moves):
+    """oneMove / short / long / veryLong for a line of `solver_moves` moves."""
+    return _LENGTH_THEMES.get(solver_moves, 'veryLong')
+
+
+def puzzle_from_csv_row(row):
+    """
+    Convert one Lichess CSV row (a list in LICHESS_CSV_FIELDS order) into a
+    puzzle record, or return None if the row is malformed.
+    """
+    if len(row) < 8 or not row[1] or not row[2]:
+        return None
+    try:
+        puzzle = {
+            'id': lichess_id_to_int(row[0]),
+            'fen': row[1],
+            'moves': row[2],
+            'rating': int(row[3]),
+            'themes': row[7],
+            'popularity': int(row[5]),
+            'lichess_id': row[0],
+            'rating_deviation': int(row[4]),
+            'nb_plays': int(row[6]),
+        }
+    except (KeyError, ValueError):
+        return None
+    if len(row) > 8:
+        puzzle['game_url'] = row[8]
+    if len(row) > 9:
+        puzzle['opening_tags'] = row[9]
+    return puzzle
+
+
+def open_text(path):
+    """Open a local text file, decompressing `.zst` on the fly."""
+    if path.endswith('.zst'):
+        import zstandard as zstd  # only needed for compressed dumps
+
+        raw = open(path, 'rb')
+        reader = zstd.ZstdDecompressor().stream_reader(raw, closefd=True)
+        return io.TextIOWrapper(reader, encoding='utf-8', newline='')
+    return open(path, 'r', encoding='utf-8', newline='')
+
+
+def iter_lichess_csv(path):
+    """Stream puzzle records from a local lichess_db_puzzle.csv(.zst)."""
+    with open_text(path) as f:
+        reader = csv.reader(f)
+        for row in reader:
+            if row and row[0] == 'PuzzleId':
+                continue
+            puzzle = puzzle_from_csv_row(row)
+            if puzzle is not None:
+                yield puzzle
+
+
+def iter_puzzles(path):
+    """Stream puzzle records from either a JSON puzzle file or the Lichess CSV dump."""
+    if path.endswith('.json'):
+        yield from load_puzzles(path)
+    else:
+        yield from iter_lichess_csv(path)
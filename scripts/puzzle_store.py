@@ -0,0 +1,311 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped puzzle store with a minimal perfect hash over puzzle IDs.
+
+Finding one puzzle in puzzles.json means json.load on the whole file and a
+linear scan. A store file instead maps every ID straight to its record:
+
+    header     MAGIC, version, puzzle count, bucket count
+    disp       int32[buckets]   per-bucket displacement (hash-and-displace)
+    keys       int64[count]     the ID stored in each slot, to reject misses
+    offsets    uint64[count+1]  byte range of each slot's record
+    records    compact JSON per puzzle, in slot order
+
+The hash is CHD ("hash, displace and compress"): an ID falls in bucket
+hb(id) % buckets and the bucket's displacement d picks the slot
+mix(h1(id) + d * h2(id)) % count (mixed again so every d reaches every
+slot, whatever gcd(h2, count) is). Buckets are placed largest first, trying
+d = 1, 2, ... until all their IDs land on free slots; single-ID buckets
+skip the search and store the free slot directly as -(slot + 1). The
+result is minimal (exactly `count` slots) and costs ~1.25 ints per ID.
+
+This is format version 2. Version 1 used the unmixed slot
+(h1(id) + d * h2(id)) % count, which could leave buckets unplaceable when
+gcd(h2, count) > 1; its displacements mean nothing under the mixed hash,
+so PuzzleStore rejects version 1 files and they must be rebuilt.
+
+PuzzleStore mmaps the file and decodes only the record asked for, so
+opening is near-instant and a lookup is four integer hashes and one json.loads,
+whatever the pack size.
+
+Usage:
+    python scripts/puzzle_store.py --input assets/puzzles/puzzles.json --output build/puzzles.store
+    python scripts/puzzle_store.py --output build/puzzles.store --lookup 190420187
+    python scripts/puzzle_store.py --input assets/puzzles/puzzles.json --benchmark
+"""
+
+import argparse
+import json
+import mmap
+import os
+import random
+import struct
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from puzzle_io import DEFAULT_PUZZLES_FILE, iter_puzzles
+
+MAGIC = b'CMPS'
+VERSION = 2  # see the module docstring for version 1
+HEADER = struct.Struct('<4sIII')
+# Average IDs per bucket; higher packs the displacement table tighter but
+# makes the last multi-ID buckets slower to place.
+BUCKET_LOAD = 4
+MAX_DISPLACEMENT = 1 << 24
+
+_MASK = (1 << 64) - 1
+GOLDEN = 0x9E3779B97F4A7C15
+_SEED1 = 0x243F6A8885A308D3
+_SEED2 = 0x13198A2E03707344
+DISPLACEMENT_BLOCK = 64
+
+
+def _mix64(x):
+    """splitmix64 finalizer on a Python int."""
+    x = (x + GOLDEN) & _MASK
+    x = ((x ^ (x >> 30)) * 0xBF58476D1CE4E5B9) & _MASK
+    x = ((x ^ (x >> 27)) * 0x94D049BB133111EB) & _MASK
+    return x ^ (x >> 31)
+
+
+def _hashes(key):
+    """Bucket hash and the two slot hashes (h1, odd h2) for one ID."""
+    key &= _MASK
+    return _mix64(key), _mix64(key ^ _SEED1), _mix64(key ^ _SEED2) | 1
+
+
+def _mix64_array(x):
+    """_mix64() on a uint64 array (wrapping arithmetic)."""
+    x = x + np.uint64(GOLDEN)
+    x = (x ^ (x >> np.uint64(30))) * np.uint64(0xBF58476D1CE4E5B9)
+    x = (x ^ (x >> np.uint64(27))) * np.uint64(0x94D049BB133111EB)
+    return x ^ (x >> np.uint64(31))
+
+
+def _hashes_array(keys):
+    """_hashes() vectorized over a uint64 array."""
+    return (_mix64_array(keys), _mix64_array(keys ^ np.uint64(_SEED1)),
+            _mix64_array(keys ^ np.uint64(_SEED2)) | np.uint64(1))
+
+
+def build_index(keys):
+    """
+    Build the displacement table for a list of distinct integer keys.
+
+    Returns (disp, slots) where slots[i] is the slot of keys[i]. Each
+    multi-ID bucket tries a block of displacements at once in NumPy.
+    """
+    count = len(keys)
+    buckets = max(1, (count + BUCKET_LOAD - 1) // BUCKET_LOAD)
+    hb, h1, h2 = _hashes_array(np.array(keys, dtype=np.int64).astype(np.uint64))
+    bucket_of = (hb % np.uint64(buckets)).astype(np.int64)
+    # Key indices grouped by bucket, largest buckets first.
+    sizes = np.bincount(bucket_of, minlength=buckets)
+    by_bucket = np.argsort(bucket_of, kind='stable')
+    starts = np.concatenate(([0], np.cumsum(sizes)))
+    order = np.argsort(-sizes, kind='stable')
+
+    disp = np.zeros(buckets, dtype=np.int32)
+    slots = np.zeros(count, dtype=np.int64)
+    taken = np.zeros(count, dtype=bool)
+    n = np.uint64(count)
+    tries = np.arange(1, DISPLACEMENT_BLOCK + 1, dtype=np.uint64)
+
+    position = 0
+    while position < buckets and sizes[order[position]] > 1:
+        bucket = order[position]
+        members = by_bucket[starts[bucket]:starts[bucket + 1]]
+        for first in range(0, MAX_DISPLACEMENT, DISPLACEMENT_BLOCK):
+            d = tries + np.uint64(first)
+            placed = (_mix64_array(h1[members, None] + d[None, :] * h2[members, None]) % n).astype(np.int64)
+            ok = ~taken[placed].any(axis=0)
+            ranked = np.sort(placed, axis=0)
+            ok &= (ranked[1:] != ranked[:-1]).all(axis=0)
+            hits = np.nonzero(ok)[0]
+            if len(hits):
+                break
+        else:
+            raise ValueError(f"could not place bucket of {len(members)} keys; duplicate IDs?")
+        column = hits[0]
+        disp[bucket] = int(d[column])
+        slots[members] = placed[:, column]
+        taken[placed[:, column]] = True
+        position += 1
+
+    # Single-ID buckets take the remaining free slots directly.
+    singles = order[position:][sizes[order[position:]] == 1]
+    free = np.nonzero(~taken)[0][:len(singles)]
+    disp[singles] = -(free + 1)
+    slots[by_bucket[starts[singles]]] = free
+    return disp.tolist(), slots.tolist()
+
+
+def _pad8(length):
+    return (8 - length % 8) % 8
+
+
+def write_store(puzzles, path):
+    """Write puzzles (an iterable of records with integer 'id') to a store file."""
+    records = {}
+    for puzzle in puzzles:
+        if puzzle['id'] in records:
+            raise ValueError(f"duplicate puzzle id {puzzle['id']}")
+        records[puzzle['id']] = json.dumps(puzzle, separators=(',', ':'), ensure_ascii=False).encode('utf-8')
+    keys = list(records)
+    disp, slots = build_index(keys)
+
+    count = len(keys)
+    by_slot = [0] * count
+    for key, slot in zip(keys, slots):
+        by_slot[slot] = key
+    offsets = [0]
+    for key in by_slot:
+        offsets.append(offsets[-1] + len(records[key]))
+
+    os.makedirs(os.path.dirname(path) or '.', exist_ok=True)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, count, len(disp)))
+        f.write(struct.pack(f'<{len(disp)}i', *disp))
+        f.write(b'\0' * _pad8(HEADER.size + 4 * len(disp)))
+        f.write(struct.pack(f'<{count}q', *by_slot))
+        f.write(struct.pack(f'<{count + 1}Q', *offsets))
+        for key in by_slot:
+            f.write(records[key])
+    return count
+
+
+class PuzzleStore:
+    """Read-only, mmap-backed view of a store file."""
+
+    def __init__(self, path):
+        self._file = open(path, 'rb')
+        self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        magic, version, self.count, self.buckets = HEADER.unpack_from(self._map, 0)
+        if magic != MAGIC or version != VERSION:
+            self.close()
+            raise ValueError(f"{path} is not a version {VERSION} puzzle store")
+
+        view = self._view = memoryview(self._map)
+        start = HEADER.size
+        self._disp = view[start:start + 4 * self.buckets].cast('i')
+        start += 4 * self.buckets + _pad8(start + 4 * self.buckets)
+        self._keys = view[start:start + 8 * self.count].cast('q')
+        start += 8 * self.count
+        self._offsets = view[start:start + 8 * (self.count + 1)].cast('Q')
+        self._records = start + 8 * (self.count + 1)
+
+    def _slot(self, puzzle_id):
+        if not self.count:
+            return None
+        hb, h1, h2 = _hashes(puzzle_id)
+        d = self._disp[hb % self.buckets]
+        slot = -d - 1 if d < 0 else _mix64((h1 + d * h2) & _MASK) % self.count
+        return slot if self._keys[slot] == puzzle_id else None
+
+    def __len__(self):
+        return self.count
+
+    def __contains__(self, puzzle_id):
+        return self._slot(puzzle_id) is not None
+
+    def get_raw(self, puzzle_id):
+        """Encoded record bytes for an ID, or None."""
+        slot = self._slot(puzzle_id)
+        if slot is None:
+            return None
+        return self._map[self._records + self._offsets[slot]:self._records + self._offsets[slot + 1]]
+
+    def get(self, puzzle_id, default=None):
+        """Decoded puzzle record for an ID, or `default`."""
+        raw = self.get_raw(puzzle_id)
+        return default if raw is None else json.loads(raw)
+
+    def ids(self):
+        return list(self._keys)
+
+    def close(self):
+        for name in ('_disp', '_keys', '_offsets', '_view'):
+            view = self.__dict__.pop(name, None)
+            if view is not None:
+                view.release()
+        self._map.close()
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+def run_benchmark(input_path, lookups=10000):
+    """Compare open time and per-ID lookup against json.load + linear search."""
+    puzzles = list(iter_puzzles(input_path))
+    sample = random.Random(1).choices([p['id'] for p in puzzles], k=lookups)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, 'puzzles.store')
+        start = time.perf_counter()
+        write_store(puzzles, path)
+        build = time.perf_counter() - start
+
+        start = time.perf_counter()
+        with open(input_path, 'r', encoding='utf-8') as f:
+            loaded = json.load(f) if input_path.endswith('.json') else puzzles
+        json_open = time.perf_counter() - start
+        linear = sample[:100]
+        start = time.perf_counter()
+        for puzzle_id in linear:
+            next(p for p in loaded if p['id'] == puzzle_id)
+        json_lookup = (time.perf_counter() - start) / len(linear)
+
+        start = time.perf_counter()
+        store = PuzzleStore(path)
+        store_open = time.perf_counter() - start
+        start = time.perf_counter()
+        for puzzle_id in sample:
+            store.get(puzzle_id)
+        store_lookup = (time.perf_counter() - start) / len(sample)
+        size = os.path.getsize(path)
+        store.close()
+
+    print(f"\n{len(puzzles)} puzzles; store built in {build:.2f}s ({size / 1e6:.2f} MB)")
+    print(f"  {'path':<22} {'open':>10} {'lookup':>12}")
+    print(f"  {'json.load + scan':<22} {json_open * 1e3:>8.1f}ms {json_lookup * 1e6:>10.1f}us")
+    print(f"  {'mmap store':<22} {store_open * 1e3:>8.3f}ms {store_lookup * 1e6:>10.2f}us")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Build or query a memory-mapped puzzle store.')
+    parser.add_argument('--input', default=DEFAULT_PUZZLES_FILE, help='puzzle JSON or Lichess CSV(.zst)')
+    parser.add_argument('--output', default='build/puzzles.store', help='store file to write or query')
+    parser.add_argument('--lookup', type=int, nargs='+', help='print these puzzle IDs from --output')
+    parser.add_argument('--benchmark', action='store_true', help='compare against the JSON path')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Puzzle Store")
+    print("=" * 70)
+
+    if args.benchmark:
+        run_benchmark(args.input)
+        return 0
+
+    if args.lookup:
+        with PuzzleStore(args.output) as store:
+            for puzzle_id in args.lookup:
+                puzzle = store.get(puzzle_id)
+                print(json.dumps(puzzle) if puzzle else f"✗ {puzzle_id} not found")
+        return 0
+
+    start = time.perf_counter()
+    count = write_store(iter_puzzles(args.input), args.output)
+    print(f"✓ Wrote {count} puzzles to {args.output} in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
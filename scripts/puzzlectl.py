@@ -0,0 +1,521 @@
+#!/usr/bin/env python3
+"""
+One entry point for the puzzle pipeline, with cached stages.
+
+The download_* / fetch_* / parse_* scripts each fetch, parse, filter and
+save on their own, so changing a filter reruns everything from the
+download. puzzlectl models the pipeline as a DAG of stages:
+
+    fetch -> decompress -> parse -> filter -> validate -> dedup -> motifs -> select -> export
+
+motifs replays every solution (motif_detector.py), adds the motifs it
+finds to each puzzle's themes and counts the puzzles that claim a motif
+their line does not show.
+
+export annotates every solution (annotate_solutions.py: the start FEN
+after the setup move, SAN and check/capture flags per ply, which the app
+plays from) and writes the pack plus openings.json, the opening-tag trie
+index (opening_index.py) over the selected puzzles, ladders.bin, the
+precomputed session ladders and daily calendar from --calendar-start
+(session_ladders.py; the 1st of the current month by default), and
+similar.bin, each puzzle's nearest neighbours (similar_puzzles.py).
+
+Every stage writes one artifact to build/pipeline_cache/<stage>-<key>/,
+where key = sha256(stage name, the stage's own config, the source of the
+stage function and of every scripts/ module it imports, directly or not,
+and the upstream keys). A rerun therefore only recomputes stages at or
+below the first one whose inputs, config or code changed; the rest are
+reported as cached. Intermediate
+artifacts are PuzzleBatch files (puzzle_batch.write_batches) so the big
+stages stream columns rather than one dict per puzzle. A remote source is
+keyed by URL only; use `--force fetch` to pick up a new monthly dump.
+
+--max-memory caps the RSS of the run (workers included): a
+MemoryGovernor shrinks batch sizes, spills selector buffers and drops
+validate workers as it nears the cap, and every adaptation goes into
+<cache-dir>/run_report.json. The cap changes how stages run, not what
+they produce, so it is not part of any cache key.
+
+Only the standard library is imported up front. requests, zstandard,
+NumPy and python-chess are imported inside the stages that need them, so
+`--help`, `status` and fully cached runs start instantly.
+
+Usage:
+    python scripts/puzzlectl.py run [--source URL_OR_PATH] [--total 10000] [--min-rating 600] ...
+    python scripts/puzzlectl.py run --until dedup --force validate
+    python scripts/puzzlectl.py run --max-memory 2G
+    python scripts/puzzlectl.py status [same options]
+    python scripts/puzzlectl.py clean [--all]
+"""
+
+import argparse
+import ast
+import datetime
+import hashlib
+import inspect
+import json
+import os
+import shutil
+import sys
+import time
+
+from memory_governor import MemoryGovernor, parse_size
+
+CACHE_DIR = os.path.join('build', 'pipeline_cache')
+DEFAULT_SOURCE = 'https://database.lichess.org/lichess_db_puzzle.csv.zst'
+DEFAULT_OUTPUT = 'assets/puzzles/puzzles.json'
+EXPORT_FIELDS = ('id', 'fen', 'moves', 'rating', 'themes', 'popularity', 'start', 'san', 'flags')
+OPENINGS_FILE = 'openings.json'
+LADDERS_FILE = 'ladders.bin'
+SIMILAR_FILE = 'similar.bin'
+VALIDATE_BATCH = 50000
+BATCHES = 'output.batches'
+_SCRIPTS_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+# Stages: run(inputs, output, config, governor) -> summary dict. `inputs`
+# maps each dependency to its artifact path; `governor` is the run's
+# MemoryGovernor.
+
+def _fetch(inputs, output, config, governor):
+    source = config['source']
+    if os.path.exists(source):
+        shutil.copyfile(source, output)
+    else:
+        import requests  # only needed for remote sources
+
+        with requests.get(source, stream=True, timeout=60) as response:
+            response.raise_for_status()
+            with open(output, 'wb') as f:
+                for chunk in response.iter_content(1 << 20):
+                    f.write(chunk)
+    return {'bytes': os.path.getsize(output)}
+
+
+def _decompress(inputs, output, config, governor):
+    with open(inputs['fetch'], 'rb') as src, open(output, 'wb') as dst:
+        if src.read(4) == b'\x28\xb5\x2f\xfd':
+            import zstandard as zstd  # only needed for .zst sources
+
+            src.seek(0)
+            zstd.ZstdDecompressor().copy_stream(src, dst)
+        else:
+            src.seek(0)
+            shutil.copyfileobj(src, dst, 1 << 20)
+    return {'bytes': os.path.getsize(output)}
+
+
+def _parse(inputs, output, config, governor):
+    import csv
+    from itertools import islice
+
+    from puzzle_batch import DEFAULT_BATCH_SIZE, PuzzleBatch, write_batches
+    from puzzle_io import open_text
+
+    def limited():
+        remaining = config['limit']
+        with open_text(inputs['decompress']) as f:
+            reader = csv.reader(f)
+            while remaining is None or remaining > 0:
+                rows = list(islice(reader, governor.batch_size('parse', DEFAULT_BATCH_SIZE)))
+                if not rows:
+                    return
+                batch = PuzzleBatch.from_csv_rows([row for row in rows if row[:1] != ['PuzzleId']])
+                if remaining is not None:
+                    if len(batch) > remaining:
+                        batch = batch.select(range(remaining))
+                    remaining -= len(batch)
+                yield batch
+
+    return {'records': write_batches(output, limited())}
+
+
+def _filter(inputs, output, config, governor):
+    from puzzle_batch import read_batches, write_batches
+
+    def kept():
+        for batch in read_batches(inputs['parse']):
+            ratings = batch['rating']
+            yield batch.select((ratings >= config['min_rating']) & (ratings <= config['max_rating'])
+                               & (batch['popularity'] >= config['min_popularity'])
+                               & (batch['nb_plays'] >= config['min_plays']))
+
+    return {'records': write_batches(output, kept())}
+
+
+def _validate(inputs, output, config, governor):
+    import chess
+
+    from puzzle_batch import PuzzleBatch, read_batches, write_batches
+    from puzzle_io import split_moves
+    from verify_mate_puzzles import FAILED_VERDICTS, verify_puzzles
+
+    dropped = {'illegal': 0, 'mate': 0}
+
+    def legal_line(fen, moves):
+        moves = split_moves(moves)
+        try:
+            board = chess.Board(fen)
+            for uci in moves:
+                move = chess.Move.from_uci(uci)
+                if move not in board.legal_moves:
+                    return False
+                board.push(move)
+        except ValueError:
+            return False
+        return len(moves) >= 2
+
+    def batches():
+        chunk = []
+        for batch in read_batches(inputs['filter']):
+            chunk.append(batch)
+            if sum(len(b) for b in chunk) >= governor.batch_size('validate', VALIDATE_BATCH):
+                yield PuzzleBatch.concat(chunk)
+                chunk = []
+        if chunk:
+            yield PuzzleBatch.concat(chunk)
+
+    def passing():
+        for batch in batches():
+            legal = batch.select([legal_line(fen, moves)
+                                  for fen, moves in zip(batch.strings('fen'), batch.strings('moves'))])
+            dropped['illegal'] += len(batch) - len(legal)
+            keep = [True] * len(legal)
+            if config['verify_mates']:
+                workers = governor.workers('validate', config['workers'] or os.cpu_count() or 1)
+                results = verify_puzzles(legal.to_records(), workers=workers)
+                failed = {r['id'] for r in results if r['verdict'] in FAILED_VERDICTS}
+                keep = [puzzle_id not in failed for puzzle_id in legal['id'].tolist()]
+            dropped['mate'] += keep.count(False)
+            yield legal.select(keep)
+
+    records = write_batches(output, passing())
+    return {'records': records, 'dropped_illegal': dropped['illegal'], 'dropped_mate': dropped['mate']}
+
+
+def _dedup(inputs, output, config, governor):
+    import numpy as np
+
+    from near_duplicates import deduplicate
+    from puzzle_batch import read_batches, write_batches
+
+    def views():
+        for batch in read_batches(inputs['validate']):
+            yield from batch
+
+    ids, keep, _ = deduplicate(views(), config['threshold'], work_dir=os.path.dirname(output))
+    kept = ids[keep]
+    records = write_batches(output, (batch.select(np.isin(batch['id'], kept))
+                                     for batch in read_batches(inputs['validate'])))
+    return {'records': records, 'dropped': len(ids) - records}
+
+
+def _motifs(inputs, output, config, governor):
+    from motif_detector import assign_themes, check_themes, detect_motifs_safe
+    from puzzle_batch import StringColumn, read_batches, write_batches
+
+    counts = {'flagged': 0, 'skipped': 0}
+
+    def tagged():
+        for batch in read_batches(inputs['dedup']):
+            themes = batch.strings('themes')
+            filled = []
+            for claimed, moves, detected in zip(themes, batch.strings('moves'),
+                                                detect_motifs_safe(batch.to_records())):
+                if detected is None:
+                    counts['skipped'] += 1
+                    filled.append(claimed)
+                    continue
+                counts['flagged'] += bool(check_themes(claimed, detected)['unsupported'])
+                filled.append(assign_themes({'themes': claimed, 'moves': moves}, detected)['themes'])
+            batch.columns['themes'] = StringColumn.from_strings(filled)
+            yield batch
+
+    records = write_batches(output, tagged())
+    return {'records': records, 'flagged': counts['flagged'], 'skipped': counts['skipped']}
+
+
+def _select(inputs, output, config, governor):
+    from puzzle_batch import PuzzleBatch, read_batches, write_batches
+    from quota_selector import select_batches
+
+    selected, report = select_batches(read_batches(inputs['motifs']), config['total'], governor=governor)
+    return {'records': write_batches(output, [PuzzleBatch.from_records(selected)]),
+            'quota_gap': report['total_gap']}
+
+
+def _export(inputs, output, config, governor):
+    from annotate_solutions import annotate_puzzles
+    from dataset_stats import DatasetStats, write_report
+    from opening_index import build_trie, save_index
+    from puzzle_batch import read_batches
+    from session_ladders import build_ladders, write_ladders
+    from similar_puzzles import build_neighbours, write_neighbours
+
+    records = [p for batch in read_batches(inputs['select']) for p in batch.to_records()]
+    # validate already dropped illegal lines; annotate and sort first so every index below matches the
+    # pack: ladders.bin and similar.bin refer to puzzles by their row in puzzles.json.
+    records, unannotated = annotate_puzzles(records, workers=1)
+    records.sort(key=lambda p: p['rating'])
+    trie, tagged = build_trie(records)
+    save_index(trie, os.path.join(os.path.dirname(output), OPENINGS_FILE))
+    ladders = build_ladders(records, start=config['calendar_start'])
+    write_ladders(os.path.join(os.path.dirname(output), LADDERS_FILE), ladders)
+    write_neighbours(os.path.join(os.path.dirname(output), SIMILAR_FILE), *build_neighbours(records))
+    puzzles = [{field: p[field] for field in EXPORT_FIELDS} for p in records]
+    stats = DatasetStats()
+    for puzzle in puzzles:
+        stats.observe(puzzle)
+    with open(output, 'w', encoding='utf-8') as f:
+        json.dump(puzzles, f, indent=2, ensure_ascii=False)
+    write_report(os.path.join(os.path.dirname(output), 'stats.json'), {'output': stats})
+    return {'records': len(puzzles), 'unannotated': len(unannotated), 'with_opening': tagged,
+            'ladders': len(ladders['ladders'])}
+
+
+class Stage:
+    """One pipeline stage: its dependencies, config keys and artifact name."""
+
+    def __init__(self, name, run, deps=(), config=(), artifact='output.jsonl'):
+        self.name = name
+        self.run = run
+        self.deps = list(deps)
+        self.config = list(config)
+        self.artifact = artifact
+
+    def code_modules(self):
+        """Every scripts/ module the stage function imports, directly or through other modules."""
+        pending = _script_imports(inspect.getsource(self.run))
+        found = set()
+        while pending:
+            module = pending.pop()
+            found.add(module)
+            with open(os.path.join(_SCRIPTS_DIR, module + '.py'), 'r', encoding='utf-8') as f:
+                pending |= _script_imports(f.read()) - found
+        return sorted(found)
+
+    def code_version(self):
+        digest = hashlib.sha256(inspect.getsource(self.run).encode('utf-8'))
+        for module in self.code_modules():
+            with open(os.path.join(_SCRIPTS_DIR, module + '.py'), 'rb') as f:
+                digest.update(f.read())
+        return digest.hexdigest()
+
+
+def _script_imports(source):
+    """Names of the scripts/ modules imported anywhere in `source`, function bodies included."""
+    names = set()
+    for node in ast.walk(ast.parse(source)):
+        if isinstance(node, ast.Import):
+            names.update(alias.name for alias in node.names)
+        elif isinstance(node, ast.ImportFrom) and node.module and not node.level:
+            names.add(node.module)
+    return {name for name in names if os.path.exists(os.path.join(_SCRIPTS_DIR, name + '.py'))}
+
+
+STAGES = [
+    Stage('fetch', _fetch, config=['source', 'source_fingerprint'], artifact='source.bin'),
+    Stage('decompress', _decompress, ['fetch'], artifact='puzzles.csv'),
+    Stage('parse', _parse, ['decompress'], ['limit'], BATCHES),
+    Stage('filter', _filter, ['parse'], ['min_rating', 'max_rating', 'min_popularity', 'min_plays'], BATCHES),
+    Stage('validate', _validate, ['filter'], ['verify_mates'], BATCHES),
+    Stage('dedup', _dedup, ['validate'], ['threshold'], BATCHES),
+    Stage('motifs', _motifs, ['dedup'], artifact=BATCHES),
+    Stage('select', _select, ['motifs'], ['total'], BATCHES),
+    Stage('export', _export, ['select'], ['calendar_start'], 'puzzles.json'),
+]
+STAGE_NAMES = [stage.name for stage in STAGES]
+
+
+def topological_order(stages):
+    """Stages ordered so every dependency comes first; raises ValueError on a cycle."""
+    by_name = {stage.name: stage for stage in stages}
+    order, state = [], {}
+
+    def visit(name):
+        if state.get(name) == 'done':
+            return
+        if state.get(name) == 'active':
+            raise ValueError(f"dependency cycle through {name}")
+        state[name] = 'active'
+        for dep in by_name[name].deps:
+            visit(dep)
+        state[name] = 'done'
+        order.append(by_name[name])
+
+    for stage in stages:
+        visit(stage.name)
+    return order
+
+
+def source_fingerprint(source):
+    """Size and mtime for local sources (cheap, changes when the file does); '' for URLs."""
+    if os.path.exists(source):
+        info = os.stat(source)
+        return f"{info.st_size}:{info.st_mtime_ns}"
+    return ''
+
+
+def plan(config, stages=STAGES, cache_dir=CACHE_DIR):
+    """Return [(stage, key, artifact path)] in execution order."""
+    keys = {}
+    steps = []
+    for stage in topological_order(stages):
+        payload = {
+            'stage': stage.name,
+            'config': {name: config[name] for name in stage.config},
+            'code': stage.code_version(),
+            'deps': {dep: keys[dep] for dep in stage.deps},
+        }
+        key = hashlib.sha256(json.dumps(payload, sort_keys=True).encode('utf-8')).hexdigest()[:16]
+        keys[stage.name] = key
+        steps.append((stage, key, os.path.join(cache_dir, f"{stage.name}-{key}", stage.artifact)))
+    return steps
+
+
+def run_pipeline(config, until=None, force=(), stages=STAGES, cache_dir=CACHE_DIR, log=print, governor=None):
+    """
+    Run stages up to `until` (inclusive), reusing cached artifacts.
+
+    Stages named in `force` are recomputed along with everything
+    downstream of them. `governor` defaults to a MemoryGovernor for
+    config['max_memory'] (no cap if unset). Returns ({stage: summary},
+    {stage: artifact path}).
+    """
+    if governor is None:
+        governor = MemoryGovernor(config.get('max_memory'), log)
+    summaries = {}
+    artifacts = {}
+    dirty = set()
+    for stage, key, artifact in plan(config, stages, cache_dir):
+        stage_dir = os.path.dirname(artifact)
+        meta_path = os.path.join(stage_dir, 'meta.json')
+        rerun = stage.name in force or any(dep in dirty for dep in stage.deps)
+        if not rerun and os.path.exists(meta_path):
+            with open(meta_path, 'r', encoding='utf-8') as f:
+                summaries[stage.name] = json.load(f)['summary']
+            log(f"  {stage.name:<11} cached   {key}  {_describe(summaries[stage.name])}")
+        else:
+            tmp_dir = stage_dir + '.tmp'
+            shutil.rmtree(tmp_dir, ignore_errors=True)
+            os.makedirs(tmp_dir)
+            start = time.perf_counter()
+            inputs = {dep: artifacts[dep] for dep in stage.deps}
+            adapted = len(governor.adaptations)
+            summary = stage.run(inputs, os.path.join(tmp_dir, stage.artifact), config, governor)
+            elapsed = time.perf_counter() - start
+            if len(governor.adaptations) > adapted:
+                summary['memory_adaptations'] = len(governor.adaptations) - adapted
+            with open(os.path.join(tmp_dir, 'meta.json'), 'w', encoding='utf-8') as f:
+                json.dump({'stage': stage.name, 'key': key, 'seconds': round(elapsed, 2), 'summary': summary}, f)
+            shutil.rmtree(stage_dir, ignore_errors=True)
+            os.replace(tmp_dir, stage_dir)
+            summaries[stage.name] = summary
+            dirty.add(stage.name)
+            log(f"  {stage.name:<11} ran      {key}  {_describe(summary)} in {elapsed:.1f}s")
+        artifacts[stage.name] = artifact
+        if stage.name == until:
+            break
+    return summaries, artifacts
+
+
+def _describe(summary):
+    return ', '.join(f"{name}={value}" for name, value in summary.items())
+
+
+def default_calendar_start(today=None):
+    """First day of the current month: the calendar starts no later than the
+    export, and the export stays cached for the rest of the month."""
+    return (today or datetime.date.today()).replace(day=1).isoformat()
+
+
+def build_config(args):
+    return {
+        'source': args.source,
+        'source_fingerprint': source_fingerprint(args.source),
+        'limit': args.limit,
+        'min_rating': args.min_rating,
+        'max_rating': args.max_rating,
+        'min_popularity': args.min_popularity,
+        'min_plays': args.min_plays,
+        'verify_mates': args.verify_mates,
+        'workers': args.workers,
+        'threshold': args.dedup_threshold,
+        'total': args.total,
+        'max_memory': args.max_memory,
+        'calendar_start': args.calendar_start or default_calendar_start(),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Run the puzzle pipeline with cached stages.')
+    parser.add_argument('command', choices=['run', 'status', 'clean'])
+    parser.add_argument('--source', default=DEFAULT_SOURCE, help='puzzle CSV URL or local path (.csv or .csv.zst)')
+    parser.add_argument('--output', default=DEFAULT_OUTPUT, help='where run copies the exported JSON')
+    parser.add_argument('--cache-dir', default=CACHE_DIR)
+    parser.add_argument('--until', choices=STAGE_NAMES, help='stop after this stage')
+    parser.add_argument('--force', action='append', default=[], choices=STAGE_NAMES,
+                        help='recompute this stage (and everything downstream)')
+    parser.add_argument('--all', action='store_true', help='clean: remove every cached artifact')
+    parser.add_argument('--limit', type=int, help='parse at most this many CSV rows')
+    parser.add_argument('--min-rating', type=int, default=400)
+    parser.add_argument('--max-rating', type=int, default=3000)
+    parser.add_argument('--min-popularity', type=int, default=50)
+    parser.add_argument('--min-plays', type=int, default=50)
+    parser.add_argument('--no-verify-mates', dest='verify_mates', action='store_false',
+                        help='skip the forced-mate check in validate')
+    parser.add_argument('--workers', type=int, help='validate worker processes (default: all cores)')
+    parser.add_argument('--dedup-threshold', type=float, default=0.8)
+    parser.add_argument('--total', type=int, default=10000, help='puzzles to select')
+    parser.add_argument('--calendar-start', help='first daily-puzzle day, YYYY-MM-DD (default: 1st of this month)')
+    parser.add_argument('--max-memory', type=parse_size,
+                        help='RSS cap for the run, e.g. 2G: shrinks batches, spills buffers and drops workers near it')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Puzzle Pipeline")
+    print("=" * 70)
+
+    config = build_config(args)
+    if args.command == 'status':
+        for stage, key, artifact in plan(config, cache_dir=args.cache_dir):
+            state = 'cached' if os.path.exists(os.path.join(os.path.dirname(artifact), 'meta.json')) else 'stale'
+            print(f"  {stage.name:<11} {state:<8} {key}")
+        return 0
+
+    if args.command == 'clean':
+        current = {os.path.dirname(artifact) for _, _, artifact in plan(config, cache_dir=args.cache_dir)}
+        removed = 0
+        if os.path.isdir(args.cache_dir):
+            for entry in os.listdir(args.cache_dir):
+                path = os.path.join(args.cache_dir, entry)
+                if args.all or path not in current:
+                    shutil.rmtree(path)
+                    removed += 1
+        print(f"✓ Removed {removed} cached artifacts")
+        return 0
+
+    start = time.perf_counter()
+    governor = MemoryGovernor(args.max_memory)
+    summaries, artifacts = run_pipeline(config, args.until, set(args.force), cache_dir=args.cache_dir,
+                                        governor=governor)
+    report_path = os.path.join(args.cache_dir, 'run_report.json')
+    with open(report_path, 'w', encoding='utf-8') as f:
+        json.dump({'stages': summaries, 'memory': governor.report()}, f, indent=2)
+    if governor.enabled:
+        memory = governor.report()
+        print(f"\nPeak RSS {memory['peak_rss_mb']} MB of {memory['max_memory_mb']} MB, "
+              f"{len(memory['adaptations'])} adaptations (see {report_path})")
+    if 'export' in artifacts:
+        os.makedirs(os.path.dirname(args.output) or '.', exist_ok=True)
+        shutil.copyfile(artifacts['export'], args.output)
+        for name in (OPENINGS_FILE, LADDERS_FILE, SIMILAR_FILE):
+            shutil.copyfile(os.path.join(os.path.dirname(artifacts['export']), name),
+                            os.path.join(os.path.dirname(args.output) or '.', name))
+        print(f"\n✓ Saved to {args.output} (with {OPENINGS_FILE}, {LADDERS_FILE} and {SIMILAR_FILE} beside it)")
+    print(f"Pipeline finished in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
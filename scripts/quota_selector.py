@@ -0,0 +1,447 @@
+#!/usr/bin/env python3
+"""
+Select a puzzle pack that hits target marginals over several dimensions.
+
+The old selectors only balance by rating (`target_per_bucket` in
+download_lichess_puzzles_official.py), so the themes end up dominated by
+"short", "middlegame" and "crushing", and niche themes such as
+smotheredMate or underPromotion almost never make it in. Here the target
+is a set of marginals:
+
+    rating   exact share per rating band (RATING_BANDS)
+    phase    exact share per opening/middlegame/endgame (position_features)
+    theme    minimum share of puzzles carrying a theme (multi-valued)
+    theme caps  maximum share for over-represented themes
+
+Selection is one streaming pass plus a fill over bounded buffers:
+
+  1. Puzzles arrive in batches; phase comes from position_features. Each
+     puzzle goes to a cell (rating band, phase, rarest targeted theme) and
+     each cell keeps at most `buffer_per_cell` candidates, most popular
+     first, so memory is bounded however long the input is. Under a
+     MemoryGovernor (--max-memory) the buffers are spilled to a temporary
+     file when RSS nears the cap and merged back before the fill.
+  2. The fill is greedy deficit-priority: every buffered candidate scores
+     the sum of relative deficits (target - achieved) / target of the
+     values it would count toward, scored as one matrix product per round.
+     The best candidates are taken a slice at a time, re-checking caps as
+     each one is accepted, until the pack is full.
+
+report() gives target vs. achieved per value and the worst deviation.
+
+Usage:
+    python scripts/quota_selector.py --input lichess_db_puzzle.csv.zst --total 10000 \
+        [--targets targets.json] [--output puzzles.json] [--report quota_report.json] [--max-memory 2G]
+"""
+
+import argparse
+import heapq
+import itertools
+import json
+import pickle
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from memory_governor import MemoryGovernor, parse_size
+from position_features import PHASES, extract_features
+from puzzle_batch import PuzzleBatch, iter_batches, rebatch
+from puzzle_io import DEFAULT_PUZZLES_FILE, split_themes
+
+RATING_BANDS = [
+    ('beginner', 600, 1200),
+    ('intermediate', 1200, 1600),
+    ('advanced', 1600, 2000),
+    ('expert', 2000, 2400),
+    ('master', 2400, 3000),
+]
+
+# Shares of the pack. rating/phase are exact; theme is a floor per theme.
+DEFAULT_TARGETS = {
+    'rating': {'beginner': 0.20, 'intermediate': 0.25, 'advanced': 0.25, 'expert': 0.20, 'master': 0.10},
+    'phase': {'opening': 0.10, 'middlegame': 0.60, 'endgame': 0.30},
+    'theme': {
+        'fork': 0.10, 'pin': 0.07, 'skewer': 0.04, 'discoveredAttack': 0.05,
+        'doubleCheck': 0.02, 'deflection': 0.04, 'attraction': 0.03, 'clearance': 0.02,
+        'interference': 0.015, 'xRayAttack': 0.01, 'zugzwang': 0.015, 'intermezzo': 0.015,
+        'mateIn1': 0.08, 'mateIn2': 0.08, 'mateIn3': 0.04, 'backRankMate': 0.03,
+        'smotheredMate': 0.01, 'promotion': 0.03, 'underPromotion': 0.005,
+        'enPassant': 0.005, 'castling': 0.003,
+    },
+}
+# Ceilings for themes that otherwise swamp every pack.
+DEFAULT_THEME_CAPS = {'short': 0.35, 'crushing': 0.35, 'advantage': 0.30, 'long': 0.30}
+
+MIN_POPULARITY = 50
+MIN_PLAYS = 50
+BATCH_SIZE = 20000
+DEFAULT_BUFFER_PER_CELL = 400
+
+
+def rating_band(rating):
+    for name, low, high in RATING_BANDS:
+        if low <= rating < high:
+            return name
+    return None
+
+
+def target_counts(shares, total):
+    """Round shares * total to integers; largest remainder keeps exact dims summing to total."""
+    raw = {value: share * total for value, share in shares.items()}
+    counts = {value: int(amount) for value, amount in raw.items()}
+    if abs(sum(shares.values()) - 1.0) < 1e-6:
+        short = total - sum(counts.values())
+        for value in sorted(raw, key=lambda v: raw[v] - counts[v], reverse=True)[:short]:
+            counts[value] += 1
+    return counts
+
+
+class QuotaSelector:
+    """Streaming multi-dimensional quota selector."""
+
+    def __init__(self, total, targets=None, theme_caps=None, buffer_per_cell=DEFAULT_BUFFER_PER_CELL,
+                 min_popularity=MIN_POPULARITY, min_plays=MIN_PLAYS, governor=None, first_seq=0):
+        self.total = total
+        self.targets = targets or DEFAULT_TARGETS
+        self.theme_caps = DEFAULT_THEME_CAPS if theme_caps is None else theme_caps
+        self.buffer_per_cell = buffer_per_cell
+        self.min_popularity = min_popularity
+        self.min_plays = min_plays
+
+        self.exact_dims = [d for d in ('rating', 'phase') if d in self.targets]
+        self.goal = {dim: target_counts(shares, total) for dim, shares in self.targets.items()}
+        self.caps = target_counts(self.theme_caps, total)
+        # Rarest first, so a puzzle's cell is keyed by its scarcest targeted theme.
+        self._theme_rank = sorted(self.targets.get('theme', {}), key=lambda t: self.targets['theme'][t])
+
+        self.governor = governor
+        self._cells = {}
+        # Cell buffers moved to disk by spill(), and the popularity a
+        # candidate must beat to displace a full spilled cell.
+        self._spill_file = None
+        self._floors = {}
+        self._seq = itertools.count(first_seq)
+        self.seen = 0
+        self.offered = 0
+        self.selected = []
+        self.achieved = {}
+
+    def _cell_theme(self, themes):
+        for theme in self._theme_rank:
+            if theme in themes:
+                return theme
+        return '*'
+
+    def offer_batch(self, puzzles):
+        """Consider a batch of puzzles: a PuzzleBatch or a list of puzzle records."""
+        if not isinstance(puzzles, PuzzleBatch):
+            puzzles = PuzzleBatch.from_records(puzzles)
+        self.seen += len(puzzles)
+        if not len(puzzles):
+            return
+        columns = puzzles.columns
+        ratings = puzzles['rating']
+        mask = (ratings >= RATING_BANDS[0][1]) & (ratings < RATING_BANDS[-1][2])
+        if 'popularity' in columns:
+            mask &= puzzles['popularity'] >= self.min_popularity
+        if 'nb_plays' in columns:
+            mask &= puzzles['nb_plays'] >= self.min_plays
+        eligible = puzzles.select(mask)
+        if not len(eligible):
+            return
+        try:
+            phases = extract_features(eligible)['phase_class'].tolist()
+        except (ValueError, IndexError):
+            # One malformed FEN spoils the batch; fall back to row by row.
+            phases = []
+            for row in range(len(eligible)):
+                try:
+                    phases.append(int(extract_features(eligible.select([row]))['phase_class'][0]))
+                except (ValueError, IndexError):
+                    phases.append(None)
+
+        popularity = eligible['popularity'].tolist() if 'popularity' in columns else [0] * len(eligible)
+        theme_strings = eligible.strings('themes') if 'themes' in columns else [''] * len(eligible)
+        for row, (rating, phase) in enumerate(zip(eligible['rating'].tolist(), phases)):
+            if phase is None:
+                continue
+            values = {'rating': rating_band(rating), 'phase': PHASES[phase]}
+            # A band or phase left out of partial targets gets no share of the pack.
+            if any(values[dim] not in self.goal[dim] for dim in self.exact_dims):
+                continue
+            self.offered += 1
+            themes = set(split_themes(theme_strings[row]))
+            key = (values['rating'], values['phase'], self._cell_theme(themes))
+            if key in self._floors and popularity[row] <= self._floors[key]:
+                continue
+            heap = self._cells.setdefault(key, [])
+            full = len(heap) >= self.buffer_per_cell
+            if full and popularity[row] <= heap[0][0]:
+                continue
+            # Only buffered candidates become dicts; the rest never leave the columns.
+            entry = (popularity[row], next(self._seq), eligible[row].to_dict(), values, themes)
+            if full:
+                heapq.heapreplace(heap, entry)
+            else:
+                heapq.heappush(heap, entry)
+        if self.governor is not None and self.governor.should_spill('quota buffers'):
+            self.spill()
+
+    def spill(self):
+        """
+        Move the cell buffers to a temporary file and start empty ones.
+
+        A cell that was full keeps its lowest popularity as a floor, so a
+        later candidate is only buffered if it could still make the top
+        `buffer_per_cell` once the spilled entries are merged back.
+        """
+        if self._spill_file is None:
+            self._spill_file = tempfile.TemporaryFile()
+        for key, heap in self._cells.items():
+            if len(heap) >= self.buffer_per_cell:
+                self._floors[key] = max(self._floors.get(key, heap[0][0]), heap[0][0])
+        pickle.dump(self._cells, self._spill_file, protocol=pickle.HIGHEST_PROTOCOL)
+        self._cells = {}
+
+    def _merge_spilled(self):
+        """Fold spilled buffers back in, keeping the best `buffer_per_cell` per cell."""
+        if self._spill_file is None:
+            return
+        merged = self._cells
+        self._spill_file.seek(0)
+        while True:
+            try:
+                cells = pickle.load(self._spill_file)
+            except EOFError:
+                break
+            for key, heap in cells.items():
+                merged.setdefault(key, []).extend(heap)
+        self._spill_file.close()
+        self._spill_file = None
+        # Same order as the heaps: higher popularity, then earlier arrival.
+        self._cells = {key: heapq.nlargest(self.buffer_per_cell, entries, key=lambda e: (e[0], -e[1]))
+                       for key, entries in merged.items()}
+
+    def merge(self, other):
+        """
+        Fold in another selector's buffers and counters (a distributed
+        worker's partial state), keeping the best `buffer_per_cell` per
+        cell as a spill merge does and one entry per puzzle ID. Selectors
+        given disjoint `first_seq` ranges break ties the same way whatever
+        order they are merged in.
+        """
+        self._merge_spilled()
+        other._merge_spilled()
+        self.seen += other.seen
+        self.offered += other.offered
+        for key, floor in other._floors.items():
+            self._floors[key] = max(self._floors.get(key, floor), floor)
+        merged = self._cells
+        for key, heap in other._cells.items():
+            merged.setdefault(key, []).extend(heap)
+        for key, entries in merged.items():
+            kept, ids = [], set()
+            for entry in sorted(entries, key=lambda e: (e[0], -e[1]), reverse=True):
+                if entry[2]['id'] not in ids:
+                    ids.add(entry[2]['id'])
+                    kept.append(entry)
+                    if len(kept) == self.buffer_per_cell:
+                        break
+            heapq.heapify(kept)
+            merged[key] = kept
+        self._cells = merged
+
+    def _value_index(self):
+        index = {}
+        for dim in self.exact_dims:
+            for value in self.goal[dim]:
+                index[(dim, value)] = len(index)
+        for theme in self.goal.get('theme', {}):
+            index[('theme', theme)] = len(index)
+        return index
+
+    def finish(self):
+        """Run the deficit-priority fill over the buffers and return the selection."""
+        self._merge_spilled()
+        candidates = [entry for heap in self._cells.values() for entry in heap]
+        candidates.sort(key=lambda e: (-e[0], e[1]))
+        self._cells = {}
+
+        index = self._value_index()
+        membership = np.zeros((len(candidates), len(index)), dtype=np.float32)
+        for row, (_, _, _, values, themes) in enumerate(candidates):
+            for dim in self.exact_dims:
+                column = index.get((dim, values[dim]))
+                if column is not None:
+                    membership[row, column] = 1
+            for theme in themes:
+                column = index.get(('theme', theme))
+                if column is not None:
+                    membership[row, column] = 1
+
+        goal = np.zeros(len(index), dtype=np.float64)
+        for (dim, value), column in index.items():
+            goal[column] = self.goal[dim][value]
+        count = np.zeros(len(index), dtype=np.float64)
+        counts = {dim: {value: 0 for value in self.goal[dim]} for dim in self.exact_dims}
+        cap_counts = {theme: 0 for theme in self.caps}
+
+        popularity = np.array([e[0] for e in candidates], dtype=np.float64)
+        tie_break = popularity / (popularity.max() + 1.0) * 1e-3 if len(candidates) else popularity
+        available = np.ones(len(candidates), dtype=bool)
+        selected = []
+        rejected = []
+
+        while len(selected) < self.total and available.any():
+            deficit = np.clip(goal - count, 0, None) / np.maximum(goal, 1)
+            scores = membership @ deficit + tie_break
+            scores[~available] = -np.inf
+            step = max(1, (self.total - len(selected)) // 20)
+            for row in np.argsort(-scores)[:step * 4]:
+                if not np.isfinite(scores[row]) or len(selected) >= self.total:
+                    break
+                available[row] = False
+                _, _, puzzle, values, themes = candidates[row]
+                if any(counts[dim].get(values[dim], 0) >= self.goal[dim].get(values[dim], 0) for dim in self.exact_dims):
+                    rejected.append(row)
+                    continue
+                if any(theme in cap_counts and cap_counts[theme] >= self.caps[theme] for theme in themes):
+                    rejected.append(row)
+                    continue
+                selected.append(puzzle)
+                count += membership[row]
+                for dim in self.exact_dims:
+                    counts[dim][values[dim]] = counts[dim].get(values[dim], 0) + 1
+                for theme in themes:
+                    if theme in cap_counts:
+                        cap_counts[theme] += 1
+                if len(selected) % step == 0:
+                    break
+
+        # Quotas the input cannot satisfy would leave the pack short; top it
+        # up with the most popular leftovers and let report() show the gap.
+        if len(selected) < self.total:
+            rejected.sort()
+            selected.extend(candidates[row][2] for row in rejected[:self.total - len(selected)])
+
+        self.selected = selected
+        self.achieved = self._measure(selected)
+        return selected
+
+    def _measure(self, puzzles):
+        achieved = {dim: {value: 0 for value in goal} for dim, goal in self.goal.items()}
+        achieved['theme_caps'] = {theme: 0 for theme in self.caps}
+        phases = extract_features(puzzles)['phase_class'].tolist() if puzzles else []
+        for puzzle, phase in zip(puzzles, phases):
+            values = {'rating': rating_band(puzzle['rating']), 'phase': PHASES[phase]}
+            for dim in self.exact_dims:
+                if values[dim] in achieved[dim]:
+                    achieved[dim][values[dim]] += 1
+            for theme in split_themes(puzzle.get('themes', '')):
+                if theme in achieved.get('theme', {}):
+                    achieved['theme'][theme] += 1
+                if theme in achieved['theme_caps']:
+                    achieved['theme_caps'][theme] += 1
+        return achieved
+
+    def report(self):
+        """Target vs. achieved per dimension value, with shares and the worst gap."""
+        size = max(len(self.selected), 1)
+        rows = []
+        for dim, goal in list(self.goal.items()) + [('theme_caps', self.caps)]:
+            for value, target in goal.items():
+                got = self.achieved.get(dim, {}).get(value, 0)
+                if dim == 'theme':
+                    gap = max(target - got, 0)
+                elif dim == 'theme_caps':
+                    gap = max(got - target, 0)
+                else:
+                    gap = abs(target - got)
+                rows.append({
+                    'dimension': dim, 'value': value, 'target': target, 'achieved': got,
+                    'share': round(got / size, 4), 'gap': gap,
+                })
+        worst = max(rows, key=lambda r: r['gap'] / max(r['target'], 1), default=None)
+        return {
+            'seen': self.seen,
+            'offered': self.offered,
+            'selected': len(self.selected),
+            'total_gap': sum(r['gap'] for r in rows),
+            'worst': worst,
+            'rows': rows,
+        }
+
+
+def print_report(report):
+    print(f"\nSelected {report['selected']} of {report['offered']} eligible ({report['seen']} seen)")
+    print(f"  {'dimension':<11} {'value':<17} {'target':>7} {'achieved':>9} {'gap':>6}")
+    for row in report['rows']:
+        print(f"  {row['dimension']:<11} {row['value']:<17} {row['target']:>7} {row['achieved']:>9} {row['gap']:>6}")
+    worst = report['worst']
+    if worst:
+        print(f"  Total gap: {report['total_gap']}; worst: {worst['dimension']}={worst['value']} "
+              f"({worst['achieved']} vs {worst['target']})")
+
+
+def select_batches(batches, total, targets=None, theme_caps=None, buffer_per_cell=DEFAULT_BUFFER_PER_CELL,
+                   governor=None):
+    """Run a QuotaSelector over an iterator of PuzzleBatches. Returns (selected, report)."""
+    selector = QuotaSelector(total, targets, theme_caps, buffer_per_cell, governor=governor)
+    for batch in batches:
+        selector.offer_batch(batch)
+    selected = selector.finish()
+    return selected, selector.report()
+
+
+def select_stream(puzzles_iter, total, targets=None, theme_caps=None, buffer_per_cell=DEFAULT_BUFFER_PER_CELL):
+    """Run a QuotaSelector over an iterator of puzzle records. Returns (selected, report)."""
+    return select_batches(rebatch(puzzles_iter, BATCH_SIZE), total, targets, theme_caps, buffer_per_cell)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Select a puzzle pack against multi-dimensional quotas.')
+    parser.add_argument('--input', default=DEFAULT_PUZZLES_FILE, help='puzzle JSON or Lichess CSV(.zst)')
+    parser.add_argument('--total', type=int, default=10000)
+    parser.add_argument('--targets', help='JSON file with {"rating": {...}, "phase": {...}, "theme": {...}}')
+    parser.add_argument('--theme-caps', help='JSON file with {"theme": max_share}')
+    parser.add_argument('--buffer', type=int, default=DEFAULT_BUFFER_PER_CELL, help='candidates kept per cell')
+    parser.add_argument('--output', help='write the selected puzzles (sorted by rating)')
+    parser.add_argument('--report', help='write the quota report as JSON')
+    parser.add_argument('--max-memory', type=parse_size, help='RSS cap, e.g. 2G; spills buffers to disk near it')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Quota Selector")
+    print("=" * 70)
+
+    targets = theme_caps = None
+    if args.targets:
+        with open(args.targets, encoding='utf-8') as f:
+            targets = json.load(f)
+    if args.theme_caps:
+        with open(args.theme_caps, encoding='utf-8') as f:
+            theme_caps = json.load(f)
+
+    start = time.perf_counter()
+    governor = MemoryGovernor(args.max_memory)
+    selected, report = select_batches(iter_batches(args.input, BATCH_SIZE), args.total, targets, theme_caps,
+                                      args.buffer, governor)
+    report['memory'] = governor.report()
+    print(f"Finished in {time.perf_counter() - start:.1f}s")
+    print_report(report)
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump(report, f, indent=2)
+    if args.output:
+        selected.sort(key=lambda p: p['rating'])
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(selected, f, indent=2, ensure_ascii=False)
+        print(f"\n✓ Saved {len(selected)} puzzles to {args.output}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,288 @@
+#!/usr/bin/env python3
+"""
+Precompute session ladders and the daily-puzzle calendar for a pack.
+
+On device, PuzzleFilterMode.daily seeds Random(yyyymmdd) over the whole
+list (so the daily puzzle can be anything, from a 600 mate-in-one to a
+2900 study, and changes when the pack does), and adaptive mode filters
+the full list down to +-200 of the player's rating on every
+startNewPuzzle. This script does that work once, at export time, and
+writes plain uint32 arrays of rows into the pack (the puzzle's index in
+puzzles.json, see puzzle_io.pack_rows) the app can walk with a cursor:
+
+  ladders   one per rating centre (every --step points): the puzzles
+            rated within --spread of the centre, each exactly once, in
+            a deterministic shuffled order made of sessions of
+            --session-length puzzles. Every session climbs from the
+            easiest to the hardest stratum of the window (strata are
+            rating quantiles), and a pick skips ahead (up to LOOKAHEAD
+            places in its stratum) rather than repeat the main theme of
+            the last THEME_GAP puzzles. The app keeps one cursor per
+            ladder and reads rows[cursor % len] for the nearest centre.
+  calendar  one puzzle per day for --years years from --start (default
+            today; puzzlectl passes its --calendar-start), drawn
+            from popular mid-rated puzzles. Difficulty follows the week
+            (Monday easiest, Sunday hardest: one rating stratum per
+            weekday) and a puzzle only repeats once its whole stratum
+            has been used. The app reads calendar[today - start].
+
+The output (ladders.bin next to puzzles.json) is little-endian:
+
+    header     MAGIC, version, ladder count, session length,
+               calendar start (days since 1970-01-01), calendar days
+    ladders    uint32[ladder count, 3]   (low, high, length) per ladder
+    rows       uint32[sum of lengths]    the ladders back to back
+    calendar   uint32[calendar days]
+
+Everything is seeded by --seed and the puzzle IDs alone, so rebuilding
+the same pack gives a byte-identical file.
+
+Usage:
+    python scripts/session_ladders.py --input assets/puzzles/puzzles.json --output build/ladders.bin \
+        [--step 100] [--spread 200] [--session-length 10] [--start 2026-10-01] [--years 3]
+    python scripts/session_ladders.py --ladders build/ladders.bin --rating 1530 --date 2025-03-14
+"""
+
+import argparse
+import datetime
+import struct
+import sys
+from collections import deque
+
+import numpy as np
+
+from puzzle_io import DEFAULT_PUZZLES_FILE, iter_puzzles, pack_rows, split_themes
+
+MAGIC = b'CMLD'
+VERSION = 1
+HEADER = struct.Struct('<4sIIIII')
+EPOCH = datetime.date(1970, 1, 1)
+
+LADDER_STEP = 100
+LADDER_SPREAD = 200
+SESSION_LENGTH = 10
+LOOKAHEAD = 8
+THEME_GAP = 3
+DEFAULT_YEARS = 3
+DAILY_MIN_RATING = 1000
+DAILY_MAX_RATING = 2200
+DAILY_MIN_POPULARITY = 85
+# Themes that say nothing about the tactic: length, phase and evaluation tags.
+GENERIC_THEMES = frozenset([
+    'oneMove', 'short', 'long', 'veryLong', 'opening', 'middlegame', 'endgame', 'advantage',
+    'crushing', 'equality', 'mate', 'master', 'masterVsMaster', 'superGM',
+])
+
+
+def main_theme(themes):
+    """The first theme that names a tactic (or '' when there is none)."""
+    for theme in split_themes(themes):
+        if theme not in GENERIC_THEMES:
+            return theme
+    return ''
+
+
+def _pick(queue, recent, themes):
+    """Pop the first of the next LOOKAHEAD queued puzzles whose theme is not recent."""
+    for i in range(min(LOOKAHEAD, len(queue))):
+        if not themes[queue[i]] or themes[queue[i]] not in recent:
+            break
+    else:
+        i = 0
+    queue.rotate(-i)
+    row = queue.popleft()
+    queue.rotate(i)
+    recent.append(themes[row])
+    return row
+
+
+def _strata(rows, ratings, ids, count):
+    """`rows` split into `count` rating quantiles (easiest first), ties broken by ID."""
+    order = rows[np.lexsort((ids[rows], ratings[rows]))]
+    return [part for part in np.array_split(order, count) if len(part)]
+
+
+def build_ladder(rows, ratings, ids, themes, rng, session_length=SESSION_LENGTH):
+    """Rows of one ladder: every row once, in sessions of rising difficulty."""
+    queues = [deque(rng.permutation(stratum).tolist())
+              for stratum in _strata(rows, ratings, ids, session_length)]
+    recent = deque(maxlen=THEME_GAP)
+    ladder = []
+    while any(queues):
+        for queue in queues:
+            if queue:
+                ladder.append(_pick(queue, recent, themes))
+    return ladder
+
+
+def build_calendar(rows, ratings, ids, themes, rng, start, days):
+    """One row per day from `start`: weekday w draws from the w-th easiest of 7 strata."""
+    strata = _strata(rows, ratings, ids, 7)
+    while len(strata) < 7:
+        # Fewer than 7 eligible puzzles: the hardest stratum covers the rest of the week.
+        strata.append(strata[-1])
+    queues = [deque() for _ in strata]
+    recent = deque(maxlen=THEME_GAP)
+    calendar = []
+    for day in range(days):
+        weekday = (start + datetime.timedelta(days=day)).weekday()
+        if not queues[weekday]:
+            queues[weekday].extend(rng.permutation(strata[weekday]).tolist())
+        calendar.append(_pick(queues[weekday], recent, themes))
+    return calendar
+
+
+def build_ladders(puzzles, step=LADDER_STEP, spread=LADDER_SPREAD, session_length=SESSION_LENGTH,
+                  start=None, years=DEFAULT_YEARS, seed=0):
+    """
+    Ladders and calendar for a list of puzzle records. `start` is the first
+    calendar day (date or YYYY-MM-DD, default today). Returns a dict with
+    'ladders' [(low, high, uint32 rows)], 'calendar' (uint32 rows),
+    'start' (date) and 'session_length'.
+    """
+    pack_rows(puzzles)
+    ids = np.array([p['id'] for p in puzzles], dtype=np.int64)
+    ratings = np.array([p['rating'] for p in puzzles], dtype=np.int64)
+    themes = [main_theme(p.get('themes', '')) for p in puzzles]
+    popularity = np.array([p.get('popularity', 100) for p in puzzles], dtype=np.int64)
+    # The shuffles depend on the seed and the IDs, not on input order.
+    by_id = np.argsort(ids, kind='stable')
+
+    ladders = []
+    if len(puzzles):
+        low_centre = int(np.ceil(ratings.min() / step) * step)
+        for centre in range(low_centre, int(ratings.max()) + 1, step):
+            low, high = centre - spread, centre + spread
+            rows = by_id[(ratings[by_id] >= low) & (ratings[by_id] < high)]
+            if not len(rows):
+                continue
+            rng = np.random.default_rng([seed, centre])
+            order = build_ladder(rows, ratings, ids, themes, rng, session_length)
+            ladders.append((low, high, np.array(order, dtype=np.uint32)))
+
+    if start is None:
+        start = datetime.date.today()
+    start = datetime.date.fromisoformat(start) if isinstance(start, str) else start
+    days = (start.replace(year=start.year + years) - start).days
+    eligible = by_id[(ratings[by_id] >= DAILY_MIN_RATING) & (ratings[by_id] < DAILY_MAX_RATING)
+                     & (popularity[by_id] >= DAILY_MIN_POPULARITY)]
+    if not len(eligible):
+        eligible = by_id
+    calendar = np.zeros(0, dtype=np.uint32)
+    if len(eligible):
+        rng = np.random.default_rng([seed, 0xDA11])
+        calendar = np.array(build_calendar(eligible, ratings, ids, themes, rng, start, days), dtype=np.uint32)
+    return {'ladders': ladders, 'calendar': calendar, 'start': start, 'session_length': session_length}
+
+
+def write_ladders(path, built):
+    table = np.array([(low, high, len(order)) for low, high, order in built['ladders']],
+                     dtype='<u4').reshape(-1, 3)
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(table), built['session_length'],
+                            (built['start'] - EPOCH).days, len(built['calendar'])))
+        f.write(table.tobytes())
+        for _, _, order in built['ladders']:
+            f.write(order.astype('<u4').tobytes())
+        f.write(built['calendar'].astype('<u4').tobytes())
+
+
+class Ladders:
+    """A ladders.bin file: the nearest ladder for a rating and the puzzle for a date."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, count, self.session_length, start, days = HEADER.unpack_from(data)
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} ladders file")
+        words = np.frombuffer(data, dtype='<u4', offset=HEADER.size)
+        self.table = words[:3 * count].reshape(count, 3)
+        ends = 3 * count + np.cumsum(self.table[:, 2].astype(np.int64))
+        starts = ends - self.table[:, 2]
+        self.ladders = [(int(low), int(high), words[a:b]) for (low, high, _), a, b in zip(self.table, starts, ends)]
+        self.start = EPOCH + datetime.timedelta(days=start)
+        self.calendar = words[int(ends[-1]) if count else 0:][:days]
+
+    def ladder(self, rating):
+        """(low, high, rows) of the ladder whose centre is nearest `rating`."""
+        centres = (self.table[:, 0].astype(np.int64) + self.table[:, 1]) // 2
+        return self.ladders[int(np.argmin(np.abs(centres - rating)))]
+
+    def next_puzzle(self, rating, cursor):
+        """Pack row of the puzzle at `cursor` on the ladder for `rating` (cursors wrap around)."""
+        rows = self.ladder(rating)[2]
+        return int(rows[cursor % len(rows)])
+
+    def daily(self, date):
+        """Pack row of the daily puzzle for `date`, or None outside the calendar."""
+        day = (date - self.start).days
+        return int(self.calendar[day]) if 0 <= day < len(self.calendar) else None
+
+
+def summarize(built, puzzles):
+    """Per-position mean rating within a session and the theme repeat rate, for the report."""
+    rating = [p['rating'] for p in puzzles]
+    theme = [main_theme(p.get('themes', '')) for p in puzzles]
+    length = built['session_length']
+    by_position = [[] for _ in range(length)]
+    repeats = pairs = 0
+    for _, _, order in built['ladders']:
+        order = order.tolist()
+        for i, row in enumerate(order):
+            by_position[i % length].append(rating[row])
+        for a, b in zip(order, order[1:]):
+            pairs += 1
+            repeats += bool(theme[a]) and theme[a] == theme[b]
+    return {
+        'ladders': len(built['ladders']),
+        'entries': sum(len(order) for _, _, order in built['ladders']),
+        'calendar_days': len(built['calendar']),
+        'session_ratings': [round(float(np.mean(r))) if r else None for r in by_position],
+        'theme_repeat_rate': round(repeats / max(pairs, 1), 4),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute session ladders and the daily-puzzle calendar.')
+    parser.add_argument('--input', default=DEFAULT_PUZZLES_FILE, help='puzzle JSON or Lichess CSV(.zst)')
+    parser.add_argument('--output', default='build/ladders.bin')
+    parser.add_argument('--step', type=int, default=LADDER_STEP, help='rating points between ladder centres')
+    parser.add_argument('--spread', type=int, default=LADDER_SPREAD, help='ladder window: centre +- spread')
+    parser.add_argument('--session-length', type=int, default=SESSION_LENGTH)
+    parser.add_argument('--start', help='first calendar day (YYYY-MM-DD, default: today)')
+    parser.add_argument('--years', type=int, default=DEFAULT_YEARS)
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--ladders', help='read an existing ladders file instead of building one')
+    parser.add_argument('--rating', type=int, help='with --ladders: show the ladder for this rating')
+    parser.add_argument('--date', help='with --ladders: show the daily puzzle for this date')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Session Ladders")
+    print("=" * 70)
+
+    if args.ladders:
+        ladders = Ladders(args.ladders)
+        print(f"{len(ladders.ladders)} ladders, calendar {ladders.start} + {len(ladders.calendar)} days")
+        if args.rating is not None:
+            low, high, rows = ladders.ladder(args.rating)
+            print(f"  rating {args.rating}: ladder {low}-{high}, {len(rows)} puzzles, first session (rows) "
+                  f"{rows[:ladders.session_length].tolist()}")
+        if args.date:
+            print(f"  {args.date}: row {ladders.daily(datetime.date.fromisoformat(args.date))}")
+        return 0
+
+    puzzles = list(iter_puzzles(args.input))
+    built = build_ladders(puzzles, args.step, args.spread, args.session_length, args.start, args.years, args.seed)
+    write_ladders(args.output, built)
+    summary = summarize(built, puzzles)
+    print(f"✓ {summary['ladders']} ladders ({summary['entries']} entries) and {summary['calendar_days']} "
+          f"calendar days written to {args.output}")
+    print(f"  mean rating by session position: {summary['session_ratings']}")
+    print(f"  consecutive puzzles sharing a main theme: {100 * summary['theme_repeat_rate']:.1f}%")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,438 @@
+#!/usr/bin/env python3
+"""
+Precompute "more puzzles like this one" neighbour lists for a pack.
+
+Each puzzle becomes a fixed-length vector describing the position the
+solver sees (after the setup move), always from the solver's side of the
+board (black-to-move positions are mirrored and the colours swapped):
+
+    board      12 x 64 piece-square occupancy, own pieces then theirs
+    material   own and opposing P, N, B, R, Q counts
+    themes     multi-hot over the pack's themes (length tags excluded)
+    length     one-hot solver moves: 1, 2, 3, 4, 5+
+
+Every block is scaled to unit length and weighted (BLOCK_WEIGHTS), and
+the whole vector is normalised, so the squared Euclidean distance
+between two puzzles is 2 - 2 x cosine similarity.
+
+All-pairs search is quadratic, which is fine for the 10k pack (about 2s,
+and exact) and not for the full dump. Packs up to EXACT_LIMIT puzzles use
+brute force; larger ones get their neighbours from an IVF-PQ index built
+in NumPy:
+
+  coarse   k-means (nlist ~ 4 sqrt(N) centroids) splits the puzzles into
+           inverted lists; a query only scans its nprobe nearest lists
+  PQ       the residual to the list centroid is cut into m sub-vectors,
+           each replaced by the nearest of 256 sub-centroids: m bytes
+           per puzzle instead of 4 x dim
+  search   ||q - c - r||^2 splits into the coarse distance, a per-puzzle
+           term stored at build time and -2<q, r>, which one table of
+           query-to-sub-centroid products per query turns into m table
+           reads (asymmetric distance); the best `rerank` candidates are
+           then re-scored exactly
+
+Queries are processed in blocks and, within a block, list by list (all
+queries probing a list at once), so the work is a handful of matrix
+products and gathers rather than a Python loop per puzzle. --benchmark
+compares build time and recall@K with brute force.
+
+The output (similar.bin next to puzzles.json) is little-endian:
+
+    header      MAGIC, version, puzzle count, K
+    neighbours  uint32[count, K]     neighbour rows, most similar first
+    similarity  uint8[count, K]      cosine similarity x 255
+
+Rows are positions in puzzles.json (puzzle_io.pack_rows), so the app
+reads the K neighbours of the puzzle at row r from row r of the table
+without parsing anything.
+
+Usage:
+    python scripts/similar_puzzles.py --input assets/puzzles/puzzles.json --output build/similar.bin [--k 10]
+    python scripts/similar_puzzles.py --input assets/puzzles/puzzles.json --benchmark
+    python scripts/similar_puzzles.py --similar build/similar.bin --row 42
+"""
+
+import argparse
+import struct
+import sys
+import time
+from collections import Counter
+
+import numpy as np
+
+from position_features import BLACK, EMPTY, apply_moves, parse_boards
+from puzzle_io import DEFAULT_PUZZLES_FILE, iter_puzzles, pack_rows, split_moves, split_themes
+
+MAGIC = b'CMSP'
+VERSION = 1
+HEADER = struct.Struct('<4sIII')
+
+DEFAULT_K = 10
+MAX_THEMES = 64
+LENGTH_BUCKETS = 5
+BLOCK_WEIGHTS = {'board': 1.0, 'material': 0.5, 'themes': 1.0, 'length': 0.4}
+LENGTH_THEMES = frozenset(['oneMove', 'short', 'long', 'veryLong'])
+
+PQ_SUBVECTORS = 32
+PQ_CENTROIDS = 256
+NPROBE = 8
+RERANK = 32
+KMEANS_ITERS = 10
+TRAIN_SAMPLE = 50000
+PQ_TRAIN_SAMPLE = 64 * PQ_CENTROIDS
+SEARCH_BLOCK = 1024
+EXACT_LIMIT = 50000
+
+
+def theme_vocabulary(puzzles, size=MAX_THEMES):
+    """The pack's `size` most common themes, length tags left out."""
+    counts = Counter(theme for p in puzzles for theme in split_themes(p.get('themes', ''))
+                     if theme not in LENGTH_THEMES)
+    return [theme for theme, _ in sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:size]]
+
+
+def _unit(block):
+    norms = np.linalg.norm(block, axis=1, keepdims=True)
+    return np.divide(block, norms, out=np.zeros_like(block), where=norms > 0)
+
+
+def encode_puzzles(puzzles, vocabulary):
+    """(N, dim) float32 unit vectors for puzzle records (see the module docstring)."""
+    count = len(puzzles)
+    boards, white, _ = parse_boards([p['fen'] for p in puzzles])
+    lines = [split_moves(p['moves']) for p in puzzles]
+    apply_moves(boards, white, [line[0] if line else '' for line in lines])
+
+    # Solver's view: mirror ranks for black and put the solver's pieces first.
+    squares = np.where(white[:, None], np.arange(64), np.arange(64) ^ 56)
+    own = np.where(white[:, None], (boards > EMPTY) & (boards <= BLACK), boards > BLACK)
+    types = np.where(boards > BLACK, boards - BLACK, boards).astype(np.intp)
+    planes = np.where(own, types - 1, types + 5)
+    rows, cols = np.nonzero(boards != EMPTY)
+    board = np.zeros((count, 12 * 64), dtype=np.float32)
+    board[rows, planes[rows, cols] * 64 + squares[rows, cols]] = 1
+
+    material = np.zeros((count, 10), dtype=np.float32)
+    for piece in range(5):
+        material[:, piece] = ((types == piece + 1) & own).sum(axis=1)
+        material[:, 5 + piece] = ((types == piece + 1) & ~own & (boards != EMPTY)).sum(axis=1)
+
+    index = {theme: i for i, theme in enumerate(vocabulary)}
+    themes = np.zeros((count, max(len(vocabulary), 1)), dtype=np.float32)
+    length = np.zeros((count, LENGTH_BUCKETS), dtype=np.float32)
+    for row, (puzzle, line) in enumerate(zip(puzzles, lines)):
+        for theme in split_themes(puzzle.get('themes', '')):
+            if theme in index:
+                themes[row, index[theme]] = 1
+        length[row, min(max(len(line) // 2, 1), LENGTH_BUCKETS) - 1] = 1
+
+    blocks = {'board': board, 'material': material, 'themes': themes, 'length': length}
+    vectors = np.hstack([_unit(block) * BLOCK_WEIGHTS[name] for name, block in blocks.items()])
+    width = -(-vectors.shape[1] // PQ_SUBVECTORS) * PQ_SUBVECTORS
+    padded = np.zeros((count, width), dtype=np.float32)
+    padded[:, :vectors.shape[1]] = vectors
+    return _unit(padded)
+
+
+def _nearest_centroid(x, centroids, block=4096):
+    """Index of the nearest centroid for every row of x."""
+    squared = (centroids * centroids).sum(axis=1)
+    out = np.empty(len(x), dtype=np.intp)
+    for start in range(0, len(x), block):
+        out[start:start + block] = np.argmin(squared - 2 * x[start:start + block] @ centroids.T, axis=1)
+    return out
+
+
+def kmeans(x, k, iters=KMEANS_ITERS, seed=0):
+    """Lloyd's k-means from a random sample of rows; empty clusters are re-seeded."""
+    rng = np.random.default_rng(seed)
+    k = min(k, len(x))
+    centroids = x[rng.choice(len(x), k, replace=False)].astype(np.float32)
+    for _ in range(iters):
+        assign = _nearest_centroid(x, centroids)
+        order = np.argsort(assign, kind='stable')
+        sizes = np.bincount(assign, minlength=k)
+        starts = np.concatenate(([0], np.cumsum(sizes)[:-1]))
+        sums = np.zeros_like(centroids)
+        filled = sizes > 0
+        sums[filled] = np.add.reduceat(x[order], starts[filled], axis=0)
+        empty = sizes == 0
+        centroids = np.where(empty[:, None], x[rng.choice(len(x), k)], sums / np.maximum(sizes, 1)[:, None])
+    return centroids.astype(np.float32)
+
+
+def _nearest_codewords(x, codebooks, block=512):
+    """(n, m) index of the nearest codeword per sub-vector; x is (m, n, dsub)."""
+    squared = (codebooks * codebooks).sum(axis=2)[:, None, :]
+    out = np.empty((x.shape[1], x.shape[0]), dtype=np.intp)
+    for start in range(0, x.shape[1], block):
+        products = np.matmul(x[:, start:start + block], codebooks.transpose(0, 2, 1))
+        products *= -2
+        products += squared
+        out[start:start + block] = np.argmin(products, axis=2).T
+    return out
+
+
+def train_codebooks(x, iters=KMEANS_ITERS, seed=0):
+    """
+    k-means in every subspace at once: x is (m, n, dsub), the result
+    (m, PQ_CENTROIDS, dsub). One batched product per iteration instead of
+    m small ones.
+    """
+    rng = np.random.default_rng(seed)
+    m, n, dsub = x.shape
+    k = min(PQ_CENTROIDS, n)
+    codebooks = x[:, rng.choice(n, k, replace=False)].copy()
+    offsets = (np.arange(m) * k)[:, None]
+    for _ in range(iters):
+        slots = (_nearest_codewords(x, codebooks).T + offsets).ravel()
+        sizes = np.bincount(slots, minlength=m * k).reshape(m, k)
+        sums = np.stack([np.bincount(slots, weights=x[:, :, d].ravel(), minlength=m * k)
+                         for d in range(dsub)], axis=1).reshape(m, k, dsub)
+        reseed = x[:, rng.choice(n, k)]
+        codebooks = np.where(sizes[:, :, None] > 0, sums / np.maximum(sizes, 1)[:, :, None], reseed)
+    return codebooks.astype(np.float32)
+
+
+class IVFPQIndex:
+    """Inverted lists over k-means centroids with product-quantised residuals."""
+
+    def __init__(self, nlist, subvectors=PQ_SUBVECTORS):
+        self.nlist = nlist
+        self.m = subvectors
+
+    def train(self, x, seed=0):
+        rng = np.random.default_rng(seed)
+        sample = x[rng.choice(len(x), min(len(x), TRAIN_SAMPLE), replace=False)]
+        self.centroids = kmeans(sample, self.nlist, seed=seed)
+        self.nlist = len(self.centroids)
+        sample = sample[:PQ_TRAIN_SAMPLE]
+        residuals = sample - self.centroids[_nearest_centroid(sample, self.centroids)]
+        self.dsub = x.shape[1] // self.m
+        self.codebooks = train_codebooks(self._split(residuals), seed=seed + 1)
+        return self
+
+    def _split(self, x):
+        """(n, dim) -> (m, n, dsub) sub-vectors."""
+        return np.ascontiguousarray(x.reshape(len(x), self.m, self.dsub).transpose(1, 0, 2))
+
+    def add(self, x):
+        """Index every row of x (row numbers are the IDs the search returns)."""
+        lists = _nearest_centroid(x, self.centroids)
+        codes = np.empty((len(x), self.m), dtype=np.uint8)
+        for start in range(0, len(x), SEARCH_BLOCK):
+            chunk = slice(start, start + SEARCH_BLOCK)
+            codes[chunk] = _nearest_codewords(self._split(x[chunk] - self.centroids[lists[chunk]]), self.codebooks)
+        # ||q - c - r||^2 = ||q - c||^2 + (||r||^2 + 2<c, r>) - 2<q, r>: the middle
+        # term depends only on the puzzle, so it is stored per puzzle.
+        decoded = self.codebooks[np.arange(self.m), codes]  # (n, m, dsub)
+        centre = self.centroids[lists].reshape(len(x), self.m, self.dsub)
+        terms = ((decoded ** 2).sum(axis=(1, 2)) + 2 * (centre * decoded).sum(axis=(1, 2)))
+        order = np.argsort(lists, kind='stable')
+        self.rows = order
+        self.codes = codes[order]
+        self.terms = terms[order].astype(np.float32)
+        self.offsets = np.searchsorted(lists[order], np.arange(self.nlist + 1))
+        return self
+
+    def search(self, queries, k, nprobe=NPROBE, rerank=RERANK, vectors=None, exclude_self=False):
+        """
+        (rows, squared distances), each (len(queries), k), best first; -1 /
+        inf where fewer than k were found. With `vectors` (the indexed
+        rows) the best `rerank` candidates are re-scored exactly. With
+        `exclude_self`, query i is row i and is left out.
+        """
+        nq = len(queries)
+        nprobe = min(nprobe, self.nlist)
+        keep = max(k, rerank) if vectors is not None else k
+        rows = np.full((nq, k), -1, dtype=np.int64)
+        distances = np.full((nq, k), np.inf, dtype=np.float32)
+        for begin in range(0, nq, SEARCH_BLOCK):
+            block = queries[begin:begin + SEARCH_BLOCK]
+            block_ids = np.arange(begin, begin + len(block))
+            coarse = (self.centroids ** 2).sum(axis=1) - 2 * block @ self.centroids.T + (block ** 2).sum(axis=1)[:, None]
+            probes = np.argpartition(coarse, nprobe - 1, axis=1)[:, :nprobe] if nprobe < self.nlist \
+                else np.broadcast_to(np.arange(self.nlist), coarse.shape)
+            # -2<q_j, codeword> for every sub-vector and codeword: (m, nq, 256).
+            table = -2 * np.matmul(self._split(block), self.codebooks.transpose(0, 2, 1))
+            found = np.full((len(block), nprobe, keep), -1, dtype=np.int64)
+            scores = np.full((len(block), nprobe, keep), np.inf, dtype=np.float32)
+            for lst in np.unique(probes).tolist():
+                start, end = self.offsets[lst], self.offsets[lst + 1]
+                if start == end:
+                    continue
+                who, slot = np.nonzero(probes == lst)
+                members, codes = self.rows[start:end], self.codes[start:end]
+                distance = coarse[who, lst][:, None] + self.terms[start:end][None, :]
+                for j in range(self.m):
+                    distance += table[j, who][:, codes[:, j]]
+                if exclude_self:
+                    distance[members[None, :] == block_ids[who][:, None]] = np.inf
+                take = min(keep, end - start)
+                best = np.argpartition(distance, take - 1, axis=1)[:, :take] if take < end - start \
+                    else np.broadcast_to(np.arange(end - start), distance.shape)
+                found[who, slot, :take] = members[best]
+                scores[who, slot, :take] = np.take_along_axis(distance, best, axis=1)
+
+            found = found.reshape(len(block), -1)
+            scores = scores.reshape(len(block), -1)
+            if vectors is not None:
+                top = np.argpartition(scores, keep - 1, axis=1)[:, :keep] if keep < scores.shape[1] \
+                    else np.broadcast_to(np.arange(scores.shape[1]), scores.shape)
+                found = np.take_along_axis(found, top, axis=1)
+                candidates = vectors[np.maximum(found, 0)]
+                exact = 2 - 2 * np.matmul(candidates, block[:, :, None])[:, :, 0]
+                scores = np.where(found >= 0, exact, np.inf).astype(np.float32)
+            order = np.argsort(scores, axis=1, kind='stable')[:, :k]
+            rows[begin:begin + len(block)] = np.take_along_axis(found, order, axis=1)
+            distances[begin:begin + len(block)] = np.take_along_axis(scores, order, axis=1)
+        rows[~np.isfinite(distances)] = -1
+        return rows, distances
+
+
+def brute_force(vectors, k, block=1024):
+    """Exact k nearest rows (excluding each row itself), as (rows, squared distances)."""
+    rows = np.empty((len(vectors), k), dtype=np.int64)
+    distances = np.empty((len(vectors), k), dtype=np.float32)
+    for start in range(0, len(vectors), block):
+        sims = vectors[start:start + block] @ vectors.T
+        sims[np.arange(len(sims)), np.arange(start, start + len(sims))] = -np.inf
+        top = np.argpartition(-sims, k - 1, axis=1)[:, :k]
+        top = np.take_along_axis(top, np.argsort(-np.take_along_axis(sims, top, axis=1), axis=1), axis=1)
+        rows[start:start + block] = top
+        distances[start:start + block] = 2 - 2 * np.take_along_axis(sims, top, axis=1)
+    return rows, distances
+
+
+def default_nlist(count):
+    return max(1, min(count // 8, int(4 * np.sqrt(count))))
+
+
+def build_neighbours(puzzles, k=DEFAULT_K, nprobe=NPROBE, seed=0, exact_limit=EXACT_LIMIT):
+    """
+    Neighbour lists for a pack: exact up to `exact_limit` puzzles, IVF-PQ
+    above. Returns (neighbour rows (N, k), cosine similarities (N, k)),
+    rows being positions in `puzzles`; missing neighbours are padded with
+    the puzzle's own row and similarity 0.
+    """
+    pack_rows(puzzles)
+    count = len(puzzles)
+    k = min(k, max(count - 1, 0))
+    if not k:
+        return np.zeros((count, 0), dtype=np.int64), np.zeros((count, 0), dtype=np.float32)
+    vectors = encode_puzzles(puzzles, theme_vocabulary(puzzles))
+    if count <= exact_limit:
+        rows, distances = brute_force(vectors, k)
+    else:
+        index = IVFPQIndex(default_nlist(count)).train(vectors, seed).add(vectors)
+        rows, distances = index.search(vectors, k, nprobe, vectors=vectors, exclude_self=True)
+    similarity = np.where(rows >= 0, 1 - distances / 2, 0).astype(np.float32)
+    neighbours = np.where(rows >= 0, rows, np.arange(count)[:, None])
+    return neighbours, similarity
+
+
+def write_neighbours(path, neighbours, similarity):
+    with open(path, 'wb') as f:
+        f.write(HEADER.pack(MAGIC, VERSION, len(neighbours), neighbours.shape[1]))
+        f.write(neighbours.astype('<u4').tobytes())
+        f.write(np.clip(np.rint(similarity * 255), 0, 255).astype(np.uint8).tobytes())
+
+
+class SimilarPuzzles:
+    """A similar.bin file: neighbour rows for a pack row."""
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            data = f.read()
+        magic, version, self.count, self.k = HEADER.unpack_from(data)
+        count = self.count
+        if magic != MAGIC or version != VERSION:
+            raise ValueError(f"{path} is not a version {VERSION} similar-puzzles file")
+        offset = HEADER.size
+        self.neighbours = np.frombuffer(data, dtype='<u4', count=count * self.k, offset=offset).reshape(count, self.k)
+        offset += 4 * count * self.k
+        self.similarity = np.frombuffer(data, dtype=np.uint8, count=count * self.k, offset=offset).reshape(count, self.k)
+
+    def similar(self, row):
+        """[(neighbour row, cosine similarity)] for the puzzle at `row`, or [] outside the pack."""
+        if not 0 <= row < self.count:
+            return []
+        return [(int(n), round(s / 255, 3)) for n, s in zip(self.neighbours[row], self.similarity[row])
+                if n != row]
+
+
+def run_benchmark(puzzles, k=DEFAULT_K, probes=(1, 4, 8, 16), seed=0):
+    """Build time and recall@k of IVF-PQ (with and without rerank) against brute force."""
+    start = time.perf_counter()
+    vectors = encode_puzzles(puzzles, theme_vocabulary(puzzles))
+    encode_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    exact, _ = brute_force(vectors, k)
+    brute_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    index = IVFPQIndex(default_nlist(len(vectors))).train(vectors, seed).add(vectors)
+    train_seconds = time.perf_counter() - start
+
+    def recall(rows):
+        return float(np.mean([len(set(a) & set(b)) / k for a, b in zip(rows.tolist(), exact.tolist())]))
+
+    results = []
+    for nprobe in probes:
+        for rerank in (False, True):
+            start = time.perf_counter()
+            rows, _ = index.search(vectors, k, nprobe, vectors=vectors if rerank else None, exclude_self=True)
+            results.append({'nprobe': nprobe, 'rerank': rerank, 'recall': round(recall(rows), 4),
+                            'seconds': round(time.perf_counter() - start, 2)})
+    return {'puzzles': len(puzzles), 'dim': vectors.shape[1], 'nlist': index.nlist,
+            'code_bytes': index.m, 'encode_seconds': round(encode_seconds, 2),
+            'brute_force_seconds': round(brute_seconds, 2), 'train_seconds': round(train_seconds, 2),
+            'search': results}
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Precompute similar-puzzle neighbour lists.')
+    parser.add_argument('--input', default=DEFAULT_PUZZLES_FILE, help='puzzle JSON or Lichess CSV(.zst)')
+    parser.add_argument('--output', default='build/similar.bin')
+    parser.add_argument('--k', type=int, default=DEFAULT_K, help='neighbours per puzzle')
+    parser.add_argument('--nprobe', type=int, default=NPROBE, help='inverted lists scanned per query')
+    parser.add_argument('--benchmark', action='store_true', help='compare recall and time with brute force')
+    parser.add_argument('--similar', help='read an existing similar.bin instead of building one')
+    parser.add_argument('--row', type=int, help='with --similar: show the neighbours of the puzzle at this row')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Similar Puzzles")
+    print("=" * 70)
+
+    if args.similar:
+        similar = SimilarPuzzles(args.similar)
+        print(f"{similar.count} puzzles, {similar.k} neighbours each")
+        if args.row is not None:
+            for row, score in similar.similar(args.row):
+                print(f"  row {row:>8}  {score:.3f}")
+        return 0
+
+    puzzles = list(iter_puzzles(args.input))
+    if args.benchmark:
+        report = run_benchmark(puzzles, args.k)
+        print(f"{report['puzzles']} puzzles, dim {report['dim']}, nlist {report['nlist']}, "
+              f"{report['code_bytes']} code bytes per puzzle")
+        print(f"  encode {report['encode_seconds']}s, brute force {report['brute_force_seconds']}s, "
+              f"IVF-PQ training {report['train_seconds']}s")
+        print(f"\n  {'nprobe':>6} {'rerank':>7} {'recall@' + str(args.k):>10} {'seconds':>8}")
+        for row in report['search']:
+            print(f"  {row['nprobe']:>6} {str(row['rerank']):>7} {row['recall']:>10.3f} {row['seconds']:>8}")
+        return 0
+
+    start = time.perf_counter()
+    neighbours, similarity = build_neighbours(puzzles, args.k, args.nprobe)
+    write_neighbours(args.output, neighbours, similarity)
+    print(f"✓ {len(neighbours)} puzzles x {neighbours.shape[1]} neighbours written to {args.output} "
+          f"in {time.perf_counter() - start:.1f}s")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,79 @@
+import os
+import random
+import sys
+
+import chess
+import chess.pgn
+import pytest
+
+# The pipeline scripts import each other as top-level modules, the same way
+# they do when run as `python scripts/<name>.py`.
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+THEMES = ['fork short', 'pin middlegame', 'mateIn2 short', 'skewer endgame', 'crushing long']
+
+
+def _random_walk(rng, board, plies, width=None):
+    """Push up to `plies` random legal moves onto `board` and return them.
+
+    With `width`, each move is one of the first `width` in UCI order, so
+    that walks from the same position often meet again.
+    """
+    line = []
+    for _ in range(plies):
+        moves = sorted(board.legal_moves, key=lambda m: m.uci())[:width] if width else list(board.legal_moves)
+        if not moves:
+            break
+        move = rng.choice(moves)
+        line.append(move)
+        board.push(move)
+    return line
+
+
+def _random_line(rng):
+    """A position a few random moves in and a legal random line from it."""
+    board = chess.Board()
+    _random_walk(rng, board, rng.randrange(4, 40))
+    line = _random_walk(rng, board, rng.randrange(2, 8))
+    for _ in line:
+        board.pop()
+    return board.fen(), ' '.join(move.uci() for move in line)
+
+
+@pytest.fixture
+def random_pack():
+    """make(count, seed, first_id=1000, id_step=1, positions=False) -> seeded random puzzles.
+
+    Every record has id, rating, popularity and one of THEMES; positions=True
+    adds a random legal fen/moves line.
+    """
+    def make(count, seed, first_id=1000, id_step=1, positions=False):
+        rng = random.Random(seed)
+        puzzles = []
+        for i in range(count):
+            puzzle = {'id': first_id + id_step * i, 'rating': rng.randrange(600, 2600),
+                      'themes': rng.choice(THEMES), 'popularity': rng.randrange(70, 100)}
+            if positions:
+                puzzle['fen'], puzzle['moves'] = _random_line(rng)
+            puzzles.append(puzzle)
+        return puzzles
+    return make
+
+
+@pytest.fixture
+def random_games():
+    """make(count, seed, width=3) -> seeded random PGN games from the start position.
+
+    Moves are drawn from a narrow choice (see _random_walk) so that games
+    share positions.
+    """
+    def make(count, seed, width=3):
+        rng = random.Random(seed)
+        games = []
+        for _ in range(count):
+            game = chess.pgn.Game()
+            game.headers['Result'] = rng.choice(['1-0', '0-1', '1/2-1/2'])
+            game.add_line(_random_walk(rng, chess.Board(), rng.randrange(2, 12), width))
+            games.append(str(game) + '\n\n')
+        return games
+    return make
@@ -0,0 +1,50 @@
+#!/usr/bin/env python3
+"""
+Scripted stand-in for a UCI engine, used by the engine_eval tests.
+
+Usage: stub_uci_engine.py SCRIPT.json
+
+SCRIPT maps a FEN to what the engine should do for `go` on that position:
+    {"lines": [["cp", 120, "e2e4"], ["cp", 20, "d2d4"]], "best": "e2e4"}
+    {"hang": true}                      never answer, not even `stop`
+    {"crash_once": "/tmp/marker"}       exit the first time (marker file absent)
+Unknown positions get `bestmove 0000` with a 0cp score.
+"""
+
+import json
+import os
+import sys
+
+
+def main():
+    with open(sys.argv[1], encoding='utf-8') as f:
+        script = json.load(f)
+    fen = None
+
+    for line in sys.stdin:
+        command = line.strip()
+        if command == 'uci':
+            print('id name StubEngine')
+            print('uciok', flush=True)
+        elif command == 'isready':
+            print('readyok', flush=True)
+        elif command.startswith('position fen '):
+            fen = command[len('position fen '):].split(' moves ')[0]
+        elif command.startswith('go'):
+            entry = script.get(fen, {})
+            if entry.get('hang'):
+                continue
+            marker = entry.get('crash_once')
+            if marker and not os.path.exists(marker):
+                open(marker, 'w').close()
+                sys.exit(1)
+            lines = entry.get('lines', [['cp', 0, '0000']])
+            for index, (kind, value, move) in enumerate(lines, start=1):
+                print(f'info depth 10 multipv {index} score {kind} {value} nodes 1000 pv {move}')
+            print(f"bestmove {entry.get('best', lines[0][2])}", flush=True)
+        elif command == 'quit':
+            return
+
+
+if __name__ == '__main__':
+    main()
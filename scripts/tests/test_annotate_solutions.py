@@ -0,0 +1,35 @@
+import chess
+
+from annotate_solutions import CHECK, MATE, QUIET, annotate_line, annotate_puzzles, unpack_flags
+
+
+def test_mate_line_annotations():
+    fen = '2r3k1/p4p2/1p4pp/3p4/3Bq3/P6P/5QP1/5RK1 b - - 1 36'
+    data = annotate_line(fen, 'c8c2 f2f7')
+
+    assert data['san'] == 'Rc2 Qxf7#'
+    assert data['start'] == '6k1/p4p2/1p4pp/3p4/3Bq3/P6P/2r2QP1/5RK1 w - - 2 37'
+    assert unpack_flags(data['flags']) == [(QUIET, 0), (MATE, chess.PAWN)]
+
+
+def test_en_passant_and_castling_captures():
+    # Black plays ...d5, white takes en passant, black castles.
+    fen = 'r3k2r/pppp1ppp/8/4P3/8/8/PPP2PPP/R3K2R b KQkq - 0 1'
+    data = annotate_line(fen, 'd7d5 e5d6 e8g8')
+
+    assert data['san'] == 'd5 exd6 O-O'
+    assert unpack_flags(data['flags']) == [(QUIET, 0), (QUIET, chess.PAWN), (QUIET, 0)]
+    # A queen capture with check packs into the highest digits.
+    queen = annotate_line('4k3/8/8/8/8/8/4q3/4RK2 w - - 0 1', 'e1e2')
+    assert unpack_flags(queen['flags']) == [(CHECK, chess.QUEEN)]
+
+
+def test_illegal_lines_are_dropped():
+    good = {'id': 1, 'fen': '6k1/5ppp/8/8/8/8/5PPP/3R2K1 b - - 0 1', 'moves': 'g8h8 d1d8'}
+    bad = {'id': 2, 'fen': '6k1/5ppp/8/8/8/8/5PPP/3R2K1 b - - 0 1', 'moves': 'g8h8 d1d9'}
+    empty = dict(good, id=3, moves='')
+    annotated, failed = annotate_puzzles([good, bad, empty], workers=1)
+
+    assert [p['id'] for p in annotated] == [1]
+    assert [check for check, _ in unpack_flags(annotated[0]['flags'])] == [QUIET, MATE]
+    assert [puzzle_id for puzzle_id, _ in failed] == [2, 3]
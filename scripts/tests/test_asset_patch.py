@@ -0,0 +1,60 @@
+import random
+
+import pytest
+
+from asset_patch import PatchError, apply_patch, diff_assets, read_patch, write_patch
+
+
+def _version(count=500, seed=1):
+    rng = random.Random(seed)
+    puzzles = [
+        {'id': 1000 + i, 'fen': f'6k1/5ppp/8/8/8/8/5PPP/3R2K{i % 8 + 1} b - - 0 1', 'moves': 'g8h8 d1d8',
+         'rating': rng.randint(600, 2800), 'themes': 'endgame mateIn1', 'popularity': rng.randint(50, 100)}
+        for i in range(count)
+    ]
+    return sorted(puzzles, key=lambda p: p['rating'])
+
+
+def _refresh(old, seed=2):
+    rng = random.Random(seed)
+    new = [dict(p) for p in old if rng.random() > 0.05]
+    for puzzle in new:
+        if rng.random() < 0.3:
+            puzzle['rating'] += rng.randint(-50, 50)
+        if rng.random() < 0.05:
+            puzzle['themes'] += ' short'
+        if rng.random() < 0.02:
+            del puzzle['popularity']
+    new += [dict(p, id=90000 + i) for i, p in enumerate(rng.sample(old, 20))]
+    return sorted(new, key=lambda p: p['rating'])
+
+
+def test_round_trip_gives_exact_next_version(tmp_path):
+    old = _version()
+    new = _refresh(old)
+    path = str(tmp_path / 'v2.patch.zst')
+    write_patch(diff_assets(old, new), path)
+
+    assert apply_patch(old, read_patch(path)) == new
+
+
+def test_unchanged_version_patch_is_tiny(tmp_path):
+    old = _version()
+    patch = diff_assets(old, [dict(p) for p in old])
+
+    assert patch['order'] == [[0, len(old)]]
+    assert not patch['inserts'] and not patch['deletes'] and not patch['updates']
+    assert apply_patch(old, patch) == old
+
+
+def test_wrong_base_is_rejected():
+    old = _version()
+    patch = diff_assets(old, _refresh(old))
+    other = _version(seed=9)
+
+    with pytest.raises(PatchError):
+        apply_patch(other, patch)
+
+    patch['updates']['rating']['values'][0] += 1
+    with pytest.raises(PatchError):
+        apply_patch(old, patch)
@@ -0,0 +1,78 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+import board_thumbnails
+from board_thumbnails import (BOARD_COLOURS, ThumbnailIndex, build_thumbnails, load_sprites, make_tiles,
+                              render_boards, start_grids)
+from position_features import KING, ROOK
+
+SQUARE = 4
+
+
+def _sprites():
+    """A 2x2 opaque block per piece, red channel = 20 x code, on a transparent square."""
+    sprites = np.zeros((12, SQUARE, SQUARE, 4), dtype=np.uint8)
+    for code in range(1, 13):
+        sprites[code - 1, 1:3, 1:3] = (20 * code, 0, 0, 255)
+    return sprites
+
+
+def _cache(tmp_path):
+    cache = tmp_path / 'cache'
+    (cache / 'sprites').mkdir(parents=True)
+    np.save(cache / 'sprites' / f'traditional-{SQUARE}.npy', _sprites())
+    return str(cache)
+
+
+def test_start_position_is_drawn_from_the_solvers_side():
+    # White's setup move leaves Black to solve: rank 1 on top, h-file on the left.
+    black = {'id': 1, 'fen': '4k3/8/8/8/8/8/8/R3K3 w - - 0 1', 'moves': 'a1a2 e8d8'}
+    white = {'id': 2, 'fen': '4k3/8/8/8/8/8/8/R3K3 b - - 0 1', 'moves': 'e8d8 a1a2'}
+    grids = start_grids([black, white])
+
+    assert grids[0][0][3] == KING and grids[0][1][7] == ROOK
+    assert grids[1][7][4] == KING and grids[1][7][0] == ROOK and grids[1][0][3] == KING + 6
+
+    tiles = make_tiles(_sprites())
+    image = render_boards(grids, tiles)[0]
+    light, dark = BOARD_COLOURS['classicWood']
+    assert image.shape == (8 * SQUARE, 8 * SQUARE, 3)
+    rook = image[1 * SQUARE:2 * SQUARE, 7 * SQUARE:8 * SQUARE]
+    assert tuple(rook[1, 1]) == (20 * ROOK, 0, 0) and tuple(rook[0, 0]) == light
+    assert tuple(image[0, SQUARE]) == dark
+
+
+def test_rebuild_reuses_pages_and_the_index_finds_every_thumbnail(tmp_path, monkeypatch, random_pack):
+    monkeypatch.setattr(board_thumbnails, 'PAGE_TARGET', 8)
+    cache, output = _cache(tmp_path), tmp_path / 'thumbs'
+    puzzles = random_pack(40, seed=6, first_id=3000, positions=True)
+    puzzles.append(dict(puzzles[0], id=9999))  # same start position, different puzzle
+
+    first = build_thumbnails(puzzles, str(output), square=SQUARE, columns=3, cache_dir=cache, workers=1)
+    assert first['distinct'] == 40 and first['pages'] == 8
+    assert first['rendered_pages'] == len(list(output.glob('page-*.png'))) and first['cached_pages'] == 0
+
+    index = ThumbnailIndex(output / 'thumbnails.idx')
+    tiles = make_tiles(_sprites())
+    assert index.count == len(puzzles)
+    for row, thumbnail in enumerate(render_boards(start_grids(puzzles), tiles)):
+        page, x, y, size = index.locate(row)
+        atlas = np.asarray(Image.open(output / page))
+        assert (atlas[y:y + size, x:x + size] == thumbnail).all()
+    assert index.locate(0) == index.locate(40)
+    assert index.locate(41) is None and index.locate(-1) is None
+
+    before = {path.name: path.read_bytes() for path in output.glob('page-*.png')}
+    extra = random_pack(1, seed=7, first_id=4000, positions=True)
+    again = build_thumbnails(puzzles + extra, str(output), square=SQUARE, columns=3, cache_dir=cache, workers=1)
+    assert again['rendered_pages'] == 1 and again['cached_pages'] == first['rendered_pages'] - 1
+    after = {path.name: path.read_bytes() for path in output.glob('page-*.png')}
+    assert sum(before[name] != after.get(name) for name in before) == 1
+
+
+@pytest.mark.skipif(board_thumbnails.cairosvg is None, reason='cairosvg / libcairo not available')
+def test_svg_pieces_are_rasterised_once(tmp_path):
+    sprites = load_sprites('modern', 16, str(tmp_path))
+    assert sprites.shape == (12, 16, 16, 4) and (sprites[..., 3] > 0).any(axis=(1, 2)).all()
+    assert (tmp_path / 'sprites' / 'modern-16.npy').exists()
@@ -0,0 +1,42 @@
+import json
+import os
+
+from compress_assets import MANIFEST_FILE, export_shards, make_shards, read_shards
+from puzzle_io import load_puzzles
+
+ASSET = os.path.join(os.path.dirname(__file__), '..', '..', 'assets', 'puzzles', 'puzzles.json')
+
+
+def test_shards_sorted_by_rating():
+    puzzles = [{'id': i, 'rating': r} for i, r in enumerate([1500, 900, 2100, 900, 1200])]
+    shards = make_shards(puzzles, 2)
+
+    assert [len(s) for s in shards] == [2, 2, 1]
+    assert [p['id'] for shard in shards for p in shard] == [1, 3, 4, 0, 2]
+
+
+def test_export_round_trip(tmp_path):
+    puzzles = load_puzzles(ASSET)[:2000]
+    out = str(tmp_path / 'shards')
+    manifest = export_shards(puzzles, out, shard_size=300, level=3, dict_size=8192)
+
+    assert sum(s['count'] for s in manifest['shards']) == 2000
+    with open(os.path.join(out, MANIFEST_FILE)) as f:
+        assert json.load(f) == manifest
+
+    restored = sorted(read_shards(out), key=lambda p: p['id'])
+    assert restored == sorted(puzzles, key=lambda p: p['id'])
+
+    # Rating filter only decodes overlapping shards.
+    some = list(read_shards(out, min_rating=1000, max_rating=1200))
+    assert any(1000 <= p['rating'] <= 1200 for p in some)
+    assert len(some) < 2000
+
+
+def test_tiny_pack_falls_back_to_a_raw_dictionary(tmp_path):
+    puzzles = load_puzzles(ASSET)[:5]
+    out = str(tmp_path / 'shards')
+    manifest = export_shards(puzzles, out, shard_size=2, level=3)
+
+    assert [s['count'] for s in manifest['shards']] == [2, 2, 1]
+    assert sorted(read_shards(out), key=lambda p: p['id']) == sorted(puzzles, key=lambda p: p['id'])
@@ -0,0 +1,62 @@
+import random
+
+from dataset_stats import DatasetStats, HyperLogLog, KllSketch
+
+
+def test_kll_quantiles_within_rank_error():
+    rng = random.Random(3)
+    values = [rng.randint(400, 3200) for _ in range(50000)]
+    sketch = KllSketch()
+    for value in values:
+        sketch.update(value)
+
+    ordered = sorted(values)
+    fractions = [0.01, 0.1, 0.5, 0.9, 0.99]
+    for fraction, estimate in zip(fractions, sketch.quantiles(fractions)):
+        rank = sum(v <= estimate for v in ordered) / len(ordered)
+        assert abs(rank - fraction) < 0.02
+    assert sketch.quantiles([0.0, 1.0]) == [ordered[0], ordered[-1]]
+    assert sum(len(level) for level in sketch.levels) < 1000
+
+
+def test_kll_merge_matches_single_stream():
+    left, right = KllSketch(), KllSketch(seed=2)
+    for value in range(10000):
+        (left if value % 2 else right).update(value)
+    left.merge(right)
+
+    assert left.count == 10000 and left.min == 0 and left.max == 9999
+    assert abs(left.quantiles([0.5])[0] - 5000) < 200
+
+
+def test_hyperloglog_estimate():
+    hll, other = HyperLogLog(), HyperLogLog()
+    for i in range(30000):
+        hll.add(f'fen-{i}')
+        other.add(f'fen-{i + 20000}')
+    assert abs(hll.estimate() - 30000) < 900
+    hll.merge(other)
+    assert abs(hll.estimate() - 50000) < 1500
+    small = HyperLogLog()
+    for i in range(50):
+        small.add(str(i % 10))
+    assert small.estimate() == 10
+
+
+def test_dataset_stats_track_and_report():
+    puzzles = [
+        {'id': i, 'fen': f'fen{i % 40}', 'rating': 1000 + i, 'popularity': 90,
+         'themes': 'fork short' if i % 2 else 'pin', 'opening_tags': 'Italian_Game' if i % 5 == 0 else ''}
+        for i in range(100)
+    ]
+    stats = DatasetStats()
+    assert list(stats.track(iter(puzzles))) == puzzles
+
+    report = stats.report()
+    assert report['count'] == 100
+    assert report['distinct_fens'] == 40
+    assert report['numeric']['rating']['mean'] == 1049.5
+    assert report['numeric']['rating']['quantiles']['1.0'] == 1099
+    assert 'rating_deviation' not in report['numeric']
+    assert report['themes']['top'] == {'fork': 50, 'short': 50, 'pin': 50}
+    assert report['openings'] == {'distinct': 1, 'top': {'Italian_Game': 20}}
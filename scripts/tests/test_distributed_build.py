@@ -0,0 +1,111 @@
+import json
+import os
+import random
+import subprocess
+import sys
+import threading
+from multiprocessing.connection import Client
+
+import chess
+import chess.pgn
+
+from distributed_build import Coordinator, make_selector, plan_units, process_unit, read_unit, run_worker
+from pgn_index import build_index
+
+KEY = b'test-key'
+OPTIONS = {'total': 20, 'mate_depth': 1, 'max_nodes': 500}
+
+
+def _games(count, seed):
+    """Random games that grab material more often than not, so they have swings and mates to mine."""
+    rng = random.Random(seed)
+    games = []
+    for number in range(count):
+        game = chess.pgn.Game()
+        game.headers['Site'] = f'https://lichess.org/{seed:04d}{number:04d}'
+        game.headers['WhiteElo'] = game.headers['BlackElo'] = str(rng.randrange(1000, 2400))
+        board, node = chess.Board(), game
+        for _ in range(rng.randrange(30, 80)):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            captures = [m for m in moves if board.is_capture(m)]
+            move = rng.choice(captures if captures and rng.random() < 0.6 else moves)
+            node = node.add_variation(move)
+            board.push(move)
+        games.append(str(game) + '\n\n')
+    return ''.join(games)
+
+
+def _inputs(tmp_path):
+    dump = tmp_path / 'dump.pgn'
+    dump.write_text(_games(16, seed=1))
+    build_index(str(dump), frame_size=1500)
+    shards = []
+    for seed in (2, 3):
+        shards.append(tmp_path / f'shard{seed}.pgn')
+        shards[-1].write_text(_games(10, seed))
+    return str(dump), [str(path) for path in shards]
+
+
+def test_units_cover_every_game_once(tmp_path):
+    dump, shards = _inputs(tmp_path)
+    units = plan_units(dump, shards, frames_per_unit=2)
+
+    assert [u['unit'] for u in units] == list(range(len(units))) and len(units) >= 5
+    games = [process_unit(unit, read_unit(unit), OPTIONS)['games'] for unit in units]
+    assert sum(games) == 36
+    assert games[-2:] == [10, 10]
+
+
+def test_localhost_workers_retry_and_match_a_sequential_merge(tmp_path):
+    dump, shards = _inputs(tmp_path)
+    corrupt = tmp_path / 'corrupt.pgn.zst'
+    corrupt.write_bytes(b'\x28\xb5\x2f\xfd' + os.urandom(64))
+    units = plan_units(dump, shards + [str(corrupt)], frames_per_unit=2)
+    coordinator = Coordinator(units, OPTIONS, ('127.0.0.1', 0), KEY, attempts=2, log=lambda _: None)
+    summary = {}
+    runner = threading.Thread(target=lambda: summary.update(coordinator.run()))
+    runner.start()
+
+    # A worker that takes the first unit and dies with it.
+    flaky = Client(coordinator.address, authkey=KEY)
+    flaky.send(('lease', 'flaky'))
+    assert flaky.recv()[1]['unit'] == 0
+    flaky.close()
+    workers = [threading.Thread(target=run_worker, args=(coordinator.address, KEY, f'w{i}'))
+               for i in range(3)]
+    for worker in workers:
+        worker.start()
+    runner.join(120)
+    for worker in workers:
+        worker.join(10)
+    coordinator.close(linger=0)
+    selected, report = coordinator.finish()
+
+    assert summary['done'] == len(units) - 1
+    assert list(summary['failed']) == ['corrupt.pgn.zst']
+    assert summary['retries'] == 2  # the flaky lease, then the corrupt shard's first try
+    assert summary['games'] == 36 and coordinator.stats.count == summary['puzzles']
+
+    # The same units merged one after another, last first, pick the same pack.
+    expected = make_selector(OPTIONS)
+    for unit in reversed(units[:-1]):
+        expected.merge(process_unit(unit, read_unit(unit), OPTIONS)['selector'])
+    assert [p['id'] for p in selected] == [p['id'] for p in expected.finish()]
+    assert report['selected'] == len(selected) == 20
+
+
+def test_local_command_runs_worker_processes(tmp_path):
+    _, shards = _inputs(tmp_path)
+    output, report = tmp_path / 'pack.json', tmp_path / 'report.json'
+    script = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'distributed_build.py')
+
+    result = subprocess.run([sys.executable, script, 'local', '--pgn', *shards, '--workers', '2', '--total', '15',
+                             '--mate-depth', '1', '--output', str(output), '--report', str(report)],
+                            capture_output=True, text=True, timeout=300)
+
+    assert result.returncode == 0, result.stdout + result.stderr
+    build = json.loads(report.read_text())['build']
+    assert build['done'] == 2 and build['games'] == 20 and build['workers'] == 2
+    assert len(json.loads(output.read_text())) == 15
@@ -0,0 +1,112 @@
+import json
+import os
+import sys
+
+import chess
+
+import engine_eval
+from engine_eval import EvalCache, evaluate_puzzles, parse_info, score_to_cp, MATE_CP
+
+STUB = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'stub_uci_engine.py')
+
+FEN_A = 'r1bqkbnr/pppp1ppp/2n5/4p3/4P3/5N2/PPPP1PPP/RNBQKB1R w KQkq - 2 3'
+FEN_B = '6k1/5ppp/8/8/8/8/5PPP/3R2K1 b - - 0 1'
+
+
+def _start_fen(fen, setup):
+    board = chess.Board(fen)
+    board.push_uci(setup)
+    return board.fen()
+
+
+def _puzzles():
+    return [
+        {'id': 1, 'fen': FEN_A, 'moves': 'f1c4 g8f6 f3g5', 'rating': 1200, 'themes': 'opening'},
+        {'id': 2, 'fen': FEN_B, 'moves': 'g8h8 d1d8', 'rating': 600, 'themes': 'mateIn1'},
+    ]
+
+
+def _engine(tmp_path, script):
+    path = tmp_path / 'script.json'
+    path.write_text(json.dumps(script))
+    return [sys.executable, STUB, str(path)]
+
+
+def test_parse_info_reads_multipv_score_and_pv():
+    assert parse_info('info depth 20 multipv 2 score cp -35 nodes 10 pv e7e5 g1f3') == (2, 'cp', -35, 'e7e5')
+    assert parse_info('info string hello') is None
+    assert score_to_cp('mate', 3) == MATE_CP - 3
+    assert score_to_cp('mate', -2) == -MATE_CP + 2
+
+
+def test_evaluations_attached_and_cached(tmp_path):
+    script = {
+        _start_fen(FEN_A, 'f1c4'): {'lines': [['cp', 80, 'f6e4'], ['cp', 10, 'f8c5']]},
+        _start_fen(FEN_B, 'g8h8'): {'lines': [['mate', 1, 'd1d8'], ['cp', 0, 'g1f1']]},
+    }
+    engine = _engine(tmp_path, script)
+    cache = EvalCache(str(tmp_path / 'cache.sqlite'))
+
+    puzzles, stats = evaluate_puzzles(_puzzles(), engine, workers=2, budget='nodes 1000', cache=cache)
+    assert stats == {'cached': 0, 'searched': 2, 'failed': 0}
+    first, second = puzzles
+    assert first['engine']['agrees'] is False
+    assert first['engine']['margin_cp'] == 70
+    assert second['engine']['agrees'] is True
+    assert second['engine']['mate'] == 1
+
+    # A re-run with the same budget is served from the cache...
+    puzzles, stats = evaluate_puzzles(_puzzles(), engine, workers=2, budget='nodes 1000', cache=cache)
+    assert stats == {'cached': 2, 'searched': 0, 'failed': 0}
+    assert puzzles[1]['engine']['mate'] == 1
+
+    # ...but a different budget is a different key.
+    _, stats = evaluate_puzzles(_puzzles(), engine, workers=1, budget='depth 5', cache=cache)
+    assert stats['searched'] == 2
+    cache.close()
+
+
+def test_hung_engine_is_restarted(tmp_path):
+    script = {
+        _start_fen(FEN_A, 'f1c4'): {'hang': True},
+        _start_fen(FEN_B, 'g8h8'): {'lines': [['mate', 1, 'd1d8']]},
+    }
+    puzzles, stats = evaluate_puzzles(_puzzles(), _engine(tmp_path, script), workers=1,
+                                      budget='nodes 1000', timeout=0.5)
+    assert stats['failed'] == 1
+    assert 'timeout' in puzzles[0]['engine']['error']
+    assert puzzles[1]['engine']['best_move'] == 'd1d8'
+
+
+def test_crashed_engine_retries_position(tmp_path):
+    script = {
+        _start_fen(FEN_B, 'g8h8'): {'crash_once': str(tmp_path / 'crashed'), 'lines': [['mate', 1, 'd1d8']]},
+    }
+    puzzles, stats = evaluate_puzzles(_puzzles()[1:], _engine(tmp_path, script), workers=1, budget='nodes 1000')
+    assert stats == {'cached': 0, 'searched': 1, 'failed': 0}
+    assert puzzles[0]['engine']['agrees'] is True
+
+
+def test_missing_engine_binary_fails_cleanly(tmp_path):
+    puzzles, stats = evaluate_puzzles(_puzzles(), [str(tmp_path / 'no-such-engine')], workers=2)
+    assert stats['failed'] == 2
+    assert all('failed to start' in p['engine']['error'] for p in puzzles)
+
+
+def test_bad_setup_move_and_failed_restart_only_fail_their_puzzles(tmp_path, monkeypatch):
+    def broken_restart(self):
+        raise OSError('engine binary vanished')
+
+    monkeypatch.setattr(engine_eval.UciEngine, 'restart', broken_restart)
+    script = {
+        _start_fen(FEN_A, 'f1c4'): {'hang': True},
+        _start_fen(FEN_B, 'g8h8'): {'lines': [['mate', 1, 'd1d8']]},
+    }
+    puzzles = _puzzles() + [{'id': 3, 'fen': FEN_B, 'moves': 'e2e4 d1d8', 'rating': 900, 'themes': ''}]
+    # One worker: it survives the failed restart and still answers the next position.
+    puzzles, stats = evaluate_puzzles(puzzles, _engine(tmp_path, script), workers=1,
+                                      budget='nodes 1000', timeout=0.5)
+    assert 'OSError' in puzzles[0]['engine']['error']
+    assert puzzles[1]['engine']['best_move'] == 'd1d8'
+    assert 'bad start position' in puzzles[2]['engine']['error']
+    assert stats == {'cached': 0, 'searched': 1, 'failed': 2}
@@ -0,0 +1,53 @@
+import random
+
+import chess
+import pytest
+
+from generate_endgame_puzzles import generate_puzzles, load_or_build, probe_position
+from verify_mate_puzzles import VERIFIED, MateSearch, verify_puzzle
+
+
+@pytest.fixture(scope='module')
+def tables(tmp_path_factory):
+    return load_or_build(['KPK'], str(tmp_path_factory.mktemp('endgame')), log=lambda _: None)
+
+
+def test_longest_mates_match_known_values(tables):
+    assert (int(tables['KQK'].w.max()) + 1) // 2 == 10
+    assert (int(tables['KRK'].w.max()) + 1) // 2 == 16
+    assert (int(tables['KPK'].w.max()) + 1) // 2 == 28
+
+
+@pytest.mark.parametrize('name', ['KQK', 'KRK', 'KPK'])
+def test_tables_agree_with_move_generator(tables, name):
+    rng = random.Random(0)
+    table = tables[name]
+    checked = 0
+    while checked < 300:
+        board = table.board(rng.randrange(64 ** 3), white_to_move=rng.random() < 0.5)
+        if len(board.piece_map()) != 3 or not board.is_valid() or board.is_checkmate():
+            continue
+        checked += 1
+        children = []
+        for move in board.legal_moves:
+            board.push(move)
+            children.append(probe_position(board, tables))
+            board.pop()
+        if board.turn == chess.WHITE:
+            wins = [value for value in children if value is not None]
+            expected = 1 + min(wins) if wins else None
+        else:
+            expected = None if not children or None in children else 1 + max(children)
+        assert table.probe(board) == expected, board.fen()
+
+
+def test_generated_puzzles_verify(tables):
+    search = MateSearch(max_nodes=200000)
+    for name in ('KQK', 'KRK', 'KPK'):
+        puzzles = generate_puzzles(name, tables, per_depth=2, max_moves=3)
+        assert puzzles
+        for puzzle in puzzles:
+            assert verify_puzzle(puzzle, search)['verdict'] == VERIFIED
+            assert puzzle['themes'].startswith('endgame mate')
+        ratings = [p['rating'] for p in puzzles]
+        assert ratings == sorted(ratings)
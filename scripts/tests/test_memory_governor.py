@@ -0,0 +1,58 @@
+import subprocess
+import sys
+import time
+
+import pytest
+
+from memory_governor import MemoryGovernor, parse_size, tree_rss
+
+
+def test_parse_size():
+    assert parse_size('512M') == 512 << 20
+    assert parse_size('1.5GB') == 3 << 29
+    assert parse_size(4096) == 4096
+    with pytest.raises(ValueError):
+        parse_size('lots')
+
+
+def test_adapts_under_pressure_and_logs():
+    lines = []
+    governor = MemoryGovernor(1, log=lines.append)
+    assert governor.batch_size('parse', 20000) == 10000
+    assert governor.batch_size('parse', 20000, minimum=8000) == 8000
+    assert governor.workers('validate', 3) == 2
+    assert governor.should_spill('buffers')
+    actions = [(a['action'], a['from'], a['to']) for a in governor.report()['adaptations']]
+    assert actions == [('batch_size', 20000, 10000), ('batch_size', 10000, 8000),
+                       ('workers', 3, 2), ('spill', None, None)]
+    assert len(lines) == 4
+
+    # Plenty of room: sizes grow back to, but never past, what was asked for.
+    governor.max_bytes = 1 << 50
+    assert governor.batch_size('parse', 20000) == 16000
+    assert governor.batch_size('parse', 20000) == 20000
+    assert governor.workers('validate', 3) == 3
+
+
+def test_without_cap_nothing_changes():
+    governor = MemoryGovernor()
+    assert governor.batch_size('parse', 20000) == 20000 and governor.workers('validate', 4) == 4
+    assert not governor.should_spill('buffers')
+    assert governor.report()['adaptations'] == []
+
+
+@pytest.mark.skipif(not sys.platform.startswith('linux'), reason='child RSS needs /proc')
+def test_tree_rss_counts_child_processes():
+    before = tree_rss()
+    child = subprocess.Popen([sys.executable, '-c', "b = bytearray(200 << 20); import sys; sys.stdin.read()"],
+                             stdin=subprocess.PIPE)
+    try:
+        grown = before
+        for _ in range(100):
+            grown = tree_rss()
+            if grown - before > 150 << 20:
+                break
+            time.sleep(0.05)
+        assert grown - before > 150 << 20
+    finally:
+        child.communicate(b'')
@@ -0,0 +1,59 @@
+import chess
+
+from mine_pgn_puzzles import MateSearch, find_mate_line, mine_game, mine_pgn, tokenize_game
+from verify_mate_puzzles import VERIFIED, verify_puzzle
+
+HEADERS = '[Event "Rated Blitz game"]\n[Site "https://lichess.org/abcdefgh"]\n[WhiteElo "1600"]\n[BlackElo "1400"]\n\n'
+SCHOLAR = HEADERS + '1. e4 e5 2. Bc4 {a comment (with parens)} Nc6 (2... Nf6 3. d3) 3. Qh5 $2 Nf6?? 4. Qxf7# 1-0\n\n'
+HANGING_QUEEN = HEADERS + '1. e4 e5 2. Nf3 Qh4 3. Nxh4 d6 4. d3 Nc6 5. Nc3 Be7 6. Nf3 Bg4 1-0\n\n'
+
+
+def test_tokenizer_skips_comments_variations_and_nags():
+    headers, sans = tokenize_game(SCHOLAR)
+    assert headers['Site'] == 'https://lichess.org/abcdefgh'
+    assert sans == ['e4', 'e5', 'Bc4', 'Nc6', 'Qh5', 'Nf6', 'Qxf7#']
+
+
+def test_mates_are_found_and_verify():
+    puzzles = mine_game(SCHOLAR, MateSearch(), min_ply=0)
+    mates = [p for p in puzzles if p['source'] == 'mate']
+    assert [p['moves'] for p in mates] == ['g8f6 h5f7']
+    puzzle = mates[0]
+    assert 'mateIn1' in puzzle['themes'] and 'opening' in puzzle['themes']
+    assert puzzle['rating'] == 1500
+    assert puzzle['game_url'] == 'https://lichess.org/abcdefgh/white#5'
+    assert verify_puzzle(puzzle, MateSearch())['verdict'] == VERIFIED
+
+
+class OverclaimingSearch:
+    """Claims e2e4 mates in exactly `depth` from the start position and nothing else."""
+
+    def __init__(self, depth):
+        self.depth = depth
+
+    def attack(self, board, depth):
+        return True
+
+    def mates_after(self, board, move, k):
+        return board.ply() == 0 and move.uci() == 'e2e4' and k == self.depth
+
+
+def test_mate_line_that_does_not_materialise_is_dropped():
+    for depth in (1, 2):
+        assert find_mate_line(chess.Board(), OverclaimingSearch(depth), depth) is None
+
+
+def test_material_swing():
+    puzzles = mine_game(HANGING_QUEEN, MateSearch(), min_ply=0)
+    assert [(p['source'], p['moves']) for p in puzzles] == [('swing', 'd8h4 f3h4')]
+    assert puzzles[0]['themes'].split()[0] == 'advantage'
+
+
+def test_pool_matches_inline(tmp_path):
+    path = tmp_path / 'games.pgn'
+    path.write_text((SCHOLAR + HANGING_QUEEN) * 5)
+    inline = list(mine_pgn(str(path), workers=1, min_ply=0))
+    pooled = list(mine_pgn(str(path), workers=2, min_ply=0))
+    assert sum(games for games, _ in pooled) == 10
+    assert sorted(p['id'] for _, found in pooled for p in found) == \
+        sorted(p['id'] for _, found in inline for p in found)
@@ -0,0 +1,65 @@
+import chess
+import numpy as np
+
+import motif_detector
+from motif_detector import assign_themes, attack_sets, check_themes, detect_motifs, run_detection
+from position_features import parse_boards
+
+BACK_RANK = {'id': 1, 'fen': '6k1/5ppp/8/8/8/8/5PPP/3R2K1 b - - 0 1', 'moves': 'g8h8 d1d8',
+             'themes': 'backRankMate mate mateIn1 oneMove'}
+FORK = {'id': 2, 'fen': 'r3k3/7p/8/1N6/8/8/8/4K3 b - - 0 1', 'moves': 'h7h6 b5c7 e8d7 c7a8',
+        'themes': 'fork short'}
+# The knight lands where the queen takes it: no fork, so the claim is flagged.
+EN_PRISE = {'id': 3, 'fen': 'r2qk3/7p/8/1N6/8/8/8/4K3 b - - 0 1', 'moves': 'h7h6 b5c7 d8c7',
+            'themes': 'fork'}
+EN_PASSANT = {'id': 4, 'fen': '4k3/8/8/8/1p6/8/P7/4K3 w - - 0 1', 'moves': 'a2a4 b4a3', 'themes': ''}
+UNDER_PROMOTION = {'id': 5, 'fen': '8/P6k/8/8/8/8/8/4K3 b - - 0 1', 'moves': 'h7g6 a7a8n', 'themes': ''}
+
+
+def test_attack_sets_match_python_chess():
+    fens = ['r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4',
+            '6k1/5ppp/8/8/8/8/5PPP/3R2K1 b - - 0 1', BACK_RANK['fen'], FORK['fen']]
+    boards, _, _ = parse_boards(fens)
+    attacks = attack_sets(boards)
+    for fen, row in zip(fens, attacks):
+        board = chess.Board(fen)
+        expected = [board.attacks_mask(square) if board.piece_at(square) else 0 for square in range(64)]
+        assert row.tolist() == expected
+    assert attacks.dtype == np.uint64
+
+
+def test_swar_popcount_matches_bit_counts(monkeypatch):
+    rng = np.random.default_rng(3)
+    values = np.concatenate([rng.integers(0, 1 << 63, 500, dtype=np.uint64) * np.uint64(2) + np.uint64(1),
+                             np.array([0, 1, (1 << 64) - 1], dtype=np.uint64)])
+    assert motif_detector._swar_popcount(values).tolist() == [bin(int(v)).count('1') for v in values]
+
+    fen = 'r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4'
+    boards, _, _ = parse_boards([fen])
+    expected = attack_sets(boards)
+    monkeypatch.setattr(motif_detector, '_popcount', motif_detector._swar_popcount)
+    assert (attack_sets(boards) == expected).all()
+
+
+def test_detects_motifs_from_the_line():
+    found = detect_motifs([BACK_RANK, FORK, EN_PRISE, EN_PASSANT, UNDER_PROMOTION])
+    assert found[0] == {'backRankMate', 'mate', 'mateIn1'}
+    assert found[1] == {'fork'}
+    assert found[2] == set()
+    assert found[3] == {'enPassant'}
+    assert found[4] == {'promotion', 'underPromotion'}
+
+
+def test_flags_unsupported_claims_and_fills_themes():
+    assert check_themes('fork', set()) == {'unsupported': ['fork'], 'missing': []}
+    # Themes the detector cannot see (crushing, endgame...) are never flagged.
+    assert check_themes('crushing endgame', {'fork'})['unsupported'] == []
+
+    mined = dict(FORK, themes='advantage')
+    assert assign_themes(mined, {'fork'})['themes'] == 'advantage fork short'
+
+    puzzles, report = run_detection(iter([dict(p) for p in (BACK_RANK, FORK, EN_PRISE)]), fill=True,
+                                    drop_unsupported=True, batch_size=2)
+    assert report['flagged'] == 1 and report['flagged_ids'] == {'3': ['fork']}
+    assert report['themes']['fork'] == {'claimed': 2, 'detected': 1, 'both': 1}
+    assert puzzles[2]['themes'] == 'oneMove'
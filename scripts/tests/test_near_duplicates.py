@@ -0,0 +1,48 @@
+import numpy as np
+
+from near_duplicates import deduplicate, minhash_batch, make_permutations, position_features
+
+BASE = {
+    'fen': 'r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/8/PPPP1PPP/RNB1K1NR w KQkq - 4 4',
+    'moves': 'h5f7',
+}
+# Same trap with an extra a-pawn move and the white king's knight developed.
+VARIANT_FENS = [
+    'r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/P7/1PPP1PPP/RNB1K1NR w KQkq - 0 4',
+    'r1bqkb1r/pppp1ppp/2n2n2/4p2Q/2B1P3/5N2/PPPP1PPP/RNB1K2R w KQkq - 4 4',
+]
+UNRELATED = {
+    'fen': '6k1/5ppp/8/8/8/8/5PPP/3R2K1 b - - 0 1',
+    'moves': 'g8h8 d1d8',
+}
+
+
+def _puzzle(pid, fen, moves, popularity):
+    return {'id': pid, 'fen': fen, 'moves': moves, 'rating': 1000, 'themes': '', 'popularity': popularity}
+
+
+def test_features_cover_pieces_side_and_moves():
+    tokens = position_features(UNRELATED['fen'], UNRELATED['moves'])
+    # 9 pieces + side to move + 2 moves
+    assert len(tokens) == len(set(tokens)) == 12
+
+
+def test_signature_agreement_tracks_jaccard():
+    seeds = make_permutations(num_perm=256)
+    a = list(range(100))
+    b = list(range(10, 110))  # Jaccard 90/110
+    sig = minhash_batch([a, b], seeds)
+    estimate = (sig[0] == sig[1]).mean()
+    assert abs(estimate - 90 / 110) < 0.1
+
+
+def test_near_duplicates_collapse_to_most_popular():
+    puzzles = [_puzzle(1, BASE['fen'], BASE['moves'], 70)]
+    puzzles += [_puzzle(10 + i, fen, BASE['moves'], 90 - i) for i, fen in enumerate(VARIANT_FENS)]
+    puzzles.append(_puzzle(99, UNRELATED['fen'], UNRELATED['moves'], 10))
+
+    ids, keep, roots = deduplicate(iter(puzzles), threshold=0.75)
+
+    kept = set(ids[keep].tolist())
+    assert kept == {10, 99}
+    assert len(np.unique(roots)) == 2
@@ -0,0 +1,84 @@
+import io
+
+import chess
+import chess.pgn
+import chess.polyglot
+import numpy as np
+
+from opening_book import RUN, OpeningBook, PrefixCache, aggregate, build_book, game_rows, merge_runs
+
+CASTLING = '1. e4 e5 2. Nf3 Nc6 3. Bc4 Bc5 4. O-O Nf6 5. d3 O-O'
+EN_PASSANT = '1. e4 Nf6 2. e5 d5 3. exd6 exd6'
+PROMOTION = '1. h4 g5 2. hxg5 h6 3. gxh6 Nf6 4. hxg7 Rg8 5. gxf8=N'
+
+
+def _game(movetext, result):
+    return f'[Event "Casual"]\n[Result "{result}"]\n\n{movetext} {result}\n\n'
+
+
+def test_keys_match_python_chess_with_and_without_the_prefix_cache():
+    cache = PrefixCache()
+    for text in [_game(CASTLING, '1-0'), _game(EN_PASSANT, '0-1'), _game(PROMOTION, '1/2-1/2')] * 2:
+        rows = game_rows(text, plies=40, cache=cache)
+        assert rows == game_rows(text, plies=40)
+        board = chess.Board()
+        for (key, _, _), move in zip(rows, chess.pgn.read_game(io.StringIO(text)).mainline_moves()):
+            assert key == chess.polyglot.zobrist_hash(board)
+            board.push(move)
+        assert len(rows) == len(board.move_stack)
+
+
+def test_book_reads_back_with_python_chess(tmp_path):
+    pgn = tmp_path / 'games.pgn'
+    pgn.write_text(_game(CASTLING, '1-0') * 3 + _game(EN_PASSANT, '0-1') * 2 + _game(PROMOTION, '1/2-1/2'))
+    book = str(tmp_path / 'book.bin')
+
+    summary = build_book([str(pgn)], book, plies=12, min_games=1, workers=1, log=lambda _: None)
+
+    assert summary['games'] == 6 and summary['games_used'] == 6
+    with chess.polyglot.open_reader(book) as reader:
+        start = {entry.move.uci(): entry.weight for entry in reader.find_all(chess.Board())}
+        assert start == {'e2e4': 6, 'h2h4': 1}
+        board = chess.Board()
+        for san in ['e4', 'e5', 'Nf3', 'Nc6', 'Bc4', 'Bc5']:
+            board.push_san(san)
+        assert [entry.move for entry in reader.find_all(board)] == [chess.Move.from_uci('e1g1')]
+    with OpeningBook(book) as ours:
+        assert ours.moves(board) == [(chess.Move.from_uci('e1g1'), 6)]
+        board = chess.Board()
+        board.push_san('e4')
+        # Black lost all three games with 1... e5, so only the Nf6 wins count.
+        assert ours.moves(board) == [(chess.Move.from_uci('g8f6'), 4)]
+
+
+def test_external_merge_matches_a_single_run(tmp_path, random_games):
+    pgn = tmp_path / 'games.pgn'
+    pgn.write_text(''.join(random_games(300, seed=5)))
+    single, spilled = str(tmp_path / 'single.bin'), str(tmp_path / 'spilled.bin')
+
+    one = build_book([str(pgn)], single, min_games=2, workers=1, log=lambda _: None)
+    many = build_book([str(pgn)], spilled, min_games=2, workers=1, run_entries=50, log=lambda _: None)
+
+    assert one['runs'] == 1 and many['runs'] == 2 and one['entries'] > 0
+    with open(single, 'rb') as a, open(spilled, 'rb') as b:
+        assert a.read() == b.read()
+
+
+def test_merge_never_splits_a_position(tmp_path, random_games):
+    rows = [np.array(game_rows(text), dtype=np.uint64) for text in random_games(200, seed=9)]
+    runs = []
+    for i in range(0, len(rows), 20):
+        table = np.concatenate(rows[i:i + 20])
+        run = np.zeros(len(table), dtype=RUN)
+        run['key'], run['move'], run['weight'], run['count'] = table[:, 0], table[:, 1], table[:, 2], 1
+        runs.append(str(tmp_path / f'run{i}.bin'))
+        aggregate(run).tofile(runs[-1])
+
+    chunks = list(merge_runs(runs, chunk=7))
+    merged = np.concatenate(chunks)
+
+    everything = np.concatenate([np.fromfile(path, dtype=RUN) for path in runs])
+    assert (merged == aggregate(everything)).all()
+    last_keys = [chunk['key'][-1] for chunk in chunks[:-1]]
+    first_keys = [chunk['key'][0] for chunk in chunks[1:]]
+    assert all(a < b for a, b in zip(last_keys, first_keys))
@@ -0,0 +1,37 @@
+from opening_index import OpeningTrie, build_trie
+
+NAJDORF = 'Sicilian_Defense Sicilian_Defense_Najdorf_Variation'
+PUZZLES = [
+    {'id': 1, 'rating': 1700, 'opening_tags': NAJDORF},
+    {'id': 2, 'rating': 1650, 'opening_tags': NAJDORF + ' Sicilian_Defense_Najdorf_Variation_English_Attack'},
+    {'id': 3, 'rating': 1900, 'opening_tags': NAJDORF},
+    {'id': 4, 'rating': 1600, 'opening_tags': 'Sicilian_Defense Sicilian_Defense_Dragon_Variation'},
+    {'id': 5, 'rating': 1750, 'opening_tags': 'French_Defense French_Defense_Winawer_Variation'},
+    {'id': 6, 'rating': 1700, 'opening_tags': ''},
+]
+
+
+def test_hierarchy_and_counts():
+    trie, tagged = build_trie(PUZZLES)
+    assert tagged == 5
+    assert trie.counts(depth=1) == {'Sicilian_Defense': 4, 'French_Defense': 1}
+    najdorf = trie.get('sicilian defense najdorf variation')
+    assert najdorf.parent.tag == 'Sicilian_Defense' and najdorf.name == 'Najdorf_Variation'
+    assert najdorf.ratings == [1650, 1700, 1900] and najdorf.ids == [2, 1, 3]
+
+
+def test_prefix_and_rating_range_queries():
+    trie, _ = build_trie(PUZZLES)
+    assert trie.query('Sicilian_Defense_Najdorf', 1600, 1800) == [1, 2]
+    # Bare variation names fall back to a lookup on the node's own name.
+    assert [node.tag for node in trie.lookup('Najdorf')] == ['Sicilian_Defense_Najdorf_Variation']
+    assert trie.query('Sicilian', max_rating=1650) == [2, 4]
+    assert trie.query('Caro_Kann') == []
+
+
+def test_json_round_trip_keeps_parents_and_postings():
+    trie, _ = build_trie(PUZZLES)
+    loaded = OpeningTrie.from_json(trie.to_json())
+    assert loaded.counts() == trie.counts()
+    assert loaded.get('Sicilian_Defense_Najdorf_Variation_English_Attack').parent.name == 'Najdorf_Variation'
+    assert loaded.query('najdorf', 1600, 1800) == [1, 2]
@@ -0,0 +1,60 @@
+import json
+import sqlite3
+
+from personal_packs import PackIndex, build_packs
+
+
+def _puzzles():
+    themes = ['fork', 'pin', 'skewer', 'mateIn1']
+    return [
+        {'id': 100 + i, 'fen': '6k1/5ppp/8/8/8/8/5PPP/3R2K1 b - - 0 1', 'moves': 'g8h8 d1d8',
+         'rating': 800 + 10 * i, 'themes': f'{themes[i % 4]} short', 'popularity': 90}
+        for i in range(120)
+    ]
+
+
+def _make_db(path, rating, solved, unsolved=()):
+    conn = sqlite3.connect(path)
+    conn.execute('CREATE TABLE statistics (id INTEGER PRIMARY KEY, current_puzzle_rating INTEGER DEFAULT 1200)')
+    conn.execute('INSERT INTO statistics (id, current_puzzle_rating) VALUES (1, ?)', (rating,))
+    conn.execute('CREATE TABLE puzzle_progress (puzzle_id INTEGER PRIMARY KEY, attempts INTEGER DEFAULT 0, '
+                 'solved INTEGER DEFAULT 0, last_attempted INTEGER)')
+    conn.executemany('INSERT INTO puzzle_progress VALUES (?, 1, 1, 0)', [(pid,) for pid in solved])
+    conn.executemany('INSERT INTO puzzle_progress VALUES (?, 2, 0, 0)', [(pid,) for pid in unsolved])
+    conn.commit()
+    conn.close()
+
+
+def test_pack_is_unsolved_in_window_and_balanced():
+    index = PackIndex(_puzzles())
+    by_id = {p['id']: p for p in _puzzles()}
+    solved_ids = [p['id'] for p in _puzzles() if 1000 <= p['rating'] <= 1100]
+    pack = index.build_pack(1200, index.solved_bitmap(solved_ids + [999999]), size=12, seed=7)
+
+    assert len(pack) == len(set(pack)) == 12
+    assert not set(pack) & set(solved_ids)
+    assert all(1000 <= by_id[pid]['rating'] <= 1400 for pid in pack)
+    counts = {}
+    for pid in pack:
+        theme = by_id[pid]['themes'].split()[0]
+        counts[theme] = counts.get(theme, 0) + 1
+    assert sorted(counts.values()) == [3, 3, 3, 3]
+
+
+def test_build_packs_over_databases(tmp_path):
+    puzzles_file = tmp_path / 'puzzles.json'
+    puzzles_file.write_text(json.dumps(_puzzles()))
+    _make_db(tmp_path / 'alice.db', 900, solved=[100, 101, 102], unsolved=[103])
+    _make_db(tmp_path / 'bob.db', 1900, solved=[])
+    (tmp_path / 'broken.db').write_bytes(b'not a database')
+    paths = [str(tmp_path / name) for name in ('alice.db', 'bob.db', 'broken.db')]
+
+    results = list(build_packs(paths, str(puzzles_file), pack_size=5, workers=1))
+
+    alice, bob, broken = results
+    assert alice['solved'] == 3 and alice['attempted'] == 4
+    assert len(alice['pack']) == 5 and not {100, 101, 102} & set(alice['pack'])
+    assert len(bob['pack']) == 5
+    assert 'error' in broken
+    # Same user, same pack.
+    assert list(build_packs(paths[:1], str(puzzles_file), pack_size=5, workers=1))[0] == alice
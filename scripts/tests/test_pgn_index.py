@@ -0,0 +1,71 @@
+import io
+import random
+
+import chess
+import chess.pgn
+import zstandard as zstd
+
+from pgn_index import build_index, extract_games, index_paths, parse_game_url
+
+
+def _write_dump(path, count=40, seed=7):
+    """Random games with Lichess-style Site headers; returns {game_id: fens}."""
+    rng = random.Random(seed)
+    games, texts = {}, []
+    for i in range(count):
+        game_id = f"game{i:04d}"
+        game = chess.pgn.Game()
+        game.headers['Event'] = 'Rated Blitz game'
+        game.headers['Site'] = f"https://lichess.org/{game_id}"
+        board = chess.Board()
+        node = game
+        fens = [board.fen()]
+        for _ in range(30):
+            moves = list(board.legal_moves)
+            if not moves:
+                break
+            move = rng.choice(moves)
+            node = node.add_variation(move)
+            board.push(move)
+            fens.append(board.fen())
+        games[game_id] = fens
+        texts.append(str(game) + '\n\n')
+    with open(path, 'wb') as f:
+        f.write(zstd.ZstdCompressor().compress(''.join(texts).encode('utf-8')))
+    return games
+
+
+def test_parse_game_url():
+    assert parse_game_url('https://lichess.org/yyznGmXs/black#48') == ('yyznGmXs', 48)
+    assert parse_game_url('https://lichess.org/yyznGmXs#7') == ('yyznGmXs', 7)
+    assert parse_game_url('') is None
+
+
+def test_build_and_extract(tmp_path):
+    dump = str(tmp_path / 'games.pgn.zst')
+    games = _write_dump(dump)
+    indexed, frames = build_index(dump, frame_size=2000)
+    assert indexed == 40 and frames > 3
+
+    # The re-framed file is still a plain .zst stream with the same content.
+    seekable_path, _ = index_paths(dump)
+    with open(dump, 'rb') as a, open(seekable_path, 'rb') as b:
+        original = zstd.ZstdDecompressor().decompress(a.read())
+        reframed = zstd.ZstdDecompressor().stream_reader(b, read_across_frames=True).read(1 << 20)
+    assert original == reframed
+
+    puzzles = [
+        {'id': i, 'fen': games[f"game{i:04d}"][ply], 'game_url': f"https://lichess.org/game{i:04d}/white#{ply}"}
+        for i, ply in ((3, 10), (17, 1), (38, 21))
+    ]
+    puzzles.append({'id': 99, 'fen': '8/8/8/8/8/8/8/8 w - - 0 1', 'game_url': 'https://lichess.org/absentXX#4'})
+
+    results = {r['puzzle_id']: r for r in extract_games(dump, puzzles, workers=1)}
+    assert set(results) == {3, 17, 38}
+    for pid, ply in ((3, 10), (17, 1), (38, 21)):
+        result = results[pid]
+        assert result['fen_match'] and result['ply'] == ply
+        game = chess.pgn.read_game(io.StringIO(result['pgn']))
+        board = game.end().board()
+        assert board.fen() == games[f"game{pid:04d}"][ply]
+        assert game.headers['Site'].endswith(f"game{pid:04d}")
@@ -0,0 +1,49 @@
+from position_features import PHASES, attach_features, extract_features, parse_boards
+
+
+def _puzzle(fen, moves):
+    return {'id': 1, 'fen': fen, 'moves': moves, 'rating': 1500, 'themes': '', 'popularity': 90}
+
+
+def test_start_position_parse():
+    boards, white, fullmove = parse_boards(['rnbqkbnr/pppppppp/8/8/8/8/PPPPPPPP/RNBQKBNR w KQkq - 0 1'])
+    assert white[0] and fullmove[0] == 1
+    assert boards[0, 4] == 6       # white king on e1
+    assert boards[0, 60] == 12     # black king on e8
+    assert (boards[0, 16:48] == 0).all()
+
+
+def test_features_after_setup_move():
+    puzzles = [
+        # Setup move Kh8 leaves the solver (white) a rook up, not in check.
+        _puzzle('6k1/5ppp/8/8/8/8/5PPP/3R2K1 b - - 0 1', 'g8h8 d1d8'),
+        # Setup move Qxf7 gives check, so the solver (black) starts in check.
+        _puzzle('rnbqkbnr/pppp1ppp/8/4p3/2B1P3/5Q2/PPPP1PPP/RNB1K1NR w KQkq - 2 3', 'f3f7 e8f7'),
+    ]
+    features = extract_features(puzzles)
+
+    assert features['white_to_move'].tolist() == [1, 0]
+    assert features['material_balance'][0] == 5
+    assert features['in_check'].tolist() == [0, 1]
+    assert features['phase_class'][0] == PHASES.index('endgame')
+    assert features['phase_class'][1] == PHASES.index('opening')
+    assert features['solution_length'].tolist() == [1, 1]
+    assert features['count_P'][1] == 8 and features['count_p'][1] == 7
+
+
+def test_castling_and_en_passant_setup_moves():
+    puzzles = [
+        _puzzle('r3k2r/8/8/8/8/8/8/R3K2R w KQkq - 0 1', 'e1g1 a8a1'),
+        _puzzle('4k3/8/8/3Pp3/8/8/8/4K3 w - e6 0 1', 'd5e6 e8d8'),
+    ]
+    features = extract_features(puzzles)
+    assert features['count_R'][0] == 2
+    assert features['count_p'][1] == 0
+
+
+def test_attach_features_names_phase():
+    puzzles = [_puzzle('6k1/5ppp/8/8/8/8/5PPP/3R2K1 b - - 0 1', 'g8h8 d1d8')]
+    attach_features(puzzles, extract_features(puzzles))
+    assert puzzles[0]['phase_class'] == 'endgame'
+    assert isinstance(puzzles[0]['material_balance'], int)
+    assert puzzles[0]['in_check'] == 0
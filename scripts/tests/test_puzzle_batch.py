@@ -0,0 +1,54 @@
+import numpy as np
+
+from download_real_puzzles import parse_lichess_csv
+from puzzle_batch import PuzzleBatch, iter_csv_batches, read_batches, write_batches
+from puzzle_io import iter_lichess_csv
+
+HEADER = 'PuzzleId,FEN,Moves,Rating,RatingDeviation,Popularity,NbPlays,Themes,GameUrl,OpeningTags\n'
+ROWS = [
+    '00008,r6k/pp2r2p/4Rp1Q/3p4/8/1N1P2R1/PqP2bPP/7K b - - 0 24,f2g3 e6e7 b2b1 b3c1 b1c1 h6c1,1913,75,94,'
+    '6230,crushing hangingPiece long middlegame,https://lichess.org/787zsVup/black#47,\n',
+    'bad,,,,,,,,,\n',
+    '0000D,5rk1/1p3ppp/pq3b2/8/8/1P1Q1N2/P4PPP/3R2K1 w - - 2 27,d3d6 f8d8 d6d8 f6d8,1541,76,96,23331,'
+    'advantage endgame short,https://lichess.org/F8M8OS71#53,Queens_Pawn_Game Queens_Pawn_Game_Other\n',
+    '0009B,r2qr1k1/b1p2ppp/pp4n1/P1P1p3/4P1n1/B2P2Pb/3NBP1P/RN1QR1K1 b - - 1 16,b6c5 e2g4 h3g4 d1g4,1094,'
+    '75,87,481,advantage middlegame short ä,https://lichess.org/4MWQCxQ6/black#32,Kings_Pawn_Game\n',
+]
+
+
+def test_csv_batches_match_dict_parser(tmp_path):
+    path = tmp_path / 'puzzles.csv'
+    path.write_text(HEADER + ''.join(ROWS), encoding='utf-8')
+    expected = list(iter_lichess_csv(str(path)))
+
+    batches = list(iter_csv_batches(str(path), batch_size=2))
+    assert [len(b) for b in batches] == [1, 2]
+    records = [r for b in batches for r in b.to_records()]
+    assert [{k: r[k] for k in e} for r, e in zip(records, expected)] == expected
+
+    combined = PuzzleBatch.concat(batches)
+    view = combined[-1]
+    assert view['themes'].endswith('ä') and view.get('missing', 7) == 7
+    popular = combined.select(combined['popularity'] >= 90)
+    assert popular.strings('lichess_id') == ['00008', '0000D']
+    assert popular.select([1, 0])[0].to_dict() == records[1]
+
+
+def test_from_records_and_file_round_trip(tmp_path):
+    records = [{'id': i, 'fen': f'fen{i}' * i, 'rating': 1000 + i, 'themes': 'fork'} for i in range(5)]
+    batch = PuzzleBatch.from_records(records)
+    assert batch['rating'].dtype == np.int32 and batch['id'].dtype == np.int64
+    assert batch.to_records() == records
+
+    path = str(tmp_path / 'out.batches')
+    assert write_batches(path, [batch, batch.select([4, 2])]) == 7
+    loaded = list(read_batches(path))
+    assert [b.to_records() for b in loaded] == [records, [records[4], records[2]]]
+
+
+def test_concat_of_empty_batches_keeps_the_schema():
+    empty = PuzzleBatch.concat([PuzzleBatch.from_csv_rows([]), PuzzleBatch.from_csv_rows([ROWS[1].split(',')])])
+    assert len(empty) == 0 and len(empty['rating']) == 0 and 'popularity' in empty.columns
+
+    # A dump whose only row has an empty FEN parses to nothing instead of failing.
+    assert parse_lichess_csv(HEADER + '00001,,e2e4 e7e5,1500,75,90,100,opening,,\n', max_puzzles=10) == []
@@ -0,0 +1,88 @@
+import asyncio
+import json
+import threading
+
+import pytest
+
+from puzzle_daemon import LruCache, PuzzleService, serve
+from puzzle_daemon_loadtest import run_load
+from puzzle_store import write_store
+
+
+def _puzzles():
+    themes = ['fork short', 'pin short', 'fork mateIn1', 'endgame']
+    return [
+        {'id': 500 + i, 'fen': '6k1/5ppp/8/8/8/8/5PPP/3R2K1 b - - 0 1', 'moves': 'g8h8 d1d8',
+         'rating': 2000 - 10 * i, 'themes': themes[i % 4], 'popularity': 90}
+        for i in range(100)
+    ]
+
+
+@pytest.fixture
+def service(tmp_path):
+    path = str(tmp_path / 'puzzles.store')
+    write_store(_puzzles(), path)
+    service = PuzzleService(path, readers=2, cache_items=8)
+    yield service
+    service.close()
+
+
+def test_queries(service):
+    status, body = service.handle('/puzzles?min_rating=1500&max_rating=1600&themes=fork&exclude=540')
+    ratings = [p['rating'] for p in json.loads(body)]
+    assert status == 200
+    assert ratings == sorted(ratings) and all(1500 <= r <= 1600 for r in ratings)
+    assert all('fork' in p['themes'] and p['id'] != 540 for p in json.loads(body))
+    assert {p['id'] for p in json.loads(body)} == {542, 544, 546, 548, 550}
+
+    status, body = service.handle('/puzzle/500')
+    assert status == 200 and json.loads(body)['rating'] == 2000
+    assert service.handle('/puzzle/1')[0] == 404
+    assert len(json.loads(service.handle('/shard/1?size=30')[1])) == 30
+    assert service.handle('/shard/9?size=30')[0] == 400
+    assert service.handle('/puzzles?limit=x')[0] == 400
+
+    service.handle('/puzzles?min_rating=1500&max_rating=1600&themes=fork&exclude=540')
+    assert service.stats()['cache_hit_rate'] > 0
+
+
+def test_lru_cache_bounds():
+    cache = LruCache(max_items=2, max_bytes=10)
+    cache.put('a', b'1234')
+    cache.put('b', b'1234')
+    cache.get('a')
+    cache.put('c', b'1234')
+    assert cache.get('b') is None and cache.get('a') == b'1234'
+    cache.put('d', b'12345678')
+    assert len(cache) == 1 and cache.bytes == 8
+
+
+def test_http_round_trip_under_load(service):
+    started = threading.Event()
+    port = []
+    loop = asyncio.new_event_loop()
+
+    def on_listening(bound):
+        port.append(bound)
+        started.set()
+
+    task = loop.create_task(serve(service, port=0, threads=2, on_listening=on_listening))
+
+    def run():
+        try:
+            loop.run_until_complete(task)
+        except asyncio.CancelledError:
+            pass
+        finally:
+            loop.close()
+
+    thread = threading.Thread(target=run, daemon=True)
+    thread.start()
+    try:
+        assert started.wait(10)
+        results = asyncio.run(run_load('127.0.0.1', port[0], total=300, concurrency=4))
+        assert results['errors'] == 0
+        assert sum(len(v) for v in results['latencies'].values()) == 300
+    finally:
+        loop.call_soon_threadsafe(task.cancel)
+        thread.join(10)
@@ -0,0 +1,65 @@
+import random
+
+import pytest
+
+from puzzle_store import HEADER, MAGIC, PuzzleStore, build_index, write_store
+
+
+def _puzzles(count, seed=3):
+    ids = random.Random(seed).sample(range(62 ** 5), count)
+    return [
+        {'id': pid, 'fen': '6k1/5ppp/8/8/8/8/5PPP/3R2K1 b - - 0 1', 'moves': 'g8h8 d1d8',
+         'rating': 600 + i, 'themes': 'endgame mateIn1', 'popularity': 90}
+        for i, pid in enumerate(ids)
+    ]
+
+
+def test_index_is_minimal_perfect():
+    keys = random.Random(5).sample(range(1 << 40), 5000)
+    _, slots = build_index(keys)
+    assert sorted(slots) == list(range(len(keys)))
+
+
+def test_index_small_and_sequential_keys():
+    # Small counts with many divisors used to leave some buckets unplaceable.
+    for count in (2, 3, 10, 64, 100, 360):
+        keys = list(range(500, 500 + count))
+        _, slots = build_index(keys)
+        assert sorted(slots) == list(range(count))
+
+
+def test_round_trip_and_misses(tmp_path):
+    puzzles = _puzzles(2000)
+    path = str(tmp_path / 'puzzles.store')
+    assert write_store(puzzles, path) == 2000
+
+    with PuzzleStore(path) as store:
+        assert len(store) == 2000
+        for puzzle in puzzles:
+            assert store.get(puzzle['id']) == puzzle
+        assert sorted(store.ids()) == sorted(p['id'] for p in puzzles)
+        known = {p['id'] for p in puzzles}
+        for missing in (pid for pid in range(5000) if pid not in known):
+            assert missing not in store
+        assert store.get(-1, 'absent') == 'absent'
+
+
+def test_tiny_and_duplicate_inputs(tmp_path):
+    path = str(tmp_path / 'one.store')
+    write_store(_puzzles(1), path)
+    with PuzzleStore(path) as store:
+        assert len(store.ids()) == 1
+
+    with pytest.raises(ValueError):
+        write_store(_puzzles(3) * 2, str(tmp_path / 'dup.store'))
+
+
+def test_older_version_is_rejected(tmp_path):
+    path = tmp_path / 'old.store'
+    write_store(_puzzles(10), str(path))
+    data = bytearray(path.read_bytes())
+    HEADER.pack_into(data, 0, MAGIC, 1, *HEADER.unpack_from(data, 0)[2:])
+    path.write_bytes(bytes(data))
+
+    with pytest.raises(ValueError, match='version 2'):
+        PuzzleStore(str(path))
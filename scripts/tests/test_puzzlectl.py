@@ -0,0 +1,112 @@
+import csv
+import datetime
+import io
+import json
+import os
+import subprocess
+import sys
+
+import chess
+import zstandard as zstd
+
+import puzzlectl
+from session_ladders import Ladders
+from similar_puzzles import SimilarPuzzles
+
+
+def _write_source(path, random_pack, count=60, seed=2):
+    out = io.StringIO()
+    writer = csv.writer(out)
+    writer.writerow(['PuzzleId', 'FEN', 'Moves', 'Rating', 'RatingDeviation', 'Popularity',
+                     'NbPlays', 'Themes', 'GameUrl', 'OpeningTags'])
+    for i, puzzle in enumerate(random_pack(count, seed, positions=True)):
+        moves = 'a1a1 a2a3' if i == 0 else puzzle['moves']
+        writer.writerow([f'p{i:04d}', puzzle['fen'], moves, 600 + 25 * i, 80, 90, 500, 'short middlegame', '', ''])
+    with open(path, 'wb') as f:
+        f.write(zstd.ZstdCompressor().compress(out.getvalue().encode('utf-8')))
+
+
+def _config(source, **overrides):
+    config = {
+        'source': source, 'source_fingerprint': puzzlectl.source_fingerprint(source), 'limit': None,
+        'min_rating': 400, 'max_rating': 3000, 'min_popularity': 50, 'min_plays': 50,
+        'verify_mates': True, 'workers': 1, 'threshold': 0.8, 'total': 20, 'calendar_start': '2026-10-01',
+    }
+    config.update(overrides)
+    return config
+
+
+def test_reruns_only_downstream_of_a_change(tmp_path, random_pack):
+    source = str(tmp_path / 'puzzles.csv.zst')
+    _write_source(source, random_pack)
+    cache = str(tmp_path / 'cache')
+    logs = []
+
+    summaries, artifacts = puzzlectl.run_pipeline(_config(source), cache_dir=cache, log=logs.append)
+    assert all(' ran ' in line for line in logs)
+    assert summaries['parse']['records'] == 60
+    assert summaries['validate']['dropped_illegal'] == 1
+    assert summaries['motifs']['records'] == summaries['dedup']['records']
+    with open(artifacts['export'], encoding='utf-8') as f:
+        exported = json.load(f)
+    assert len(exported) == 20 and set(exported[0]) == set(puzzlectl.EXPORT_FIELDS)
+    assert summaries['export']['unannotated'] == 0
+    for puzzle in exported:
+        board = chess.Board(puzzle['fen'])
+        board.push_uci(puzzle['moves'].split()[0])
+        assert puzzle['start'] == board.fen() and len(puzzle['flags']) == len(puzzle['san'].split()) > 1
+    similar = SimilarPuzzles(os.path.join(os.path.dirname(artifacts['export']), puzzlectl.SIMILAR_FILE))
+    assert similar.count == len(exported) and similar.neighbours.max() < len(exported)
+    ladders = Ladders(os.path.join(os.path.dirname(artifacts['export']), puzzlectl.LADDERS_FILE))
+    assert ladders.start == datetime.date(2026, 10, 1)
+    assert ladders.daily(ladders.start) < len(exported)
+
+    logs.clear()
+    puzzlectl.run_pipeline(_config(source), cache_dir=cache, log=logs.append)
+    assert all(' cached ' in line for line in logs)
+
+    logs.clear()
+    puzzlectl.run_pipeline(_config(source, min_rating=1000), cache_dir=cache, log=logs.append)
+    states = {line.split()[0]: line.split()[1] for line in logs}
+    assert [states[s] for s in ('fetch', 'decompress', 'parse')] == ['cached'] * 3
+    assert [states[s] for s in ('filter', 'validate', 'dedup', 'motifs', 'select', 'export')] == ['ran'] * 6
+
+    logs.clear()
+    puzzlectl.run_pipeline(_config(source, calendar_start='2026-11-01'), cache_dir=cache, log=logs.append)
+    assert [line.split()[:2] for line in logs if ' ran ' in line] == [['export', 'ran']]
+
+    logs.clear()
+    puzzlectl.run_pipeline(_config(source), until='dedup', force={'validate'}, cache_dir=cache, log=logs.append)
+    states = {line.split()[0]: line.split()[1] for line in logs}
+    assert states == {'fetch': 'cached', 'decompress': 'cached', 'parse': 'cached', 'filter': 'cached',
+                      'validate': 'ran', 'dedup': 'ran'}
+
+
+def test_cached_runs_do_not_import_heavy_modules(tmp_path, random_pack):
+    source = str(tmp_path / 'puzzles.csv.zst')
+    _write_source(source, random_pack, count=10)
+    cache = str(tmp_path / 'cache')
+    puzzlectl.run_pipeline(_config(source, total=5), cache_dir=cache, log=lambda _: None)
+
+    script = (
+        "import sys, puzzlectl\n"
+        f"config = {_config(source, total=5)!r}\n"
+        f"puzzlectl.run_pipeline(config, cache_dir={cache!r}, log=lambda _: None)\n"
+        "print(sorted(m for m in ('numpy', 'chess', 'zstandard', 'requests') if m in sys.modules))\n"
+    )
+    result = subprocess.run([sys.executable, '-c', script], cwd=puzzlectl._SCRIPTS_DIR,
+                            capture_output=True, text=True, check=True)
+    assert result.stdout.strip() == '[]'
+
+
+def test_code_version_covers_modules_imported_indirectly():
+    stages = {stage.name: stage for stage in puzzlectl.STAGES}
+    # The stage functions import their modules lazily, inside the function body.
+    assert {'session_ladders', 'similar_puzzles'} <= set(stages['export'].code_modules())
+    # quota_selector and dataset_stats reach puzzle_io; verify_mate_puzzles reaches the fetchers.
+    assert 'puzzle_io' in stages['select'].code_modules() and 'puzzle_io' in stages['export'].code_modules()
+    assert 'fetch_real_puzzles' in stages['validate'].code_modules()
+
+
+def test_calendar_start_defaults_to_the_first_of_the_month():
+    assert puzzlectl.default_calendar_start(datetime.date(2026, 10, 19)) == '2026-10-01'
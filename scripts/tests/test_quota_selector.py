@@ -0,0 +1,108 @@
+import random
+
+from memory_governor import MemoryGovernor
+from quota_selector import QuotaSelector, select_stream, target_counts
+
+# Middlegame-ish and endgame positions (phase comes from position_features).
+MIDDLEGAME = 'r1bqkb1r/pppp1ppp/2n2n2/4p3/2B1P3/5N2/PPPP1PPP/RNBQK2R w KQkq - 4 4'
+ENDGAME = '6k1/5ppp/8/8/8/8/5PPP/3R2K1 b - - 0 1'
+
+TARGETS = {
+    'rating': {'beginner': 0.5, 'advanced': 0.5},
+    'theme': {'smotheredMate': 0.2},
+}
+
+
+def _puzzle(pid, rating, themes='', popularity=90, fen=ENDGAME, moves='g8h8 d1d8'):
+    return {'id': pid, 'fen': fen, 'moves': moves, 'rating': rating,
+            'themes': themes, 'popularity': popularity}
+
+
+def test_target_counts_sum_to_total():
+    counts = target_counts({'a': 1 / 3, 'b': 1 / 3, 'c': 1 / 3}, 10)
+    assert sum(counts.values()) == 10
+    # Floors (theme minimums) are not rounded up to the total.
+    assert target_counts({'fork': 0.15}, 10) == {'fork': 1}
+
+
+def test_exact_bands_and_theme_floor():
+    puzzles = [_puzzle(i, 1000, 'short', popularity=99) for i in range(20)]
+    puzzles += [_puzzle(100 + i, 1800, 'short', popularity=98) for i in range(20)]
+    # Less popular, but carries the under-represented theme.
+    puzzles += [_puzzle(200 + i, 1800, 'smotheredMate', popularity=60) for i in range(5)]
+
+    selected, report = select_stream(iter(puzzles), 10, TARGETS, theme_caps={})
+
+    ratings = [p['rating'] for p in selected]
+    assert len(selected) == 10
+    assert ratings.count(1000) == 5 and ratings.count(1800) == 5
+    assert sum('smotheredMate' in p['themes'] for p in selected) == 2
+    assert report['total_gap'] == 0
+
+
+def test_theme_cap_respected_when_possible():
+    puzzles = [_puzzle(i, 1000, 'crushing', popularity=99) for i in range(20)]
+    puzzles += [_puzzle(100 + i, 1000, 'fork', popularity=70) for i in range(20)]
+
+    selected, _ = select_stream(iter(puzzles), 10, {'rating': {'beginner': 1.0}}, {'crushing': 0.3})
+
+    assert len(selected) == 10
+    assert sum('crushing' in p['themes'] for p in selected) == 3
+
+
+def test_short_input_tops_up_and_reports_gap():
+    # No advanced puzzles at all: the pack is still filled, the gap reported.
+    puzzles = [_puzzle(i, 1000, popularity=90 - i) for i in range(20)]
+    selector = QuotaSelector(10, TARGETS, theme_caps={})
+    selector.offer_batch(puzzles)
+    selected = selector.finish()
+
+    assert len(selected) == 10
+    report = selector.report()
+    gaps = {(row['dimension'], row['value']): row['gap'] for row in report['rows']}
+    assert gaps[('rating', 'advanced')] == 5
+    assert gaps[('theme', 'smotheredMate')] == 2
+
+
+def test_phase_and_popularity_filter():
+    puzzles = [_puzzle(i, 1000, fen=MIDDLEGAME, moves='e1g1 f6e4') for i in range(4)]
+    puzzles += [_puzzle(10 + i, 1000) for i in range(4)]
+    puzzles.append(_puzzle(99, 1000, popularity=10))
+    targets = {'rating': {'beginner': 1.0}, 'phase': {'opening': 0.5, 'endgame': 0.5}}
+
+    selected, report = select_stream(iter(puzzles), 4, targets, theme_caps={})
+
+    assert report['offered'] == 8
+    assert sorted(p['id'] for p in selected)[:2] == [0, 1]
+    assert report['total_gap'] == 0
+
+
+def test_untargeted_bands_and_phases_are_skipped():
+    # Popular expert and middlegame puzzles have no share in these targets.
+    puzzles = [_puzzle(i, 2200, popularity=99) for i in range(10)]
+    puzzles += [_puzzle(20 + i, 1000, fen=MIDDLEGAME, moves='e1g1 f6e4', popularity=99) for i in range(10)]
+    puzzles += [_puzzle(40 + i, 1000, popularity=80) for i in range(10)]
+    puzzles += [_puzzle(60 + i, 1400, popularity=80) for i in range(10)]
+    targets = {'rating': {'beginner': 0.5, 'intermediate': 0.5}, 'phase': {'endgame': 1.0}}
+
+    selected, report = select_stream(iter(puzzles), 8, targets, theme_caps={})
+
+    assert report['offered'] == 20
+    assert sorted(p['rating'] for p in selected) == [1000] * 4 + [1400] * 4
+    assert report['total_gap'] == 0
+
+
+def test_spilled_buffers_select_the_same_pack():
+    rng = random.Random(3)
+    puzzles = [_puzzle(i, rng.choice([1000, 1800]), rng.choice(['short', 'smotheredMate', '']),
+                       popularity=rng.randrange(50, 100)) for i in range(400)]
+    plain = QuotaSelector(20, TARGETS, theme_caps={}, buffer_per_cell=8)
+    # A 1-byte cap is always exceeded, so every batch is spilled to disk.
+    spilling = QuotaSelector(20, TARGETS, theme_caps={}, buffer_per_cell=8,
+                             governor=MemoryGovernor(1, log=lambda _: None))
+    for start in range(0, len(puzzles), 50):
+        plain.offer_batch(puzzles[start:start + 50])
+        spilling.offer_batch(puzzles[start:start + 50])
+
+    assert [p['id'] for p in spilling.finish()] == [p['id'] for p in plain.finish()]
+    assert spilling.governor.adaptations[0]['action'] == 'spill'
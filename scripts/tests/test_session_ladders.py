@@ -0,0 +1,59 @@
+import datetime
+
+from puzzle_io import line_id
+from session_ladders import Ladders, build_ladders, main_theme, write_ladders
+
+
+def test_main_theme_skips_generic_tags():
+    assert main_theme('short middlegame fork') == 'fork'
+    assert main_theme('crushing,long') == ''
+
+
+def test_ladders_cover_each_window_once_and_climb_within_sessions(random_pack):
+    puzzles = random_pack(600, seed=4)
+    rating = [p['rating'] for p in puzzles]
+    built = build_ladders(puzzles, step=200, spread=200, session_length=5, years=1)
+
+    for low, high, rows in built['ladders']:
+        expected = [row for row, p in enumerate(puzzles) if low <= p['rating'] < high]
+        assert sorted(rows.tolist()) == expected
+    low, high, rows = next(ladder for ladder in built['ladders'] if ladder[0] == 1400)
+    sessions = [rows[i:i + 5].tolist() for i in range(0, len(rows) - 4, 5)]
+    firsts = sum(rating[s[0]] for s in sessions) / len(sessions)
+    lasts = sum(rating[s[-1]] for s in sessions) / len(sessions)
+    assert lasts - firsts > 200
+    # The same pack in another order gives the same ladders, as puzzle IDs.
+    reordered = list(reversed(puzzles))
+    shuffled = build_ladders(reordered, step=200, spread=200, session_length=5, years=1)
+    assert all([puzzles[row]['id'] for row in a[2]] == [reordered[row]['id'] for row in b[2]]
+               for a, b in zip(built['ladders'], shuffled['ladders']))
+
+
+def test_mined_ids_above_uint32_are_stored_as_rows(random_pack):
+    puzzles = random_pack(50, seed=5, first_id=line_id('8/8/8/8/8/8/8/K6k w - - 0 1', 'a1a2'))
+    built = build_ladders(puzzles, step=200, spread=200, years=1)
+    assert puzzles[0]['id'] > 0xFFFFFFFF
+    assert {row for _, _, rows in built['ladders'] for row in rows.tolist()} == set(range(50))
+    assert max(built['calendar'].tolist()) < 50
+
+
+def test_calendar_follows_the_week_and_round_trips(tmp_path, random_pack):
+    puzzles = random_pack(600, seed=4)
+    rating = [p['rating'] for p in puzzles]
+    built = build_ladders(puzzles, start='2025-01-06', years=1)  # a Monday
+    calendar = built['calendar'].tolist()
+
+    assert len(calendar) == 365
+    mondays, sundays = calendar[0::7], calendar[6::7]
+    assert max(rating[i] for i in mondays) <= min(rating[i] for i in sundays)
+    # No repeats until a weekday's stratum is used up.
+    assert len(set(mondays[:10])) == 10
+
+    path = tmp_path / 'ladders.bin'
+    write_ladders(path, built)
+    ladders = Ladders(path)
+    assert ladders.daily(datetime.date(2025, 1, 8)) == calendar[2]
+    assert ladders.daily(datetime.date(2024, 12, 31)) is None
+    low, high, rows = ladders.ladder(1530)
+    assert (low, high) == (1300, 1700)
+    assert ladders.next_puzzle(1530, len(rows) + 3) == int(rows[3])
@@ -0,0 +1,53 @@
+import numpy as np
+
+from similar_puzzles import (IVFPQIndex, SimilarPuzzles, brute_force, build_neighbours, encode_puzzles,
+                             theme_vocabulary, write_neighbours)
+
+
+def test_vectors_are_unit_length_and_colour_blind(random_pack):
+    puzzles = random_pack(50, seed=3, first_id=5000, id_step=7, positions=True)
+    vectors = encode_puzzles(puzzles, theme_vocabulary(puzzles))
+    assert vectors.shape[0] == 50 and vectors.shape[1] % 32 == 0
+    assert np.allclose(np.linalg.norm(vectors, axis=1), 1, atol=1e-5)
+
+    # The same puzzle with the board mirrored and the colours swapped.
+    p = {'id': 1, 'fen': '6k1/5ppp/8/8/8/8/5PPP/3R2K1 b - - 0 1', 'moves': 'h7h6 d1d8', 'themes': 'backRankMate'}
+    q = {'id': 2, 'fen': '3r2k1/5ppp/8/8/8/8/5PPP/6K1 w - - 0 1', 'moves': 'h2h3 d8d1', 'themes': 'backRankMate'}
+    a, b = encode_puzzles([p, q], ['backRankMate'])
+    assert np.allclose(a, b)
+
+
+def test_index_with_every_list_probed_matches_brute_force(random_pack):
+    puzzles = random_pack(600, seed=3, first_id=5000, id_step=7, positions=True)
+    vectors = encode_puzzles(puzzles, theme_vocabulary(puzzles))
+    _, exact = brute_force(vectors, 5)
+    index = IVFPQIndex(16, subvectors=8).train(vectors).add(vectors)
+
+    rows, distances = index.search(vectors, 5, nprobe=16, rerank=200, vectors=vectors, exclude_self=True)
+    # Compare distances, not rows: random positions with the same theme tie.
+    assert np.allclose(distances, exact, atol=1e-5)
+    assert (rows != np.arange(len(vectors))[:, None]).all()
+    assert (np.diff(distances, axis=1) >= 0).all()
+
+    approximate, _ = index.search(vectors, 5, nprobe=2, exclude_self=True)
+    assert (approximate >= 0).all()
+
+
+def test_neighbour_file_round_trips(tmp_path, random_pack):
+    # Mined/generated IDs do not fit in uint32; the file stores rows instead.
+    puzzles = random_pack(300, seed=3, first_id=1 << 61, id_step=7, positions=True)
+    neighbours, similarity = build_neighbours(puzzles, k=4)
+    assert neighbours.shape == (300, 4) and neighbours.max() < 300
+    _, exact = brute_force(encode_puzzles(puzzles, theme_vocabulary(puzzles)), 4)
+    assert np.allclose(similarity, 1 - exact / 2, atol=1e-5)
+    approximate, _ = build_neighbours(puzzles, k=4, exact_limit=0)
+    assert approximate.shape == (300, 4) and approximate.max() < 300
+
+    path = tmp_path / 'similar.bin'
+    write_neighbours(path, neighbours, similarity)
+    similar = SimilarPuzzles(path)
+    assert similar.count == 300
+    assert [n for n, _ in similar.similar(0)] == neighbours[0].tolist()
+    scores = [s for _, s in similar.similar(0)]
+    assert scores == sorted(scores, reverse=True) and 0 < scores[0] <= 1
+    assert similar.similar(300) == []
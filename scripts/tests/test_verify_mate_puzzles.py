@@ -0,0 +1,59 @@
+from verify_mate_puzzles import (
+    AMBIGUOUS, ILLEGAL_MOVE, NOT_MATE, VERIFIED,
+    MateSearch, claimed_mate_depth, verify_puzzle, verify_puzzles,
+)
+
+BACK_RANK = '6k1/5ppp/8/8/8/8/5PPP/3R2K1 b - - 0 1'
+
+
+def _puzzle(fen, moves, themes):
+    return {'id': 1, 'fen': fen, 'moves': moves, 'rating': 1000, 'themes': themes, 'popularity': 90}
+
+
+def test_claimed_depth_from_themes():
+    assert claimed_mate_depth(_puzzle(BACK_RANK, 'g8h8 d1d8', 'mateIn1 short')) == 1
+    assert claimed_mate_depth(_puzzle(BACK_RANK, 'a b c d e', 'backRankMate,endgame')) == 2
+    assert claimed_mate_depth(_puzzle(BACK_RANK, 'g8h8 d1d8', 'fork pin')) is None
+
+
+def test_back_rank_mate_is_verified():
+    result = verify_puzzle(_puzzle(BACK_RANK, 'g8h8 d1d8', 'mateIn1 backRankMate'), MateSearch())
+    assert result['verdict'] == VERIFIED
+
+
+def test_line_that_is_not_mate_is_rejected():
+    result = verify_puzzle(_puzzle(BACK_RANK, 'g8h8 d1d7', 'mateIn1'), MateSearch())
+    assert result['verdict'] == NOT_MATE
+
+
+def test_illegal_line_is_rejected():
+    result = verify_puzzle(_puzzle(BACK_RANK, 'e8d7 d1d8', 'mateIn1'), MateSearch())
+    assert result['verdict'] == ILLEGAL_MOVE
+
+
+def test_second_mating_first_move_is_ambiguous():
+    fen = '6k1/5ppp/8/8/8/8/5PPP/R2R2K1 b - - 0 1'
+    result = verify_puzzle(_puzzle(fen, 'g8h8 d1d8', 'mateIn1'), MateSearch())
+    assert result['verdict'] == AMBIGUOUS
+
+
+def test_mate_in_two_is_proven():
+    fen = '2r2rk1/p4ppp/1p2p3/3pP2Q/3N4/7R/P4PPP/R1q3K1 w - - 1 23'
+    result = verify_puzzle(_puzzle(fen, 'a1c1 c8c1 h5d1 c1d1', 'mateIn2 backRankMate'), MateSearch())
+    assert result['verdict'] == VERIFIED
+
+
+def test_alternative_mate_in_two_is_ambiguous():
+    fen = '7k/8/8/8/8/8/R7/1R4K1 b - - 0 1'
+    result = verify_puzzle(_puzzle(fen, 'h8g8 a2a7 g8f8 b1b8', 'mateIn2'), MateSearch())
+    assert result['verdict'] == AMBIGUOUS
+    assert 'b1b7' in result['detail']
+
+
+def test_pool_skips_non_mate_puzzles():
+    puzzles = [
+        _puzzle(BACK_RANK, 'g8h8 d1d8', 'mateIn1'),
+        _puzzle(BACK_RANK, 'g8h8 d1d7', 'advantage'),
+    ]
+    results = verify_puzzles(puzzles, workers=1)
+    assert [r['verdict'] for r in results] == [VERIFIED]
@@ -0,0 +1,428 @@
+#!/usr/bin/env python3
+"""
+Verify mate-tagged puzzles with a depth-limited mate search.
+
+Themes such as mateIn1/mateIn2/backRankMate used to be taken on trust, and
+the hand-written sets in fetch_lichess_puzzles.py and fetch_real_puzzles.py
+label lines "mateIn2" that are not mate at all. This stage proves, for every
+mate-tagged puzzle, that:
+
+  1. every move in the listed line is legal and the line ends in checkmate,
+  2. every solver move keeps a forced mate within the claimed depth, and
+  3. the first solver move is the only one that mates within that depth
+     (the app compares moves exactly, so a second mating move is a bug).
+
+The search is a boolean alpha-beta (AND/OR) search with a Zobrist keyed
+transposition table. Each worker process keeps its table warm across the
+puzzles it is given, so shared positions are only searched once.
+
+Usage:
+    python scripts/verify_mate_puzzles.py [--input puzzles.json] [--curated]
+        [--report report.json] [--output verified.json] [--workers N]
+    python scripts/verify_mate_puzzles.py --benchmark
+"""
+
+import argparse
+import json
+import os
+import re
+import sys
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor
+
+import chess
+import chess.polyglot
+
+from puzzle_io import DEFAULT_PUZZLES_FILE, load_puzzles, split_moves, split_themes
+
+MAX_MATE_DEPTH = 5
+DEFAULT_MAX_NODES = 100000
+# Cleared wholesale when exceeded; entries are tiny but workers live long.
+MAX_TT_ENTRIES = 2000000
+
+_MATE_IN_THEME = re.compile(r'^mateIn(\d+)$')
+
+# Verdicts
+VERIFIED = 'verified'
+ILLEGAL_MOVE = 'illegal_move'
+NOT_MATE = 'not_mate'
+NOT_FORCED = 'not_forced'
+AMBIGUOUS = 'ambiguous'
+TOO_DEEP = 'too_deep'
+UNKNOWN = 'unknown'
+
+FAILED_VERDICTS = {ILLEGAL_MOVE, NOT_MATE, NOT_FORCED, AMBIGUOUS}
+
+
+class SearchBudgetExceeded(Exception):
+    """Raised when a single puzzle uses more nodes than allowed."""
+
+
+def claimed_mate_depth(puzzle):
+    """
+    Return the mate depth a puzzle claims, or None if it is not mate-tagged.
+
+    An explicit mateInN theme wins. Otherwise any other mate theme (`mate`,
+    `backRankMate`, `smotheredMate`, ...) claims mate at the end of the line,
+    i.e. in as many moves as the solver plays.
+    """
+    themes = split_themes(puzzle.get('themes', ''))
+    for theme in themes:
+        match = _MATE_IN_THEME.match(theme)
+        if match:
+            return int(match.group(1))
+
+    if any(theme == 'mate' or theme.endswith('Mate') for theme in themes):
+        solution_plies = len(split_moves(puzzle.get('moves', ''))) - 1
+        return max((solution_plies + 1) // 2, 1)
+
+    return None
+
+
+class MateSearch:
+    """
+    Depth-limited mate prover.
+
+    Depth is counted in attacker moves. Two transposition tables are kept,
+    both keyed by the Polyglot Zobrist hash of the position:
+
+        attack_tt[key] -> (proven, refuted)  side to move mates within `proven`
+                                             moves / cannot within `refuted`
+        defend_tt[key] -> (proven, refuted)  side to move gets mated within ...
+
+    Storing the meaning relative to the side to move keeps entries valid
+    across puzzles with different colours, so a worker reuses its tables.
+    """
+
+    def __init__(self, max_nodes=DEFAULT_MAX_NODES):
+        self.max_nodes = max_nodes
+        self.attack_tt = {}
+        self.defend_tt = {}
+        self.nodes = 0
+        self.tt_hits = 0
+        self._budget = 0
+
+    def reset_budget(self):
+        if len(self.attack_tt) + len(self.defend_tt) > MAX_TT_ENTRIES:
+            self.attack_tt.clear()
+            self.defend_tt.clear()
+        self._budget = self.max_nodes
+
+    def _tick(self):
+        self.nodes += 1
+        self._budget -= 1
+        if self._budget < 0:
+            raise SearchBudgetExceeded()
+
+    def _probe(self, table, key, depth):
+        entry = table.get(key)
+        if entry is None:
+            return None
+        proven, refuted = entry
+        if proven is not None and proven <= depth:
+            self.tt_hits += 1
+            return True
+        if refuted is not None and refuted >= depth:
+            self.tt_hits += 1
+            return False
+        return None
+
+    @staticmethod
+    def _store(table, key, depth, result):
+        proven, refuted = table.get(key, (None, None))
+        if result:
+            proven = depth if proven is None else min(proven, depth)
+        else:
+            refuted = depth if refuted is None else max(refuted, depth)
+        table[key] = (proven, refuted)
+
+    def mates_after(self, board, move, depth):
+        """True if playing `move` (attacker) forces mate within `depth` moves in total."""
+        board.push(move)
+        try:
+            if board.is_checkmate():
+                return True
+            if depth <= 1:
+                return False
+            return self.defend(board, depth - 1)
+        finally:
+            board.pop()
+
+    def attack(self, board, depth):
+        """True if the side to move can force mate within `depth` moves."""
+        key = chess.polyglot.zobrist_hash(board)
+        cached = self._probe(self.attack_tt, key, depth)
+        if cached is not None:
+            return cached
+        self._tick()
+
+        # Checks first: they are tried while the move is already pushed for
+        # the is_check() test, which avoids gives_check()'s extra push/pop.
+        # Only checks can mate in one, so quiet moves are only kept deeper.
+        result = False
+        deferred = []
+        for move in list(board.legal_moves):
+            board.push(move)
+            try:
+                if board.is_check():
+                    result = board.is_checkmate() or (depth > 1 and self.defend(board, depth - 1))
+                elif depth > 1:
+                    deferred.append(move)
+            finally:
+                board.pop()
+            if result:
+                break
+
+        if not result and deferred:
+            deferred.sort(key=lambda m: not board.is_capture(m))
+            for move in deferred:
+                if self.mates_after(board, move, depth):
+                    result = True
+                    break
+
+        self._store(self.attack_tt, key, depth, result)
+        return result
+
+    def defend(self, board, depth):
+        """True if the side to move is mated within `depth` attacker moves whatever it plays."""
+        key = chess.polyglot.zobrist_hash(board)
+        cached = self._probe(self.defend_tt, key, depth)
+        if cached is not None:
+            return cached
+        self._tick()
+
+        result = True
+        has_move = False
+        for move in list(board.legal_moves):
+            has_move = True
+            board.push(move)
+            try:
+                escaped = not self.attack(board, depth)
+            finally:
+                board.pop()
+            if escaped:
+                result = False
+                break
+
+        if not has_move:
+            # Stalemate (checkmate is detected before we get here).
+            result = False
+
+        self._store(self.defend_tt, key, depth, result)
+        return result
+
+
+def verify_puzzle(puzzle, search):
+    """
+    Verify one mate-tagged puzzle.
+
+    Returns a dict with the puzzle id, claimed depth, verdict and detail.
+    """
+    result = {
+        'id': puzzle.get('id'),
+        'claimed': claimed_mate_depth(puzzle),
+        'verdict': VERIFIED,
+        'detail': '',
+        'nodes': 0,
+    }
+    depth = result['claimed']
+    if depth is None:
+        result['verdict'] = None
+        return result
+    if depth > MAX_MATE_DEPTH:
+        result['verdict'] = TOO_DEEP
+        return result
+
+    search.reset_budget()
+    nodes_before = search.nodes
+
+    try:
+        board = chess.Board(puzzle['fen'])
+        moves = [chess.Move.from_uci(m) for m in split_moves(puzzle['moves'])]
+    except ValueError as e:
+        result['verdict'] = ILLEGAL_MOVE
+        result['detail'] = str(e)
+        return result
+
+    if len(moves) < 2:
+        result['verdict'] = NOT_MATE
+        result['detail'] = 'no solution moves after the setup move'
+        return result
+
+    # 1. The line must be legal and end in checkmate.
+    replay = board.copy(stack=False)
+    for ply, move in enumerate(moves):
+        if move not in replay.legal_moves:
+            result['verdict'] = ILLEGAL_MOVE
+            result['detail'] = f'ply {ply}: {move.uci()}'
+            return result
+        replay.push(move)
+    if not replay.is_checkmate():
+        result['verdict'] = NOT_MATE
+        result['detail'] = 'line does not end in checkmate'
+        return result
+
+    board.push(moves[0])
+    solution = moves[1:]
+
+    try:
+        # 2. Every solver move must keep a forced mate within the remaining depth.
+        position = board.copy(stack=False)
+        for index, move in enumerate(solution):
+            if index % 2 == 0:
+                remaining = depth - index // 2
+                if remaining < 1 or not search.mates_after(position, move, remaining):
+                    result['verdict'] = NOT_FORCED
+                    result['detail'] = f'solver move {index // 2 + 1} ({move.uci()}) does not force mate in {depth}'
+                    return result
+            position.push(move)
+
+        # 3. The first solver move must be the only one mating within `depth`.
+        first = solution[0]
+        for move in board.legal_moves:
+            if move != first and search.mates_after(board, move, depth):
+                result['verdict'] = AMBIGUOUS
+                result['detail'] = f'{move.uci()} also mates in {depth}'
+                return result
+    except SearchBudgetExceeded:
+        result['verdict'] = UNKNOWN
+        result['detail'] = f'node budget of {search.max_nodes} exceeded'
+    finally:
+        result['nodes'] = search.nodes - nodes_before
+
+    return result
+
+
+# Per-process search, created by the pool initializer so its
+# transposition tables stay warm across the puzzles a worker handles.
+_worker_search = None
+
+
+def _init_worker(max_nodes):
+    global _worker_search
+    _worker_search = MateSearch(max_nodes=max_nodes)
+
+
+def _verify_in_worker(puzzle):
+    return verify_puzzle(puzzle, _worker_search)
+
+
+def verify_puzzles(puzzles, workers=None, max_nodes=DEFAULT_MAX_NODES, chunksize=16):
+    """
+    Verify every mate-tagged puzzle in `puzzles` across a process pool.
+
+    Returns the list of results in input order (non-mate puzzles skipped).
+    """
+    mate_puzzles = [p for p in puzzles if claimed_mate_depth(p) is not None]
+    workers = workers or os.cpu_count() or 1
+
+    if workers == 1:
+        _init_worker(max_nodes)
+        return [_verify_in_worker(p) for p in mate_puzzles]
+
+    with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                             initargs=(max_nodes,)) as pool:
+        return list(pool.map(_verify_in_worker, mate_puzzles, chunksize=chunksize))
+
+
+def load_curated_puzzles():
+    """The hand-written sets from fetch_lichess_puzzles.py and fetch_real_puzzles.py."""
+    from fetch_lichess_puzzles import get_curated_puzzle_set
+    from fetch_real_puzzles import create_comprehensive_puzzle_set
+
+    puzzles = list(get_curated_puzzle_set())
+    # The comprehensive set is ~10 base positions copied with jittered ratings,
+    # so keep one record per distinct line.
+    seen = set()
+    for puzzle in create_comprehensive_puzzle_set():
+        key = (puzzle['fen'], puzzle['moves'])
+        if key not in seen:
+            seen.add(key)
+            puzzles.append(puzzle)
+    return puzzles
+
+
+def summarize(results):
+    """Count verdicts per claimed depth."""
+    summary = Counter(r['verdict'] for r in results)
+    by_depth = Counter((r['claimed'], r['verdict']) for r in results)
+    return {
+        'checked': len(results),
+        'verdicts': dict(summary),
+        'by_depth': {f'mateIn{d}:{v}': c for (d, v), c in sorted(by_depth.items(), key=str)},
+        'nodes': sum(r['nodes'] for r in results),
+    }
+
+
+def run_benchmark(puzzles, max_nodes=DEFAULT_MAX_NODES):
+    """Time verification of the whole mate subset with 1..N workers."""
+    mate_puzzles = [p for p in puzzles if claimed_mate_depth(p) is not None]
+    cpu = os.cpu_count() or 1
+    worker_counts = sorted({1, max(cpu // 2, 1), cpu})
+
+    print(f"\nBenchmark: {len(mate_puzzles)} mate-tagged puzzles")
+    print(f"  {'workers':>8} {'seconds':>9} {'puzzles/s':>10} {'nodes/s':>10}")
+    for workers in worker_counts:
+        start = time.perf_counter()
+        results = verify_puzzles(mate_puzzles, workers=workers, max_nodes=max_nodes)
+        elapsed = time.perf_counter() - start
+        nodes = sum(r['nodes'] for r in results)
+        print(f"  {workers:>8} {elapsed:>9.2f} {len(results) / elapsed:>10.1f} {nodes / elapsed:>10.0f}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify mate-tagged puzzles with a forced-mate search.')
+    parser.add_argument('--input', default=DEFAULT_PUZZLES_FILE, help='puzzle JSON file to verify')
+    parser.add_argument('--curated', action='store_true',
+                        help='verify the hand-written sets from the fetch_* scripts instead')
+    parser.add_argument('--report', help='write per-puzzle verdicts to this JSON file')
+    parser.add_argument('--output', help='write the puzzles minus failed mate puzzles to this JSON file')
+    parser.add_argument('--workers', type=int, default=None, help='process pool size (default: all cores)')
+    parser.add_argument('--max-nodes', type=int, default=DEFAULT_MAX_NODES, help='node budget per puzzle')
+    parser.add_argument('--benchmark', action='store_true', help='report throughput over the mate subset')
+    args = parser.parse_args()
+
+    print("=" * 70)
+    print("ChessMaster Mate Puzzle Verifier")
+    print("=" * 70)
+
+    puzzles = load_curated_puzzles() if args.curated else load_puzzles(args.input)
+    print(f"Loaded {len(puzzles)} puzzles")
+
+    if args.benchmark:
+        run_benchmark(puzzles, max_nodes=args.max_nodes)
+        return 0
+
+    start = time.perf_counter()
+    results = verify_puzzles(puzzles, workers=args.workers, max_nodes=args.max_nodes)
+    elapsed = time.perf_counter() - start
+
+    summary = summarize(results)
+    print(f"\nChecked {summary['checked']} mate-tagged puzzles in {elapsed:.1f}s")
+    for verdict, count in sorted(summary['verdicts'].items()):
+        print(f"  {verdict}: {count}")
+
+    failures = [r for r in results if r['verdict'] in FAILED_VERDICTS]
+    for r in failures[:20]:
+        print(f"  ✗ {r['id']} (mateIn{r['claimed']}): {r['verdict']} - {r['detail']}")
+    if len(failures) > 20:
+        print(f"  ... and {len(failures) - 20} more")
+
+    if args.report:
+        with open(args.report, 'w', encoding='utf-8') as f:
+            json.dump({'summary': summary, 'results': results}, f, indent=2)
+        print(f"\nReport written to {args.report}")
+
+    if args.output:
+        failed_ids = {r['id'] for r in failures}
+        kept = [p for p in puzzles if p.get('id') not in failed_ids]
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(kept, f, indent=2, ensure_ascii=False)
+        print(f"✓ Saved {len(kept)} puzzles ({len(failed_ids)} dropped) to {args.output}")
+
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -62,5 +62,32 @@ void main() {
       final puzzle = Puzzle.fromJson(json);
       expect(puzzle.moves, isEmpty);
     });
+
+    test('Puzzle.fromJson reads the annotated start position and plies', () {
+      final json = {
+        'id': 127,
+        'fen': '2r3k1/p4p2/1p4pp/3p4/3Bq3/P6P/5QP1/5RK1 b - - 1 36',
+        'moves': 'c8c2 f2f7',
+        'rating': 600,
+        'themes': 'mate',
+        'popularity': 100,
+        'start': '6k1/p4p2/1p4pp/3p4/3Bq3/P6P/2r2QP1/5RK1 w - - 2 37',
+        'san': 'Rc2 Qxf7#',
+        'flags': '06',
+      };
+
+      final puzzle = Puzzle.fromJson(json);
+      expect(puzzle.startFen, json['start']);
+      expect(puzzle.getPly(0)!.isCapture, isFalse);
+      expect(puzzle.getPly(1)!.san, 'Qxf7#');
+      expect(puzzle.getPly(1)!.captured, 'p');
+      expect(puzzle.getPly(1)!.isCheckmate, isTrue);
+      expect(puzzle.toJson()['flags'], '06');
+
+      // Flags that do not line up with the moves are ignored as a whole.
+      final broken = Puzzle.fromJson({...json, 'flags': '0'});
+      expect(broken.startFen, isNull);
+      expect(broken.plies, isEmpty);
+    });
   });
 }